@@ -4,7 +4,8 @@ A set of utility functions for alignment processing.
 import re
 from collections import OrderedDict
 from common import definitions
-from protein.models import Protein
+from django.db.models import Case, When
+from protein.models import Protein, ProteinSegment
 
 
 def strip_html_tags(text):
@@ -194,3 +195,34 @@ def get_proteins_from_selection(simple_selection):
                 proteins.append(fp)
 
     return proteins
+
+def get_family_alignment_selection(slug):
+    """
+    Get the proteins and segments shown in the alignment of a protein family.
+
+    @param: slug - protein family slug
+    """
+    proteins = Protein.objects.filter(family__slug__startswith=slug, sequence_type__slug='wt')
+
+    if len(proteins)>50 and len(slug.split("_"))<4:
+        # If alignment is going to be too big, only pick human.
+        proteins = Protein.objects.filter(family__slug__startswith=slug, sequence_type__slug='wt',
+            species__latin_name='Homo sapiens')
+
+    if slug.startswith('100'):
+        gsegments = definitions.G_PROTEIN_SEGMENTS
+
+        preserved = Case(*[When(slug=pk, then=pos) for pos, pk in enumerate(gsegments['Full'])])
+        segments = ProteinSegment.objects.filter(slug__in = gsegments['Full'], partial=False).order_by(preserved)
+    else:
+        segments = ProteinSegment.objects.filter(partial=False, proteinfamily='GPCR')
+        if len(proteins)>50:
+            # if a lot of proteins, exclude some segments
+            segments = ProteinSegment.objects.filter(partial=False, proteinfamily='GPCR').exclude(
+                slug__in=['N-term','C-term'])
+        if len(proteins)>200:
+            # if many more proteins exluclude more segments
+            segments = ProteinSegment.objects.filter(partial=False, proteinfamily='GPCR').exclude(
+                slug__in=['N-term','C-term']).exclude(category='loop')
+
+    return proteins, segments
@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alignment', '0002_cachedalignment'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='alignmentconsensus',
+            name='gn_consensus',
+        ),
+        migrations.AddField(
+            model_name='alignmentconsensus',
+            name='version',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -4,5 +4,18 @@ from django.db import models
 
 class AlignmentConsensus(models.Model):
     slug = models.SlugField(max_length=100, unique=True)
-    alignment = models.BinaryField()
-    gn_consensus = models.BinaryField(blank=True) # Store conservation calculation for each GN
\ No newline at end of file
+    alignment = models.BinaryField() # consensus columns, see common.alignment_consensus
+    version = models.IntegerField(default=0) # format of the stored consensus, 0 for pickled alignments
+
+class CachedAlignment(models.Model):
+    key = models.CharField(max_length=100, unique=True)
+    alignment = models.BinaryField() # compressed pickle of a built alignment with statistics
+    size = models.IntegerField()
+    created = models.DateTimeField(auto_now_add=True)
+    last_used = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.key
+
+    class Meta():
+        db_table = 'alignment_cache'
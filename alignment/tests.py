@@ -1,3 +1,54 @@
 from django.test import TestCase
 
-# Create your tests here.
+from common.alignment_gpcr import Alignment, AlignmentMatrix
+from common.selection import SelectionItem
+from common.testing import create_receptors
+from protein.models import Protein, ProteinSegment
+from residue.models import ResidueGenericNumberEquivalent
+
+import json
+import random
+
+
+class AlignmentMatrixTests(TestCase):
+    """AlignmentMatrix, which the alignment views use, builds the same alignment and statistics as Alignment"""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_receptors(random.Random(1), classes=[('001', 15)], two_schemes=True)
+
+    def build(self, alignment_class, show_padding, segments):
+        a = alignment_class()
+        a.show_padding = show_padding
+        a.load_proteins(Protein.objects.all())
+        a.load_segments(segments)
+        a.build_alignment()
+        a.calculate_statistics()
+        return a
+
+    def assertSameAlignment(self, segments):
+        for show_padding in (True, False):
+            a = self.build(Alignment, show_padding, segments)
+            m = self.build(AlignmentMatrix, show_padding, segments)
+
+            self.assertEqual([p.protein.entry_name for p in a.proteins], [p.protein.entry_name for p in m.proteins])
+            for pa, pm in zip(a.proteins, m.proteins):
+                self.assertEqual(dict(pa.alignment.items()), dict(pm.alignment.items()))
+            for attr in ['segments', 'generic_numbers', 'consensus', 'forced_consensus', 'aa_count',
+                'aa_count_with_protein', 'amino_acid_stats', 'feature_stats', 'amino_acids', 'features']:
+                self.assertEqual(json.dumps(getattr(a, attr)), json.dumps(getattr(m, attr)), attr)
+            self.assertEqual(dict((label, gn.pk) for label, gn in a.generic_number_objs.items()),
+                dict((label, gn.pk) for label, gn in m.generic_number_objs.items()))
+            self.assertEqual(sorted(a.positions), sorted(m.positions))
+            self.assertEqual([(r.amino_acid, r.family_generic_number, r.frequency, r.segment_slug)
+                for r in a.full_consensus], [(r.amino_acid, r.family_generic_number, r.frequency, r.segment_slug)
+                for r in m.full_consensus])
+
+    def test_segments(self):
+        self.assertSameAlignment(ProteinSegment.objects.all())
+
+    def test_custom_positions(self):
+        # whole segments with single positions, which are collected in a custom segment
+        self.assertSameAlignment(list(ProteinSegment.objects.filter(slug__in=['TM1', 'ECL1'])) +
+            [SelectionItem('residue', e) for e in ResidueGenericNumberEquivalent.objects.filter(label__in=['2x50',
+            '2x41', '1x33'])])
@@ -21,6 +21,8 @@ urlpatterns = [
     url(r'render_positive', views.render_reordered, {'group' : 'positive'}, name='render-reordered'),
     url(r'render_negative', views.render_reordered, {'group' : 'negative'}, name='render-reordered'),
     url(r'^render/(?P<slug>[^/]+)/$', views.render_family_alignment, name='render-family'),
+    url(r'^payload/(?P<slug>[^/]+)/$', views.family_alignment_payload, name='payload-family'),
+    url(r'^payload', views.alignment_payload, name='payload'),
     url(r'^render', views.render_alignment, name='render'),
     url(r'^fasta/(?P<slug>[^/]+)/$', views.render_fasta_family_alignment, name='fasta-family'),
     url(r'^fasta', views.render_fasta_alignment, name='fasta'),
@@ -2,6 +2,7 @@
 from django.conf import settings
 from django.http import HttpResponse
 from django.views.generic import TemplateView
+from django.utils.cache import patch_vary_headers
 from django.db.models import Case, When
 from django.core.cache import cache
 from django.core.cache import caches
@@ -10,8 +11,9 @@ try:
 except:
     cache_alignment = cache
 
-from alignment.functions import get_proteins_from_selection
+from alignment.functions import get_proteins_from_selection, get_family_alignment_selection
 from common import definitions
+from common.alignment_cache import alignment_key, get_or_build_alignment
 from common.selection import Selection
 from common.views import AbsTargetSelection
 from common.views import AbsSegmentSelection
@@ -21,12 +23,14 @@ from structure.functions import BlastSearch
 
 # from common.alignment_SITE_NAME import Alignment
 Alignment = getattr(__import__('common.alignment_' + settings.SITE_NAME, fromlist=['Alignment']), 'Alignment')
+AlignmentMatrix = getattr(__import__('common.alignment_' + settings.SITE_NAME, fromlist=['AlignmentMatrix']),
+    'AlignmentMatrix')
 from protein.models import Protein, ProteinSegment, ProteinFamily, ProteinSet
 from residue.models import ResidueNumberingScheme, ResiduePositionSet
 
 from collections import OrderedDict
 from copy import deepcopy
-import hashlib
+import gzip
 import inspect
 from io import BytesIO
 import itertools
@@ -288,10 +292,11 @@ class BlastSearchResults(TemplateView):
     def post(self, request, *args, **kwargs):
 
         if 'human' in request.POST.keys():
-            blast = BlastSearch(blastdb=os.sep.join([settings.STATICFILES_DIRS[0], 'blast', 'protwis_human_blastdb']), top_results=50)
+            blast = BlastSearch(blastdb=os.sep.join([settings.STATICFILES_DIRS[0], 'blast', 'protwis_human_blastdb']), top_results=50,
+                use_index=True)
             blast_out = blast.run(request.POST['input_seq'])
         else:
-            blast = BlastSearch(top_results=50)
+            blast = BlastSearch(top_results=50, use_index=True)
             blast_out = blast.run(request.POST['input_seq'])
 
         context = {}
@@ -301,113 +306,67 @@ class BlastSearchResults(TemplateView):
         return render(request, self.template_name, context)
 
 def render_alignment(request):
+    # the alignment is loaded by the viewer, segment by segment
+    return render(request, 'alignment/alignment_viewer.html', {'payload_url': '/alignment/payload'})
+
+def render_family_alignment(request, slug):
+    # the alignment is loaded by the viewer, segment by segment
+    return render(request, 'alignment/alignment_viewer.html', {'payload_url': '/alignment/payload/' + slug + '/',
+        'slug': slug})
+
+def alignment_payload_response(request, a):
+    """The viewer payload of an alignment with loaded proteins and segments, the header without a segment parameter
+    and the cells and statistics of one segment with it. All parts are cached together as compressed JSON, which is
+    sent as it is to clients that accept gzip."""
+    key = 'PAYLOAD_GZ_' + alignment_key(a)
+    segment = request.GET.get('segment')
+    part = key + '_' + (segment or '')
+    payload = cache_alignment.get(part)
+
+    if payload is None:
+        # build the alignment data matrix and calculate consensus sequence + amino acid and feature frequency,
+        # or load a previously built alignment of the same selection
+        a = get_or_build_alignment(a)
+        parts = {key + '_': a.payload_header()}
+        for s in a.segment_slices:
+            parts[key + '_' + s] = a.segment_payload(s)
+        parts = {k: gzip.compress(json.dumps(v, separators=(',', ':')).encode('utf-8')) for k, v in parts.items()}
+        cache_alignment.set_many(parts, 60*60*24*7) #set alignment cache one week
+        if part not in parts:
+            return HttpResponse(status=404)
+        payload = parts[part]
+
+    if 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+        response = HttpResponse(payload, content_type='application/json')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(gzip.decompress(payload), content_type='application/json')
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+def alignment_payload(request):
     # get the user selection from session
     simple_selection = request.session.get('selection', False)
 
     # create an alignment object
-    a = Alignment()
+    a = AlignmentMatrix()
 
     # load data from selection into the alignment
     a.load_proteins_from_selection(simple_selection)
     a.load_segments_from_selection(simple_selection)
 
-    #create unique proteins_id
-    protein_ids = []
-    for p in a.proteins:
-        protein_ids.append(p.pk)
-    protein_list = ','.join(str(x) for x in sorted(protein_ids))
-
-    #create unique proteins_id
-    segments_ids = []
-    for s in a.segments:
-        segments_ids.append(s)
-    segments_list = ','.join(str(x) for x in sorted(segments_ids))
-
-    s = str(protein_list+"_"+segments_list)
-    key = "ALIGNMENT_"+hashlib.md5(s.encode('utf-8')).hexdigest()
-    return_html = cache_alignment.get(key)
-
-    if return_html==None or 'Custom' in segments_ids:
-        # build the alignment data matrix
-        check = a.build_alignment()
-        if check == 'Too large':
-            return render(request, 'alignment/error.html', {'proteins': len(a.proteins), 'residues':a.number_of_residues_total})
-        # calculate consensus sequence + amino acid and feature frequency
-        a.calculate_statistics()
-
-        num_of_sequences = len(a.proteins)
-        num_residue_columns = len(a.positions) + len(a.segments)
-
-        return_html = render(request, 'alignment/alignment.html', {'a': a, 'num_of_sequences': num_of_sequences,
-            'num_residue_columns': num_residue_columns})
-    if 'Custom' not in segments_ids:
-        #update it if used
-        cache_alignment.set(key,return_html, 60*60*24*7) #set alignment cache one week
-
-    return return_html
+    return alignment_payload_response(request, a)
 
-def render_family_alignment(request, slug):
+def family_alignment_payload(request, slug):
     # create an alignment object
-    a = Alignment()
+    a = AlignmentMatrix()
 
     # fetch proteins and segments
-    proteins = Protein.objects.filter(family__slug__startswith=slug, sequence_type__slug='wt')
-
-    if len(proteins)>50 and len(slug.split("_"))<4:
-        # If alignment is going to be too big, only pick human.
-        proteins = Protein.objects.filter(family__slug__startswith=slug, sequence_type__slug='wt', species__latin_name='Homo sapiens')
-
-    if slug.startswith('100'):
-
-        gsegments = definitions.G_PROTEIN_SEGMENTS
-
-        preserved = Case(*[When(slug=pk, then=pos) for pos, pk in enumerate(gsegments['Full'])])
-        segments = ProteinSegment.objects.filter(slug__in = gsegments['Full'], partial=False).order_by(preserved)
-    else:
-        segments = ProteinSegment.objects.filter(partial=False, proteinfamily='GPCR')
-        if len(proteins)>50:
-            # if a lot of proteins, exclude some segments
-            segments = ProteinSegment.objects.filter(partial=False, proteinfamily='GPCR').exclude(slug__in=['N-term','C-term'])
-        if len(proteins)>200:
-            # if many more proteins exluclude more segments
-            segments = ProteinSegment.objects.filter(partial=False, proteinfamily='GPCR').exclude(slug__in=['N-term','C-term']).exclude(category='loop')
-
-    protein_ids = []
-    for p in proteins:
-        protein_ids.append(p.pk)
-    protein_list = ','.join(str(x) for x in sorted(protein_ids))
-
-    #create unique proteins_id
-    segments_ids = []
-    for s in segments:
-        segments_ids.append(s.slug)
-    segments_list = ','.join(str(x) for x in sorted(segments_ids))
-
-    s = str(protein_list+"_"+segments_list)
-    key = "ALIGNMENT_"+hashlib.md5(s.encode('utf-8')).hexdigest()
-    return_html = cache_alignment.get(key)
-
-    if return_html==None:
-        # load data into the alignment
-        a.load_proteins(proteins)
-        a.load_segments(segments)
-
-        # build the alignment data matrix
-        a.build_alignment()
-
-        # calculate consensus sequence + amino acid and feature frequency
-        a.calculate_statistics()
-
-        num_of_sequences = len(a.proteins)
-        num_residue_columns = len(a.positions) + len(a.segments)
-
-        return_html = render(request, 'alignment/alignment.html', {'a': a, 'num_of_sequences': num_of_sequences,
-        'num_residue_columns': num_residue_columns})
-
-    #update it if used
-    cache_alignment.set(key,return_html, 60*60*24*7) #set alignment cache one week
+    proteins, segments = get_family_alignment_selection(slug)
+    a.load_proteins(proteins)
+    a.load_segments(segments)
 
-    return return_html
+    return alignment_payload_response(request, a)
 
 def render_fasta_alignment(request):
     # get the user selection from session
@@ -453,18 +412,15 @@ def render_csv_alignment(request):
     simple_selection = request.session.get('selection', False)
 
     # create an alignment object
-    a = Alignment()
+    a = AlignmentMatrix()
     a.show_padding = False
 
     # load data from selection into the alignment
     a.load_proteins_from_selection(simple_selection)
     a.load_segments_from_selection(simple_selection)
 
-    # build the alignment data matrix
-    a.build_alignment()
-
-    # calculate consensus sequence + amino acid and feature frequency
-    a.calculate_statistics()
+    # build the alignment data matrix and calculate consensus sequence + amino acid and feature frequency
+    a = get_or_build_alignment(a)
 
     response = render(request, 'alignment/alignment_csv.html', context={'a': a}, content_type='text/csv')
     response['Content-Disposition'] = "attachment; filename=" + settings.SITE_TITLE + "_alignment.csv"
@@ -21,6 +21,7 @@ from api.renderers import PDBRenderer
 from common.alignment import Alignment
 from common.definitions import *
 from drugs.models import Drugs
+from residue.functions import get_gn_equivalents
 
 import json, os
 from io import StringIO
@@ -329,9 +330,10 @@ class FamilyAlignment(views.APIView):
                 ps = Protein.objects.filter(sequence_type__slug='wt', source__id=1, family__slug__startswith=slug)
 
             # take the numbering scheme from the first protein
-            s_slug = Protein.objects.get(entry_name=ps[0]).residue_numbering_scheme_id
+            s_slug = ps[0].residue_numbering_scheme_id
 
             gen_list = []
+            gen_labels = []
             segment_list = []
             if segments is not None:
                 input_list = segments.split(",")
@@ -341,12 +343,14 @@ class FamilyAlignment(views.APIView):
                     # add to segment list
                     if s in protein_segments:
                         segment_list.append(s)
-                    # get generic numbering object for generic positions
+                    # collect generic positions
                     else:
-                        # make sure the query works for all positions
-                        gen_object = ResidueGenericNumberEquivalent.objects.get(label=s, scheme__id=s_slug)
-                        gen_object.properties = {}
-                        gen_list.append(gen_object)
+                        gen_labels.append(s)
+
+                # get generic numbering objects for all generic positions at once
+                gen_list = get_gn_equivalents(gen_labels, s_slug)
+                for gen_object in gen_list:
+                    gen_object.properties = {}
 
                 # fetch all complete protein_segments
                 ss = ProteinSegment.objects.filter(slug__in=segment_list, partial=False)
@@ -446,27 +450,29 @@ class ProteinSimilaritySearchAlignment(views.APIView):
             protein_list = proteins.split(",")
             # first in API should be reference
             ps = Protein.objects.filter(sequence_type__slug='wt', entry_name__in=protein_list[1:])
-            reference = Protein.objects.filter(sequence_type__slug='wt', entry_name__in=[protein_list[0]])
+            reference = Protein.objects.filter(sequence_type__slug='wt', entry_name__in=[protein_list[0]])[0]
 
             # take the numbering scheme from the first protein
-            s_slug = Protein.objects.get(entry_name=protein_list[0]).residue_numbering_scheme_id
+            s_slug = reference.residue_numbering_scheme_id
 
             if segments is not None:
                 input_list = segments.split(",")
                 # fetch a list of all segments
                 protein_segments = ProteinSegment.objects.filter(partial=False).values_list('slug', flat=True)
-                gen_list = []
+                gen_labels = []
                 segment_list = []
                 for s in input_list:
                     # add to segment list
                     if s in protein_segments:
                         segment_list.append(s)
-                    # get generic numbering object for generic positions
+                    # collect generic positions
                     else:
-                        # make sure the query works for all positions
-                        gen_object = ResidueGenericNumberEquivalent.objects.get(label=s, scheme__id=s_slug)
-                        gen_object.properties = {}
-                        gen_list.append(gen_object)
+                        gen_labels.append(s)
+
+                # get generic numbering objects for all generic positions at once
+                gen_list = get_gn_equivalents(gen_labels, s_slug)
+                for gen_object in gen_list:
+                    gen_object.properties = {}
 
                 # fetch all complete protein_segments
                 ss = ProteinSegment.objects.filter(slug__in=segment_list, partial=False)
@@ -476,7 +482,7 @@ class ProteinSimilaritySearchAlignment(views.APIView):
             a.show_padding = False
 
             # load data from API into the alignment
-            a.load_reference_protein(reference[0])
+            a.load_reference_protein(reference)
             a.load_proteins(ps)
 
             # load generic numbers and TMs seperately
@@ -526,10 +532,12 @@ class ProteinAlignment(views.APIView):
             protein_list = proteins.split(",")
             ps = Protein.objects.filter(sequence_type__slug='wt', entry_name__in=protein_list)
 
-            # take the numbering scheme from the first protein
-            s_slug = Protein.objects.get(entry_name=protein_list[0]).residue_numbering_scheme_id
+            # take the numbering scheme from the first protein of the selection
+            reference = [p for p in ps if p.entry_name == protein_list[0]] or ps[:1]
+            s_slug = reference[0].residue_numbering_scheme_id
 
             gen_list = []
+            gen_labels = []
             segment_list = []
             if segments is not None:
                 input_list = segments.split(",")
@@ -539,11 +547,14 @@ class ProteinAlignment(views.APIView):
                     # add to segment list
                     if s in protein_segments:
                         segment_list.append(s)
-                    # get generic numbering object for generic positions
+                    # collect generic positions
                     else:
-                        gen_object = ResidueGenericNumberEquivalent.objects.get(label=s, scheme__id=s_slug)
-                        gen_object.properties = {}
-                        gen_list.append(gen_object)
+                        gen_labels.append(s)
+
+                # get generic numbering objects for all generic positions at once
+                gen_list = get_gn_equivalents(gen_labels, s_slug)
+                for gen_object in gen_list:
+                    gen_object.properties = {}
 
                 # fetch all complete protein_segments
                 ss = ProteinSegment.objects.filter(slug__in=segment_list, partial=False)
@@ -693,7 +704,7 @@ class StructureAssignGenericNumbers(views.APIView):
     def post(self, request):
 
         root, ext = os.path.splitext(request.FILES['pdb_file'].name)
-        generic_numbering = GenericNumbering(StringIO(request.FILES['pdb_file'].file.read().decode('UTF-8',"ignore")))
+        generic_numbering = GenericNumbering(StringIO(request.FILES['pdb_file'].file.read().decode('UTF-8',"ignore")), use_index=True)
         out_struct = generic_numbering.assign_generic_numbers()
         out_stream = StringIO()
         io = PDBIO()
@@ -718,7 +729,7 @@ class StructureSequenceParser(views.APIView):
 
         root, ext = os.path.splitext(request.FILES['pdb_file'].name)
         header = parse_pdb_header(request.FILES['pdb_file'])
-        parser = SequenceParser(request.FILES['pdb_file'])
+        parser = SequenceParser(request.FILES['pdb_file'], use_index=True)
 
         json_data = OrderedDict()
         json_data["header"] = header
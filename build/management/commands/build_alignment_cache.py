@@ -0,0 +1,42 @@
+from django.conf import settings
+
+from build.management.commands.base_build import Command as BaseBuild
+from alignment.functions import get_family_alignment_selection
+from common.alignment_cache import get_or_build_alignment
+from protein.models import ProteinFamily
+
+# from common.alignment_SITE_NAME import AlignmentMatrix
+AlignmentMatrix = getattr(__import__('common.alignment_' + settings.SITE_NAME, fromlist=['AlignmentMatrix']),
+    'AlignmentMatrix')
+
+
+class Command(BaseBuild):
+    help = 'Builds and caches the alignments shown on the protein family pages'
+
+    families = ProteinFamily.objects.filter(slug__startswith='00').exclude(slug='000').order_by('slug')
+
+    def handle(self, *args, **options):
+        try:
+            self.logger.info('BUILDING ALIGNMENT CACHE')
+            self.prepare_input(options['proc'], self.families)
+            self.logger.info('COMPLETED BUILDING ALIGNMENT CACHE')
+        except Exception as msg:
+            print(msg)
+            self.logger.error(msg)
+
+    def main_func(self, positions, iteration, count, lock):
+        families = self.families
+        while count.value < len(families):
+            with lock:
+                family = families[count.value]
+                count.value += 1
+
+            proteins, segments = get_family_alignment_selection(family.slug)
+            if not proteins.exists():
+                continue
+
+            a = AlignmentMatrix()
+            a.load_proteins(proteins)
+            a.load_segments(segments)
+            get_or_build_alignment(a)
+            self.logger.info('Cached alignment for {}'.format(family))
@@ -47,6 +47,7 @@ class Command(BaseCommand):
             ['update_construct_mutations'],
             ['build_ligands_from_cache', {'proc': options['proc'], 'test_run': options['test']}],
             ['build_ligand_assays', {'proc': options['proc'], 'test_run': options['test']}],
+            ['build_ligand_summary'],
             ['build_mutant_data', {'proc': options['proc'], 'test_run': options['test']}],
             # ['build_crystal_interactions', {'proc': options['proc']}],
             ['build_protein_sets'],
@@ -56,13 +57,17 @@ class Command(BaseCommand):
             ['build_signprot_complex'],
             ['build_drugs'],
             ['build_nhs'],
-            ['build_mutational_landscape'],
             ['build_residue_sets'],
+            ['build_mutational_landscape'],
+            ['build_mutation_design'],
+            ['build_alignment_cache', {'proc': options['proc']}],
             ['build_dynamine_annotation', {'proc': options['proc']}],
             ['build_homology_models', ['--update', '-z'], {'proc': options['proc'], 'test_run': options['test']}],
+            ['build_protein_cards'],
             ['build_blast_database'],
             ['build_text'],
             ['build_release_notes'],
+            ['warm_cache', {'switch': True}],
         ]
 
         for c in commands:
@@ -443,6 +443,7 @@ class Command(BaseBuild):
                 al.append(res)
 
             bulked = Residue.objects.bulk_create(bulk)
+            clear_gn_translation_cache([pconf])
             rs = Residue.objects.filter(protein_conformation=pconf).order_by('sequence_number')
 
             ThroughModel = Residue.alternative_generic_numbers.through
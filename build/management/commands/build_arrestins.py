@@ -8,6 +8,7 @@ from common.models import WebResource, WebLink
 from protein.models import (Protein, ProteinConformation, ProteinState, ProteinFamily, ProteinAlias, ProteinSequenceType, Species, Gene, ProteinSource, ProteinSegment)
 
 from residue.models import (ResidueNumberingScheme, ResidueGenericNumber, Residue, ResidueGenericNumberEquivalent)
+from residue.functions import clear_gn_equivalent_cache, clear_gn_translation_cache
 
 from signprot.models import SignprotStructure
 import pandas as pd
@@ -120,6 +121,8 @@ class Command(BaseCommand):
             except:
                 print("failed to add residue generic number")
                 self.logger.error("Failed to add residues to ResidueGenericNumberEquivalent")
+        clear_gn_translation_cache()
+        clear_gn_equivalent_cache()
 
     def update_protein_conformation(self, arrestin_list):
 
@@ -8,10 +8,11 @@ from residue.functions import *
 from protein.models import Protein, ProteinConformation, ProteinFamily, ProteinSegment, ProteinSequenceType
 from common.alignment import Alignment
 from alignment.models import AlignmentConsensus
+from common.alignment_cache import invalidate_alignment_cache
+from common.alignment_consensus import store_consensus, get_consensus, clear_consensus_cache
 
 import os
 import yaml
-import pickle
 
 class Command(BuildHumanProteins):
     help = 'Builds consensus sequences for human proteins in all families'
@@ -42,6 +43,8 @@ class Command(BuildHumanProteins):
     def purge_consensus_sequences(self):
         Protein.objects.filter(sequence_type__slug='consensus').delete()
         AlignmentConsensus.objects.all().delete()
+        clear_consensus_cache()
+        invalidate_alignment_cache()
 
     def get_segment_residue_information(self, consensus_sequence):
         ref_positions = dict()
@@ -105,14 +108,14 @@ class Command(BuildHumanProteins):
             a.calculate_statistics()
 
             try:
-                # Save alignment
-                AlignmentConsensus.objects.create(slug=family.slug, alignment=pickle.dumps(a))
+                # Save consensus
+                store_consensus(family.slug, a)
 
-                # Load alignment to ensure it works
-                a = pickle.loads(AlignmentConsensus.objects.get(slug=family.slug).alignment)
-                self.logger.info('Succesfully pickled {}'.format(family))
+                # Load consensus to ensure it works
+                get_consensus(family.slug).consensus
+                self.logger.info('Succesfully stored consensus of {}'.format(family))
             except:
-                self.logger.error('Failed pickle for {}'.format(family))
+                self.logger.error('Failed storing consensus of {}'.format(family))
 
             self.logger.info('Completed building alignment for {}'.format(family))
 
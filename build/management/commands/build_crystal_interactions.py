@@ -4,14 +4,17 @@ from build.management.commands.base_build import Command as BaseBuild
 from django.db import transaction
 
 from contactnetwork.models import *
+from contactnetwork.structure_store import get_pdb_data
 from residue.models import Residue
+from common.tools import bulk_create_polymorphic
 
 import contactnetwork.interaction as ci
 
 import logging
 import datetime
+import hashlib
 
-from contactnetwork.cube import compute_interactions
+from contactnetwork.cube import compute_interactions, INTERACTION_ALGORITHM_VERSION
 
 from django.contrib.contenttypes.models import ContentType
 
@@ -26,10 +29,28 @@ class Command(BaseBuild):
             dest='proc',
             default=1,
             help='Number of processes to run')
+        parser.add_argument('--purge',
+            action='store_true',
+            dest='purge',
+            default=False,
+            help='Delete all interactions and recompute them for all structures')
+        parser.add_argument('--flat',
+            action='store_true',
+            dest='flat',
+            default=False,
+            help='Only rebuild the flat interaction table from the stored interactions')
 
     def handle(self, *args, **options):
-        self.delete_all()
-        self.structures = Structure.objects.all().exclude(refined=True)
+        if options['purge']:
+            self.delete_all()
+        self.structures = Structure.objects.all().exclude(refined=True).select_related(
+            'protein_conformation__protein', 'pdb_data')
+        if options['flat']:
+            for s in self.structures:
+                with transaction.atomic():
+                    self.create_flat_interactions(s)
+            self.logger.info('Finished building flat interaction data for all PDBs!')
+            return
         self.prepare_input(options['proc'], self.structures)
         self.logger.info('Finished building crystal interaction data for all PDBs!')
 
@@ -42,9 +63,19 @@ class Command(BaseBuild):
         FaceToEdgeInteraction.objects.all().delete()
         PiCationInteraction.objects.all().delete()
         InteractingResiduePair.objects.all().delete()
+        FlatInteraction.objects.all().delete()
+        StructureInteractionsHash.objects.all().delete()
         self.logger.info('Deleted crystal interactions data all PDBs...')
 
-    # @transaction.atomic
+    def structure_hash(self, s, pdb_code):
+        """SHA-1 of the interaction algorithm version and the coordinates and chain the interactions of a structure
+        are computed from"""
+        pdb_data = get_pdb_data(pdb_code, s)
+        if pdb_data is None:
+            return None
+        return hashlib.sha1('{}\n{}\n{}'.format(INTERACTION_ALGORITHM_VERSION, s.preferred_chain,
+            pdb_data).encode('utf-8')).hexdigest()
+
     def main_func(self, positions, iteration,count,lock):
         while count.value<len(self.structures):
             with lock:
@@ -53,86 +84,115 @@ class Command(BaseBuild):
                 count.value +=1 
                 self.logger.info('Generating crystal interactions data for PDB \'{}\'... ({} out of {})'.format(pdb_code, count.value, len(self.structures)))
 
+            # skip structures whose coordinates and chain have not changed since the last run
+            content_hash = self.structure_hash(s, pdb_code)
+            if content_hash is not None and StructureInteractionsHash.objects.filter(structure=s,
+                content_hash=content_hash).exists():
+                self.logger.info('Crystal interactions data for PDB \'{}\' is up to date'.format(pdb_code))
+                continue
+
             try:
                 interacting_pairs = compute_interactions(pdb_code)
             except:
                 self.logger.error('Error with computing interactions (%s)' % (pdb_code))
                 continue
 
-            for p in interacting_pairs:
-                # Create the pair
-                res1_seq_num = p.get_residue_1().id[1]
-                res2_seq_num = p.get_residue_2().id[1]
-                conformation = s.protein_conformation
-
-                # Get the residues
-                try:
-                    res1 = Residue.objects.get(sequence_number=res1_seq_num, protein_conformation=conformation)
-                    res2 = Residue.objects.get(sequence_number=res2_seq_num, protein_conformation=conformation)
-                except Residue.DoesNotExist:
-                    self.logger.warning('Error with pair between %s and %s (%s)' % (res1_seq_num,res2_seq_num,conformation))
-                    continue
-
-                # Save the pair
-                pair = InteractingResiduePair()
-                pair.res1 = res1
-                pair.res2 = res2
-                pair.referenced_structure = s
-                pair.save()
-
-                # Add the interactions to the pair
-                for i in p.get_interactions():
-                    if type(i) is ci.VanDerWaalsInteraction:
-                        ni = VanDerWaalsInteraction()
-                        ni.interacting_pair = pair
-                        ni.save()
-                    elif type(i) is ci.HydrophobicInteraction:
-                        ni = HydrophobicInteraction()
-                        ni.interacting_pair = pair
-                        ni.save()
-                    elif type(i) is ci.PolarSidechainSidechainInteraction:
-                        ni = PolarSidechainSidechainInteraction()
-                        ni.interacting_pair = pair
-                        ni.is_charged_res1 = i.is_charged_res1
-                        ni.is_charged_res2 = i.is_charged_res2
-                        ni.save()
-                    elif type(i) is ci.PolarBackboneSidechainInteraction:
-                        ni = PolarBackboneSidechainInteraction()
-                        ni.interacting_pair = pair
-                        ni.is_charged_res1 = i.is_charged_res1
-                        ni.is_charged_res2 = i.is_charged_res2
-                        ni.res1_is_sidechain = False
-                        ni.save()
-                    elif type(i) is ci.PolarSideChainBackboneInteraction:
-                        ni = PolarBackboneSidechainInteraction()
-                        ni.interacting_pair = pair
-                        ni.is_charged_res1 = i.is_charged_res1
-                        ni.is_charged_res2 = i.is_charged_res2
-                        ni.res1_is_sidechain = True
-                        ni.save()
-                    elif type(i) is ci.FaceToFaceInteraction:
-                        ni = FaceToFaceInteraction()
-                        ni.interacting_pair = pair
-                        ni.save()
-                    elif type(i) is ci.FaceToEdgeInteraction:
-                        ni = FaceToEdgeInteraction()
-                        ni.interacting_pair = pair
-                        ni.res1_has_face = True
-                        ni.save()
-                    elif type(i) is ci.EdgeToFaceInteraction:
-                        ni = FaceToEdgeInteraction()
-                        ni.interacting_pair = pair
-                        ni.res1_has_face = False
-                        ni.save()
-                    elif type(i) is ci.PiCationInteraction:
-                        ni = PiCationInteraction()
-                        ni.interacting_pair = pair
-                        ni.res1_has_pi = True
-                        ni.save()
-                    elif type(i) is ci.CationPiInteraction:
-                        ni = PiCationInteraction()
-                        ni.interacting_pair = pair
-                        ni.res1_has_pi = False
-                        ni.save()
+            with transaction.atomic():
+                InteractingResiduePair.objects.filter(referenced_structure=s).delete()
+                self.create_interactions(s, interacting_pairs)
+                self.create_flat_interactions(s)
+                if content_hash is not None:
+                    StructureInteractionsHash.objects.update_or_create(structure=s,
+                        defaults={'content_hash': content_hash})
 
             self.logger.info('Generated crystal interactions data for PDB \'{}\'...'.format(pdb_code))
+
+    def create_interactions(self, s, interacting_pairs):
+        conformation = s.protein_conformation
+
+        # Get the residues
+        residues = dict(Residue.objects.filter(protein_conformation=conformation).values_list('sequence_number',
+            'pk'))
+
+        pairs = []
+        pair_interactions = []
+        for p in interacting_pairs:
+            res1_seq_num = p.get_residue_1().id[1]
+            res2_seq_num = p.get_residue_2().id[1]
+            if res1_seq_num not in residues or res2_seq_num not in residues:
+                self.logger.warning('Error with pair between %s and %s (%s)' % (res1_seq_num,res2_seq_num,conformation))
+                continue
+
+            # Create the pair
+            pair = InteractingResiduePair(res1_id=residues[res1_seq_num], res2_id=residues[res2_seq_num],
+                referenced_structure=s)
+            pairs.append(pair)
+            pair_interactions.append(p.get_interactions())
+
+        # Save the pairs
+        bulk_create_polymorphic(pairs)
+
+        # Add the interactions to the pairs
+        interactions = []
+        for pair, pis in zip(pairs, pair_interactions):
+            for i in pis:
+                if type(i) is ci.VanDerWaalsInteraction:
+                    ni = VanDerWaalsInteraction()
+                elif type(i) is ci.HydrophobicInteraction:
+                    ni = HydrophobicInteraction()
+                elif type(i) is ci.PolarSidechainSidechainInteraction:
+                    ni = PolarSidechainSidechainInteraction()
+                    ni.is_charged_res1 = i.is_charged_res1
+                    ni.is_charged_res2 = i.is_charged_res2
+                elif type(i) is ci.PolarBackboneSidechainInteraction:
+                    ni = PolarBackboneSidechainInteraction()
+                    ni.is_charged_res1 = i.is_charged_res1
+                    ni.is_charged_res2 = i.is_charged_res2
+                    ni.res1_is_sidechain = False
+                elif type(i) is ci.PolarSideChainBackboneInteraction:
+                    ni = PolarBackboneSidechainInteraction()
+                    ni.is_charged_res1 = i.is_charged_res1
+                    ni.is_charged_res2 = i.is_charged_res2
+                    ni.res1_is_sidechain = True
+                elif type(i) is ci.FaceToFaceInteraction:
+                    ni = FaceToFaceInteraction()
+                elif type(i) is ci.FaceToEdgeInteraction:
+                    ni = FaceToEdgeInteraction()
+                    ni.res1_has_face = True
+                elif type(i) is ci.EdgeToFaceInteraction:
+                    ni = FaceToEdgeInteraction()
+                    ni.res1_has_face = False
+                elif type(i) is ci.PiCationInteraction:
+                    ni = PiCationInteraction()
+                    ni.res1_has_pi = True
+                elif type(i) is ci.CationPiInteraction:
+                    ni = PiCationInteraction()
+                    ni.res1_has_pi = False
+                else:
+                    continue
+                ni.interacting_pair = pair
+                interactions.append(ni)
+
+        bulk_create_polymorphic(interactions)
+
+    def create_flat_interactions(self, s):
+        """Copy the interactions of a structure, with their residue information, to the flat interaction table"""
+        FlatInteraction.objects.filter(structure=s).delete()
+
+        interactions = Interaction.objects.filter(interacting_pair__referenced_structure=s).values_list(
+            'interacting_pair__res1__sequence_number',
+            'interacting_pair__res1__generic_number__label',
+            'interacting_pair__res1__protein_segment__slug',
+            'interacting_pair__res1__amino_acid',
+            'interacting_pair__res2__sequence_number',
+            'interacting_pair__res2__generic_number__label',
+            'interacting_pair__res2__protein_segment__slug',
+            'interacting_pair__res2__amino_acid',
+            'polymorphic_ctype__model',
+        )
+
+        pdb_code = s.protein_conformation.protein.entry_name
+        FlatInteraction.objects.bulk_create([FlatInteraction(structure=s, pdb_code=pdb_code,
+            res1_sequence_number=i[0], res1_generic_number=i[1], res1_segment=i[2], res1_amino_acid=i[3],
+            res2_sequence_number=i[4], res2_generic_number=i[5], res2_segment=i[6], res2_amino_acid=i[7],
+            interaction_type=i[8]) for i in interactions], batch_size=1000)
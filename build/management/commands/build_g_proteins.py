@@ -10,6 +10,7 @@ from protein.models import (Protein, ProteinGProtein,ProteinGProteinPair, Protei
         ProteinSequenceType, Species, Gene, ProteinSource, ProteinSegment)
 
 from residue.models import (ResidueNumberingScheme, ResidueGenericNumber, Residue, ResidueGenericNumberEquivalent)
+from residue.functions import clear_gn_equivalent_cache, clear_gn_translation_cache
 
 from signprot.models import SignprotStructure, SignprotBarcode
 import pandas as pd
@@ -637,6 +638,8 @@ class Command(BaseCommand):
                 self.logger.error("Failed to add residues to ResidueGenericNumberEquivalent")
         self.logger.info('Inserted bulk {} (Index:{})'.format(len(bulk),index))
         Residue.objects.bulk_create(bulk)
+        clear_gn_translation_cache()
+        clear_gn_equivalent_cache()
 
     def update_protein_conformation(self, gprotein_list):
         #gprotein_list=['gnaz_human','gnat3_human', 'gnat2_human', 'gnat1_human', 'gnas2_human', 'gnaq_human', 'gnao_human', 'gnal_human', 'gnai3_human', 'gnai2_human','gnai1_human', 'gna15_human', 'gna14_human', 'gna12_human', 'gna11_human', 'gna13_human']
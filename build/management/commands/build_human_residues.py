@@ -6,8 +6,10 @@ from django.db import IntegrityError
 from build.management.commands.base_build import Command as BaseBuild
 from protein.models import Protein, ProteinConformation, ProteinSegment, ProteinFamily
 from residue.functions import *
+from common.alignment_cache import invalidate_alignment_cache
 
 import os
+import time
 import yaml
 from collections import OrderedDict
 import copy
@@ -28,6 +30,9 @@ class Command(BaseBuild):
 
     schemes = parse_scheme_tables(generic_numbers_source_dir)
 
+    # number of residues written per bulk write
+    batch_size = 20000
+
     # default segment length
     with open(default_segment_length_file_path, 'r') as default_segment_length_file:
         segment_length = yaml.load(default_segment_length_file)
@@ -41,19 +46,29 @@ class Command(BaseBuild):
             for i in range(1,iterations+1):
                 self.prepare_input(options['proc'], self.pconfs, i)
 
+            # cached alignments were built from the old residues
+            invalidate_alignment_cache()
+
             self.logger.info('COMPLETED CREATING RESIDUES')
         except Exception as msg:
             print(msg)
             self.logger.error(msg)
 
-    def main_func(self, positions, iteration):
+    def main_func(self, positions, iteration, count, lock):
         # pconfs
         if not positions[1]:
             pconfs = self.pconfs[positions[0]:]
         else:
             pconfs = self.pconfs[positions[0]:positions[1]]
 
+        # residues are collected for many proteins and written together
+        batch = ResidueBatch(self.schemes, self.batch_size)
+        start_time = time.time()
+
         for pconf in pconfs:
+            if len(batch) >= self.batch_size:
+                batch.write()
+
             # read reference positions for this protein
             ref_position_file_path = os.sep.join([self.ref_position_source_dir, pconf.protein.entry_name + '.yaml'])
             ref_positions = load_reference_positions(ref_position_file_path)
@@ -227,7 +242,13 @@ class Command(BaseBuild):
                     continue
 
                 # create residues for this segment
-                create_or_update_residues_in_segment(pconf, segment, segment_start, aligned_segment_start,
-                    segment_end, aligned_segment_end, self.schemes, ref_positions, [], True)
+                batch.add_segment(pconf, segment, segment_start, aligned_segment_start, segment_end,
+                    aligned_segment_end, ref_positions, [])
 
                 sequence_number_counter = segment_end
+
+        batch.write()
+        if batch.total_residues:
+            elapsed = time.time() - start_time
+            self.logger.info('Built {} residues in {:.1f}s ({:.0f} residues/s, {:.1f}s writing)'.format(
+                batch.total_residues, elapsed, batch.total_residues / max(elapsed, 1e-6), batch.total_time))
@@ -2,14 +2,14 @@ from django.core.management.base import BaseCommand, CommandError
 from build.management.commands.base_build import Command as BaseBuild
 from django.utils.text import slugify
 from django.conf import settings
-from django.db import IntegrityError
+from django.db import transaction
 from ligand.functions import get_or_make_ligand
 from common.models import WebResource, WebLink
 from protein.models import Protein
 from ligand.models import Ligand, LigandProperities, LigandRole, LigandType, ChemblAssay, AssayExperiment
 from ligand.models import LigandVendorLink, LigandVendors
 from ligand.functions import get_or_make_ligand
-from common.tools import fetch_from_web_api
+from common.tools import fetch_from_web_api, BuildCheckpoint, report_throughput
 from collections import defaultdict
 import requests
 from optparse import make_option
@@ -19,6 +19,7 @@ import csv
 import os
 from collections import OrderedDict
 import datetime
+import time
 
 class Command(BaseBuild):
     help = 'Reads source data and creates links to other databases'
@@ -33,6 +34,9 @@ class Command(BaseBuild):
         parser.add_argument('--filename', action='append', dest='filename',
             help='Filename to import. Can be used multiple times')
         parser.add_argument('--test_run', action='store_true', help='Skip this during a test run', default=False)
+        parser.add_argument('--batch_size', type=int, default=10000, help='Number of assay records inserted at a time')
+        parser.add_argument('--restart', action='store_true', default=False,
+            help='Load all assay records again, instead of continuing an interrupted import')
 
     logger = logging.getLogger(__name__)
 
@@ -40,6 +44,13 @@ class Command(BaseBuild):
     links_data_dir = os.sep.join([settings.DATA_DIR, 'ligand_data', 'assay_data'])
     dictionary_file = os.sep.join([settings.DATA_DIR, 'ligand_data', 'assay_data', 'dictionary.txt'])
 
+    # fields of AssayExperiment set from the source records
+    experiment_fields = ['assay_type', 'pchembl_value', 'assay_description', 'published_value', 'published_relation',
+        'published_type', 'published_units', 'standard_value', 'standard_relation', 'standard_type', 'standard_units']
+
+    # ChEMBL targets that are not in the database, reported once per process
+    missing_proteins = set()
+
     wr = WebResource.objects.get(slug='chembl_ligand')
     wr_pubchem = WebResource.objects.get(slug='pubchem')
         
@@ -52,7 +63,8 @@ class Command(BaseBuild):
         if options['filename']:
             filenames = options['filename']
         else:
-            filenames = os.listdir(self.links_data_dir)
+            # sorted, so that the records are read in the same order when an interrupted import continues
+            filenames = sorted(os.listdir(self.links_data_dir))
 
         self.chembl_cid_dict = self.read_dict_file(self.dictionary_file)
         self.chembl_cid_dict = OrderedDict(self.chembl_cid_dict)
@@ -95,8 +107,23 @@ class Command(BaseBuild):
             
         # Load all ligands ( possible to skip if believed to be included or already imported )
         #self.prepare_input(options['proc'], self.chembl_mol_ids, 0)
-        # Insert the actual data points
-        self.prepare_input(options['proc'], self.data ,1)
+        # Insert the actual data points, in batches that are marked when done so that an interrupted import can continue
+        self.batches = [self.data[i:i + options['batch_size']] for i in range(0, len(self.data),
+            options['batch_size'])]
+        source_files = [os.sep.join([self.links_data_dir, f]) for f in filenames if f != 'dictionary.txt']
+        self.checkpoint = BuildCheckpoint('ligand_assays', source_files, options['batch_size'], self.batch_loaded)
+        if options['restart']:
+            self.checkpoint.clear()
+            self.checkpoint = BuildCheckpoint('ligand_assays', source_files, options['batch_size'],
+                self.batch_loaded)
+        elif self.checkpoint.done_count():
+            print(self.checkpoint.done_count(), 'of', len(self.batches), 'batches already loaded, continuing')
+        self.load_lookup_tables()
+        self.start_time = time.time()
+        self.prepare_input(options['proc'], self.batches ,1)
+        if self.checkpoint.done_count() == len(self.batches):
+            self.checkpoint.clear()
+        report_throughput(len(self.data), len(self.data), self.start_time)
 
         
     def main_func(self, positions, iteration,count,lock):
@@ -181,77 +208,105 @@ class Command(BaseBuild):
                                     lvl.save()
 
         elif iteration==1:
-            # Third load loads the exp (based on ligand/assay)
-            header = self.header_dict
-            skipped = 0
-            non_p = []
-            wr_chembl_assays = WebResource.objects.get(slug='chembl_assays')
-            while count.value<len(self.data):
+            # Third load loads the exp (based on ligand/assay), each process takes the next batch not loaded yet
+            while count.value<len(self.batches):
                 with lock:
-                    record = self.data[count.value]
-                    count.value +=1 
-                    if count.value % 10000 == 0:
-                        print('{} Status {} out of {}'.format(
-                        datetime.datetime.strftime(datetime.datetime.now(), '%Y-%m-%d %H:%M:%S'), count.value, len(self.data)))
-
-
-                target = record[header['target_chembl_id']]
-                assay_id = record[header['assay_chembl_id']]
-
-                assay, created = ChemblAssay.objects.get_or_create(assay_id=assay_id)
-                if created:
-                    wl, created = WebLink.objects.get_or_create(index=assay_id, web_resource=wr_chembl_assays)
-                    assay.web_links.add(wl)
-
-
-                ligand =record[header['molecule_chembl_id']]
-                p = Protein.objects.filter(web_links__index = target, web_links__web_resource__slug = 'chembl').first()
-                if not p:
-                    if not target in non_p:
-                        non_p.append(target)
-                        print('Not found protein!',target)
+                    i = count.value
+                    count.value +=1
+                if self.checkpoint.is_done(i):
                     continue
-
-                ls = Ligand.objects.filter(properities__web_links__index=ligand, properities__web_links__web_resource__slug = 'chembl_ligand', canonical=True)
-                if not ls.exists():
-                    # if no ligand matches this, then ignore -- be sure this works later.
-                    skipped += 1
-                    continue
-                for l in ls:
-                    if len(ls)>1:
-                        print('issue with canonical! give to munk',l,l.pk,ligand)
-                        break
-                assay_experiments = AssayExperiment.objects.filter( protein=p, ligand=l, assay=assay)
-                
-                if assay_experiments.exists():
-                    assay_experiment = assay_experiments.get()
-                else:
-                    assay_experiment = AssayExperiment()
-                    assay_experiment.assay = assay
-                    assay_experiment.ligand = l
-                    assay_experiment.protein = p
-
-                
-                
-                assay_experiment.assay_type = record[header['assay_type']]
-                assay_experiment.pchembl_value = record[header['pchembl_value']]
-                assay_experiment.assay_description = record[header['assay_description']]
-                assay_experiment.published_value = record[header['published_value']]
-                assay_experiment.published_relation = record[header['published_relation']]
-                assay_experiment.published_type = record[header['published_type']]
-                assay_experiment.published_units = record[header['published_units']]
-                
-                assay_experiment.standard_value = record[header['standard_value']]
-                assay_experiment.standard_relation = record[header['standard_relation']]
-                assay_experiment.standard_type = record[header['standard_type']]
-                assay_experiment.standard_units = record[header['standard_units']]
-                
-                try:
-                    assay_experiment.save()
-                except IntegrityError:
-                    assay_experiment = AssayExperiment.objects.get( protein=p, ligand=l, assay=assay)
-
-            print('done, skipped:',skipped)
+                self.checkpoint.mark_done(i, self.load_batch(self.batches[i]))
+                report_throughput(min((i + 1) * len(self.batches[0]), len(self.data)), len(self.data),
+                    self.start_time)
+
+    def load_lookup_tables(self):
+        """Proteins by ChEMBL target id and canonical ligands by ChEMBL compound id"""
+        self.proteins = {}
+        for index, protein_id in Protein.objects.filter(web_links__web_resource__slug='chembl').order_by(
+            'id').values_list('web_links__index', 'id'):
+            self.proteins.setdefault(index, protein_id)
+
+        self.ligands = {}
+        for index, ligand_id in Ligand.objects.filter(properities__web_links__web_resource__slug='chembl_ligand',
+            canonical=True).order_by('id').values_list('properities__web_links__index', 'id'):
+            if index in self.ligands:
+                print('issue with canonical! give to munk', ligand_id, index)
+                continue
+            self.ligands[index] = ligand_id
+
+        self.wr_chembl_assays = WebResource.objects.get(slug='chembl_assays')
+
+    @transaction.atomic
+    def load_batch(self, records):
+        """Create or update the assay experiments of a batch of records, and the assays they belong to"""
+        header = self.header_dict
+
+        # assays, with a link to ChEMBL for the new ones
+        assay_ids = set(record[header['assay_chembl_id']] for record in records)
+        assays = dict(ChemblAssay.objects.filter(assay_id__in=assay_ids).values_list('assay_id', 'id'))
+        new_assays = sorted(assay_ids - set(assays))
+        if new_assays:
+            ChemblAssay.objects.bulk_create([ChemblAssay(assay_id=assay_id) for assay_id in new_assays],
+                ignore_conflicts=True)
+            created = dict(ChemblAssay.objects.filter(assay_id__in=new_assays).values_list('assay_id', 'id'))
+            assays.update(created)
+            links = dict(WebLink.objects.filter(web_resource=self.wr_chembl_assays,
+                index__in=new_assays).values_list('index', 'id'))
+            WebLink.objects.bulk_create([WebLink(index=assay_id, web_resource=self.wr_chembl_assays)
+                for assay_id in new_assays if assay_id not in links], ignore_conflicts=True)
+            links = dict(WebLink.objects.filter(web_resource=self.wr_chembl_assays,
+                index__in=new_assays).values_list('index', 'id'))
+            LinkThrough = ChemblAssay.web_links.through
+            LinkThrough.objects.bulk_create([LinkThrough(chemblassay_id=created[assay_id],
+                weblink_id=links[assay_id]) for assay_id in created], ignore_conflicts=True)
+
+        # the last record of each ligand, protein and assay, like when they were saved one by one
+        experiments = OrderedDict()
+        loaded_assays = set()
+        for record in records:
+            target = record[header['target_chembl_id']]
+            if target not in self.proteins:
+                if target not in self.missing_proteins:
+                    self.missing_proteins.add(target)
+                    print('Not found protein!',target)
+                continue
+            ligand = record[header['molecule_chembl_id']]
+            if ligand not in self.ligands:
+                # if no ligand matches this, then ignore -- be sure this works later.
+                continue
+            key = (self.ligands[ligand], self.proteins[target], assays[record[header['assay_chembl_id']]])
+            loaded_assays.add(record[header['assay_chembl_id']])
+            experiments[key] = AssayExperiment(ligand_id=key[0], protein_id=key[1], assay_id=key[2],
+                assay_type=record[header['assay_type']],
+                pchembl_value=record[header['pchembl_value']],
+                assay_description=record[header['assay_description']],
+                published_value=record[header['published_value']],
+                published_relation=record[header['published_relation']],
+                published_type=record[header['published_type']],
+                published_units=record[header['published_units']],
+                standard_value=record[header['standard_value']],
+                standard_relation=record[header['standard_relation']],
+                standard_type=record[header['standard_type']],
+                standard_units=record[header['standard_units']])
+
+        existing = {}
+        for e_id, ligand_id, protein_id, assay_id in AssayExperiment.objects.filter(
+            assay_id__in=set(key[2] for key in experiments)).values_list('id', 'ligand_id', 'protein_id', 'assay_id'):
+            existing[(ligand_id, protein_id, assay_id)] = e_id
+        updated = []
+        for key, experiment in experiments.items():
+            if key in existing:
+                experiment.id = existing[key]
+                updated.append(experiment)
+        AssayExperiment.objects.bulk_create([e for key, e in experiments.items() if key not in existing],
+            batch_size=5000, ignore_conflicts=True)
+        AssayExperiment.objects.bulk_update(updated, self.experiment_fields, batch_size=5000)
+        return sorted(loaded_assays)
+
+    def batch_loaded(self, assay_ids):
+        """Whether the experiments of a batch marked as loaded are (still) in the database"""
+        return AssayExperiment.objects.filter(assay__assay_id__in=assay_ids).values('assay_id').distinct().count() == \
+            len(assay_ids)
 
     def find_cid_for_chembl(self, chembl_mol_id):
         # function to find cid based on chembl
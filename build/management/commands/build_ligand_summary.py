@@ -0,0 +1,84 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Min, Max, Sum
+
+from ligand.functions import purchasable_properities
+from ligand.models import AssayExperiment, LigandProperities, LigandTargetSummary
+from protein.models import Protein
+
+from collections import defaultdict
+import logging
+
+
+class Command(BaseCommand):
+    help = 'Aggregates the ChEMBL assays of each ligand and protein into the summary table of the target details pages'
+
+    logger = logging.getLogger(__name__)
+
+    def handle(self, *args, **options):
+        try:
+            self.logger.info('BUILDING LIGAND TARGET SUMMARIES')
+            self.build_summaries()
+            self.logger.info('COMPLETED BUILDING LIGAND TARGET SUMMARIES')
+        except Exception as msg:
+            print(msg)
+            self.logger.error(msg)
+
+    @transaction.atomic
+    def build_summaries(self):
+        LigandTargetSummary.objects.all().delete()
+
+        # ChEMBL id of each ligand properities, the first link if there are several
+        chembl_ids = {}
+        for lp_id, index in LigandProperities.objects.filter(web_links__web_resource__slug='chembl_ligand').order_by(
+            'web_links__id').values_list('id', 'web_links__index'):
+            chembl_ids.setdefault(lp_id, index)
+        purchasable = purchasable_properities()
+
+        # filtered with a subquery, so that ligands with several ChEMBL links are not counted more than once
+        assays = AssayExperiment.objects.filter(ligand__properities__in=LigandProperities.objects.filter(
+            web_links__web_resource__slug='chembl_ligand'))
+
+        units = defaultdict(set)
+        for ligand_id, protein_id, unit in assays.values_list('ligand_id', 'protein_id',
+            'standard_units').distinct():
+            units[(ligand_id, protein_id)].add(unit)
+
+        # pchembl statistics per ligand, protein and assay type, binding assays (b) and all others (functional)
+        stats = defaultdict(lambda: {'b': [0, 0.0, None, None], 'f': [0, 0.0, None, None]})
+        for ligand_id, protein_id, assay_type, count, total, low, high in assays.values_list('ligand_id',
+            'protein_id', 'assay_type').annotate(count=Count('id'), total=Sum('pchembl_value'),
+            low=Min('pchembl_value'), high=Max('pchembl_value')).order_by().iterator():
+            s = stats[(ligand_id, protein_id)]['b' if assay_type == 'b' else 'f']
+            s[0] += count
+            s[1] += float(total)
+            s[2] = float(low) if s[2] is None else min(s[2], float(low))
+            s[3] = float(high) if s[3] is None else max(s[3], float(high))
+
+        ligands = dict((l[0], l[1:]) for l in assays.values_list('ligand_id', 'ligand__properities_id',
+            'ligand__properities__smiles', 'ligand__properities__mw', 'ligand__properities__rotatable_bonds',
+            'ligand__properities__hdon', 'ligand__properities__hacc', 'ligand__properities__logp').distinct())
+        proteins = dict((p[0], p[1:]) for p in Protein.objects.filter(id__in=assays.values('protein_id')).values_list(
+            'id', 'family__slug', 'entry_name', 'species__common_name'))
+
+        rows = []
+        for (ligand_id, protein_id), s in stats.items():
+            lp_id, smiles, mw, rotatable_bonds, hdon, hacc, logp = ligands[ligand_id]
+            family_slug, entry_name, species = proteins[protein_id]
+            bind, funct = s['b'], s['f']
+            count = bind[0] + funct[0]
+            rows.append(LigandTargetSummary(ligand_id=ligand_id, protein_id=protein_id, family_slug=family_slug,
+                entry_name=entry_name, species=species, chembl_id=chembl_ids[lp_id], record_count=count,
+                assay_types=', '.join(name for name, t in (('Bind', bind), ('Funct', funct)) if t[0]),
+                min_value=min(t[2] for t in (bind, funct) if t[0]), avg_value=(bind[1] + funct[1]) / count,
+                max_value=max(t[3] for t in (bind, funct) if t[0]),
+                bind_count=bind[0], bind_min=bind[2], bind_avg=bind[1] / bind[0] if bind[0] else None,
+                bind_max=bind[3],
+                funct_count=funct[0], funct_min=funct[2], funct_avg=funct[1] / funct[0] if funct[0] else None,
+                funct_max=funct[3],
+                standard_units=', '.join(sorted(units[(ligand_id, protein_id)])), purchasable=lp_id in purchasable,
+                smiles=smiles, mw=float(mw) if mw is not None else None, rotatable_bonds=rotatable_bonds, hdon=hdon,
+                hacc=hacc, logp=float(logp) if logp is not None else None))
+        LigandTargetSummary.objects.bulk_create(rows, batch_size=5000)
+
+        self.logger.info('Built {} ligand target summaries'.format(len(rows)))
@@ -2,11 +2,12 @@ from django.core.management.base import BaseCommand, CommandError
 from build.management.commands.base_build import Command as BaseBuild
 from django.utils.text import slugify
 from django.conf import settings
+from django.db import transaction
 from common.models import WebResource, WebLink
 from ligand.models import Ligand, LigandProperities, LigandRole, LigandType, ChemblAssay, AssayExperiment
 from ligand.models import LigandVendorLink, LigandVendors
 from ligand.functions import get_or_make_ligand
-from common.tools import fetch_from_web_api
+from common.tools import fetch_from_web_api, BuildCheckpoint, report_throughput
 from collections import defaultdict
 import requests
 from optparse import make_option
@@ -15,8 +16,8 @@ import shlex
 import csv
 import os
 from collections import OrderedDict
-import datetime
 import gzip, json
+import time
 
 class Command(BaseBuild):
     help = 'Reads ligand_cache and creates the ligands'
@@ -31,6 +32,9 @@ class Command(BaseBuild):
         parser.add_argument('--filename', action='append', dest='filename',
             help='Filename to import. Can be used multiple times')
         parser.add_argument('--test_run', action='store_true', help='Skip this during a test run', default=False)
+        parser.add_argument('--batch_size', type=int, default=5000, help='Number of ligands inserted at a time')
+        parser.add_argument('--restart', action='store_true', default=False,
+            help='Load all ligands again, instead of continuing an interrupted import')
     logger = logging.getLogger(__name__)
 
     # source file directory
@@ -50,10 +54,42 @@ class Command(BaseBuild):
         self.create_vendors(filenames)
 
 
-        with gzip.open(os.sep.join([settings.DATA_DIR, 'ligand_data','raw_ligands','ligands.json.gz']), "rb") as f:
-            self.ligand_dump = json.loads(f.read().decode("ascii"))
-        print(len(self.ligand_dump),"ligands to load")
-        self.prepare_input(options['proc'], self.ligand_dump)
+        ligand_file = os.sep.join([settings.DATA_DIR, 'ligand_data','raw_ligands','ligands.json.gz'])
+        with gzip.open(ligand_file, "rb") as f:
+            ligand_dump = json.loads(f.read().decode("ascii"))
+        print(len(ligand_dump),"ligands to load")
+
+        # temp skip to only use "full" annotated ligands
+        ligand_dump = [l for l in ligand_dump if 'logp' in l]
+        self.batches = [ligand_dump[i:i + options['batch_size']] for i in range(0, len(ligand_dump),
+            options['batch_size'])]
+        self.ligand_count = len(ligand_dump)
+
+        self.checkpoint = BuildCheckpoint('ligands_from_cache', [ligand_file], options['batch_size'],
+            self.batch_loaded)
+        if options['restart']:
+            self.checkpoint.clear()
+            self.checkpoint = BuildCheckpoint('ligands_from_cache', [ligand_file], options['batch_size'],
+                self.batch_loaded)
+        elif self.checkpoint.done_count():
+            print(self.checkpoint.done_count(), 'of', len(self.batches), 'batches already loaded, continuing')
+
+        # lookup tables shared by all batches
+        ligand_types = OrderedDict()
+        for l in ligand_dump:
+            ligand_types.setdefault(l['ligand_type__slug'], l['ligand_type__name'])
+        existing_types = set(LigandType.objects.values_list('slug', flat=True))
+        LigandType.objects.bulk_create([LigandType(slug=slug, name=name) for slug, name in ligand_types.items()
+            if slug not in existing_types], ignore_conflicts=True)
+        self.ligand_types = dict(LigandType.objects.values_list('slug', 'id'))
+        self.web_resources = dict(WebResource.objects.values_list('slug', 'id'))
+        self.vendors = dict(LigandVendors.objects.values_list('slug', 'id'))
+
+        self.start_time = time.time()
+        self.prepare_input(options['proc'], self.batches)
+        if self.checkpoint.done_count() == len(self.batches):
+            self.checkpoint.clear()
+        report_throughput(self.ligand_count, self.ligand_count, self.start_time, 'ligands')
 
 
     def create_vendors(self,filenames):
@@ -73,79 +109,91 @@ class Command(BaseBuild):
                 print(len(d),"vendors",create_count,"vendors created")  
 
     def main_func(self, positions, iteration,count,lock):
-
-        # print(positions,iteration,count,lock)
-        ligands = self.ligand_dump
-        while count.value<len(ligands):
+        # each process takes the next batch of ligands that has not been loaded yet
+        while count.value<len(self.batches):
             with lock:
-                l = ligands[count.value]
-                count.value +=1 
-                if count.value % 10000 == 0:
-                    print('{} Status {} out of {}'.format(
-                    datetime.datetime.strftime(datetime.datetime.now(), '%Y-%m-%d %H:%M:%S'), count.value, len(ligands)))
-
-            if 'logp' not in l:
-                # temp skip to only use "full" annotated ligands
+                i = count.value
+                count.value +=1
+            if self.checkpoint.is_done(i):
                 continue
-
-            lp = LigandProperities.objects.filter(inchikey=l['inchikey']).first()
-            ligand = None
-            if lp:
-                # Check if inchikey is there
-                ligand = Ligand.objects.filter(name=l['name'], properities=lp).prefetch_related('properities__ligand_type','properities__web_links','properities__vendors').first()
-
-            # The name with corresponding inchikey is there, assume all is good and skip.
-            # Will add links to make sure they're there.
-            if not ligand:
-                if lp:
-                    print(l['name'],'is there! (but not by name, only inchi')
-                    ligand = Ligand()
-                    ligand.properities = lp
-                    ligand.name = l['name']
-                    ligand.canonical = l['canonical']
-                    ligand.ambigious_alias = l['ambigious_alias']
-                    ligand.save()
-                else:
-                    # No ligand seems to match by inchikey -- start creating it.
-                    # Make LigandProperities first
-                    lt, created = LigandType.objects.get_or_create(slug=l['ligand_type__slug'],defaults = {'name':l['ligand_type__name']})
-                    lp = LigandProperities()
-                    lp.inchikey = l['inchikey']
-                    lp.smiles = l['smiles']
-                    lp.mw = l['mw']
-                    lp.logp = l['logp']
-                    lp.rotatable_bonds = l['rotatable_bonds']
-                    lp.hacc = l['hacc']
-                    lp.hdon = l['hdon']
-                    lp.ligand_type = lt
-
-                    lp.save()
-
-                    ligand = Ligand()
-                    ligand.properities = lp
-                    ligand.name = l['name']
-                    ligand.canonical = l['canonical']
-                    ligand.ambigious_alias = l['ambigious_alias']
-                    ligand.save()
-
-
-            # create links - impossible to make duplicates so no need to check if there already
-            if ligand.properities.web_links.count()<len(l['web_links']):
-                for link in l['web_links']:
-                    wr = WebResource.objects.get(slug=link['web_resource'])
-                    wl, created = WebLink.objects.get_or_create(index=link['index'], web_resource=wr)
-                    ligand.properities.web_links.add(wl)
-
-            # create vendors - impossible to make duplicates so no need to check if there already
-            if ligand.properities.vendors.count()<len(l['vendors']):
-                for link in l['vendors']:
-                    lv = LigandVendors.objects.get(slug = link['vendor_slug'])
-                    check = LigandVendorLink.objects.filter(sid=link['sid']).exists()
-                    if not check:
-                        lvl = LigandVendorLink()
-                        lvl.sid = link['sid']
-                        lvl.vendor = lv
-                        lvl.lp = ligand.properities
-                        lvl.vendor_external_id = link['vendor_external_id']
-                        lvl.url = link['url']
-                        lvl.save()
\ No newline at end of file
+            self.load_batch(self.batches[i])
+            self.checkpoint.mark_done(i, sorted(set(l['inchikey'] for l in self.batches[i])))
+            report_throughput(min((i + 1) * len(self.batches[0]), self.ligand_count), self.ligand_count,
+                self.start_time, 'ligands')
+
+    def batch_loaded(self, inchikeys):
+        """Whether the ligands of a batch marked as loaded are (still) in the database"""
+        return LigandProperities.objects.filter(inchikey__in=inchikeys).count() == len(inchikeys)
+
+    @transaction.atomic
+    def load_batch(self, ligands):
+        """Create the ligands of a batch with their properities, web links and vendor links, whichever are missing"""
+        # properities, matched by inchikey
+        inchikeys = set(l['inchikey'] for l in ligands)
+        lp_ids = dict(LigandProperities.objects.filter(inchikey__in=inchikeys).values_list('inchikey', 'id'))
+        new_lps = OrderedDict()
+        for l in ligands:
+            if l['inchikey'] not in lp_ids and l['inchikey'] not in new_lps:
+                new_lps[l['inchikey']] = LigandProperities(inchikey=l['inchikey'], smiles=l['smiles'], mw=l['mw'],
+                    logp=l['logp'], rotatable_bonds=l['rotatable_bonds'], hacc=l['hacc'], hdon=l['hdon'],
+                    ligand_type_id=self.ligand_types[l['ligand_type__slug']])
+        if new_lps:
+            LigandProperities.objects.bulk_create(new_lps.values(), ignore_conflicts=True)
+            lp_ids.update(LigandProperities.objects.filter(inchikey__in=list(new_lps)).values_list('inchikey', 'id'))
+
+        # ligands, matched by name and properities
+        existing = set(Ligand.objects.filter(properities_id__in=lp_ids.values()).values_list('name', 'properities_id'))
+        new_ligands = OrderedDict()
+        for l in ligands:
+            key = (l['name'], lp_ids[l['inchikey']])
+            if key not in existing and key not in new_ligands:
+                new_ligands[key] = Ligand(properities_id=key[1], name=l['name'], canonical=l['canonical'],
+                    ambigious_alias=l['ambigious_alias'])
+        Ligand.objects.bulk_create(new_ligands.values(), ignore_conflicts=True)
+
+        # ligands skipped because another ligand has the same name and canonical flag
+        stored = set(Ligand.objects.filter(name__in=set(name for name, lp_id in new_ligands)).values_list('name',
+            'canonical', 'properities_id'))
+        dropped = [ligand for ligand in new_ligands.values() if (ligand.name, ligand.canonical,
+            ligand.properities_id) not in stored]
+        for ligand in dropped:
+            self.logger.warning('Ligand {} (canonical {}) not created, the name is used by another ligand'.format(
+                ligand.name, ligand.canonical))
+        if dropped:
+            print(len(dropped), 'ligands not created, their name is used by another ligand')
+
+        # web links, which are shared between ligands with the same resource and index
+        wanted_links = set((self.web_resources[link['web_resource']], link['index']) for l in ligands
+            for link in l['web_links'])
+        link_ids = self.get_or_create_web_links(wanted_links)
+        LinkThrough = LigandProperities.web_links.through
+        LinkThrough.objects.bulk_create([LinkThrough(ligandproperities_id=lp_id, weblink_id=link_id)
+            for lp_id, link_id in set((lp_ids[l['inchikey']], link_ids[(self.web_resources[link['web_resource']],
+            link['index'])]) for l in ligands for link in l['web_links'])], ignore_conflicts=True)
+
+        # vendor links, one per PubChem substance (sid)
+        vendor_links = OrderedDict()
+        for l in ligands:
+            for link in l['vendors']:
+                vendor_links.setdefault(link['sid'], LigandVendorLink(sid=link['sid'],
+                    vendor_id=self.vendors[link['vendor_slug']], lp_id=lp_ids[l['inchikey']],
+                    vendor_external_id=link['vendor_external_id'], url=link['url']))
+        existing = set(LigandVendorLink.objects.filter(sid__in=list(vendor_links)).values_list('sid', flat=True))
+        LigandVendorLink.objects.bulk_create([lvl for sid, lvl in vendor_links.items() if sid not in existing],
+            ignore_conflicts=True)
+
+    def get_or_create_web_links(self, links):
+        """Ids of the web links with the given (web resource id, index), creating the missing ones"""
+        link_ids = {}
+        indexes = set(index for wr_id, index in links)
+        for wr_id, index, link_id in WebLink.objects.filter(index__in=indexes).order_by('id').values_list(
+            'web_resource_id', 'index', 'id'):
+            link_ids.setdefault((wr_id, index), link_id)
+        missing = [link for link in links if link not in link_ids]
+        if missing:
+            WebLink.objects.bulk_create([WebLink(web_resource_id=wr_id, index=index) for wr_id, index in missing],
+                ignore_conflicts=True)
+            for wr_id, index, link_id in WebLink.objects.filter(index__in=set(index for wr_id, index in
+                missing)).order_by('id').values_list('web_resource_id', 'index', 'id'):
+                link_ids.setdefault((wr_id, index), link_id)
+        return link_ids
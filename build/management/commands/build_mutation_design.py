@@ -0,0 +1,110 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from interaction.models import ResidueFragmentInteraction
+from mutation.models import (MutationExperiment, MutationDesignInteraction, MutationDesignMutation,
+    MutationDesignPosition, MutationDesignAlignment)
+from protein.models import ProteinFamily
+from residue.models import Residue
+
+from collections import OrderedDict, defaultdict
+import logging
+
+
+class Command(BaseCommand):
+    help = 'Precomputes the ligand interactions, mutations and alignment of each receptor class used by the mutation ' \
+        'design tool'
+
+    logger = logging.getLogger(__name__)
+
+    def add_arguments(self, parser):
+        parser.add_argument('--classes', nargs='+', help='Slugs of the classes to build (default: all)')
+
+    def handle(self, *args, **options):
+        classes = ProteinFamily.objects.filter(parent__slug='000').order_by('slug')
+        if options['classes']:
+            classes = classes.filter(slug__in=options['classes'])
+
+        try:
+            self.logger.info('BUILDING MUTATION DESIGN STATISTICS')
+            for receptor_class in classes:
+                self.build_class(receptor_class.slug)
+            self.logger.info('COMPLETED BUILDING MUTATION DESIGN STATISTICS')
+        except Exception as msg:
+            print(msg)
+            self.logger.error(msg)
+
+    @transaction.atomic
+    def build_class(self, receptor_class):
+        for model in (MutationDesignInteraction, MutationDesignMutation, MutationDesignPosition,
+            MutationDesignAlignment):
+            model.objects.filter(receptor_class=receptor_class).delete()
+
+        # receptors with data, in the order they were added to the class alignment of the design page
+        proteins = OrderedDict()
+        pairs = defaultdict(lambda: [set(), set()])
+
+        interactions = ResidueFragmentInteraction.objects.filter(
+            structure_ligand_pair__structure__protein_conformation__protein__family__slug__startswith=receptor_class,
+            structure_ligand_pair__annotated=True).order_by('id').values_list(
+            'rotamer__residue__generic_number__label', 'rotamer__residue__amino_acid',
+            'structure_ligand_pair__structure__protein_conformation__protein__parent_id',
+            'structure_ligand_pair__structure__protein_conformation__protein__parent__entry_name',
+            'structure_ligand_pair__structure__protein_conformation__protein__parent__family__slug',
+            'structure_ligand_pair__structure__pdb_code__index', 'structure_ligand_pair__ligand__name',
+            'structure_ligand_pair__ligand__properities__smiles', 'interaction_type__slug', 'interaction_type__type')
+
+        rows = []
+        for (gn, aa, protein_id, entry_name, family, pdb_code, ligand, smiles, interaction_type,
+            interaction_class) in interactions:
+            proteins.setdefault(protein_id, entry_name)
+            if not gn or interaction_type == 'polar_backbone':
+                continue
+            rows.append(MutationDesignInteraction(receptor_class=receptor_class, generic_number=gn, amino_acid=aa,
+                entry_name=entry_name, family=family, pdb_code=pdb_code, ligand=ligand, smiles=smiles or '',
+                interaction_type=interaction_type, interaction_class=interaction_class))
+            if interaction_type != 'acc':
+                pairs[(gn, aa, family)][0].add((entry_name.split('_')[0], ligand))
+        MutationDesignInteraction.objects.bulk_create(rows, batch_size=5000)
+        interaction_count = len(rows)
+
+        mutations = MutationExperiment.objects.filter(protein__family__slug__startswith=receptor_class).order_by(
+            '-foldchange', 'exp_qual', 'id').values_list('residue__generic_number__label', 'residue__amino_acid',
+            'mutation__amino_acid', 'protein_id', 'protein__entry_name', 'protein__family__slug', 'ligand__name',
+            'ligand__properities__smiles', 'foldchange', 'exp_qual_id', 'exp_qual__qual', 'exp_qual__prop')
+
+        rows = []
+        for (gn, aa, mutation_aa, protein_id, entry_name, family, ligand, smiles, foldchange, exp_qual_id, qual,
+            prop) in mutations:
+            if int(foldchange) != 0 or exp_qual_id:
+                proteins.setdefault(protein_id, entry_name)
+            if not gn:
+                continue
+            rows.append(MutationDesignMutation(receptor_class=receptor_class, generic_number=gn, amino_acid=aa,
+                mutation_amino_acid=mutation_aa, entry_name=entry_name, family=family, ligand=ligand,
+                smiles=smiles or '', foldchange=foldchange, qual=qual or '', prop=prop or '',
+                exp_qual_id=exp_qual_id))
+            significant = foldchange > 5 or (qual and 'abolish' in qual.lower())
+            if ligand is not None and significant:
+                pairs[(gn, aa, family)][1].add((entry_name.split('_')[0], ligand))
+        MutationDesignMutation.objects.bulk_create(rows, batch_size=5000)
+        mutation_count = len(rows)
+
+        MutationDesignPosition.objects.bulk_create([MutationDesignPosition(receptor_class=receptor_class,
+            generic_number=gn, amino_acid=aa, family=family, interactions=len(i), mutations=len(m))
+            for (gn, aa, family), (i, m) in sorted(pairs.items())], batch_size=5000)
+
+        # helix residues of the receptors with data, one sequence per receptor over the generic numbers of the class
+        sequences = defaultdict(dict)
+        residues = Residue.objects.filter(protein_conformation__protein__in=list(proteins),
+            protein_segment__category='helix', generic_number__isnull=False).values_list(
+            'protein_conformation__protein_id', 'generic_number__label', 'amino_acid')
+        for protein_id, gn, aa in residues:
+            sequences[protein_id][gn] = aa
+        generic_numbers = sorted(set(gn for residues in sequences.values() for gn in residues))
+        MutationDesignAlignment.objects.create(receptor_class=receptor_class,
+            generic_numbers=','.join(generic_numbers), entry_names=','.join(proteins.values()),
+            sequences=','.join(''.join(sequences[p].get(gn, '-') for gn in generic_numbers) for p in proteins))
+
+        self.logger.info('Built mutation design statistics of class {}: {} interactions, {} mutations, {} '
+            'receptors'.format(receptor_class, interaction_count, mutation_count, len(proteins)))
@@ -2,11 +2,14 @@ from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
 from django.db import connection
 from django.db import IntegrityError
+from django.db.models import Q
 
 from protein.models import (Protein, ProteinGProtein,ProteinGProteinPair, ProteinConformation, ProteinState, ProteinFamily, ProteinAlias,
         ProteinSequenceType, Species, Gene, ProteinSource, ProteinSegment)
 from residue.models import (ResidueNumberingScheme, ResidueGenericNumber, Residue, ResidueGenericNumberEquivalent)
-from mutational_landscape.models import NaturalMutations, CancerMutations, DiseaseMutations, PTMs
+from mutational_landscape.models import (NaturalMutations, CancerMutations, DiseaseMutations, PTMs,
+    MutationalLandscapePayload)
+from mutational_landscape.functions import natural_mutations_payload, ptms_payload, compress_payload
 
 import pandas as pd
 import numpy as np
@@ -38,6 +41,7 @@ class Command(BaseCommand):
             self.purge_data()
             self.create_PTMs()
             self.create_natural_mutations()
+            self.create_payloads()
             # self.create_cancer_mutations()
             # self.create_disease_mutations()
         except Exception as msg:
@@ -48,6 +52,7 @@ class Command(BaseCommand):
         try:
             PTMs.objects.all().delete()
             NaturalMutations.objects.all().delete()
+            MutationalLandscapePayload.objects.all().delete()
             # CancerMutations.objects.all().delete()
             # DiseaseMutations.objects.all().delete()
         except Exception as msg:
@@ -231,3 +236,18 @@ class Command(BaseCommand):
                     snp, created = PTMs.objects.get_or_create(protein=p, residue=res, modification=modification) #
 
         self.logger.info('COMPLETED CREATING PTM SITES')
+
+    def create_payloads(self):
+        self.logger.info('CREATING MUTATIONAL LANDSCAPE PAYLOADS')
+
+        # the JSON of the landscape viewer, served as is by ajaxNaturalMutation and ajaxPTMs
+        proteins = Protein.objects.filter(Q(naturalmutations__isnull=False) | Q(ptms__isnull=False)).distinct(
+            ).select_related('family')
+        payloads = []
+        for p in proteins:
+            for kind, payload in (('natural_mutations', natural_mutations_payload), ('ptms', ptms_payload)):
+                data, etag = compress_payload(payload(p))
+                payloads.append(MutationalLandscapePayload(protein=p, kind=kind, data=data, etag=etag))
+        MutationalLandscapePayload.objects.bulk_create(payloads, batch_size=500)
+
+        self.logger.info('COMPLETED CREATING {} MUTATIONAL LANDSCAPE PAYLOADS'.format(len(payloads)))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from protein.models import Protein, ProteinSequenceCard
+
+import logging
+
+
+class Command(BaseCommand):
+    help = 'Builds the sequence cards shown on the protein detail pages'
+
+    logger = logging.getLogger(__name__)
+
+    # number of proteins read and written at a time
+    batch_size = 200
+
+    def handle(self, *args, **options):
+        try:
+            self.logger.info('BUILDING PROTEIN SEQUENCE CARDS')
+            self.build_cards()
+            self.logger.info('COMPLETED BUILDING PROTEIN SEQUENCE CARDS')
+        except Exception as msg:
+            print(msg)
+            self.logger.error(msg)
+
+    @transaction.atomic
+    def build_cards(self):
+        ProteinSequenceCard.objects.all().delete()
+        proteins = list(Protein.objects.filter(sequence_type__slug='wt').order_by('id'))
+        for i in range(0, len(proteins), self.batch_size):
+            ProteinSequenceCard.objects.bulk_create(ProteinSequenceCard.build(proteins[i:i + self.batch_size]))
+        self.logger.info('Built {} protein sequence cards'.format(len(proteins)))
@@ -0,0 +1,31 @@
+from build.management.commands.base_build import Command as BaseBuild
+from contactnetwork.structure_store import load_atoms
+from structure.models import Structure
+
+
+class Command(BaseBuild):
+    help = 'Parses the PDB files of all structures into the local structure store'
+
+    structures = Structure.objects.exclude(pdb_data=None).select_related('protein_conformation__protein',
+        'pdb_data')
+
+    def handle(self, *args, **options):
+        try:
+            self.logger.info('BUILDING STRUCTURE STORE')
+            self.prepare_input(options['proc'], self.structures)
+            self.logger.info('COMPLETED BUILDING STRUCTURE STORE')
+        except Exception as msg:
+            print(msg)
+            self.logger.error(msg)
+
+    def main_func(self, positions, iteration, count, lock):
+        while count.value < len(self.structures):
+            with lock:
+                s = self.structures[count.value]
+                count.value += 1
+
+            pdb_code = s.protein_conformation.protein.entry_name
+            try:
+                load_atoms(pdb_code, s.pdb_data.pdb)
+            except Exception as msg:
+                self.logger.error('Could not store structure {}: {}'.format(pdb_code, msg))
@@ -25,7 +25,7 @@ from structure.assign_generic_numbers_gpcr import GenericNumbering
 from ligand.models import Ligand, LigandType, LigandRole, LigandProperities
 from interaction.models import *
 from interaction.views import runcalculation,parsecalculation
-from residue.functions import dgn
+from residue.functions import dgn, clear_gn_equivalent_cache, clear_gn_translation_cache
 
 import logging
 import os
@@ -722,6 +722,8 @@ class Command(BaseBuild):
                                 default_generic_number=gn,
                                 scheme=scheme,
                                 defaults={'label': new_equivalent})
+                            if created:
+                                clear_gn_equivalent_cache()
                         except IntegrityError:
                             gn_equivalent = ResidueGenericNumberEquivalent.objects.get(
                                 default_generic_number=gn,
@@ -767,6 +769,8 @@ class Command(BaseBuild):
                                 default_generic_number=gn,
                                 scheme=scheme,
                                 defaults={'label': new_equivalent})
+                            if created:
+                                clear_gn_equivalent_cache()
                         except IntegrityError:
                             gn_equivalent = ResidueGenericNumberEquivalent.objects.get(
                                 default_generic_number=gn,
@@ -788,6 +792,7 @@ class Command(BaseBuild):
                     prev_segment = res.protein_segment
 
         bulked_res = Residue.objects.bulk_create(residues_bulk)
+        clear_gn_translation_cache([protein_conformation])
         #bulked_rot = PdbData.objects.bulk_create(rotamer_data_bulk)
         bulked_rot = rotamer_data_bulk
 
@@ -1464,6 +1469,7 @@ class Command(BaseBuild):
                     Fragment.objects.filter(structure=s).delete()
                     Rotamer.objects.filter(structure=s).delete()
                     Residue.objects.filter(protein_conformation=s.protein_conformation).delete()
+                    clear_gn_translation_cache([s.protein_conformation])
 
                     d = {}
 
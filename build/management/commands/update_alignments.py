@@ -8,6 +8,7 @@ from structure.models import StructureSegment
 from residue.models import Residue
 from residue.functions import *
 from common.alignment import Alignment
+from common.alignment_cache import invalidate_alignment_cache
 
 import os
 from collections import OrderedDict
@@ -41,6 +42,9 @@ class Command(BaseBuild):
         try:
             self.logger.info('UPDATING PROTEIN ALIGNMENTS')
             self.prepare_input(options['proc'], self.pconfs)
+
+            # cached alignments were built from the old residue positions
+            invalidate_alignment_cache()
             self.logger.info('COMPLETED UPDATING PROTEIN ALIGNMENTS')
         except Exception as msg:
             print(msg)
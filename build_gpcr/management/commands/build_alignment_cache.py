@@ -0,0 +1,5 @@
+from build.management.commands.build_alignment_cache import Command as BuildAlignmentCache
+
+
+class Command(BuildAlignmentCache):
+    pass
@@ -5,7 +5,7 @@ from django.conf import settings
 
 from protein.models import Protein, ProteinConformation, ProteinAnomaly, ProteinState, ProteinSegment
 from residue.models import Residue
-from residue.functions import dgn, ggn
+from residue.functions import dgn, ggn, get_gn_translation_table
 from structure.models import *
 from structure.functions import HSExposureCB, PdbStateIdentifier
 from common.alignment import AlignedReferenceTemplate, GProteinAlignment
@@ -469,8 +469,7 @@ class HomologyModeling(object):
         for seg in self.template_source:
             for num in self.template_source[seg]:
                 try:
-                    num = str(Residue.objects.get(protein_conformation=self.prot_conf,
-                                                  display_generic_number__label=dgn(num,self.prot_conf)).sequence_number)
+                    num = str(get_gn_translation_table(self.prot_conf).sequence_number(num))
                 except:
                     if self.complex and seg not in gpcr_segments:
                         try:
@@ -2230,7 +2229,7 @@ class HomologyModeling(object):
                 first_temp = self.template_source[seg][first_gn][0]
                 if 'x' in first_gn:
                     try:
-                        first_seqnum = Residue.objects.get(protein_conformation=self.prot_conf,display_generic_number__label=dgn(list_keys[0],self.prot_conf)).sequence_number
+                        first_seqnum = get_gn_translation_table(self.prot_conf).sequence_number(list_keys[0])
                     except:
                         try:
                             first_seqnum = int(list_keys[0])
@@ -2244,7 +2243,7 @@ class HomologyModeling(object):
                 for gn, res in resis.items():
                     key = gn
                     if 'x' in gn:
-                        seq_num = Residue.objects.get(protein_conformation=self.prot_conf,display_generic_number__label=dgn(gn,self.prot_conf)).sequence_number
+                        seq_num = get_gn_translation_table(self.prot_conf).sequence_number(gn)
                         curr_seqnum = seq_num
                     elif self.complex and first_gn!=None and len(first_gn.split('.'))==3:
                         seq_num = Residue.objects.get(protein_conformation=self.signprot_protconf,display_generic_number__label=gn).sequence_number
@@ -3230,27 +3229,19 @@ class HelixEndsModeling(HomologyModeling):
                 if ref_seg!='H8':
                     continue
             if ref_seg=='H8' and H8_alt!=None:
-                first_res = Residue.objects.get(protein_conformation=H8_alt.protein_conformation, 
-                                                display_generic_number__label=dgn(raw_helix_ends[ref_seg][0],
-                                                                                  H8_alt.protein_conformation)).sequence_number
+                first_res = get_gn_translation_table(H8_alt.protein_conformation).sequence_number(raw_helix_ends[ref_seg][0])
                 for h in list(a.template_dict[temp_seg].keys())[::-1]:
                     if a.template_dict[temp_seg][h]!='x':
                         raw_helix_ends[ref_seg][1]=h
                         break
-                last_res = Residue.objects.get(protein_conformation=H8_alt.protein_conformation, 
-                                               display_generic_number__label=dgn(raw_helix_ends[ref_seg][1],
-                                                                                 H8_alt.protein_conformation)).sequence_number
+                last_res = get_gn_translation_table(H8_alt.protein_conformation).sequence_number(raw_helix_ends[ref_seg][1])
                 temp_seg_seq_len = len(list(Residue.objects.filter(protein_conformation=H8_alt.protein_conformation, 
                                                                    sequence_number__in=range(first_res,last_res+1))))
                 mid = temp_seg_seq_len/2
 
             elif ref_seg[0]=='T':
-                first_res = Residue.objects.get(protein_conformation=main_structure.protein_conformation, 
-                                                display_generic_number__label=dgn(raw_helix_ends[ref_seg][0],
-                                                                                  main_structure.protein_conformation)).sequence_number
-                last_res = Residue.objects.get(protein_conformation=main_structure.protein_conformation, 
-                                               display_generic_number__label=dgn(raw_helix_ends[ref_seg][1],
-                                                                                 main_structure.protein_conformation)).sequence_number
+                first_res = get_gn_translation_table(main_structure.protein_conformation).sequence_number(raw_helix_ends[ref_seg][0])
+                last_res = get_gn_translation_table(main_structure.protein_conformation).sequence_number(raw_helix_ends[ref_seg][1])
                 temp_seg_seq_len = len(list(Residue.objects.filter(protein_conformation=main_structure.protein_conformation, 
                                                                    sequence_number__in=range(first_res,last_res+1))))
                 mid = temp_seg_seq_len/2
@@ -3577,9 +3568,7 @@ class Loops(object):
                                 break_count = 0
                                 while b_num_found==False and break_count<30:
                                     try:
-                                        b_num = Residue.objects.get(protein_conformation=template.protein_conformation,
-                                                                    display_generic_number__label=dgn(alt_last_before_gn,
-                                                                                                      template.protein_conformation)).sequence_number
+                                        b_num = get_gn_translation_table(template.protein_conformation).sequence_number(alt_last_before_gn)
                                         b_num_found = True
                                     except:
                                         alt_last_before_gn = parse.gn_indecer(alt_last_before_gn,'x',-1)
@@ -3589,20 +3578,14 @@ class Loops(object):
                                 break_count = 0
                                 while a_num_found==False and break_count<30:
                                     try:
-                                        a_num = Residue.objects.get(protein_conformation=template.protein_conformation,
-                                                                    display_generic_number__label=dgn(alt_first_after_gn,
-                                                                                                      template.protein_conformation)).sequence_number
+                                        a_num = get_gn_translation_table(template.protein_conformation).sequence_number(alt_first_after_gn)
                                         a_num_found = True
                                     except:
                                         alt_first_after_gn = parse.gn_indecer(alt_first_after_gn,'x',1)
                                         break_count+=1
                             else:
-                                b_num = Residue.objects.get(protein_conformation=template.protein_conformation,
-                                                            display_generic_number__label=dgn(last_before_gn,
-                                                                    template.protein_conformation)).sequence_number                               
-                                a_num = Residue.objects.get(protein_conformation=template.protein_conformation,
-                                                            display_generic_number__label=dgn(first_after_gn,
-                                                                    template.protein_conformation)).sequence_number
+                                b_num = get_gn_translation_table(template.protein_conformation).sequence_number(last_before_gn)                               
+                                a_num = get_gn_translation_table(template.protein_conformation).sequence_number(first_after_gn)
                             before4 = Residue.objects.filter(protein_conformation=template.protein_conformation, 
                                                              sequence_number__in=[b_num,b_num-1,b_num-2,b_num-3])
                             after4 = Residue.objects.filter(protein_conformation=template.protein_conformation, 
@@ -3740,9 +3723,7 @@ class Loops(object):
                                     continue
                         else:
                             try:
-                                b_num = Residue.objects.get(protein_conformation=first_temp.protein_conformation,
-                                                            display_generic_number__label=dgn(last_before_gn,
-                                                                                              first_temp.protein_conformation)).sequence_number
+                                b_num = get_gn_translation_table(first_temp.protein_conformation).sequence_number(last_before_gn)
                                 before4 = Residue.objects.filter(protein_conformation=first_temp.protein_conformation, 
                                                                  sequence_number__in=[b_num,b_num-1,b_num-2,b_num-3])
                                 alt_mid1 = Residue.objects.filter(protein_conformation=first_temp.protein_conformation,
@@ -3795,9 +3776,7 @@ class Loops(object):
                                     continue
                         else:
                             try:                                
-                                a_num = Residue.objects.get(protein_conformation=second_temp.protein_conformation,
-                                                            display_generic_number__label=dgn(first_after_gn,
-                                                                                              second_temp.protein_conformation)).sequence_number
+                                a_num = get_gn_translation_table(second_temp.protein_conformation).sequence_number(first_after_gn)
                                 after4 = Residue.objects.filter(protein_conformation=second_temp.protein_conformation, 
                                                                 sequence_number__in=[a_num,a_num+1,a_num+2,a_num+3])
                                 alt_mid2 = Residue.objects.filter(protein_conformation=second_temp.protein_conformation,
@@ -4404,9 +4383,7 @@ class Bulges(object):
         self.template = None
         
     def check_range(self, gn_list, protein_conformation, num):
-        check = [dgn(i,protein_conformation) for i in gn_list]
-        check_list = [i.sequence_number for i in list(Residue.objects.filter(protein_conformation=protein_conformation,
-                                                                             display_generic_number__label__in=check))]
+        check_list = sorted(get_gn_translation_table(protein_conformation).sequence_numbers(gn_list))
         ref_list = list(range(check_list[0],check_list[0]+num))
         if ref_list==check_list:
             return 1
@@ -4544,9 +4521,8 @@ class GPCRDBParsingPDB(object):
     def gn_comparer(self, gn1, gn2, protein_conformation):
         '''
         '''
-        res1 = Residue.objects.get(protein_conformation=protein_conformation, display_generic_number__label=dgn(gn1,protein_conformation))
-        res2 = Residue.objects.get(protein_conformation=protein_conformation, display_generic_number__label=dgn(gn2,protein_conformation))
-        return res1.sequence_number-res2.sequence_number
+        gn_table = get_gn_translation_table(protein_conformation)
+        return gn_table.sequence_number(gn1)-gn_table.sequence_number(gn2)
             
     def gn_indecer(self, gn, delimiter, direction):
         ''' Get an upstream or downstream generic number from reference generic number.
@@ -4576,21 +4552,26 @@ class GPCRDBParsingPDB(object):
         '''
         output = OrderedDict()
         atoms_list = []
+        # residues of all generic numbers resolved from the translation table, rotamers fetched in one query
+        gn_table = get_gn_translation_table(structure.protein_conformation)
+        residue_ids = []
         for gn in generic_numbers:
-            rotamer=None
-            if 'x' in str(gn):      
-                rotamer = list(Rotamer.objects.filter(structure__protein_conformation=structure.protein_conformation, 
-                        residue__display_generic_number__label=dgn(gn,structure.protein_conformation), 
-                        structure__preferred_chain=structure.preferred_chain))
+            if 'x' in str(gn):
+                residue_ids.append(gn_table.residue_id(gn))
             else:
-                rotamer = list(Rotamer.objects.filter(structure__protein_conformation=structure.protein_conformation, 
-                        residue__sequence_number=gn, structure__preferred_chain=structure.preferred_chain))
-                if just_nums==False:
-                    try:
-                        gn = ggn(Residue.objects.get(protein_conformation=structure.protein_conformation,
-                                                    sequence_number=gn).display_generic_number.label)
-                    except:
-                        pass
+                residue = gn_table.residue_by_sequence_number(gn)
+                residue_ids.append(residue[0] if residue else None)
+        rotamers = OrderedDict()
+        for rotamer in Rotamer.objects.filter(structure__protein_conformation=structure.protein_conformation,
+                residue_id__in=[i for i in residue_ids if i], structure__preferred_chain=structure.preferred_chain
+                ).select_related('pdbdata').order_by('id'):
+            rotamers.setdefault(rotamer.residue_id, []).append(rotamer)
+        for gn, residue_id in zip(generic_numbers, residue_ids):
+            rotamer = rotamers.get(residue_id, [])
+            if 'x' not in str(gn) and just_nums==False:
+                residue = gn_table.residue_by_sequence_number(gn)
+                if residue and residue[3]:
+                    gn = ggn(residue[3])
             if len(rotamer)>1:
                 for i in rotamer:
                     if i.pdbdata.pdb.startswith('COMPND')==False:
@@ -0,0 +1,5 @@
+from build.management.commands.build_ligand_summary import Command as BuildLigandSummary
+
+
+class Command(BuildLigandSummary):
+    pass
@@ -0,0 +1,5 @@
+from build.management.commands.build_mutation_design import Command as BuildMutationDesign
+
+
+class Command(BuildMutationDesign):
+    pass
@@ -0,0 +1,5 @@
+from build.management.commands.build_protein_cards import Command as BuildProteinCards
+
+
+class Command(BuildProteinCards):
+    pass
@@ -0,0 +1,5 @@
+from build.management.commands.build_structure_store import Command as BuildStructureStore
+
+
+class Command(BuildStructureStore):
+    pass
@@ -799,7 +799,10 @@ class Alignment:
                 self.proteins[i].similarity_score = similarity_score
                 i+=1
             
-        # order protein list by similarity score
+        self.order_by_similarity()
+
+    def order_by_similarity(self):
+        """Order protein list by similarity score, keeping the reference first"""
         ref = self.proteins.pop(0)
         order_by_value = int(getattr(self.proteins[0], self.order_by))
         if order_by_value:
@@ -0,0 +1,108 @@
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import Sum
+from django.utils import timezone
+
+from alignment.models import CachedAlignment
+
+import datetime
+import hashlib
+import logging
+import pickle
+import zlib
+
+
+logger = logging.getLogger('protwis')
+
+# total size (bytes) of stored alignments, least recently used alignments are evicted above this
+ALIGNMENT_CACHE_MAX_SIZE = getattr(settings, 'ALIGNMENT_CACHE_MAX_SIZE', 2 * 1024 ** 3)
+
+# last_used is only updated when it is older than this (seconds), so that cache hits do not write to the database
+ALIGNMENT_CACHE_TOUCH_INTERVAL = 60
+
+
+def alignment_key(a):
+    """A canonical key for the proteins, segments, numbering scheme and settings loaded into an alignment"""
+    parts = [
+        a.__class__.__module__ + '.' + a.__class__.__name__,
+        'ref' + str(a.proteins[0].pk) if a.reference and a.proteins else '',
+        ','.join(str(pk) for pk in sorted(pc.pk for pc in a.proteins)),
+        ';'.join(segment + ':' + ','.join(positions) for segment, positions in a.segments.items()),
+        ','.join(sorted(a.segments_only_alignable)),
+        a.default_numbering_scheme.slug,
+        ','.join(ns[0] for ns in a.numbering_schemes),
+        'padding' if a.show_padding else 'no_padding',
+        a.order_by,
+        'groups' if a.use_residue_groups else '',
+        'no_alternative' if a.ignore_alternative_residue_numbering_schemes else '',
+    ]
+    return 'ALIGNMENT_' + hashlib.md5('|'.join(parts).encode('utf-8')).hexdigest()
+
+
+def get_cached_alignment(key):
+    """Load a built alignment from the cache, None if it is not there"""
+    try:
+        ca = CachedAlignment.objects.get(key=key)
+    except CachedAlignment.DoesNotExist:
+        return None
+
+    try:
+        a = pickle.loads(zlib.decompress(ca.alignment))
+    except Exception as msg:
+        logger.warning('Could not load cached alignment {}: {}'.format(key, msg))
+        ca.delete()
+        return None
+    now = timezone.now()
+    if now - ca.last_used > datetime.timedelta(seconds=ALIGNMENT_CACHE_TOUCH_INTERVAL):
+        CachedAlignment.objects.filter(pk=ca.pk).update(last_used=now)
+    return a
+
+
+def cache_alignment(key, a):
+    """Store a built alignment, evicting the least recently used alignments if the cache is full"""
+    data = zlib.compress(pickle.dumps(a, pickle.HIGHEST_PROTOCOL))
+    if len(data) > ALIGNMENT_CACHE_MAX_SIZE:
+        return
+    try:
+        CachedAlignment.objects.update_or_create(key=key, defaults={'alignment': data, 'size': len(data),
+            'last_used': timezone.now()})
+    except IntegrityError:
+        # stored by another request that built the same alignment at the same time
+        return
+    evict_alignments()
+
+
+def evict_alignments(max_size=ALIGNMENT_CACHE_MAX_SIZE):
+    """Delete least recently used alignments until the cache is within max_size"""
+    total_size = CachedAlignment.objects.aggregate(total=Sum('size'))['total'] or 0
+    if total_size <= max_size:
+        return
+    evict = []
+    for pk, size in CachedAlignment.objects.order_by('last_used').values_list('pk', 'size'):
+        if total_size <= max_size:
+            break
+        evict.append(pk)
+        total_size -= size
+    CachedAlignment.objects.filter(pk__in=evict).delete()
+
+
+def invalidate_alignment_cache():
+    """Remove all cached alignments, used by build commands that change residues"""
+    CachedAlignment.objects.all().delete()
+
+
+def get_or_build_alignment(a, similarity=False):
+    """Return the cached version of an alignment with the same proteins and segments loaded as a, or build it,
+    calculate statistics and cache it. With similarity, the identity and similarity of each protein to the reference
+    are calculated (and cached) as well"""
+    key = alignment_key(a) + ('_SIMILARITY' if similarity else '')
+    cached = get_cached_alignment(key)
+    if cached is not None:
+        return cached
+
+    a.build_alignment()
+    a.calculate_statistics()
+    if similarity:
+        a.calculate_similarity()
+    cache_alignment(key, a)
+    return a
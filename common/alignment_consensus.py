@@ -0,0 +1,169 @@
+from django.conf import settings
+
+from alignment.models import AlignmentConsensus
+from common.cache_backend import current_data_release
+
+from collections import OrderedDict
+from io import BytesIO
+import json
+import logging
+import threading
+
+import numpy as np
+
+
+logger = logging.getLogger('protwis')
+
+# version of the stored consensus format, consensus rows with another version are rebuilt on demand
+CONSENSUS_SCHEMA_VERSION = 1
+
+# number of loaded consensus alignments kept in each process
+CONSENSUS_CACHE_SIZE = getattr(settings, 'CONSENSUS_CACHE_SIZE', 64)
+
+# loaded consensus alignments by (data release, slug), entries of older releases are no longer used and drop out
+consensus_cache = OrderedDict()
+consensus_lock = threading.Lock()
+
+
+class ConsensusData(object):
+    """The consensus and amino acid counts of a family alignment, stored as columns over its generic numbers (in
+    the order of the consensus sequence). The columns are read from the stored data when first used."""
+
+    def __init__(self, meta, arrays):
+        self.version = meta['version']
+        self.num_proteins = meta['num_proteins']
+        self.segments = meta['segments']
+        self.amino_acids = meta['amino_acids']
+        self._arrays = arrays
+        self._columns = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_alignment(cls, a):
+        """Columns of an Alignment with calculated statistics"""
+        segments = list(a.consensus.keys())
+        amino_acids = list(a.amino_acids)
+        columns = OrderedDict([('segment', []), ('generic_number', []), ('consensus', []), ('interval', []),
+            ('frequency', []), ('forced_consensus', []), ('aa_count', [])])
+        for s_id, segment in enumerate(segments):
+            for gn, consensus in a.consensus[segment].items():
+                columns['segment'].append(s_id)
+                columns['generic_number'].append(gn)
+                columns['consensus'].append(consensus[0])
+                columns['interval'].append(consensus[1])
+                columns['frequency'].append(consensus[2])
+                columns['forced_consensus'].append(a.forced_consensus[segment][gn])
+                columns['aa_count'].append([a.aa_count[segment][gn][aa] for aa in amino_acids])
+        arrays = {
+            'segment': np.array(columns['segment'], dtype=np.int32),
+            'generic_number': np.array(columns['generic_number'], dtype=str),
+            'consensus': np.array(columns['consensus'], dtype=str),
+            'interval': np.array(columns['interval'], dtype=str),
+            'frequency': np.array(columns['frequency'], dtype=np.int32),
+            'forced_consensus': np.array(columns['forced_consensus'], dtype=str),
+            'aa_count': np.array(columns['aa_count'], dtype=np.int32).reshape(-1, len(amino_acids)),
+        }
+        meta = {'version': CONSENSUS_SCHEMA_VERSION, 'num_proteins': len(a.proteins), 'segments': segments,
+            'amino_acids': amino_acids}
+        return cls(meta, arrays)
+
+    @classmethod
+    def loads(cls, data):
+        """Read stored consensus data, the columns stay compressed until they are used"""
+        arrays = np.load(BytesIO(data), allow_pickle=False)
+        meta = json.loads(arrays['meta'].item())
+        return cls(meta, arrays)
+
+    def dumps(self):
+        output = BytesIO()
+        meta = {'version': self.version, 'num_proteins': self.num_proteins, 'segments': self.segments,
+            'amino_acids': self.amino_acids}
+        np.savez_compressed(output, meta=np.array(json.dumps(meta)), **dict((name, self.column(name)) for name in
+            ('segment', 'generic_number', 'consensus', 'interval', 'frequency', 'forced_consensus', 'aa_count')))
+        return output.getvalue()
+
+    def column(self, name):
+        with self._lock:
+            if name not in self._columns:
+                self._columns[name] = self._arrays[name]
+            return self._columns[name]
+
+    def positions(self):
+        """(segment, generic number) of each column"""
+        return [(self.segments[s_id], gn) for s_id, gn in zip(self.column('segment').tolist(),
+            self.column('generic_number').tolist())]
+
+    @property
+    def consensus(self):
+        """Consensus sequence per segment, generic number -> [amino acid, conservation interval, frequency]"""
+        consensus = OrderedDict([(segment, OrderedDict()) for segment in self.segments])
+        for (segment, gn), aa, interval, frequency in zip(self.positions(), self.column('consensus').tolist(),
+            self.column('interval').tolist(), self.column('frequency').tolist()):
+            consensus[segment][gn] = [aa, interval, frequency]
+        return consensus
+
+    @property
+    def forced_consensus(self):
+        """Consensus sequence per segment without ties, generic number -> amino acid"""
+        forced_consensus = OrderedDict([(segment, OrderedDict()) for segment in self.segments])
+        for (segment, gn), aa in zip(self.positions(), self.column('forced_consensus').tolist()):
+            forced_consensus[segment][gn] = aa
+        return forced_consensus
+
+    def conservation(self):
+        """Consensus amino acid, conservation interval and the count and fraction of each amino acid, for the
+        generic numbers of the alignment (1x50 etc.)"""
+        aa_count = self.column('aa_count')
+        conservation = {}
+        for i, ((segment, gn), aa, interval) in enumerate(zip(self.positions(), self.column('consensus').tolist(),
+            self.column('interval').tolist())):
+            if 'x' not in gn:
+                continue
+            aa_count_dict = {}
+            for a_id in np.nonzero(aa_count[i])[0].tolist():
+                num = int(aa_count[i][a_id])
+                aa_count_dict[self.amino_acids[a_id]] = (num, round(num/self.num_proteins, 3))
+            conservation[gn] = [aa, interval, aa_count_dict]
+        return conservation
+
+
+def store_consensus(slug, a):
+    """Store the consensus of an alignment with calculated statistics"""
+    data = ConsensusData.from_alignment(a).dumps()
+    AlignmentConsensus.objects.update_or_create(slug=slug, defaults={'alignment': data,
+        'version': CONSENSUS_SCHEMA_VERSION})
+    with consensus_lock:
+        for key in [key for key in consensus_cache if key[1] == slug]:
+            del consensus_cache[key]
+
+
+def get_consensus(slug):
+    """The stored consensus of a family as ConsensusData, kept in an in-process LRU. None if there is no consensus
+    of the current format."""
+    key = (current_data_release(), slug)
+    with consensus_lock:
+        if key in consensus_cache:
+            consensus_cache.move_to_end(key)
+            return consensus_cache[key]
+
+    row = AlignmentConsensus.objects.filter(slug=slug, version=CONSENSUS_SCHEMA_VERSION).values_list('alignment',
+        flat=True).first()
+    if row is None:
+        return None
+    try:
+        consensus = ConsensusData.loads(bytes(row))
+    except Exception as msg:
+        logger.warning('Could not load consensus {}: {}'.format(slug, msg))
+        return None
+
+    with consensus_lock:
+        consensus_cache[key] = consensus
+        while len(consensus_cache) > CONSENSUS_CACHE_SIZE:
+            consensus_cache.popitem(last=False)
+    return consensus
+
+
+def clear_consensus_cache():
+    """Empty the in-process consensus cache, used when the consensus alignments are rebuilt"""
+    with consensus_lock:
+        consensus_cache.clear()
@@ -1,4 +1,5 @@
 from common.alignment import Alignment as GenericAlignment
+from common.alignment_matrix import AlignmentMatrix as GenericAlignmentMatrix
 
 from copy import deepcopy
 
@@ -77,4 +78,9 @@ class Alignment(GenericAlignment):
             # structure-based number
             formatted_gn += 'x{:s}'.format(str_num)
         
-        return formatted_gn
\ No newline at end of file
+        return formatted_gn
+
+
+class AlignmentMatrix(GenericAlignmentMatrix, Alignment):
+    """A code matrix backed alignment, with the generic number formatting of the alignment viewer"""
+    pass
@@ -0,0 +1,615 @@
+from django.conf import settings
+
+from common.alignment import Alignment
+from common.definitions import AMINO_ACIDS, AMINO_ACID_GROUPS, AMINO_ACID_GROUP_NAMES
+from residue.models import Residue, ResidueGenericNumber
+
+from collections import OrderedDict
+from collections.abc import Mapping
+from Bio.SubsMat import MatrixInfo
+import string
+
+import numpy as np
+
+
+# residue code alphabet, the index of a symbol is the uint8 code stored in the alignment matrix. The first
+# len(AMINO_ACIDS) codes are the ones collected in statistics (the gap symbol '-' is one of them)
+ALIGNMENT_ALPHABET = list(AMINO_ACIDS.keys()) + ['_'] + [c for c in string.ascii_uppercase if c not in AMINO_ACIDS]
+NUM_STAT_CODES = len(AMINO_ACIDS)
+GAP_CODE = ALIGNMENT_ALPHABET.index('-')
+PADDING_CODE = ALIGNMENT_ALPHABET.index('_')
+UNKNOWN_CODE = ALIGNMENT_ALPHABET.index('X')
+EMPTY_CODE = 255 # placeholder for cells that have not been filled yet
+
+# version of the alignment viewer payload (see AlignmentMatrix.payload_header)
+PAYLOAD_VERSION = 1
+
+# byte -> code lookup table, anything that is not in the alphabet is encoded as X
+CODE_LOOKUP = np.full(256, UNKNOWN_CODE, dtype=np.uint8)
+for code, symbol in enumerate(ALIGNMENT_ALPHABET):
+    CODE_LOOKUP[ord(symbol)] = code
+SYMBOLS = np.array(ALIGNMENT_ALPHABET + ['X'] * (256 - len(ALIGNMENT_ALPHABET)))
+
+# membership of each statistics code in the amino acid feature groups (features x codes)
+FEATURE_MATRIX = np.array([[aa in members for aa in AMINO_ACIDS] for members in AMINO_ACID_GROUPS.values()],
+    dtype=np.int32)
+
+# BLOSUM62 scores between codes, pairs that are not in the matrix (and gaps) score 0
+BLOSUM62_SCORES = np.zeros((len(ALIGNMENT_ALPHABET), len(ALIGNMENT_ALPHABET)), dtype=np.int32)
+for (aa_1, aa_2), score in MatrixInfo.blosum62.items():
+    if aa_1 in ALIGNMENT_ALPHABET and aa_2 in ALIGNMENT_ALPHABET:
+        BLOSUM62_SCORES[ALIGNMENT_ALPHABET.index(aa_1), ALIGNMENT_ALPHABET.index(aa_2)] = score
+        BLOSUM62_SCORES[ALIGNMENT_ALPHABET.index(aa_2), ALIGNMENT_ALPHABET.index(aa_1)] = score
+BLOSUM62_SIMILAR = (BLOSUM62_SCORES > 0).astype(np.int32)
+
+
+def encode_sequence(sequence):
+    """Encode a sequence string (one letter codes) as an array of alignment codes"""
+    return CODE_LOOKUP[np.frombuffer(sequence.encode('ascii', 'replace'), dtype=np.uint8)]
+
+
+def decode_sequence(codes):
+    """Decode an array of alignment codes into a sequence string"""
+    return ''.join(SYMBOLS[codes])
+
+
+def stat_codes(codes):
+    """Map padding to gaps, so that both are counted as '-' in statistics"""
+    codes = codes.copy()
+    codes[codes == PADDING_CODE] = GAP_CODE
+    return codes
+
+
+def code_counts(codes):
+    """Count the statistics codes in each column of a code matrix (codes x columns)"""
+    codes = stat_codes(codes)
+    return np.array([(codes == c).sum(axis=0) for c in range(NUM_STAT_CODES)], dtype=np.int32).reshape(
+        NUM_STAT_CODES, codes.shape[1])
+
+
+def first_to_reach(column, candidates, count):
+    """Of the codes in candidates, return the one whose count-th occurrence comes first in the column"""
+    return min(candidates, key=lambda c: np.flatnonzero(column == c)[count - 1])
+
+
+def pairwise_similarity_counts(codes_1, codes_2):
+    """Compare every row of codes_1 with every row of codes_2 (see Alignment.pairwise_similarity). Returns the
+    number of identical positions, positions with a positive BLOSUM62 score, the summed BLOSUM62 score and the
+    number of compared positions (not gapped in both sequences) as integer arrays of shape (rows_1, rows_2)"""
+    # the products are done in float32 to use BLAS, they are exact as long as the sums stay below 2**24
+    gaps_1 = ((codes_1 == GAP_CODE) | (codes_1 == PADDING_CODE)).astype(np.float32)
+    gaps_2 = ((codes_2 == GAP_CODE) | (codes_2 == PADDING_CODE)).astype(np.float32)
+    compared = codes_1.shape[1] - gaps_1.dot(gaps_2.T)
+
+    identities = np.zeros(compared.shape, dtype=np.float32)
+    similarities = np.zeros(compared.shape, dtype=np.float32)
+    scores = np.zeros(compared.shape, dtype=np.float32)
+    for code in np.unique(codes_1[gaps_1 == 0]).tolist():
+        present = (codes_1 == code).astype(np.float32)
+        identities += present.dot((codes_2 == code).astype(np.float32).T)
+        similarities += present.dot(BLOSUM62_SIMILAR[code][codes_2].astype(np.float32).T)
+        scores += present.dot(BLOSUM62_SCORES[code][codes_2].astype(np.float32).T)
+    return (np.rint(identities).astype(np.int64), np.rint(similarities).astype(np.int64),
+        np.rint(scores).astype(np.int64), np.rint(compared).astype(np.int64))
+
+
+def format_percentages(counts, compared):
+    """Percentages formatted like Alignment.pairwise_similarity, '0' where nothing was compared"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percentages = np.where(compared > 0, counts / compared * 100, 0)
+    return [["{:10.0f}".format(v) for v in row] for row in percentages.tolist()]
+
+
+class MatrixAlignmentRow(Mapping):
+    """A row of an AlignmentMatrix that looks like the segment dict of Alignment.build_alignment.
+    Cells are only materialized when a segment is accessed, and are kept after that."""
+    def __init__(self, alignment, row):
+        self.a = alignment
+        self.row = row
+        self.materialized = {}
+
+    def __getitem__(self, segment):
+        if segment not in self.materialized:
+            if segment not in self.a.segment_slices:
+                raise KeyError(segment)
+            self.materialized[segment] = self.a.row_cells(self.row, segment)
+        return self.materialized[segment]
+
+    def __iter__(self):
+        return iter(self.a.segment_slices)
+
+    def __len__(self):
+        return len(self.a.segment_slices)
+
+    def __getstate__(self):
+        # materialized cells can be recreated from the matrix, don't store them
+        return {'a': self.a, 'row': self.row, 'materialized': {}}
+
+
+class AlignmentMatrix(Alignment):
+    """An Alignment that holds residues in a dense uint8 code matrix (proteins x positions) instead of nested dicts
+    of Residue objects, and calculates statistics with column reductions"""
+    residue_fields = ('id', 'protein_conformation_id', 'protein_segment__slug', 'protein_segment__category',
+        'generic_number__label', 'display_generic_number_id', 'amino_acid', 'sequence_number')
+
+    def __init__(self):
+        super(AlignmentMatrix, self).__init__()
+        self.matrix = np.zeros((0, 0), dtype=np.uint8) # residue codes, proteins x positions
+        self.sequence_numbers = np.zeros((0, 0), dtype=np.int32) # 0 for gaps
+        self.display_numbers = np.zeros((0, 0), dtype=np.int32) # index in self.display_labels, -1 if none
+        self.display_labels = [] # (label, scheme short name) of display generic numbers
+        self.column_labels = [] # position label of each column
+        self.column_segments = np.zeros(0, dtype=np.int32) # index of the segment of each column
+        self.column_generic = np.zeros(0, dtype=bool) # True for columns with generic numbers
+        self.segment_slices = OrderedDict() # segment slug -> slice of columns
+
+    def residue_rows(self, rs):
+        """Split a values_list of residues into a dict of protein conformations, segments and position labels"""
+        proteins = {}
+        segment_counters = {}
+        aligned_residue_encountered = {}
+        for r in rs:
+            pcid = r[1]
+            ps = r[2]
+            if pcid not in proteins:
+                proteins[pcid] = {}
+                segment_counters[pcid] = {}
+                aligned_residue_encountered[pcid] = {}
+            if ps not in proteins[pcid]:
+                proteins[pcid][ps] = {}
+                aligned_residue_encountered[pcid][ps] = False
+
+            # what part of the segment is this? (see Alignment.build_alignment)
+            if r[4]:
+                segment_part = 1
+            elif ps in settings.REFERENCE_POSITIONS and not aligned_residue_encountered[pcid][ps]:
+                segment_part = 2
+            elif ps in settings.REFERENCE_POSITIONS and aligned_residue_encountered[pcid][ps]:
+                segment_part = 3
+            else:
+                segment_part = 4
+
+            # update segment counters
+            part_ps = ps + '_after' if segment_part == 3 else ps
+            segment_counters[pcid][part_ps] = segment_counters[pcid].get(part_ps, 0) + 1
+
+            if r[4]:
+                proteins[pcid][ps][r[4]] = r
+                aligned_residue_encountered[pcid][ps] = True
+            else:
+                if segment_part == 2:
+                    prefix = '00-'
+                elif segment_part == 3:
+                    prefix = 'zz-'
+                else:
+                    prefix = '01-'
+                index = str("%04d" % (segment_counters[pcid][part_ps],))
+                proteins[pcid][ps][prefix + ps + "-" + index] = r
+
+        # correct alignment of split segments
+        for pcid, segments in proteins.items():
+            for ps, positions in segments.items():
+                pos_num = 1
+                pos_num_after = 1
+                for pos_label in sorted(positions):
+                    r = positions[pos_label]
+                    right_align = False
+                    if (pos_label.startswith('01-')
+                        and r[3] != 'terminus'
+                        and pos_num > (segment_counters[pcid][ps] / 2 + 0.5)):
+                        right_align = True
+                    elif (pos_label.startswith('00-')
+                        and not aligned_residue_encountered[pcid][ps]
+                        and pos_num > (segment_counters[pcid][ps] / 2 + 0.5)
+                        or r[2] == 'N-term'):
+                        right_align = True
+                    elif pos_label.startswith('01-') and r[2] == 'N-term':
+                        right_align = True
+
+                    if right_align:
+                        updated_index = 'zz' + pos_label[2:]
+                        positions[updated_index] = positions.pop(pos_label)
+                        pos_label = updated_index
+
+                    if pos_label.startswith('zz-'):
+                        segment_label_after = ps + '_after'
+                        if segment_label_after in segment_counters[pcid]:
+                            segment_length = segment_counters[pcid][segment_label_after]
+                            counter = pos_num_after
+                        else:
+                            segment_length = segment_counters[pcid][ps]
+                            counter = pos_num
+
+                        updated_index = pos_label[:-4] + str(9999 - (segment_length - counter))
+                        positions[updated_index] = positions.pop(pos_label)
+                        pos_label = updated_index
+                        pos_num_after += 1
+                    if pos_label not in self.segments[ps]:
+                        self.segments[ps].append(pos_label)
+                    pos_num += 1
+        return proteins
+
+    def build_alignment(self):
+        """Fetch selected residues from DB and build the alignment code matrix"""
+        rs = Residue.objects.filter(protein_segment__slug__in=self.segments, protein_conformation__in=self.proteins)
+
+        # If segment flagged to only include the alignable residues, exclude the ones with GN
+        for s in self.segments_only_alignable:
+            rs = rs.exclude(protein_segment__slug=s, generic_number=None)
+        rs = list(rs.order_by('protein_conformation', 'sequence_number').values_list(*self.residue_fields))
+        self.number_of_residues_total = len(rs)
+
+        proteins = self.residue_rows(rs)
+
+        # individually selected residues (Custom segment)
+        for segment in self.segments:
+            if segment == self.custom_segment_label or self.use_residue_groups:
+                crs = Residue.objects.filter(generic_number__label__in=self.segments[segment],
+                    protein_conformation__in=self.proteins).values_list(*self.residue_fields)
+                for r in crs:
+                    proteins.setdefault(r[1], {}).setdefault(segment, {})[r[4]] = r
+
+        # remove split segments from segment list and order segment positions
+        for segment in [s for s in self.segments if len(s.split("_")) > 1]:
+            del self.segments[segment]
+        for segment, positions in self.segments.items():
+            self.segments[segment] = sorted(positions, key=lambda x: x.split('x'))
+
+        # column index arrays
+        self.column_labels = []
+        column_segments = []
+        column_lookup = {}
+        for i, (segment, positions) in enumerate(self.segments.items()):
+            self.segment_slices[segment] = slice(len(self.column_labels), len(self.column_labels) + len(positions))
+            for pos in positions:
+                column_lookup[(segment, pos)] = len(self.column_labels)
+                self.column_labels.append(pos)
+                column_segments.append(i)
+        self.column_segments = np.array(column_segments, dtype=np.int32)
+        self.column_generic = np.array([not p[:3] in ('00-', '01-', 'zz-') for p in self.column_labels], dtype=bool)
+
+        # fill the matrix
+        num_rows, num_columns = len(self.proteins), len(self.column_labels)
+        self.matrix = np.full((num_rows, num_columns), EMPTY_CODE, dtype=np.uint8)
+        self.sequence_numbers = np.zeros((num_rows, num_columns), dtype=np.int32)
+        self.display_numbers = np.full((num_rows, num_columns), -1, dtype=np.int32)
+        display_lookup = {}
+        residue_cells = {}
+        rows, columns, amino_acids, sequence_numbers, display_ids = [], [], [], [], []
+        for i, pc in enumerate(self.proteins):
+            for segment, positions in proteins.get(pc.pk, {}).items():
+                for pos, r in positions.items():
+                    column = column_lookup.get((segment, pos))
+                    if column is None:
+                        continue
+                    rows.append(i)
+                    columns.append(column)
+                    amino_acids.append(r[6] or 'X')
+                    sequence_numbers.append(r[7])
+                    if r[5]:
+                        if r[5] not in display_lookup:
+                            display_lookup[r[5]] = len(display_lookup)
+                        display_ids.append(display_lookup[r[5]])
+                    else:
+                        display_ids.append(-1)
+                    if r[4]:
+                        residue_cells.setdefault(r[0], []).append((i, column))
+        rows = np.array(rows, dtype=np.intp)
+        columns = np.array(columns, dtype=np.intp)
+        display_ids = np.array(display_ids, dtype=np.int32)
+        self.matrix[rows, columns] = encode_sequence(''.join(amino_acids))
+        self.sequence_numbers[rows, columns] = sequence_numbers
+        self.display_numbers[rows, columns] = display_ids
+
+        # display generic numbers, one query for all of them
+        display_objs = ResidueGenericNumber.objects.select_related('scheme').in_bulk(list(display_lookup))
+        self.display_labels = [None] * len(display_lookup)
+        for display_id, index in display_lookup.items():
+            self.display_labels[index] = (display_objs[display_id].label, display_objs[display_id].scheme.short_name)
+
+        self.pad_gaps()
+        self.collect_generic_numbers(rows, columns, display_ids, display_objs, display_lookup, residue_cells)
+
+        for i, pc in enumerate(self.proteins):
+            pc.alignment = MatrixAlignmentRow(self, i)
+        self.sort_generic_numbers()
+        self.merge_generic_numbers()
+        self.clear_empty_positions()
+
+    def pad_gaps(self):
+        """Fill empty cells with gap symbols, gaps at the beginning or end of a segment are padding"""
+        for segment, columns in self.segment_slices.items():
+            block = self.matrix[:, columns]
+            filled = block != EMPTY_CODE
+            if self.show_padding:
+                leading = ~np.logical_or.accumulate(filled, axis=1)
+                trailing = ~np.logical_or.accumulate(filled[:, ::-1], axis=1)[:, ::-1]
+                block[~filled] = GAP_CODE
+                block[leading | trailing] = PADDING_CODE
+            else:
+                block[~filled] = GAP_CODE
+            self.matrix[:, columns] = block
+
+    def collect_generic_numbers(self, rows, columns, display_ids, display_objs, display_lookup, residue_cells):
+        """Collect display numbers of each position in the numbering schemes of the selected proteins"""
+        scheme_slugs = [ns[0] for ns in self.numbering_schemes]
+        row_schemes = np.array([scheme_slugs.index(pc.protein.residue_numbering_scheme.slug)
+            for pc in self.proteins], dtype=np.intp)
+        column_segment_slugs = list(self.segment_slices)
+        display_index = {index: display_id for display_id, index in display_lookup.items()}
+        alternative_schemes = not self.ignore_alternative_residue_numbering_schemes and len(scheme_slugs) > 1
+
+        # unique (scheme, column, display number) combinations, in the order they appear in the matrix
+        num_columns = max(len(self.column_labels), 1)
+        num_displays = len(display_lookup) + 1
+        keys = (row_schemes[rows] * num_columns + columns) * num_displays + (display_ids + 1)
+        order = np.lexsort((columns, rows))
+        rows, columns = rows[order].tolist(), columns[order].tolist()
+        unique_keys, first = np.unique(keys[order], return_index=True)
+        events = [(rows[i], columns[i], 0, key % num_displays - 1, None)
+            for key, i in sorted(zip(unique_keys.tolist(), first.tolist()), key=lambda x: x[1])]
+
+        # display numbers for other numbering schemes of selected proteins, fetched in one query
+        if alternative_schemes and residue_cells:
+            through = Residue.alternative_generic_numbers.through
+            arns = through.objects.filter(residue__protein_conformation__in=self.proteins,
+                residue__generic_number__isnull=False, residuegenericnumber__scheme__slug__in=scheme_slugs).values_list(
+                'residue_id', 'residuegenericnumber__label', 'residuegenericnumber__scheme__slug')
+            for residue_id, label, arn_slug in arns:
+                for row, column in residue_cells.get(residue_id, []):
+                    if arn_slug != scheme_slugs[row_schemes[row]]:
+                        events.append((row, column, 1, label, arn_slug))
+            events.sort(key=lambda x: x[:3])
+
+        # apply in the same order as Alignment.build_alignment (proteins, then positions)
+        for row, column, alternative, value, arn_slug in events:
+            segment = column_segment_slugs[self.column_segments[column]]
+            pos = self.column_labels[column]
+            if alternative:
+                self.generic_numbers[arn_slug][segment].setdefault(pos, []).append(value)
+                continue
+            generic_numbers = self.generic_numbers[scheme_slugs[row_schemes[row]]][segment]
+            if pos not in generic_numbers:
+                generic_numbers[pos] = []
+            if value >= 0:
+                if self.display_labels[value][0] not in generic_numbers[pos]:
+                    generic_numbers[pos].append(self.display_labels[value][0])
+                if self.column_generic[column] and pos not in self.generic_number_objs:
+                    self.generic_number_objs[pos] = display_objs[display_index[value]]
+            if alternative_schemes and not self.column_generic[column]:
+                for other_slug in scheme_slugs:
+                    if pos not in self.generic_numbers[other_slug][segment]:
+                        self.generic_numbers[other_slug][segment][pos] = []
+
+    def clear_empty_positions(self):
+        """Remove empty columns from the segments and matrix"""
+        filled = ((self.matrix != GAP_CODE) & (self.matrix != PADDING_CODE)).any(axis=0)
+        self.positions = list(OrderedDict.fromkeys(p for p, f in zip(self.column_labels, filled) if f))
+        positions = set(self.positions)
+        keep = np.array([p in positions for p in self.column_labels], dtype=bool)
+
+        for ns, segments in self.generic_numbers.items():
+            for segment, generic_numbers in segments.items():
+                for pos in [p for p in generic_numbers if p not in positions]:
+                    del generic_numbers[pos]
+        for segment in self.segments:
+            self.segments[segment] = [p for p in self.segments[segment] if p in positions]
+
+        self.matrix = self.matrix[:, keep]
+        self.sequence_numbers = self.sequence_numbers[:, keep]
+        self.display_numbers = self.display_numbers[:, keep]
+        self.column_labels = [p for p, k in zip(self.column_labels, keep) if k]
+        self.column_segments = self.column_segments[keep]
+        self.column_generic = self.column_generic[keep]
+        start = 0
+        for segment in self.segment_slices:
+            self.segment_slices[segment] = slice(start, start + len(self.segments[segment]))
+            start += len(self.segments[segment])
+
+    def row_cells(self, row, segment):
+        """Format the cells of one row and segment in the same way as Alignment.build_alignment"""
+        columns = self.segment_slices[segment]
+        cells = []
+        for column, code, sequence_number, display in zip(range(columns.start, columns.stop),
+            self.matrix[row, columns].tolist(), self.sequence_numbers[row, columns].tolist(),
+            self.display_numbers[row, columns].tolist()):
+            pos = self.column_labels[column]
+            if code == GAP_CODE or code == PADDING_CODE:
+                cells.append([pos, False, ALIGNMENT_ALPHABET[code], 0])
+            elif self.column_generic[column] and display >= 0:
+                label, scheme = self.display_labels[display]
+                cells.append([pos, label, ALIGNMENT_ALPHABET[code], scheme, sequence_number, pos])
+            else:
+                cells.append([pos, "", ALIGNMENT_ALPHABET[code], "", sequence_number])
+        return cells
+
+    def row_indices(self):
+        """Matrix rows of the currently loaded proteins, in their current order"""
+        return np.array([pc.alignment.row for pc in self.proteins], dtype=np.intp)
+
+    def ordered_positions(self, segment):
+        """Column indices of a segment in the order used for statistics (see Alignment.calculate_statistics)"""
+        columns = self.segment_slices[segment]
+        labels = self.column_labels[columns]
+        if segment == 'Custom':
+            order = sorted(range(len(labels)), key=lambda x: (labels[x].split("x")[0], labels[x].split("x")[1]))
+        else:
+            order = sorted(range(len(labels)), key=lambda x: labels[x])
+        return [columns.start + i for i in order]
+
+    def calculate_statistics(self):
+        """Calculate consesus sequence and amino acid and feature frequency with column reductions"""
+        self.amino_acids = list(AMINO_ACIDS.keys())
+        self.features = list(AMINO_ACID_GROUP_NAMES.values())
+
+        rows = self.row_indices()
+        matrix = stat_codes(self.matrix[rows])
+        num_proteins = len(self.proteins)
+        entry_names = np.array([pc.protein.entry_name for pc in self.proteins])
+
+        counts = code_counts(matrix)
+        feature_counts = FEATURE_MATRIX.dot(counts)
+        max_counts = counts.max(axis=0) if counts.size else np.zeros(0, dtype=np.int32)
+        most_frequent = counts.argmax(axis=0) if counts.size else np.zeros(0, dtype=np.int32)
+        num_most_frequent = (counts == max_counts).sum(axis=0)
+
+        # forced consensus sequence uses the residue that first reached the highest count to break ties
+        forced = most_frequent.tolist()
+        for column in np.flatnonzero(num_most_frequent > 1).tolist():
+            forced[column] = first_to_reach(matrix[:, column], np.flatnonzero(counts[:, column] == max_counts[column]),
+                int(max_counts[column]))
+
+        # amino acid counts in alignment order
+        for segment, columns in self.segment_slices.items():
+            self.aa_count[segment] = OrderedDict()
+            for column in range(columns.start, columns.stop):
+                pos = self.column_labels[column]
+                self.aa_count[segment][pos] = OrderedDict(zip(self.amino_acids, counts[:, column].tolist()))
+                if pos in self.generic_number_objs:
+                    column_codes = matrix[:, column]
+                    self.aa_count_with_protein[pos] = OrderedDict()
+                    for code in OrderedDict.fromkeys(column_codes.tolist()):
+                        if code < NUM_STAT_CODES:
+                            self.aa_count_with_protein[pos][self.amino_acids[code]] = list(
+                                OrderedDict.fromkeys(entry_names[column_codes == code].tolist()))
+
+        # consensus sequence
+        sequence_counter = 1
+        for segment in self.segment_slices:
+            self.consensus[segment] = OrderedDict()
+            self.forced_consensus[segment] = OrderedDict()
+            for column in self.ordered_positions(segment):
+                pos = self.column_labels[column]
+                frequency = round(int(max_counts[column]) / num_proteins * 100)
+                conservation = str(frequency)
+                cons_interval = '0' if len(conservation) == 1 else conservation[:-1]
+                self.forced_consensus[segment][pos] = self.amino_acids[forced[column]]
+                if num_most_frequent[column] == 1:
+                    self.consensus[segment][pos] = [self.amino_acids[forced[column]], cons_interval, frequency]
+                else:
+                    self.consensus[segment][pos] = ['+', cons_interval, frequency]
+
+                # create a residue object full consensus
+                res = Residue()
+                res.sequence_number = sequence_counter
+                if pos in self.generic_number_objs:
+                    res.display_generic_number = self.generic_number_objs[pos]
+                res.family_generic_number = pos
+                res.segment_slug = segment
+                res.amino_acid = self.amino_acids[forced[column]]
+                res.frequency = frequency
+                self.full_consensus.append(res)
+                sequence_counter += 1
+
+        # amino acid and feature frequency
+        ordered_columns = [self.ordered_positions(segment) for segment in self.segment_slices]
+        self.amino_acid_stats = self.frequency_stats(counts, ordered_columns, num_proteins)
+        self.feature_stats = self.frequency_stats(feature_counts, ordered_columns, num_proteins)
+
+    def frequency_stats(self, counts, ordered_columns, num_proteins):
+        """Format a matrix of counts (items x columns) as [frequency, interval] per item, segment and position"""
+        frequencies = np.round(counts / max(num_proteins, 1) * 100).astype(np.int64).tolist()
+        stats = []
+        for item_frequencies in frequencies:
+            item_stats = []
+            for columns in ordered_columns:
+                segment_stats = []
+                for column in columns:
+                    frequency = str(item_frequencies[column])
+                    segment_stats.append([frequency, '0' if len(frequency) == 1 else frequency[:-1]])
+                item_stats.append(segment_stats)
+            stats.append(item_stats)
+        return stats
+
+    def calculate_similarity(self, normalized=False):
+        """Calculate the sequence identity/similarity of every selected protein compared to a selected reference"""
+        if normalized:
+            return super(AlignmentMatrix, self).calculate_similarity(normalized)
+
+        codes = self.matrix[self.row_indices()]
+        identities, similarities, scores, compared = pairwise_similarity_counts(codes[:1], codes)
+        identity = format_percentages(identities, compared)[0]
+        similarity = format_percentages(similarities, compared)[0]
+        for i, protein in enumerate(self.proteins):
+            # skip the first row, as it is the reference
+            if i == 0 or not compared[0, i]:
+                continue
+            protein.identity = identity[i]
+            protein.similarity = similarity[i]
+            protein.similarity_score = int(scores[0, i])
+        self.order_by_similarity()
+
+    def calculate_similarity_matrix(self):
+        """Calculate a matrix of sequence identity/similarity for every selected protein, all pairs at once"""
+        codes = self.matrix[self.row_indices()]
+        identities, similarities, scores, compared = pairwise_similarity_counts(codes, codes)
+        identity = format_percentages(identities, compared)
+        similarity = format_percentages(similarities, compared)
+
+        self.similarity_matrix = OrderedDict()
+        for i, protein in enumerate(self.proteins):
+            protein_key = protein.protein.entry_name
+            protein_name = "[" + protein.protein.species.common_name + "] " + protein.protein.name
+            self.similarity_matrix[protein_key] = {'name': protein_name, 'values': []}
+            for k in range(len(self.proteins)):
+                # identity above the diagonal, similarity below it
+                if k == i:
+                    value = '-'
+                elif k < i:
+                    value = similarity[i][k].strip()
+                else:
+                    value = identity[i][k].strip()
+
+                if value == '-':
+                    color_class = "-"
+                else:
+                    if int(value) < 10:
+                        color_class = 0
+                    else:
+                        color_class = str(value)[:-1]
+                self.similarity_matrix[protein_key]['values'].append([value, color_class])
+
+    def payload_header(self):
+        """Proteins, segments and labels of the alignment, the part of the viewer payload that is not per segment"""
+        first_scheme = self.numbering_schemes[0] if self.numbering_schemes else ()
+        signprot = ('Common G-alpha numbering scheme' in first_scheme or
+            'Common arrestin numbering scheme' in first_scheme)
+        return {
+            'version': PAYLOAD_VERSION,
+            'numbering_schemes': [list(ns) for ns in self.numbering_schemes],
+            'g_alpha': 'Common G-alpha numbering scheme' in first_scheme,
+            'proteins': [[pc.protein.entry_name, pc.protein.species.common_name, pc.protein.name,
+                '/signprot/' if signprot else '/protein/'] for pc in self.proteins],
+            'segments': [[segment, len(self.segments[segment])] for segment in self.segment_slices],
+            'display_labels': [list(label) for label in self.display_labels],
+            'features': list(self.features),
+            'amino_acids': list(self.amino_acids),
+            'statistics': bool(self.consensus),
+        }
+
+    def segment_payload(self, segment):
+        """The cells and statistics of one segment for the alignment viewer. Each row is a sequence string with
+        sequence numbers as differences to the previous residue of the row (0 for gaps), and display numbers as
+        indices in the display labels of the header (-1 for none)"""
+        columns = self.segment_slices[segment]
+        rows = self.row_indices()
+        sequence_numbers = self.sequence_numbers[rows, columns]
+        previous = np.maximum.accumulate(np.concatenate([np.zeros((len(rows), 1), dtype=np.int32),
+            sequence_numbers], axis=1), axis=1)[:, :-1]
+        deltas = np.where(sequence_numbers > 0, sequence_numbers - previous, 0)
+        s_id = list(self.segment_slices).index(segment)
+        payload = {
+            'segment': segment,
+            'positions': self.column_labels[columns],
+            'generic_numbers': [[str(dn) for dn in segments[segment].values()] if segment in segments else []
+                for ns, segments in self.generic_numbers.items()],
+            'sequences': [decode_sequence(codes) for codes in self.matrix[rows, columns]],
+            'sequence_numbers': deltas.tolist(),
+            'display_numbers': np.where(self.column_generic[columns], self.display_numbers[rows, columns],
+                -1).tolist(),
+        }
+        if self.consensus:
+            payload['consensus'] = list(self.consensus[segment].values())
+            payload['feature_stats'] = [feature[s_id] for feature in self.feature_stats]
+            payload['amino_acid_stats'] = [aa[s_id] for aa in self.amino_acid_stats]
+        return payload
@@ -0,0 +1,333 @@
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+
+from common.telemetry import RequestStats
+
+from collections import OrderedDict, defaultdict
+import atexit
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+
+class ProcessTier:
+    """Entries and counters of a cache location kept by one process"""
+    def __init__(self):
+        # key -> (pickled value, expiry time, release), least recently used first
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.RLock()
+
+        self.release = None
+        self.release_checked = 0
+        # release used by this process instead of the shared one, see TieredCache.pin_release
+        self.pinned_release = None
+        self.written = 0
+        self.counters = defaultdict(int)
+        self.stats_written = time.time()
+
+
+process_tiers = {}
+process_tiers_lock = threading.Lock()
+
+
+class TieredCache(BaseCache):
+    """Two tier cache backend. Each process keeps a bounded LRU of recently used entries in front of a single SQLite
+    store that is shared by all processes, memory mapped for reads and evicted by size (least recently used first).
+
+    The data release is part of the key of every entry. Setting a new release (set_release) invalidates all entries of
+    other releases in one step. A process can pin a new release (pin_release) to fill the cache for it while all other
+    processes keep serving the current one.
+
+    OPTIONS:
+        MAX_SIZE: total size (bytes) of the shared store
+        LOCAL_MAX_SIZE: total size (bytes) of the per-process LRU
+        LOCAL_MAX_ENTRIES: number of entries in the per-process LRU
+        LOCAL_TIMEOUT: seconds an entry is served from the per-process LRU before it is read from the shared store
+            again, this bounds how long a process can miss changes made by other processes
+        RELEASE_CHECK_INTERVAL: seconds between checks for a new release by other processes
+    """
+
+    # last_used of shared entries is only updated when it is older than this (seconds), to keep reads cheap
+    TOUCH_INTERVAL = 60
+
+    # seconds between writes of the hit/miss/eviction counters to the shared store
+    STATS_INTERVAL = 10
+
+    def __init__(self, location, params):
+        super(TieredCache, self).__init__(params)
+        options = params.get('OPTIONS', {})
+        self.location = location
+        self.max_size = int(options.get('MAX_SIZE', 4 * 1024 ** 3))
+        self.local_max_size = int(options.get('LOCAL_MAX_SIZE', 64 * 1024 ** 2))
+        self.local_max_entries = int(options.get('LOCAL_MAX_ENTRIES', 1000))
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 60)
+        self.release_check_interval = options.get('RELEASE_CHECK_INTERVAL', 5)
+
+        # Django creates a cache object per thread, the per-process tier is shared by all of them
+        with process_tiers_lock:
+            if location not in process_tiers:
+                process_tiers[location] = ProcessTier()
+                atexit.register(self.write_stats)
+            self.tier = process_tiers[location]
+        self.connections = threading.local()
+
+    # shared store
+
+    def connection(self):
+        """SQLite connection of the current thread, connections are not shared with forked processes"""
+        conn = getattr(self.connections, 'conn', None)
+        if conn is None or self.connections.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.location) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.location, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA mmap_size={}'.format(self.max_size))
+            conn.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, expires REAL, '
+                'release TEXT, size INTEGER, last_used REAL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS cache_last_used ON cache (last_used)')
+            conn.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)')
+            conn.execute('CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER)')
+            self.connections.conn = conn
+            self.connections.pid = os.getpid()
+        return conn
+
+    def current_release(self):
+        """The data release of the shared store, re-read every RELEASE_CHECK_INTERVAL seconds"""
+        if self.tier.pinned_release is not None:
+            return self.tier.pinned_release
+        now = time.time()
+        if self.tier.release is None or now - self.tier.release_checked > self.release_check_interval:
+            row = self.connection().execute("SELECT value FROM meta WHERE name = 'release'").fetchone()
+            release = row[0] if row else ''
+            if release != self.tier.release:
+                self.clear_local()
+            self.tier.release = release
+            self.tier.release_checked = now
+        return self.tier.release
+
+    def set_release(self, release):
+        """Tag new entries with release and delete all entries of other releases"""
+        release = str(release)
+        conn = self.connection()
+        with self.tier.lock:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('release', ?)", (release,))
+                deleted = conn.execute('DELETE FROM cache WHERE release != ?', (release,)).rowcount
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            self.clear_local()
+            self.tier.release = release
+            self.tier.release_checked = time.time()
+            self.tier.pinned_release = None
+            self.tier.counters['release_invalidations'] += deleted
+        self.write_stats()
+        return deleted
+
+    def pin_release(self, release):
+        """Read and write the entries of release in this process only, or follow the shared release again if release
+        is None. Entries of the pinned release are kept when it is set with set_release."""
+        with self.tier.lock:
+            self.tier.pinned_release = None if release is None else str(release)
+            self.tier.release_checked = 0
+
+    @staticmethod
+    def release_key(key, release):
+        return '{}:{}'.format(release, key)
+
+    def cull(self):
+        """Evict least recently used entries until the shared store is below 90% of MAX_SIZE"""
+        conn = self.connection()
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM cache').fetchone()[0]
+        if total <= self.max_size:
+            return
+        target = self.max_size * 0.9
+        evict = []
+        for key, size in conn.execute('SELECT key, size FROM cache ORDER BY last_used'):
+            if total <= target:
+                break
+            evict.append((key,))
+            total -= size
+        conn.executemany('DELETE FROM cache WHERE key = ?', evict)
+        with self.tier.lock:
+            self.tier.counters['evictions'] += len(evict)
+
+    # per-process tier
+
+    def clear_local(self):
+        with self.tier.lock:
+            self.tier.entries.clear()
+            self.tier.size = 0
+
+    def set_local(self, key, pickled, expires, release):
+        with self.tier.lock:
+            self.delete_local(key)
+            if len(pickled) > self.local_max_size:
+                return
+            local_expires = time.time() + self.local_timeout
+            if expires is None or expires > local_expires:
+                expires = local_expires
+            self.tier.entries[key] = (pickled, expires, release)
+            self.tier.size += len(pickled)
+            while len(self.tier.entries) > self.local_max_entries or self.tier.size > self.local_max_size:
+                _, (old, _, _) = self.tier.entries.popitem(last=False)
+                self.tier.size -= len(old)
+
+    def delete_local(self, key):
+        with self.tier.lock:
+            entry = self.tier.entries.pop(key, None)
+            if entry is not None:
+                self.tier.size -= len(entry[0])
+
+    # counters
+
+    def count(self, name):
+        # not to be called with the tier lock held, as it can write the counters to the shared store
+        with self.tier.lock:
+            self.tier.counters[name] += 1
+        if time.time() - self.tier.stats_written > self.STATS_INTERVAL:
+            self.write_stats()
+
+    def write_stats(self):
+        """Add the counters of this process to the shared store"""
+        with self.tier.lock:
+            counters = dict(self.tier.counters)
+            self.tier.counters.clear()
+            self.tier.stats_written = time.time()
+        if not counters:
+            return
+        conn = self.connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for name, value in counters.items():
+                conn.execute('INSERT OR IGNORE INTO stats (name, value) VALUES (?, 0)', (name,))
+                conn.execute('UPDATE stats SET value = value + ? WHERE name = ?', (value, name))
+            conn.execute('COMMIT')
+        except sqlite3.Error:
+            # the counters are lost, but the connection must not stay in the write transaction
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+
+    def stats(self):
+        """Counters of all processes and the size of the shared store"""
+        self.write_stats()
+        conn = self.connection()
+        stats = dict(conn.execute('SELECT name, value FROM stats'))
+        entries, size = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache').fetchone()
+        stats.update({'entries': entries, 'size': size, 'max_size': self.max_size, 'release': self.current_release()})
+        return stats
+
+    def reset_stats(self):
+        with self.tier.lock:
+            self.tier.counters.clear()
+        self.connection().execute('DELETE FROM stats')
+
+    # cache API
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        release = self.current_release()
+        key = self.release_key(key, release)
+        now = time.time()
+
+        with self.tier.lock:
+            entry = self.tier.entries.get(key)
+            if entry is not None:
+                if entry[2] == release and (entry[1] is None or entry[1] > now):
+                    self.tier.entries.move_to_end(key)
+                else:
+                    self.delete_local(key)
+                    entry = None
+        if entry is not None:
+            self.count('local_hits')
+            RequestStats.count_cache(True)
+            return pickle.loads(entry[0])
+
+        conn = self.connection()
+        row = conn.execute('SELECT value, expires, release, last_used FROM cache WHERE key = ?', (key,)).fetchone()
+        if row is None or row[2] != release or (row[1] is not None and row[1] <= now):
+            if row is not None:
+                conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+                self.count('expired')
+            self.count('misses')
+            RequestStats.count_cache(False)
+            return default
+
+        pickled, expires, _, last_used = row
+        if now - last_used > self.TOUCH_INTERVAL:
+            conn.execute('UPDATE cache SET last_used = ? WHERE key = ?', (now, key))
+        self.set_local(key, pickled, expires, release)
+        self.count('shared_hits')
+        RequestStats.count_cache(True)
+        return pickle.loads(pickled)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._set(key, value, timeout)
+
+    def _set(self, key, value, timeout, only_new=False):
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        expires = self.get_backend_timeout(timeout)
+        release = self.current_release()
+        key = self.release_key(key, release)
+        now = time.time()
+        conn = self.connection()
+
+        if only_new:
+            row = conn.execute('SELECT expires, release FROM cache WHERE key = ?', (key,)).fetchone()
+            if row is not None and row[1] == release and (row[0] is None or row[0] > now):
+                return False
+
+        conn.execute('INSERT OR REPLACE INTO cache (key, value, expires, release, size, last_used) VALUES '
+            '(?, ?, ?, ?, ?, ?)', (key, sqlite3.Binary(pickled), expires, release, len(pickled), now))
+        self.set_local(key, pickled, expires, release)
+        self.count('sets')
+
+        # check the size of the shared store after every 1% of MAX_SIZE written by this process
+        self.tier.written += len(pickled)
+        if self.tier.written > self.max_size / 100:
+            self.tier.written = 0
+            self.cull()
+        return True
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._set(key, value, timeout, only_new=True)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        expires = self.get_backend_timeout(timeout)
+        key = self.release_key(key, self.current_release())
+        self.delete_local(key)
+        return self.connection().execute('UPDATE cache SET expires = ? WHERE key = ?', (expires, key)).rowcount > 0
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        key = self.release_key(key, self.current_release())
+        self.delete_local(key)
+        self.connection().execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def clear(self):
+        self.clear_local()
+        self.connection().execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # connections are kept open between requests
+        pass
+
+
+def current_data_release(alias='default'):
+    """The data release of a TieredCache, or '' for other cache backends. In-process caches of database content store it
+    and are emptied when it changes, so that long-lived processes do not keep serving data of an older release."""
+    from django.core.cache import caches
+    cache = caches[alias]
+    return cache.current_release() if hasattr(cache, 'current_release') else ''
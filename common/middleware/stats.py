@@ -1,6 +1,10 @@
-from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
 
-import time,datetime,os
+from common.telemetry import telemetry, RequestStats, SLOW_REQUEST_TIME
+
+from contextlib import ExitStack
+import time
 
 class StatsMiddleware:
     def __init__(self, get_response):
@@ -11,27 +15,60 @@ class StatsMiddleware:
         # Code to be executed for each request before
         # the view (and later middleware) are called.
         start_time = time.time()
+        stats = RequestStats.start()
 
-        response = self.get_response(request)
+        # count the database queries of all connections
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(RequestStats.count_query))
+            try:
+                response = self.get_response(request)
+            finally:
+                RequestStats.stop()
 
         # Code to be executed for each request/response after
         # the view is called.
         total = time.time() - start_time
 
-        text_file = open(os.path.join(settings.BASE_DIR, "logs/stats.log"), "a")
-        text_file.write('%s %s %s %s %s\n' % (datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"), round(total,2),request.META.get('REMOTE_ADDR'), request.method, request.path ))
-        text_file.close()
+        if request.resolver_match:
+            view = request.resolver_match.view_name
+        else:
+            view = request.path
+
+        # streamed responses are written after this, so their size is unknown
+        if response.streaming:
+            size = None
+        else:
+            size = len(response.content)
 
-        if total>5:
-            # If slower than 5 seconds
-            text_file = open(os.path.join(settings.BASE_DIR, "logs/stats_slow.log"), "a")
-            text_file.write('%s %s %s %s %s\n' % (datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"), round(total,2),request.META.get('REMOTE_ADDR'), request.method, request.path ))
-            text_file.close()
+        # the record is written to the telemetry log by a background thread
+        telemetry.record({
+            'timestamp': start_time,
+            'time': round(total, 4),
+            'view': view,
+            'method': request.method,
+            'host': request.META.get('HTTP_HOST'),
+            'path': request.path,
+            'query_string': request.META.get('QUERY_STRING', ''),
+            'status': response.status_code,
+            'size': size,
+            'db_queries': stats['db_queries'],
+            'db_time': round(stats['db_time'], 4),
+            'cache_hits': stats['cache_hits'],
+            'cache_misses': stats['cache_misses'],
+            'remote_addr': request.META.get('REMOTE_ADDR'),
+            'slow': total > SLOW_REQUEST_TIME,
+        })
 
         return response
 
     def process_exception(self, request, exception):
-        text_file = open(os.path.join(settings.BASE_DIR, "logs/errors.log"), "a")
-        text_file.write('%s %s %s %s "%s"\n' % (datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),request.META.get('REMOTE_ADDR'), request.method, request.path,str(exception) ))
-        text_file.close()
-        return HttpResponse('Exception caught')
\ No newline at end of file
+        telemetry.record({
+            'timestamp': time.time(),
+            'view': request.resolver_match.view_name if request.resolver_match else request.path,
+            'method': request.method,
+            'path': request.path,
+            'remote_addr': request.META.get('REMOTE_ADDR'),
+            'exception': str(exception),
+        })
+        return HttpResponse('Exception caught')
@@ -0,0 +1,376 @@
+from Bio.SubsMat import MatrixInfo
+
+import numpy as np
+
+
+# residue codes, anything that is not in BLOSUM62 is scored as X
+BLOSUM62_ALPHABET = sorted(set(aa for pair in MatrixInfo.blosum62 for aa in pair))
+UNKNOWN_CODE = BLOSUM62_ALPHABET.index('X')
+PADDING_CODE = len(BLOSUM62_ALPHABET)
+CODE_LOOKUP = np.full(256, UNKNOWN_CODE, dtype=np.uint8)
+for code, aa in enumerate(BLOSUM62_ALPHABET):
+    CODE_LOOKUP[ord(aa)] = code
+
+# substitution scores between codes, padding scores 0
+BLOSUM62_SCORES = np.zeros((PADDING_CODE + 1, PADDING_CODE + 1))
+for (aa_1, aa_2), score in MatrixInfo.blosum62.items():
+    BLOSUM62_SCORES[CODE_LOOKUP[ord(aa_1)], CODE_LOOKUP[ord(aa_2)]] = score
+    BLOSUM62_SCORES[CODE_LOOKUP[ord(aa_2)], CODE_LOOKUP[ord(aa_1)]] = score
+
+
+# substitution scores for local alignments, residues outside a sequence never align
+OUTSIDE_CODE = PADDING_CODE
+LOCAL_SCORES = BLOSUM62_SCORES.astype(np.float32)
+LOCAL_SCORES[OUTSIDE_CODE, :] = -np.inf
+LOCAL_SCORES[:, OUTSIDE_CODE] = -np.inf
+
+
+# affine gap penalties (BLOSUM62 defaults of EMBOSS needle), a gap of length L costs GAP_OPEN + (L - 1) * GAP_EXTEND
+GAP_OPEN = 10.0
+GAP_EXTEND = 0.5
+
+# maximum number of dynamic programming cells (reference length x sequences x sequence length) aligned at once,
+# each cell keeps 7 bytes of traceback
+MAX_CELLS = 10000000
+
+
+def global_align(reference, sequence, gap_open=GAP_OPEN, gap_extend=GAP_EXTEND):
+    """Global alignment of two sequences, returns (aligned reference, aligned sequence, score)"""
+    return global_align_many(reference, [sequence], gap_open, gap_extend)[0]
+
+
+def global_align_many(reference, sequences, gap_open=GAP_OPEN, gap_extend=GAP_EXTEND, max_cells=MAX_CELLS):
+    """Global alignment (BLOSUM62, affine gaps) of each sequence in a list to one reference sequence. The dynamic
+    programming runs one reference residue at a time, vectorized over all positions of all sequences.
+
+    Returns a list of (aligned reference, aligned sequence, score) in the order of sequences"""
+    reference_codes = encode_sequence(reference)
+    results = [None] * len(sequences)
+
+    # sequences of similar length are aligned together to limit padding
+    order = sorted(range(len(sequences)), key=lambda k: len(sequences[k]))
+    chunk = []
+    for k in order:
+        if chunk and (len(chunk) + 1) * (len(reference) + 1) * (len(sequences[k]) + 1) > max_cells:
+            align_chunk(reference, reference_codes, sequences, chunk, results, gap_open, gap_extend)
+            chunk = []
+        chunk.append(k)
+    if chunk:
+        align_chunk(reference, reference_codes, sequences, chunk, results, gap_open, gap_extend)
+
+    return results
+
+
+def encode_sequence(sequence):
+    return CODE_LOOKUP[np.frombuffer(sequence.upper().encode('ascii', 'replace'), dtype=np.uint8)]
+
+
+def align_chunk(reference, reference_codes, sequences, chunk, results, gap_open, gap_extend):
+    n = len(reference_codes)
+    lengths = np.array([len(sequences[k]) for k in chunk])
+    b = len(chunk)
+    m = int(lengths.max())
+
+    # padded columns do not influence the columns before them
+    codes = np.full((b, m), PADDING_CODE, dtype=np.uint8)
+    for row, k in enumerate(chunk):
+        codes[row, :lengths[row]] = encode_sequence(sequences[k])
+    scores = BLOSUM62_SCORES
+
+    columns = np.arange(m + 1)
+    extend_offset = columns * gap_extend
+
+    # first row: leading gaps in the reference
+    h = np.empty((b, m + 1))
+    h[:, 0] = 0
+    h[:, 1:] = -(gap_open + (columns[1:] - 1) * gap_extend)
+    ix = np.full((b, m + 1), -np.inf)
+
+    # traceback, for every reference residue (row) and sequence position (column)
+    # h_from_iy: the best alignment ends with a gap in the reference
+    # d_from_ix: otherwise, it ends with a gap in the sequence (instead of a match)
+    # ix_extend: that gap extends a gap in the previous row
+    # iy_start: column where the gap in the reference starts
+    h_from_iy = np.zeros((n + 1, b, m + 1), dtype=bool)
+    d_from_ix = np.zeros((n + 1, b, m + 1), dtype=bool)
+    ix_extend = np.zeros((n + 1, b, m + 1), dtype=bool)
+    iy_start = np.zeros((n + 1, b, m + 1), dtype=np.int32)
+
+    match = np.full((b, m + 1), -np.inf)
+    for i in range(1, n + 1):
+        match[:, 1:] = h[:, :-1] + scores[reference_codes[i - 1]][codes]
+
+        ix_open = h - gap_open
+        ix_ext = ix - gap_extend
+        ix_extend[i] = ix_ext > ix_open
+        ix = np.maximum(ix_open, ix_ext)
+
+        d = np.maximum(match, ix)
+        d_from_ix[i] = ix > match
+
+        # a gap in the reference ending at column j starts after the column k < j that maximizes
+        # d[k] - gap_open - (j - k - 1) * gap_extend, found with a running maximum
+        values = d + extend_offset
+        running_max = np.maximum.accumulate(values, axis=1)
+        start = np.maximum.accumulate(np.where(values == running_max, columns, 0), axis=1)
+        iy = np.full((b, m + 1), -np.inf)
+        iy[:, 1:] = running_max[:, :-1] - gap_open - extend_offset[:-1]
+        iy_start[i, :, 1:] = start[:, :-1]
+
+        h_from_iy[i] = iy > d
+        h = np.maximum(d, iy)
+
+    for row, k in enumerate(chunk):
+        reference_index, sequence_index = traceback(n, int(lengths[row]), row, h_from_iy, d_from_ix, ix_extend,
+            iy_start)
+        results[k] = (aligned_string(reference, reference_index), aligned_string(sequences[k], sequence_index),
+            float(h[row, lengths[row]]))
+
+
+def traceback(n, m, row, h_from_iy, d_from_ix, ix_extend, iy_start):
+    """Aligned (reference index, sequence index) pairs, -1 for gaps"""
+    pairs = []
+    i, j = n, m
+    state = 'h'
+    while i > 0 and j > 0:
+        if state == 'h':
+            state = 'iy' if h_from_iy[i, row, j] else 'd'
+        if state == 'd':
+            state = 'ix' if d_from_ix[i, row, j] else 'match'
+        if state == 'match':
+            pairs.append((i - 1, j - 1))
+            i -= 1
+            j -= 1
+            state = 'h'
+        elif state == 'ix':
+            pairs.append((i - 1, -1))
+            state = 'ix' if ix_extend[i, row, j] else 'h'
+            i -= 1
+        else:
+            k = iy_start[i, row, j]
+            pairs.extend((-1, c) for c in range(j - 1, k - 1, -1))
+            j = k
+            state = 'd'
+    # leading gaps
+    pairs.extend((r, -1) for r in range(i - 1, -1, -1))
+    pairs.extend((-1, c) for c in range(j - 1, -1, -1))
+
+    pairs = np.array(pairs[::-1], dtype=np.int64).reshape(-1, 2)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def aligned_string(sequence, index):
+    residues = np.frombuffer(sequence.encode('ascii', 'replace'), dtype='S1')
+    aligned = np.full(len(index), b'-', dtype='S1')
+    aligned[index >= 0] = residues[index[index >= 0]]
+    return aligned.tobytes().decode('ascii')
+
+
+def transfer_positions(aligned_reference, aligned_sequence, positions):
+    """Maps residue numbers (1-based) of the reference to the sequence through an alignment. A reference residue
+    aligned to a gap maps to the preceding residue of the sequence"""
+    reference_count = np.cumsum(np.frombuffer(aligned_reference.encode('ascii'), dtype='S1') != b'-')
+    sequence_count = np.cumsum(np.frombuffer(aligned_sequence.encode('ascii'), dtype='S1') != b'-')
+
+    transferred = {}
+    for key, position in positions.items():
+        if not isinstance(position, int):
+            continue
+        # last alignment column at this reference residue
+        column = np.searchsorted(reference_count, position, side='right') - 1
+        if column >= 0 and reference_count[column] == position:
+            transferred[key] = int(sequence_count[column])
+    return transferred
+
+
+def local_score_banded(queries, subjects, band_starts, band_widths, gap_open, gap_extend, max_cells=MAX_CELLS):
+    """Scores of Smith-Waterman local alignments (BLOSUM62, affine gaps) of pairs of sequences (queries[k],
+    subjects[k]), restricted to a band of diagonals. The alignment of query residue a to subject residue c lies on
+    diagonal c - a, the band of a pair covers the diagonals band_starts[k] to band_starts[k] + band_widths[k] - 1.
+    Sequences are strings or encoded sequences.
+
+    Returns an array of scores in the order of the pairs. Without the alignments this needs no traceback and is
+    about twice as fast as local_align_banded."""
+    scores = np.zeros(len(subjects))
+    for chunk, width in banded_chunks(queries, band_widths, max_cells):
+        scores[chunk] = score_chunk_banded(queries, subjects, band_starts, width, chunk, gap_open, gap_extend)
+    return scores
+
+
+def local_align_banded(queries, subjects, band_starts, band_widths, gap_open, gap_extend, max_cells=MAX_CELLS):
+    """Banded Smith-Waterman local alignments of pairs of sequences, as in local_score_banded.
+
+    Returns a list of (score, query index, subject index) in the order of the pairs, the indexes are arrays of aligned
+    residue indexes (0-based, -1 for gaps), empty if nothing aligns with a positive score"""
+    results = [None] * len(subjects)
+    for chunk, width in banded_chunks(queries, band_widths, max_cells):
+        align_chunk_banded(queries, subjects, band_starts, width, chunk, results, gap_open, gap_extend)
+    return results
+
+
+def banded_chunks(queries, band_widths, max_cells):
+    """Pairs with bands of similar width are aligned together, narrow bands are widened to the widest band of their
+    chunk"""
+    order = sorted(range(len(band_widths)), key=lambda k: band_widths[k])
+    chunk = []
+    rows = 0
+    for k in order:
+        rows = max(rows, len(queries[k]) + 1)
+        if chunk and (band_widths[k] > 3 * band_widths[chunk[0]] or (len(chunk) + 1) * rows * band_widths[k] >
+                max_cells):
+            yield chunk, max(int(band_widths[chunk[-1]]), 1)
+            chunk = []
+            rows = len(queries[k]) + 1
+        chunk.append(k)
+    if chunk:
+        yield chunk, max(int(band_widths[chunk[-1]]), 1)
+
+
+def residues_banded(queries, subjects, band_starts, width, chunk):
+    """Residue codes of a chunk of pairs. Row i of the dynamic programming aligns query residue queries[:, i - 1] to the
+    subject residues[:, i - 1:i - 1 + width] of the band positions. Residues outside a sequence never align."""
+    encoded = {}
+    def encode(sequence):
+        if isinstance(sequence, np.ndarray):
+            return sequence
+        if sequence not in encoded:
+            encoded[sequence] = encode_sequence(sequence)
+        return encoded[sequence]
+
+    query_codes = [encode(queries[k]) for k in chunk]
+    n = max(len(q) for q in query_codes)
+    query_residues = np.full((len(chunk), n), OUTSIDE_CODE, dtype=np.uint8)
+    residues = np.full((len(chunk), n + width), OUTSIDE_CODE, dtype=np.uint8)
+    for row, k in enumerate(chunk):
+        query_residues[row, :len(query_codes[row])] = query_codes[row]
+        codes = encode(subjects[k])
+        start = band_starts[k]
+        first = max(0, -start)
+        last = min(n + width, len(codes) - start)
+        if last > first:
+            residues[row, first:last] = codes[start + first:start + last]
+    return query_residues, residues
+
+
+def score_chunk_banded(queries, subjects, band_starts, width, chunk, gap_open, gap_extend):
+    query_residues, residues = residues_banded(queries, subjects, band_starts, width, chunk)
+    b, n = query_residues.shape
+    scores = LOCAL_SCORES
+    extend_offset = (np.arange(width) * gap_extend).astype(np.float32)
+
+    h = np.zeros((b, width), dtype=np.float32)
+    ix = np.full((b, width), -np.inf, dtype=np.float32)
+    best = np.zeros((b, width), dtype=np.float32)
+    iy = np.full((b, width), -np.inf, dtype=np.float32)
+    for i in range(1, n + 1):
+        match = h + scores[query_residues[:, i - 1, None], residues[:, i - 1:i - 1 + width]]
+        ix[:, :-1] = np.maximum(ix[:, 1:] - gap_extend, h[:, 1:] - gap_open)
+
+        h = np.maximum(match, ix)
+        running_max = np.maximum.accumulate(h + extend_offset, axis=1)
+        iy[:, 1:] = running_max[:, :-1] - gap_open - extend_offset[:-1]
+        np.maximum(h, iy, out=h)
+        np.maximum(h, 0, out=h)
+        np.maximum(best, h, out=best)
+
+    return best.max(axis=1)
+
+
+def align_chunk_banded(queries, subjects, band_starts, width, chunk, results, gap_open, gap_extend):
+    query_residues, residues = residues_banded(queries, subjects, band_starts, width, chunk)
+    b, n = query_residues.shape
+    starts = np.array([band_starts[k] for k in chunk])
+    scores = LOCAL_SCORES
+
+    offsets = np.arange(width)
+    extend_offset = (offsets * gap_extend).astype(np.float32)
+
+    # traceback, for every query residue (row), subject and band position
+    # h_state: 0 the alignment starts after this cell, 1 it ends with a match or a gap in the subject, 2 it ends with
+    #   a gap in the query
+    # d_from_ix: it ends with a gap in the subject (instead of a match)
+    # ix_extend: that gap extends a gap in the previous row
+    # iy_start: band position where the gap in the query starts
+    h_state = np.zeros((n + 1, b, width), dtype=np.uint8)
+    d_from_ix = np.zeros((n + 1, b, width), dtype=bool)
+    ix_extend = np.zeros((n + 1, b, width), dtype=bool)
+    iy_start = np.zeros((n + 1, b, width), dtype=np.int32)
+
+    # cells outside the subject start at 0 like any other cell, but cannot be reached with a positive score
+    h = np.zeros((b, width), dtype=np.float32)
+    ix = np.full((b, width), -np.inf, dtype=np.float32)
+    best_h = np.zeros((b, width), dtype=np.float32)
+    best_i = np.zeros((b, width), dtype=np.int32)
+
+    up_h = np.full((b, width), -np.inf, dtype=np.float32)
+    up_ix = np.full((b, width), -np.inf, dtype=np.float32)
+    iy = np.full((b, width), -np.inf, dtype=np.float32)
+    for i in range(1, n + 1):
+        match = h + scores[query_residues[:, i - 1, None], residues[:, i - 1:i - 1 + width]]
+
+        # a gap in the subject comes from the same subject position in the previous row, one band position up
+        up_h[:, :-1] = h[:, 1:]
+        up_ix[:, :-1] = ix[:, 1:]
+        ix_open = up_h - gap_open
+        ix_ext = up_ix - gap_extend
+        ix_extend[i] = ix_ext > ix_open
+        ix = np.maximum(ix_open, ix_ext)
+
+        d = np.maximum(match, ix)
+        d_from_ix[i] = ix > match
+
+        # a gap in the query ending at band position t starts after the position k < t that maximizes
+        # d[k] - gap_open - (t - k - 1) * gap_extend, found with a running maximum
+        values = d + extend_offset
+        running_max = np.maximum.accumulate(values, axis=1)
+        start = np.maximum.accumulate(np.where(values == running_max, offsets, 0), axis=1)
+        iy[:, 1:] = running_max[:, :-1] - gap_open - extend_offset[:-1]
+        iy_start[i, :, 1:] = start[:, :-1]
+
+        h = np.maximum(d, 0)
+        h_state[i] = (iy > h) * 2 + (d > 0)
+        np.maximum(h, iy, out=h)
+
+        better = h > best_h
+        best_h[better] = h[better]
+        best_i[better] = i
+
+    for row, k in enumerate(chunk):
+        t = int(best_h[row].argmax())
+        if best_h[row, t] <= 0:
+            results[k] = (0.0, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+            continue
+        query_index, subject_index = traceback_banded(int(best_i[row, t]), t, int(starts[row]), row, h_state,
+            d_from_ix, ix_extend, iy_start)
+        results[k] = (float(best_h[row, t]), query_index, subject_index)
+
+
+def traceback_banded(i, t, band_start, row, h_state, d_from_ix, ix_extend, iy_start):
+    """Aligned (query index, subject index) pairs of a local alignment ending at cell (i, t), -1 for gaps"""
+    pairs = []
+    state = 'h'
+    while i > 0:
+        j = i + band_start + t
+        if state == 'h':
+            if h_state[i, row, t] == 0:
+                break
+            state = 'iy' if h_state[i, row, t] >= 2 else 'd'
+        if state == 'd':
+            state = 'ix' if d_from_ix[i, row, t] else 'match'
+        if state == 'match':
+            pairs.append((i - 1, j - 1))
+            i -= 1
+            state = 'h'
+        elif state == 'ix':
+            pairs.append((i - 1, -1))
+            state = 'ix' if ix_extend[i, row, t] else 'h'
+            i -= 1
+            t += 1
+        else:
+            k = iy_start[i, row, t]
+            pairs.extend((-1, c) for c in range(j - 1, j - 1 - (t - k), -1))
+            t = k
+            state = 'd'
+
+    pairs = np.array(pairs[::-1], dtype=np.int64).reshape(-1, 2)
+    return pairs[:, 0], pairs[:, 1]
@@ -1,9 +1,25 @@
-﻿from django.conf import settings
+﻿from django.apps import apps
+from django.conf import settings
 
 from protein.models import Species
 from protein.models import ProteinSource
 from residue.models import ResidueNumberingScheme
 
+from collections import defaultdict
+
+# default protein source and numbering scheme of new selections, fetched once per process
+default_selection_objects = {}
+
+
+def get_default_selection_object(name):
+    """Returns the default protein source ('annotation') or numbering scheme ('numbering_schemes')"""
+    if name not in default_selection_objects:
+        if name == 'annotation':
+            default_selection_objects[name] = ProteinSource.objects.get(name='SWISSPROT')
+        elif name == 'numbering_schemes':
+            default_selection_objects[name] = ResidueNumberingScheme.objects.get(slug=settings.DEFAULT_NUMBERING_SCHEME)
+    return default_selection_objects[name]
+
 
 class SimpleSelection:
     """A class representing the proteins and segments a user has selected. Can be serialized and stored in session"""
@@ -20,12 +36,12 @@ class SimpleSelection:
         self.g_proteins = []
 
         # annotation
-        ps = ProteinSource.objects.get(name='SWISSPROT') # Default protein source is SWISSPROT
+        ps = get_default_selection_object('annotation') # Default protein source is SWISSPROT
         o = SelectionItem('protein_source', ps)
         self.annotation = [o]
 
         # numbering schemes
-        gn = ResidueNumberingScheme.objects.get(slug=settings.DEFAULT_NUMBERING_SCHEME)
+        gn = get_default_selection_object('numbering_schemes')
         o = SelectionItem('numbering_schemes', gn)
         self.numbering_schemes = [o]
 
@@ -39,6 +55,18 @@ class SimpleSelection:
     def __str__(self):
         return str(self.__dict__)
 
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+        # the objects of all items are fetched together when the first one is used
+        loader = SelectionItemLoader()
+        for name, value in state.items():
+            if isinstance(value, list) and any(isinstance(i, SelectionItem) for i in value):
+                for selection_item in value:
+                    if isinstance(selection_item, SelectionItem):
+                        loader.register(selection_item)
+                self.__dict__[name] = SelectionList(value)
+
 
 class Selection(SimpleSelection):
     """A class that extends SimpleSelection, and adds methods to process the selection (these methods can not be
@@ -169,15 +197,129 @@ class Selection(SimpleSelection):
 
 
 class SelectionItem:
-    """A wrapper class for selectable objects (protein, family, sequence segment etc.) that adds a type attribute"""
+    """A wrapper class for selectable objects (protein, family, sequence segment etc.) that adds a type attribute.
+    Only the model, id and properties are serialized, the object is fetched again when it is first used"""
     def __init__(self, selection_type, selection_object, properties={}):
         self.type = selection_type
         self.type_title = selection_type.replace('_', ' ').capitalize()
         self.item = selection_object
         self.properties = properties
 
+    @property
+    def item(self):
+        if self._item is None and self._loader is not None:
+            self._loader.load(self._ref[0])
+        return self._item
+
+    @item.setter
+    def item(self, selection_object):
+        self._item = selection_object
+        self._ref = None
+        self._loader = None
+
+    def ref(self):
+        """The model label and id of the selected object"""
+        if self._ref is not None:
+            return self._ref[:2]
+        return (self._item._meta.label, self._item.pk)
+
+    def __getstate__(self):
+        model, pk = self.ref()
+        if self._item is not None:
+            # keep attributes that views add to selected objects (e.g. only_aligned_residues)
+            field_names = set(f.attname for f in self._item._meta.concrete_fields)
+            extra = {k: v for k, v in self._item.__dict__.items() if k not in field_names and not k.startswith('_')}
+        else:
+            extra = self._ref[2]
+        return {'type': self.type, 'properties': self.properties, 'ref': (model, pk, extra)}
+
+    def __setstate__(self, state):
+        if 'ref' not in state:
+            # selection stored with the full object
+            state = dict(state)
+            self.item = state.pop('item')
+            self.__dict__.update(state)
+            return
+        self.type = state['type']
+        self.type_title = self.type.replace('_', ' ').capitalize()
+        self.properties = state['properties']
+        self._item = None
+        self._ref = state['ref']
+        SelectionItemLoader().register(self)
+
     def __str__(self):
-        return str(self.__dict__)
+        return str({'type': self.type, 'type_title': self.type_title, 'item': self.item, 'properties': self.properties})
+
+    def __eq__(self, other):
+        if not isinstance(other, SelectionItem):
+            return False
+        return (self.type == other.type and self.ref() == other.ref() and self.properties == other.properties)
+
+
+class SelectionList(list):
+    """A list of deserialized selection items. Items whose object no longer exists (e.g. after the database has been
+    rebuilt) are dropped when the list is first used, before any of its items are handed out"""
+    def __init__(self, selection_items):
+        super(SelectionList, self).__init__(selection_items)
+        self.checked = False
+
+    def check(self):
+        if not self.checked:
+            self.checked = True
+            items = list.__iter__(self)
+            list.__setitem__(self, slice(None), [i for i in items if not isinstance(i, SelectionItem) or
+                i.item is not None])
+
+    def __iter__(self):
+        self.check()
+        return super(SelectionList, self).__iter__()
+
+    def __reversed__(self):
+        self.check()
+        return super(SelectionList, self).__reversed__()
+
+    def __getitem__(self, index):
+        self.check()
+        return super(SelectionList, self).__getitem__(index)
+
+    def __len__(self):
+        self.check()
+        return super(SelectionList, self).__len__()
+
+    def __contains__(self, selection_item):
+        self.check()
+        return super(SelectionList, self).__contains__(selection_item)
+
+    def __reduce_ex__(self, protocol):
+        # stored as a plain list, without loading the objects of its items
+        return (list, (list(list.__iter__(self)),))
+
+
+class SelectionItemLoader:
+    """Fetches the objects of deserialized selection items, with one query per model"""
+    # large fields that are not needed to show a selection, loaded when they are accessed
+    deferred_fields = {
+        'structure.structuremodel': ['pdb'],
+        'structure.structurecomplexmodel': ['pdb'],
+    }
+
+    def __init__(self):
+        self.pending = defaultdict(list)
+
+    def register(self, selection_item):
+        if selection_item._ref is not None:
+            self.pending[selection_item._ref[0]].append(selection_item)
+            selection_item._loader = self
 
-    def __eq__(self, other): 
-        return self.__dict__ == other.__dict__
\ No newline at end of file
+    def load(self, model_label):
+        selection_items = self.pending.pop(model_label, [])
+        model = apps.get_model(model_label)
+        objects = model._default_manager.defer(*self.deferred_fields.get(model._meta.label_lower, [])).in_bulk(
+            set(i._ref[1] for i in selection_items))
+        for selection_item in selection_items:
+            obj = objects.get(selection_item._ref[1])
+            if obj is not None:
+                for k, v in selection_item._ref[2].items():
+                    setattr(obj, k, v)
+            selection_item._item = obj
+            selection_item._loader = None
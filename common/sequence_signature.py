@@ -3,6 +3,7 @@ A module for generating sequence signatures for the given two sets of proteins.
 """
 from django.conf import settings
 from django.core import exceptions
+from django.db import connections
 
 from alignment.functions import strip_html_tags, get_format_props
 Alignment = getattr(__import__(
@@ -16,10 +17,10 @@ from residue.models import Residue
 
 
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 import numpy as np
 import re
-import time
 
 class SequenceSignature:
     """
@@ -559,6 +560,8 @@ class SignatureMatch():
         self.scored_proteins = []
         self.protein_report = OrderedDict()
         self.protein_signatures = OrderedDict()
+        self.signature_features = OrderedDict()
+        self.signature_norm = 0.0
         self.feature_preference = prepare_aa_group_preference()
 
         self.find_relevant_gns()
@@ -633,9 +636,13 @@ class SignatureMatch():
         ])
 
         signature = OrderedDict([(x[0], []) for x in matrix_consensus.items()])
+        self.signature_features = OrderedDict()
+        self.signature_norm = 0.0
         for segment in self.relevant_segments:
             signature_map = self.signature_matrix_filtered[segment].argmax(axis=0)
             signature_map = self._assign_preferred_features(signature_map, segment, self.signature_matrix_filtered)
+            self.signature_features[segment] = signature_map
+            self.signature_norm += np.sum(np.amax(self.signature_matrix_filtered[segment], axis=0))
             tmp = np.array(self.signature_matrix_filtered[segment])
 
             for col, pos in enumerate(list(signature_map)):
@@ -650,9 +657,25 @@ class SignatureMatch():
 
     def score_protein_class(self, pclass_slug='001'):
 
-        start = time.time()
-        protein_scores = {}
-        protein_signature_match = {}
+        self._set_protein_report(self._score_class(pclass_slug))
+
+    def score_protein_classes(self, pclass_slugs, workers=4):
+        """
+        Score the proteins of several classes, each class in its own thread.
+        """
+
+        def score_class(pclass_slug):
+            try:
+                return self._score_class(pclass_slug)
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            class_scores = list(executor.map(score_class, pclass_slugs))
+        self._set_protein_report([x for scores in class_scores for x in scores])
+
+    def _score_class(self, pclass_slug):
+
         class_proteins = Protein.objects.filter(
             species__common_name='Human',
             family__slug__startswith=pclass_slug
@@ -665,128 +688,88 @@ class SignatureMatch():
             ).filter(
                 protein__in=class_proteins,
                 protein__sequence_type__slug='wt'
-                ).exclude(protein__entry_name__endswith='-consensus')
-        for pcf in class_a_pcf:
-            p_start = time.time()
-            score, nscore, signature_match = self.score_protein(pcf)
+                ).exclude(protein__entry_name__endswith='-consensus').select_related('protein')
+        return self.score_proteins(class_a_pcf)
+
+    def _set_protein_report(self, scores):
+
+        protein_scores = OrderedDict()
+        protein_signature_match = {}
+        for pcf, score, nscore, signature_match in scores:
             protein_scores[pcf] = (score, nscore)
             protein_signature_match[pcf] = signature_match
-            p_end = time.time()
-            print("Time elapsed for {}: ".format(pcf.protein.entry_name), p_end - p_start)
-        end = time.time()
         self.protein_report = OrderedDict(sorted(protein_scores.items(), key=lambda x: x[1][0], reverse=True))
         for prot in self.protein_report.items():
             self.protein_signatures[prot[0]] = protein_signature_match[prot[0]]
         self.scored_proteins = list(self.protein_report.keys())
-        print("Total time: ", end - start)
-
 
     def score_protein(self, pcf):
-        prot_score = 0.0
-        norm = 0.0
-        consensus_match = OrderedDict([(x, []) for x in self.relevant_segments])
 
-        relevant_gns_total = []
-        for segment in  self.relevant_segments:
-            for idx, pos in enumerate(self.relevant_gn[self.schemes[0][0]][segment].keys()):
-                relevant_gns_total.append(pos)
-
-        resi = Residue.objects.filter(
-            protein_conformation=pcf,
-            generic_number__label__in=relevant_gns_total
-            ).prefetch_related('generic_number')
-        resi_dict = {}
-        for r in resi:
-            if r.generic_number:
-                resi_dict[r.generic_number.label] = r
+        return self.score_proteins([pcf])[0][1:]
 
-        for segment in self.relevant_segments:
-            tmp = []
-            signature_map = self.signature_matrix_filtered[segment].argmax(axis=0)
-            signature_map = self._assign_preferred_features(signature_map, segment, self.signature_matrix_filtered)
+    def score_proteins(self, pcfs):
+        """
+        Score protein conformations against the signature. The residues of all conformations at the relevant
+        positions are loaded in one query as a matrix of amino acid codes, which is matched against the signature
+        features with array operations. Returns (pcf, score, normalized score, consensus match) per conformation.
+        """
 
-            norm += np.sum(np.amax(self.signature_matrix_filtered[segment], axis=0))
+        pcfs = list(pcfs)
+        feat_abrs = list(AMINO_ACID_GROUPS.keys())
+        feat_names = list(AMINO_ACID_GROUP_NAMES.values())
 
+        # signature feature and value of each relevant position, segment after segment
+        positions = []
+        for segment in self.relevant_segments:
             for idx, pos in enumerate(self.relevant_gn[self.schemes[0][0]][segment].keys()):
-                feat = signature_map[idx]
-                feat_abr = list(AMINO_ACID_GROUPS.keys())[feat]
-                feat_name = list(AMINO_ACID_GROUP_NAMES.values())[feat]
-                val = self.signature_matrix_filtered[segment][feat][idx]
-                if pos in resi_dict:
-                    res = resi_dict[pos]
-                    if feat in self.residue_to_feat[res.amino_acid]:
-                        if val > 0:
-                            prot_score += val
-                        tmp.append([
-                            feat_abr,
-                            feat_name,
-                            val,
-                            "green",
-                            res.amino_acid, pos
-                            ]) if val > 0 else tmp.append([
-                                feat_abr,
-                                feat_name,
-                                val,
-                                "white",
-                                res.amino_acid,
-                                pos
-                                ])
-                    else:
-                        #David doesn't want the negative values in the score
-                        # prot_score -= val
-                        tmp.append([
-                            feat_abr,
-                            feat_name,
-                            val,
-                            "red",
-                            res.amino_acid,
-                            pos
-                            ]) if val > 0 else tmp.append([
-                                feat_abr,
-                                feat_name,
-                                val,
-                                "white",
-                                res.amino_acid,
-                                pos
-                                ])
-                else:
-                    if feat_name == 'Gap':
-                        tmp.append([
-                            feat_abr,
-                            feat_name,
-                            val,
-                            "green",
-                            '_',
-                            pos
-                            ]) if val > 0 else tmp.append([
-                                feat_abr,
-                                feat_name,
-                                val,
-                                "white",
-                                '_',
-                                pos
-                                ])
-                        prot_score += val
-                    else:
-                        #David doesn't want the negative values in the score
-                        #prot_score -= val
-                        tmp.append([
-                            feat_abr,
-                            feat_name,
-                            val,
-                            "red",
-                            '_',
-                            pos
-                            ]) if val > 0 else tmp.append([
-                                feat_abr,
-                                feat_name,
-                                val,
-                                "white",
-                                '_',
-                                pos
-                                ])
-            consensus_match[segment] = tmp
-        return (prot_score/100, prot_score/norm*100, consensus_match)
+                feat = self.signature_features[segment][idx]
+                positions.append((segment, pos, feat, self.signature_matrix_filtered[segment][feat][idx]))
+        gn_index = dict([(x[1], i) for i, x in enumerate(positions)])
+        feats = np.array([x[2] for x in positions], dtype=int)
+        vals = np.array([x[3] for x in positions], dtype=float)
+        gaps = np.array([feat_names[x[2]] == 'Gap' for x in positions], dtype=bool)
+
+        # amino acid codes of the residues, -1 where a protein has no residue at the position
+        amino_acids = list(AMINO_ACIDS.keys())
+        aa_index = dict([(aa, i) for i, aa in enumerate(amino_acids)])
+        pcf_index = dict([(pcf.pk, i) for i, pcf in enumerate(pcfs)])
+        codes = np.full((len(pcfs), len(positions)), -1, dtype=int)
+        residues = Residue.objects.filter(
+            protein_conformation__in=list(pcf_index),
+            generic_number__label__in=list(gn_index)
+            ).values_list('protein_conformation_id', 'generic_number__label', 'amino_acid')
+        for pcf_id, gn, aa in residues:
+            if aa not in aa_index:
+                aa_index[aa] = len(amino_acids)
+                amino_acids.append(aa)
+            codes[pcf_index[pcf_id], gn_index[gn]] = aa_index[aa]
+
+        features = np.zeros((len(amino_acids), len(feat_abrs)), dtype=bool)
+        for aa, fidx in self.residue_to_feat.items():
+            features[aa_index[aa], list(fidx)] = True
+
+        present = codes >= 0
+        match = np.where(present, features[np.where(present, codes, 0), feats[np.newaxis, :]], gaps[np.newaxis, :])
+        # negative values are not part of the score, except at gaps
+        contribution = np.where((match & present & (vals > 0)) | (gaps & ~present), vals, 0.0)
+        prot_scores = np.cumsum(contribution, axis=1)[:, -1] if positions else np.zeros(len(pcfs))
+        colors = np.where(vals > 0, np.where(match, 'green', 'red'), 'white')
+
+        scores = []
+        for row, pcf in enumerate(pcfs):
+            consensus_match = OrderedDict([(x, []) for x in self.relevant_segments])
+            for col, (segment, pos, feat, val) in enumerate(positions):
+                consensus_match[segment].append([
+                    feat_abrs[feat],
+                    feat_names[feat],
+                    val,
+                    str(colors[row, col]),
+                    amino_acids[codes[row, col]] if present[row, col] else '_',
+                    pos
+                    ])
+            prot_score = prot_scores[row]
+            scores.append((pcf, prot_score/100, prot_score/self.signature_norm*100, consensus_match))
+        return scores
 
 def signature_score_excel(workbook, scores, protein_signatures, signature_filtered, relevant_gn, relevant_segments, numbering_schemes):
 
@@ -0,0 +1,152 @@
+from django.conf import settings
+
+from collections import deque
+import atexit
+import json
+import math
+import os
+import threading
+import time
+
+# JSON lines file with one record per request, rotated to TELEMETRY_LOG + '.1' when it exceeds TELEMETRY_MAX_LOG_SIZE
+TELEMETRY_LOG = getattr(settings, 'TELEMETRY_LOG', os.path.join(settings.BASE_DIR, 'logs', 'telemetry.log'))
+TELEMETRY_MAX_LOG_SIZE = getattr(settings, 'TELEMETRY_MAX_LOG_SIZE', 100 * 1024 ** 2)
+
+# Records are written by a background thread every TELEMETRY_FLUSH_INTERVAL seconds, or sooner when
+# TELEMETRY_FLUSH_SIZE records are waiting. Records beyond TELEMETRY_MAX_BUFFER are dropped if writing falls behind.
+TELEMETRY_FLUSH_INTERVAL = getattr(settings, 'TELEMETRY_FLUSH_INTERVAL', 5)
+TELEMETRY_FLUSH_SIZE = getattr(settings, 'TELEMETRY_FLUSH_SIZE', 500)
+TELEMETRY_MAX_BUFFER = getattr(settings, 'TELEMETRY_MAX_BUFFER', 10000)
+
+# Requests slower than this (seconds) are flagged as slow
+SLOW_REQUEST_TIME = 5
+
+
+def percentile(values, p):
+    """Nearest rank percentile of a list of numbers"""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, int(math.ceil(p / 100 * len(values))) - 1)]
+
+
+class RequestStats:
+    """Database and cache usage of the request handled by the current thread"""
+    local = threading.local()
+
+    @classmethod
+    def start(cls):
+        cls.local.stats = {'db_queries': 0, 'db_time': 0.0, 'cache_hits': 0, 'cache_misses': 0}
+        return cls.local.stats
+
+    @classmethod
+    def stop(cls):
+        stats = getattr(cls.local, 'stats', None)
+        cls.local.stats = None
+        return stats
+
+    @classmethod
+    def get(cls):
+        return getattr(cls.local, 'stats', None)
+
+    @classmethod
+    def count_query(cls, execute, sql, params, many, context):
+        """Database execute wrapper counting the queries and their time"""
+        start = time.time()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            stats = cls.get()
+            if stats is not None:
+                stats['db_queries'] += 1
+                stats['db_time'] += time.time() - start
+
+    @classmethod
+    def count_cache(cls, hit):
+        stats = cls.get()
+        if stats is not None:
+            if hit:
+                stats['cache_hits'] += 1
+            else:
+                stats['cache_misses'] += 1
+
+
+class Telemetry:
+    """Buffers request records in memory and writes them to the telemetry log from a background thread"""
+
+    def __init__(self, log_path=TELEMETRY_LOG):
+        self.log_path = log_path
+        self.buffer = deque()
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+
+    def record(self, record):
+        with self.lock:
+            if len(self.buffer) >= TELEMETRY_MAX_BUFFER:
+                self.dropped += 1
+            else:
+                self.buffer.append(record)
+            buffered = len(self.buffer)
+
+        # the writer thread is started lazily, so that it also runs in forked worker processes
+        if self.thread is None or not self.thread.is_alive():
+            self.start()
+        if buffered >= TELEMETRY_FLUSH_SIZE:
+            self.wake.set()
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(target=self.run, name='telemetry', daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while True:
+            self.wake.wait(TELEMETRY_FLUSH_INTERVAL)
+            self.wake.clear()
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            records = list(self.buffer)
+            self.buffer.clear()
+            dropped = self.dropped
+            self.dropped = 0
+        if dropped:
+            records.append({'dropped': dropped, 'timestamp': time.time()})
+        if not records:
+            return
+
+        try:
+            os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+            if os.path.exists(self.log_path) and os.path.getsize(self.log_path) > TELEMETRY_MAX_LOG_SIZE:
+                os.replace(self.log_path, self.log_path + '.1')
+            # one write per batch
+            with open(self.log_path, 'a') as log_file:
+                log_file.write(''.join(json.dumps(r) + '\n' for r in records))
+        except OSError:
+            pass
+
+
+telemetry = Telemetry()
+atexit.register(telemetry.flush)
+
+
+def read_records(log_path=TELEMETRY_LOG):
+    """Read the request records of the telemetry log, including the rotated log"""
+    for path in (log_path + '.1', log_path):
+        if not os.path.exists(path):
+            continue
+        with open(path) as log_file:
+            for line in log_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                # skip exception and dropped records
+                if 'time' in record:
+                    yield record
+
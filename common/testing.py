@@ -0,0 +1,133 @@
+"""
+Test data shared by the test modules of the apps. Random data is drawn from a random.Random passed in by the test, so
+that every run uses the same data.
+"""
+from django.conf import settings
+
+from common.definitions import AMINO_ACIDS
+from protein.models import (Protein, ProteinConformation, ProteinFamily, ProteinSegment, ProteinSequenceType,
+    ProteinSource, ProteinState, Species)
+from residue.models import Residue, ResidueGenericNumber, ResidueGenericNumberEquivalent, ResidueNumberingScheme
+
+from collections import OrderedDict
+
+# the 20 standard amino acids
+STANDARD_AMINO_ACIDS = ''.join(list(AMINO_ACIDS.keys())[:20])
+
+# segments of the test receptors (slug, category, generic number prefix and positions), residues of segments
+# without generic numbers are not aligned
+RECEPTOR_SEGMENTS = [
+    ('N-term', 'terminus', None, []),
+    ('TM1', 'helix', '1', range(30, 61)),
+    ('ICL1', 'loop', '12', range(48, 52)),
+    ('TM2', 'helix', '2', range(38, 67)),
+    ('ECL1', 'loop', None, []),
+    ('C-term', 'terminus', None, []),
+]
+
+
+def random_sequence(rnd, length):
+    return ''.join(rnd.choice(STANDARD_AMINO_ACIDS) for i in range(length))
+
+
+def mutate_sequence(rnd, sequence, substitution=0.05, deletion=0, insertion=0):
+    """A copy of sequence with random substitutions, deletions and insertions (of 1-6 residues), the arguments are
+    the rates per residue"""
+    mutated = ''
+    for residue in sequence:
+        r = rnd.random()
+        if r < deletion:
+            continue
+        elif r < deletion + substitution:
+            mutated += rnd.choice(STANDARD_AMINO_ACIDS)
+        elif r < deletion + substitution + insertion:
+            mutated += residue + random_sequence(rnd, rnd.randint(1, 6))
+        else:
+            mutated += residue
+    return mutated
+
+
+def create_receptors(rnd, classes=(('001', 12),), two_schemes=False):
+    """Create human wild-type receptors with random residues, the given number per class slug. Residues of helices
+    and ICL1 have generic numbers, with the ends of the segments truncated and some positions left out. Residues of
+    the other segments, and those at the ends of some ICL1s, do not. With two_schemes, every other receptor is
+    numbered with a second (BW) scheme, and residues have the display generic number of the other scheme as
+    alternative generic number.
+
+    Returns the generic numbers of the default scheme by segment slug"""
+    default_scheme = ResidueNumberingScheme.objects.create(slug=settings.DEFAULT_NUMBERING_SCHEME, short_name='GPCRdb',
+        name='GPCRdb')
+    schemes = [default_scheme]
+    if two_schemes:
+        schemes.append(ResidueNumberingScheme.objects.create(slug='bw', short_name='BW', name='Ballesteros-Weinstein',
+            parent=default_scheme))
+
+    segments = []
+    generic_numbers = OrderedDict()
+    for slug, category, prefix, positions in RECEPTOR_SEGMENTS:
+        segment = ProteinSegment.objects.create(slug=slug, name=slug, category=category,
+            fully_aligned=category == 'helix', partial=False, proteinfamily='GPCR')
+        segments.append(segment)
+        generic_numbers[slug] = []
+        for n in positions:
+            gn = ResidueGenericNumber.objects.create(scheme=default_scheme, protein_segment=segment,
+                label='{}x{}'.format(prefix, n))
+            ResidueGenericNumberEquivalent.objects.create(default_generic_number=gn, scheme=default_scheme,
+                label=gn.label)
+            generic_numbers[slug].append(gn)
+
+    # display generic numbers, e.g. 1.50x50 (GPCRdb) and 1.51x50 (BW)
+    display_numbers = {}
+    def display_number(scheme, gn):
+        if (scheme.pk, gn.pk) not in display_numbers:
+            prefix, position = gn.label.split('x')
+            display_numbers[(scheme.pk, gn.pk)] = ResidueGenericNumber.objects.create(scheme=scheme,
+                protein_segment=gn.protein_segment, label='{}.{}x{}'.format(prefix, int(position) + schemes.index(
+                scheme), position))
+        return display_numbers[(scheme.pk, gn.pk)]
+
+    species = Species.objects.create(latin_name='Homo sapiens', common_name='Human')
+    source = ProteinSource.objects.create(name='SWISSPROT')
+    sequence_type = ProteinSequenceType.objects.create(slug='wt', name='Wild-type')
+    state = ProteinState.objects.create(slug=settings.DEFAULT_PROTEIN_STATE, name='Inactive')
+    p = 0
+    for class_slug, count in classes:
+        family = ProteinFamily.objects.create(slug=class_slug + '_001_001_001', name='Receptors ' + class_slug,
+            parent=ProteinFamily.objects.create(slug=class_slug, name='Class ' + class_slug))
+        for i in range(count):
+            scheme = schemes[p % len(schemes)]
+            other_scheme = schemes[(p + 1) % len(schemes)]
+            protein = Protein.objects.create(family=family, species=species, source=source,
+                residue_numbering_scheme=scheme, sequence_type=sequence_type, entry_name='p{}_human'.format(p),
+                name='P{}'.format(p), sequence='')
+            pcf = ProteinConformation.objects.create(protein=protein, state=state)
+            p += 1
+
+            residues = []
+            for segment in segments:
+                gns = generic_numbers[segment.slug]
+                if not gns:
+                    residues += [(segment, None) for k in range(rnd.randint(0, 9))]
+                    continue
+                start, end = rnd.randint(0, 4), len(gns) - rnd.randint(0, 4)
+                aligned = [(segment, gn) for gn in gns[start:end] if rnd.random() > 0.08]
+                if segment.category == 'loop' and rnd.random() < 0.5:
+                    # partially aligned loop, with residues without generic numbers at its ends
+                    aligned = ([(segment, None)] * rnd.randint(0, 3) + aligned +
+                        [(segment, None)] * rnd.randint(0, 3))
+                residues += aligned
+
+            sequence = ''
+            for sequence_number, (segment, gn) in enumerate(residues, 1):
+                # mostly a few amino acids, so that positions have a clear consensus
+                amino_acid = rnd.choice(STANDARD_AMINO_ACIDS[:6] if rnd.random() < 0.7 else STANDARD_AMINO_ACIDS)
+                sequence += amino_acid
+                residue = Residue.objects.create(protein_conformation=pcf, protein_segment=segment,
+                    sequence_number=sequence_number, amino_acid=amino_acid, generic_number=gn,
+                    display_generic_number=display_number(scheme, gn) if gn else None)
+                if gn and two_schemes:
+                    residue.alternative_generic_numbers.add(display_number(other_scheme, gn))
+            protein.sequence = sequence
+            protein.save()
+
+    return generic_numbers
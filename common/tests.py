@@ -1,3 +1,210 @@
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
 
-# Create your tests here.
+from common.cache_backend import TieredCache
+from common.definitions import AMINO_ACID_GROUPS, AMINO_ACID_GROUP_NAMES
+from common.sequence_signature import SignatureMatch
+from common.testing import create_receptors
+from protein.models import Protein
+from residue.models import Residue
+
+from collections import OrderedDict
+import numpy as np
+import os
+import random
+import shutil
+import tempfile
+
+
+def score_protein_per_residue(signature_match, pcf):
+    """Score of one protein conformation as SignatureMatch.score_protein calculated it before the scoring was
+    vectorised, with one residue query per protein"""
+    feat_abrs = list(AMINO_ACID_GROUPS.keys())
+    feat_names = list(AMINO_ACID_GROUP_NAMES.values())
+    matrix = signature_match.signature_matrix_filtered
+    gns = signature_match.relevant_gn[signature_match.schemes[0][0]]
+    residues = dict((r.generic_number.label, r) for r in Residue.objects.filter(protein_conformation=pcf,
+        generic_number__isnull=False).select_related('generic_number'))
+
+    prot_score = 0.0
+    norm = 0.0
+    consensus_match = OrderedDict()
+    for segment in signature_match.relevant_segments:
+        signature_map = signature_match._assign_preferred_features(matrix[segment].argmax(axis=0), segment, matrix)
+        norm += np.sum(np.amax(matrix[segment], axis=0))
+        consensus_match[segment] = []
+        for idx, pos in enumerate(gns[segment].keys()):
+            feat = signature_map[idx]
+            val = matrix[segment][feat][idx]
+            if pos in residues:
+                amino_acid = residues[pos].amino_acid
+                match = feat in signature_match.residue_to_feat[amino_acid]
+                if match and val > 0:
+                    prot_score += val
+            else:
+                amino_acid = '_'
+                match = feat_names[feat] == 'Gap'
+                if match:
+                    prot_score += val
+            color = ('green' if match else 'red') if val > 0 else 'white'
+            consensus_match[segment].append([feat_abrs[feat], feat_names[feat], val, color, amino_acid, pos])
+    return prot_score / 100, prot_score / norm * 100, consensus_match
+
+
+def create_signature_proteins(rnd):
+    """Receptors of class A (12) and class B1 (6), returns the TM1 and TM2 generic numbers"""
+    generic_numbers = create_receptors(rnd, classes=[('001', 12), ('002', 6)])
+    return OrderedDict((segment, generic_numbers[segment]) for segment in ['TM1', 'TM2'])
+
+
+def create_signature_match(segments, dtype):
+    """SignatureMatch of a random difference matrix (of type dtype) for the first two proteins"""
+    rng = np.random.RandomState(7)
+    schemes = [('gpcrdb', 'GPCRdb')]
+    common_positions = {'gpcrdb': OrderedDict((segment, OrderedDict((gn.label, gn.label) for gn in gns))
+        for segment, gns in segments.items())}
+    shape = lambda gns: (len(AMINO_ACID_GROUPS), len(gns))
+    diff_matrix = OrderedDict((segment, rng.randint(-100, 100, size=shape(gns)) if dtype is int else
+        rng.uniform(-100, 100, size=shape(gns))) for segment, gns in segments.items())
+    return SignatureMatch(common_positions, schemes, list(segments), diff_matrix,
+        list(Protein.objects.filter(entry_name__in=['p0_human', 'p1_human'])), cutoff=40)
+
+
+class SignatureMatchTests(TestCase):
+    """The proteins of a class are scored in one batch, with the same results as scoring them one by one"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.segments = create_signature_proteins(random.Random(5))
+
+    def test_batch_scores_match_per_protein_scores(self):
+        for dtype in (int, float):
+            signature_match = create_signature_match(self.segments, dtype)
+            signature_match.score_protein_class('001')
+            self.assertEqual(len(signature_match.protein_report), 10)
+            for pcf, (score, nscore) in signature_match.protein_report.items():
+                expected = score_protein_per_residue(signature_match, pcf)
+                self.assertAlmostEqual(score, expected[0])
+                self.assertAlmostEqual(nscore, expected[1])
+                self.assertEqual(signature_match.protein_signatures[pcf], expected[2])
+
+
+class SignatureMatchClassesTests(TransactionTestCase):
+    """Classes scored in parallel threads (which use their own database connections, so the proteins are committed)
+    get the same scores as when each class is scored on its own"""
+
+    def setUp(self):
+        self.segments = create_signature_proteins(random.Random(5))
+
+    def test_parallel_class_scores_match_single_class_scores(self):
+        expected_report = OrderedDict()
+        expected_signatures = {}
+        for pclass_slug in ['001', '002']:
+            signature_match = create_signature_match(self.segments, float)
+            signature_match.score_protein_class(pclass_slug)
+            expected_report.update(signature_match.protein_report)
+            expected_signatures.update(signature_match.protein_signatures)
+
+        signature_match = create_signature_match(self.segments, float)
+        signature_match.score_protein_classes(['001', '002'], workers=2)
+        self.assertEqual(len(signature_match.protein_report), 16)
+        self.assertEqual(dict(signature_match.protein_report), dict(expected_report))
+        self.assertEqual(signature_match.protein_signatures, expected_signatures)
+        scores = [score for score, nscore in signature_match.protein_report.values()]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+
+class TieredCacheTests(SimpleTestCase):
+    """Per-process LRU, releases, eviction and counters of the two tier cache backend"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache = self.tiered_cache()
+
+    def tearDown(self):
+        self.cache.write_stats()
+        shutil.rmtree(self.tmp_dir)
+
+    def tiered_cache(self, **options):
+        # the per-process tier is shared by all caches of a location
+        location = os.path.join(self.tmp_dir, 'cache{}.sqlite3'.format(len(os.listdir(self.tmp_dir))))
+        options.setdefault('LOCAL_MAX_ENTRIES', 3)
+        options.setdefault('LOCAL_MAX_SIZE', 1000)
+        return TieredCache(location, {'OPTIONS': options})
+
+    def test_local_tier_is_bounded(self):
+        for i in range(5):
+            self.cache.set('key{}'.format(i), i)
+        self.assertEqual(len(self.cache.tier.entries), 3)
+        self.assertEqual([key.rsplit(':', 1)[1] for key in self.cache.tier.entries], ['key2', 'key3', 'key4'])
+
+        # too large for the per-process tier, but kept in the shared store
+        self.cache.set('large', 'x' * 2000)
+        self.assertEqual(len(self.cache.tier.entries), 3)
+        self.assertLessEqual(self.cache.tier.size, 1000)
+        self.assertEqual(self.cache.get('large'), 'x' * 2000)
+        self.assertEqual(self.cache.get('key0'), 0)
+
+    def test_local_hits_and_shared_hits(self):
+        self.assertIsNone(self.cache.get('key'))
+        self.cache.set('key', 'value')
+        self.assertEqual(self.cache.get('key'), 'value')
+        self.cache.clear_local()
+        self.assertEqual(self.cache.get('key'), 'value')
+        self.cache.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+
+        stats = self.cache.stats()
+        self.assertEqual((stats['misses'], stats['sets'], stats['local_hits'], stats['shared_hits']), (2, 1, 1, 1))
+        self.assertEqual(stats['entries'], 0)
+        self.cache.reset_stats()
+        self.assertNotIn('misses', self.cache.stats())
+
+    def test_other_caches_of_a_location_see_changes(self):
+        other = TieredCache(self.cache.location, {'OPTIONS': {'LOCAL_TIMEOUT': 0}})
+        self.cache.set('key', 'value')
+        self.assertEqual(other.get('key'), 'value')
+        self.assertIs(other.tier, self.cache.tier)
+
+    def test_set_release_invalidates_other_releases(self):
+        self.cache.set('key', 'value')
+        self.assertEqual(self.cache.set_release('2'), 1)
+        self.assertEqual(self.cache.current_release(), '2')
+        self.assertIsNone(self.cache.get('key'))
+        self.cache.set('key', 'new value')
+        self.assertEqual(self.cache.get('key'), 'new value')
+        self.assertEqual(self.cache.stats()['release_invalidations'], 1)
+
+    def test_pinned_release_is_filled_separately(self):
+        self.cache.set_release('1')
+        self.cache.set('key', 'release 1')
+        self.cache.pin_release('2')
+        self.assertEqual(self.cache.current_release(), '2')
+        self.assertIsNone(self.cache.get('key'))
+        self.cache.set('key', 'release 2')
+
+        # the shared release is served again once unpinned
+        self.cache.pin_release(None)
+        self.assertEqual(self.cache.get('key'), 'release 1')
+
+        # the entries of the pinned release are kept when it is made the shared release
+        self.cache.set_release('2')
+        self.assertEqual(self.cache.get('key'), 'release 2')
+
+    def test_cull_evicts_least_recently_used(self):
+        cache = self.tiered_cache(MAX_SIZE=10000)
+        for i in range(20):
+            cache.set('key{}'.format(i), 'x' * 1000)
+        stats = cache.stats()
+        self.assertLessEqual(stats['size'], 10000)
+        self.assertGreater(stats['evictions'], 0)
+        self.assertIsNone(cache.get('key0'))
+        self.assertIsNotNone(cache.get('key19'))
+
+    def test_failed_stats_write_is_rolled_back(self):
+        conn = self.cache.connection()
+        conn.execute('DROP TABLE stats')
+        self.cache.set('key', 'value')
+        self.cache.write_stats()
+        self.assertFalse(conn.in_transaction)
+        self.cache.set('other', 'value')
+        self.assertEqual(TieredCache(self.cache.location, {}).get('other'), 'value')
@@ -1,10 +1,15 @@
 from django.conf import settings
 from django.utils.text import slugify
 from django.core.cache import cache
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
 
 import os
 import yaml
 import time
+import datetime
+import hashlib
+import shutil
 import logging
 import urllib
 from urllib.parse import quote
@@ -12,10 +17,12 @@ from urllib.request import urlopen
 from urllib.error import HTTPError
 import json
 import gzip
-from io import BytesIO
+from io import BytesIO, RawIOBase
 from string import Template
 from Bio import Entrez, Medline
 import xml.etree.ElementTree as etree 
+import zipfile
+from collections import OrderedDict
 
 
 
@@ -156,4 +163,134 @@ def fetch_from_entrez(index, cache_dir=False):
             # save to cache
             save_to_cache(cache_dir, index_slug, d)
             logger.info('Saved entry for {} in cache'.format(cache_file_path))
-            return d
\ No newline at end of file
+            return d
+
+
+def bulk_create_polymorphic(objs, batch_size=1000):
+    """Bulk insert polymorphic model instances, also of models with multi-table inheritance, which bulk_create does not
+    support. The rows of the root table are created first, the rows of the child tables are then inserted with the
+    primary keys of the root rows."""
+    objs_by_model = OrderedDict()
+    for obj in objs:
+        objs_by_model.setdefault(type(obj), []).append(obj)
+
+    for model, model_objs in objs_by_model.items():
+        # concrete tables from the root down to the model itself
+        tables = [model] + list(model._meta.get_parent_list())
+        tables.reverse()
+        root = tables[0]
+
+        polymorphic_ctype = ContentType.objects.get_for_model(model, for_concrete_model=False)
+        if root is model:
+            roots = model_objs
+        else:
+            roots = [root(**{f.attname: getattr(obj, f.attname) for f in root._meta.concrete_fields
+                if not f.primary_key}) for obj in model_objs]
+        for r in roots:
+            r.polymorphic_ctype = polymorphic_ctype
+
+        # only databases that return the ids of bulk inserted rows (e.g. PostgreSQL) can insert the root rows in bulk
+        if connection.features.can_return_ids_from_bulk_insert:
+            root.objects.bulk_create(roots, batch_size=batch_size)
+        else:
+            for r in roots:
+                r.save()
+
+        for obj, r in zip(model_objs, roots):
+            for table in tables:
+                setattr(obj, table._meta.pk.attname, r.pk)
+            obj._state.adding = False
+            obj._state.db = r._state.db
+
+        with connection.cursor() as cursor:
+            for table in tables[1:]:
+                fields = table._meta.local_concrete_fields
+                sql = 'INSERT INTO {} ({}) VALUES ({})'.format(connection.ops.quote_name(table._meta.db_table),
+                    ', '.join(connection.ops.quote_name(f.column) for f in fields), ', '.join(['%s'] * len(fields)))
+                rows = [[f.get_db_prep_save(getattr(obj, f.attname), connection) for f in fields]
+                    for obj in model_objs]
+                for i in range(0, len(rows), batch_size):
+                    cursor.executemany(sql, rows[i:i + batch_size])
+
+
+class ZipStreamBuffer(RawIOBase):
+    """Unseekable file object that keeps what is written to it until it is collected"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.chunks.append(bytes(b))
+        return len(b)
+
+    def collect(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_zip(entries):
+    """Generate a ZIP archive in chunks from an iterable of (file name, file contents) tuples, for use with a
+    StreamingHttpResponse. Only one entry is kept in memory at a time."""
+    buffer = ZipStreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        for name, data in entries:
+            zipf.writestr(name, data)
+            yield buffer.collect()
+    yield buffer.collect()
+
+
+class BuildCheckpoint(object):
+    """Completed batches of an import, kept as marker files in the build cache so that an interrupted import can
+    continue where it stopped. The markers belong to the given source files (in the order they are read) and batch
+    size, they do not apply when these change. Each marker holds the keys of the rows its batch loaded, which are
+    checked with verify(keys) before the marker is trusted, so that a reset database is loaded again.
+    Batches can be marked from several processes at the same time."""
+
+    def __init__(self, name, source_files, batch_size, verify=None):
+        signature = hashlib.sha1('batch_size:{}\n'.format(batch_size).encode('utf-8'))
+        for source_file in source_files:
+            stat = os.stat(source_file)
+            signature.update('{}:{}:{}\n'.format(source_file, stat.st_size, int(stat.st_mtime)).encode('utf-8'))
+        self.verify = verify
+        self.path = os.sep.join([settings.BUILD_CACHE_DIR, 'checkpoints', name])
+        self.source_path = os.sep.join([self.path, signature.hexdigest()])
+        os.makedirs(self.source_path, exist_ok=True)
+
+    def marker(self, batch):
+        return os.sep.join([self.source_path, str(batch)])
+
+    def is_done(self, batch):
+        try:
+            with open(self.marker(batch)) as marker:
+                keys = json.load(marker)
+        except (IOError, ValueError):
+            return False
+        if self.verify and not self.verify(keys):
+            os.remove(self.marker(batch))
+            return False
+        return True
+
+    def mark_done(self, batch, keys=()):
+        # written to a temporary file first, so that a marker is never read half written
+        with open(self.marker(batch) + '.tmp', 'w') as marker:
+            json.dump(list(keys), marker)
+        os.replace(self.marker(batch) + '.tmp', self.marker(batch))
+
+    def done_count(self):
+        return len([f for f in os.listdir(self.source_path) if not f.endswith('.tmp')])
+
+    def clear(self):
+        """Remove the markers, e.g. when the import has completed"""
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def report_throughput(done, total, start_time, unit='records'):
+    """Print the progress of a build step and its rate since start_time"""
+    elapsed = max(time.time() - start_time, 1e-6)
+    print('{} Status {} out of {} {}, {:.0f} {}/s'.format(
+        datetime.datetime.strftime(datetime.datetime.now(), '%Y-%m-%d %H:%M:%S'), done, total, unit,
+        done / elapsed, unit))
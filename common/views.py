@@ -11,6 +11,7 @@ from common import definitions
 from structure.models import Structure, StructureModel, StructureComplexModel
 from protein.models import Protein, ProteinFamily, ProteinSegment, Species, ProteinSource, ProteinSet, ProteinGProtein, ProteinGProteinPair
 from residue.models import ResidueGenericNumber, ResidueNumberingScheme, ResidueGenericNumberEquivalent, ResiduePositionSet
+from residue.functions import get_gn_equivalents
 from interaction.forms import PDBform
 from construct.tool import FileUploadForm
 
@@ -1328,7 +1329,8 @@ def ResiduesUpload(request):
                 continue
             try:
                 if row[0].value == 'residue':
-                    position = ResidueGenericNumberEquivalent.objects.get(label=row[2].value, scheme__slug=row[1].value)
+                    # generic numbers are resolved from the in-process table of the scheme, one query per scheme
+                    position = get_gn_equivalents([row[2].value], row[1].value)[0]
                     o.append(position)
                 elif row[0].value == 'helix':
                     o.append(ProteinSegment.objects.get(slug=row[2].value))
@@ -8,7 +8,7 @@ from django import forms
 from construct.models import *
 from structure.models import Structure
 from protein.models import ProteinConformation, Protein, ProteinSegment, ProteinFamily
-from alignment.models import AlignmentConsensus
+from common.alignment_consensus import get_consensus
 from common.definitions import AMINO_ACIDS, AMINO_ACID_GROUPS, STRUCTURAL_RULES, STRUCTURAL_SWITCHES
 
 import json
@@ -18,7 +18,6 @@ import xlrd
 import yaml
 import os
 import time
-import pickle
 
 Alignment = getattr(__import__('common.alignment_' + settings.SITE_NAME, fromlist=['Alignment']), 'Alignment')
 
@@ -1448,17 +1447,12 @@ def cons_rf(request, slug, **response_kwargs):
     rf_proteins = Protein.objects.filter(family__slug__startswith="_".join(level.split("_")[0:3]), source__name='SWISSPROT',species__common_name='Human')
     align_segments = ProteinSegment.objects.all().filter(slug__in = list(settings.REFERENCE_POSITIONS.keys())).prefetch_related()
 
-    amino_acids_stats = {}
-    amino_acids_groups_stats = {}
-        
 
     print(len(rf_proteins))
 
-    try:
-
-        # Load alignment 
-        a = pickle.loads(AlignmentConsensus.objects.get(slug="_".join(level.split("_")[0:3])).alignment)
-    except:
+    # Load consensus
+    a = get_consensus("_".join(level.split("_")[0:3]))
+    if a is None:
         print('failed!')
         a = Alignment()
 
@@ -1472,23 +1466,6 @@ def cons_rf(request, slug, **response_kwargs):
         # calculate consensus sequence + amino acid and feature frequency
         a.calculate_statistics()
 
-    s_id = 0
-    a_id = 0
-    for ns, segments in a.generic_numbers.items():
-        for s, num in segments.items():
-            for n, dn in num.items():
-                temp = []
-                temp2 = []
-                for i, aa in enumerate(AMINO_ACIDS):
-                    temp.append(a.amino_acid_stats[i][s_id][a_id])
-
-                for i, aa in enumerate(AMINO_ACID_GROUPS):
-                    temp2.append(a.feature_stats[i][s_id][a_id])
-                amino_acids_stats[n] = temp
-                amino_acids_groups_stats[n] = temp2
-            a_id += 1
-        s_id += 1
-
     potentials = {}
     for seg, aa_list in a.consensus.items():
         for gn, aa in aa_list.items():
@@ -1520,13 +1497,9 @@ def cons_rf_and_class(request, slug, **response_kwargs):
     rf_proteins = Protein.objects.filter(family__slug__startswith="_".join(level.split("_")[0:3]), source__name='SWISSPROT',species__common_name='Human')
     align_segments = ProteinSegment.objects.all().filter(slug__in = list(settings.REFERENCE_POSITIONS.keys())).prefetch_related()
 
-    amino_acids_stats = {}
-    amino_acids_groups_stats = {}
-        
-    try:
-        # Load alignment 
-        a = pickle.loads(AlignmentConsensus.objects.get(slug="_".join(level.split("_")[0:3])).alignment)
-    except:
+    # Load consensus
+    a = get_consensus("_".join(level.split("_")[0:3]))
+    if a is None:
         print('failed!')
         a = Alignment()
 
@@ -1540,23 +1513,6 @@ def cons_rf_and_class(request, slug, **response_kwargs):
         # calculate consensus sequence + amino acid and feature frequency
         a.calculate_statistics()
 
-    s_id = 0
-    a_id = 0
-    for ns, segments in a.generic_numbers.items():
-        for s, num in segments.items():
-            for n, dn in num.items():
-                temp = []
-                temp2 = []
-                for i, aa in enumerate(AMINO_ACIDS):
-                    temp.append(a.amino_acid_stats[i][s_id][a_id])
-
-                for i, aa in enumerate(AMINO_ACID_GROUPS):
-                    temp2.append(a.feature_stats[i][s_id][a_id])
-                amino_acids_stats[n] = temp
-                amino_acids_groups_stats[n] = temp2
-            a_id += 1
-        s_id += 1
-
     potentials = {}
     for seg, aa_list in a.consensus.items():
         for gn, aa in aa_list.items():
@@ -1569,13 +1525,9 @@ def cons_rf_and_class(request, slug, **response_kwargs):
         class_proteins = Protein.objects.filter(family__slug__startswith="_".join(level.split("_")[0:1]), source__name='SWISSPROT',species__common_name='Human')
         align_segments = ProteinSegment.objects.all().filter(slug__in = list(settings.REFERENCE_POSITIONS.keys())).prefetch_related()
 
-        amino_acids_stats = {}
-        amino_acids_groups_stats = {}
-            
-        try:
-            # Load alignment 
-            a = pickle.loads(AlignmentConsensus.objects.get(slug="_".join(level.split("_")[0:1])).alignment)
-        except:
+        # Load consensus
+        a = get_consensus("_".join(level.split("_")[0:1]))
+        if a is None:
             print('failed!')
 
             a = Alignment()
@@ -1590,23 +1542,6 @@ def cons_rf_and_class(request, slug, **response_kwargs):
             # calculate consensus sequence + amino acid and feature frequency
             a.calculate_statistics()
 
-        s_id = 0
-        a_id = 0
-        for ns, segments in a.generic_numbers.items():
-            for s, num in segments.items():
-                for n, dn in num.items():
-                    temp = []
-                    temp2 = []
-                    for i, aa in enumerate(AMINO_ACIDS):
-                        temp.append(a.amino_acid_stats[i][s_id][a_id])
-
-                    for i, aa in enumerate(AMINO_ACID_GROUPS):
-                        temp2.append(a.feature_stats[i][s_id][a_id])
-                    amino_acids_stats[n] = temp
-                    amino_acids_groups_stats[n] = temp2
-                a_id += 1
-            s_id += 1
-
         potentials2 = {}
         for seg, aa_list in a.consensus.items():
             for gn, aa in aa_list.items():
@@ -1696,20 +1631,12 @@ def calculate_conservation(proteins = None, slug = None):
     # Return a a dictionary of each generic number and the conserved residue and its frequency
     # Can either be used on a list of proteins or on a slug. If slug then use the cached alignment object.
 
-    amino_acids_stats = {}
-    amino_acids_groups_stats = {}
-
     if slug:
-        try: 
-            # Load alignment 
-            alignment_consensus = AlignmentConsensus.objects.get(slug=slug)
-            if alignment_consensus.gn_consensus:
-                alignment_consensus = pickle.loads(alignment_consensus.gn_consensus)
-                # make sure it has this value, so it's newest version
-                test = alignment_consensus['1x50'][2]
-                return alignment_consensus
-            a = pickle.loads(alignment_consensus.alignment)
-        except: 
+        # Load consensus
+        alignment_consensus = get_consensus(slug)
+        if alignment_consensus:
+            return alignment_consensus.conservation()
+        else:
             print('no saved alignment')
             proteins = Protein.objects.filter(family__slug__startswith=slug, source__name='SWISSPROT',species__common_name='Human')
             align_segments = ProteinSegment.objects.all().filter(slug__in = list(settings.REFERENCE_POSITIONS.keys())).prefetch_related()
@@ -1719,7 +1646,6 @@ def calculate_conservation(proteins = None, slug = None):
             a.build_alignment()
             # calculate consensus sequence + amino acid and feature frequency
             a.calculate_statistics()
-            alignment_consensus = None
     elif proteins:
         align_segments = ProteinSegment.objects.all().filter(slug__in = list(settings.REFERENCE_POSITIONS.keys())).prefetch_related()
         a = Alignment()
@@ -1740,8 +1666,4 @@ def calculate_conservation(proteins = None, slug = None):
                     aa_count_dict[aa] = (num,round(num/num_proteins,3))
             if 'x' in gn: # only takes those GN positions that are actual 1x50 etc
                 consensus[gn] = [aal[0],aal[1],aa_count_dict]
-    if slug and alignment_consensus:
-        alignment_consensus.gn_consensus = pickle.dumps(consensus)
-        alignment_consensus.save()
-
     return consensus
@@ -9,6 +9,10 @@ from structure.models import Structure
 # Distance between residues in peptide
 NUM_SKIP_RESIDUES = 4
 
+# Version of the interaction detection, part of the structure hashes of build_crystal_interactions. Increase it when
+# the way interactions are found or classified changes, so that the stored interactions are computed again
+INTERACTION_ALGORITHM_VERSION = 2
+
 
 def compute_interactions(pdb_name):
     # Ensure that the PDB name is lowercase
@@ -20,8 +24,8 @@ def compute_interactions(pdb_name):
     # Get the preferred chain
     preferred_chain = s.preferred_chain.split(',')[0]
 
-    # Get the Biopython structure for the PDB
-    s = pdb_get_structure(pdb_name)
+    # Get the Biopython structure of the preferred chain
+    s = pdb_get_structure(pdb_name, s, preferred_chain)
 
     # Get all atoms
     atom_list = Selection.unfold_entities(s[0][preferred_chain], 'A')
@@ -37,7 +41,7 @@ def compute_interactions(pdb_name):
     all_aa_neighbors = [pair for pair in all_aa_neighbors if abs(pair[0].id[1] - pair[1].id[1]) > NUM_SKIP_RESIDUES]
 
     # For each pair of interacting residues, determine the type of interaction
-    interactions = [InteractingPair(res_pair[0], res_pair[1], get_interactions(res_pair[0], res_pair[1])) for res_pair in all_aa_neighbors]
+    interactions = [InteractingPair(res_pair[0], res_pair[1], res_interactions) for res_pair, res_interactions in zip(all_aa_neighbors, get_interactions_batch(all_aa_neighbors))]
 
     # Split unto classified and unclassified.
     classified = [interaction for interaction in interactions if len(interaction.get_interactions()) > 0]
@@ -453,3 +453,217 @@ def get_interactions(res1, res2):
     interactions += get_van_der_waals_interactions(res1, res2)
 
     return interactions
+
+
+# Distance (in Angstrom) around each cut-off within which the batched classifier re-checks a pair with the per-pair
+# functions, so that rounding differences between the vectorized and per-pair distances never change the result
+BATCH_DISTANCE_MARGIN = 1e-3
+
+# Maximum number of atom-atom distances computed at once by the batched classifier
+BATCH_MAX_DISTANCES = 4000000
+
+
+class ResidueDescriptors:
+    'Per-residue atom coordinates, atom masks and ring descriptors, computed once per structure'
+    def __init__(self, residues):
+        self.residues = []
+        self.index = {}
+        for res in residues:
+            if id(res) not in self.index:
+                self.index[id(res)] = len(self.residues)
+                self.residues.append(res)
+
+        num_atoms = max([len(res.child_list) for res in self.residues] + [1])
+        shape = (len(self.residues), num_atoms)
+        self.coords = numpy.full(shape + (3,), numpy.nan, dtype=numpy.float32)
+        self.carbon = numpy.zeros(shape, dtype=bool)
+        self.polar = numpy.zeros(shape, dtype=bool)
+        self.sidechain_polar = numpy.zeros(shape, dtype=bool)
+        self.backbone_polar = numpy.zeros(shape, dtype=bool)
+        self.hbond_donor = numpy.zeros(shape, dtype=bool)
+        self.hbond_acceptor = numpy.zeros(shape, dtype=bool)
+        self.vdw_radius = numpy.full(shape, numpy.nan)
+
+        self.has_backbone = numpy.zeros(len(self.residues), dtype=bool)
+        self.has_vdw_radii = numpy.zeros(len(self.residues), dtype=bool)
+        self.is_water = numpy.zeros(len(self.residues), dtype=bool)
+        self.is_hbd = numpy.zeros(len(self.residues), dtype=bool)
+        self.is_hba = numpy.zeros(len(self.residues), dtype=bool)
+
+        self.rings = []
+        self.pos_charged_atom = []
+        for i, res in enumerate(self.residues):
+            donors = get_hbond_donor_references(res)
+            acceptors = get_hbond_acceptors(res)
+            for j, atom in enumerate(res.child_list):
+                self.coords[i, j] = atom.coord
+                self.carbon[i, j] = atom.element == 'C'
+                self.polar[i, j] = atom.element in ('N', 'O', 'S')
+                self.sidechain_polar[i, j] = ((atom.element == 'N' and atom.name != 'N')
+                    or (atom.element == 'O' and atom.name != 'O') or atom.element == 'S')
+                self.backbone_polar[i, j] = atom.name in ('N', 'O')
+                self.hbond_donor[i, j] = atom.name in donors
+                self.hbond_acceptor[i, j] = atom.name in acceptors
+                if atom.element in VDW_RADII:
+                    self.vdw_radius[i, j] = VDW_RADII[atom.element]
+
+            self.has_backbone[i] = 'N' in res.child_dict and 'O' in res.child_dict
+            self.has_vdw_radii[i] = all(atom.element in VDW_RADII for atom in res.child_list)
+            self.is_water[i] = is_water(res)
+            self.is_hbd[i] = is_hbd(res)
+            self.is_hba[i] = is_hba(res)
+
+            # Ring centers and normals
+            self.rings.append(list(get_ring_descriptors(res)))
+
+            # Only the first positively charged atom is compared to the ring centers of the other residue, see
+            # has_pi_cation_interaction
+            pos_atom_names = get_pos_charged_atom_names(res)
+            if pos_atom_names and pos_atom_names[0] in res.child_dict:
+                self.pos_charged_atom.append(res.child_dict[pos_atom_names[0]].coord)
+            else:
+                self.pos_charged_atom.append(None)
+
+
+# Returns for each pair of atom masks whether any atoms pair is certainly within the cut-off, and whether a pair is
+# so close to the cut-off that it has to be checked by the per-pair function
+def close_atoms(distances, mask1, mask2, cutoff):
+    mask = mask1[:, :, numpy.newaxis] & mask2[:, numpy.newaxis, :]
+    certain = (mask & (distances <= cutoff - BATCH_DISTANCE_MARGIN)).any(axis=(1, 2))
+    possible = (mask & (distances <= cutoff + BATCH_DISTANCE_MARGIN)).any(axis=(1, 2))
+    return certain, possible & ~certain
+
+
+def batch_has_face_to_face_interaction(rings1, rings2):
+    # get_ring_descriptors returns an iterator, so the per-pair function compares only the first ring of res1
+    return any([(math.degrees(angle_between_plane_normals(r1[1], r2[1])) <= 20)
+                and (numpy.linalg.norm(numpy.subtract(r1[0], r2[0])) <= 5.0)
+                for r1 in rings1[:1] for r2 in rings2])
+
+
+def batch_has_edge_to_face_interaction(rings1, rings2):
+    # get_ring_descriptors returns an iterator, so the per-pair function compares only the first ring of res1
+    return any([(math.degrees(abs(angle_between_plane_normals(r1[1], r2[1]) - 1.5707963267)) <= 30)
+                and (numpy.linalg.norm(numpy.subtract(r1[0], r2[0])) <= 5.2)
+                for r1 in rings1[:1] for r2 in rings2])
+
+
+def batch_has_pi_cation_interaction(rings, pos_charged_atom):
+    if pos_charged_atom is None:
+        return False
+    return any([distance_between(pos_charged_atom, desc[0]) <= 6 for desc in rings])
+
+
+def batch_get_aromatic_interactions(descriptors, i1, i2):
+    res1 = descriptors.residues[i1]
+    res2 = descriptors.residues[i2]
+    interactions = []
+
+    if is_aromatic_aa(res1) and is_aromatic_aa(res2):
+        if batch_has_face_to_face_interaction(descriptors.rings[i1], descriptors.rings[i2]):
+            interactions.append(FaceToFaceInteraction())
+
+        if batch_has_edge_to_face_interaction(descriptors.rings[i1], descriptors.rings[i2]):
+            interactions.append(EdgeToFaceInteraction())
+
+        if batch_has_edge_to_face_interaction(descriptors.rings[i2], descriptors.rings[i1]):
+            interactions.append(FaceToEdgeInteraction())
+
+    if is_aromatic_aa(res1) and is_pos_charged(res2):
+        if batch_has_pi_cation_interaction(descriptors.rings[i1], descriptors.pos_charged_atom[i2]):
+            interactions.append(PiCationInteraction())
+
+    if is_pos_charged(res1) and is_aromatic_aa(res2):
+        if batch_has_pi_cation_interaction(descriptors.rings[i2], descriptors.pos_charged_atom[i1]):
+            interactions.append(CationPiInteraction())
+
+    return interactions
+
+
+# Returns a list of interactions for each pair of residues, identical to calling get_interactions for each pair.
+# Atom coordinates and ring descriptors are computed once per residue, and the atom distance checks of all pairs
+# are done with a few array operations.
+def get_interactions_batch(residue_pairs):
+    # Padding atoms have NaN coordinates, which are never close to anything
+    with numpy.errstate(invalid='ignore'):
+        return _get_interactions_batch(residue_pairs)
+
+
+def _get_interactions_batch(residue_pairs):
+    descriptors = ResidueDescriptors([res for pair in residue_pairs for res in pair])
+    index1 = numpy.array([descriptors.index[id(pair[0])] for pair in residue_pairs], dtype=int)
+    index2 = numpy.array([descriptors.index[id(pair[1])] for pair in residue_pairs], dtype=int)
+
+    num_atoms = descriptors.coords.shape[1]
+    chunk_size = max(1, BATCH_MAX_DISTANCES // (num_atoms * num_atoms))
+
+    all_interactions = []
+    for start in range(0, len(residue_pairs), chunk_size):
+        i1 = index1[start:start + chunk_size]
+        i2 = index2[start:start + chunk_size]
+
+        # Distances between all atoms of each pair, NaN for padding
+        distances = numpy.sqrt(numpy.sum(numpy.square(descriptors.coords[i1][:, :, numpy.newaxis, :]
+            - descriptors.coords[i2][:, numpy.newaxis, :, :]), axis=3))
+        distances_21 = distances.transpose(0, 2, 1)
+
+        hydrophobic = close_atoms(distances, descriptors.carbon[i1], descriptors.carbon[i2], 4.5)
+        sidechain_backbone = close_atoms(distances, descriptors.sidechain_polar[i1], descriptors.backbone_polar[i2],
+            4.5)
+        backbone_sidechain = close_atoms(distances_21, descriptors.sidechain_polar[i2],
+            descriptors.backbone_polar[i1], 4.5)
+        sidechain_sidechain = close_atoms(distances, descriptors.sidechain_polar[i1],
+            descriptors.sidechain_polar[i2], 4.5)
+        water = close_atoms(distances, descriptors.polar[i1], descriptors.polar[i2], 4.5)
+        hbond_12 = close_atoms(distances, descriptors.hbond_donor[i1], descriptors.hbond_acceptor[i2], 3.5)
+        hbond_21 = close_atoms(distances_21, descriptors.hbond_donor[i2], descriptors.hbond_acceptor[i1], 3.5)
+
+        # Van der Waals cut-offs depend on the elements of both atoms
+        vdw_cutoffs = (descriptors.vdw_radius[i1][:, :, numpy.newaxis]
+            + descriptors.vdw_radius[i2][:, numpy.newaxis, :]) * VDW_TRESHOLD_FACTOR
+        vdw_certain = (distances <= vdw_cutoffs - BATCH_DISTANCE_MARGIN).any(axis=(1, 2))
+        vdw_possible = (distances <= vdw_cutoffs + BATCH_DISTANCE_MARGIN).any(axis=(1, 2))
+
+        for k, (a, b) in enumerate(zip(i1, i2)):
+            res1 = descriptors.residues[a]
+            res2 = descriptors.residues[b]
+            interactions = []
+
+            # Aromatic interactions
+            interactions += batch_get_aromatic_interactions(descriptors, a, b)
+
+            # Hydrophobic interactions
+            if hydrophobic[0][k] or (hydrophobic[1][k] and get_hydrophobic_interactions(res1, res2)):
+                interactions.append(HydrophobicInteraction())
+
+            # Polar interactions
+            if descriptors.has_backbone[a] and (backbone_sidechain[0][k]
+                or (backbone_sidechain[1][k] and get_polar_sidechain_backbone_interactions(res2, res1))):
+                interactions.append(PolarBackboneSidechainInteraction(is_charged(res1), is_charged(res2)))
+
+            if descriptors.has_backbone[b] and (sidechain_backbone[0][k]
+                or (sidechain_backbone[1][k] and get_polar_sidechain_backbone_interactions(res1, res2))):
+                interactions.append(PolarSideChainBackboneInteraction(is_charged(res1), is_charged(res2)))
+
+            if sidechain_sidechain[0][k] or (sidechain_sidechain[1][k]
+                and get_polar_sidechain_sidechain_interactions(res1, res2)):
+                interactions.append(PolarSidechainSidechainInteraction(is_charged(res1), is_charged(res2)))
+
+            if (descriptors.is_water[a] or descriptors.is_water[b]) and (water[0][k]
+                or (water[1][k] and get_polar_water_interactions(res1, res2))):
+                interactions.append(PolarWaterInteraction())
+
+            # Only pairs with a donor and acceptor atom close enough are checked for the H-bond angle
+            if ((descriptors.is_hbd[a] and descriptors.is_hba[b] and (hbond_12[0][k] or hbond_12[1][k]))
+                or (descriptors.is_hbd[b] and descriptors.is_hba[a] and (hbond_21[0][k] or hbond_21[1][k]))):
+                interactions += get_polar_hbonds_interactions(res1, res2)
+
+            # Van der Waals interactions, the per-pair function raises the KeyError for unknown elements
+            if not (descriptors.has_vdw_radii[a] and descriptors.has_vdw_radii[b]):
+                interactions += get_van_der_waals_interactions(res1, res2)
+            elif vdw_certain[k] or (vdw_possible[k] and get_van_der_waals_interactions(res1, res2)):
+                interactions.append(VanDerWaalsInteraction())
+
+            all_interactions.append(interactions)
+
+    return all_interactions
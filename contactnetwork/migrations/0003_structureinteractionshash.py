@@ -0,0 +1,24 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('structure', '0005_auto_20180625_1634'),
+        ('contactnetwork', '0002_auto_20180117_1457'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StructureInteractionsHash',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=40)),
+                ('structure', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='structure.Structure')),
+            ],
+            options={
+                'db_table': 'structure_interactions_hash',
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('structure', '0005_auto_20180625_1634'),
+        ('contactnetwork', '0003_structureinteractionshash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FlatInteraction',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pdb_code', models.CharField(db_index=True, max_length=100)),
+                ('interaction_type', models.CharField(max_length=50)),
+                ('res1_sequence_number', models.SmallIntegerField()),
+                ('res1_generic_number', models.CharField(max_length=12, null=True)),
+                ('res1_segment', models.CharField(max_length=100, null=True)),
+                ('res1_amino_acid', models.CharField(max_length=1)),
+                ('res2_sequence_number', models.SmallIntegerField()),
+                ('res2_generic_number', models.CharField(max_length=12, null=True)),
+                ('res2_segment', models.CharField(max_length=100, null=True)),
+                ('res2_amino_acid', models.CharField(max_length=1)),
+                ('structure', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='structure.Structure')),
+            ],
+            options={
+                'db_table': 'interaction_flat',
+            },
+        ),
+    ]
@@ -1,15 +1,13 @@
-import urllib.request
-import os
-
 from Bio.PDB import *
 from Bio.PDB.mmtf import *
 from Bio.PDB.PDBExceptions import PDBException
 
-from io import StringIO
+from contactnetwork.structure_store import get_pdb_data, get_structure
 
-# Download the specified MMTF file from RCSB.
-def mmtf_get_structure(pdb_name):
-    # Download the PDB
-    response = urllib.request.urlopen('http://mmtf.rcsb.org/v1.0/full/%s' % pdb_name)
+# Get the specified structure from the local structure store, or download the MMTF file from RCSB if it is not
+# available locally.
+def mmtf_get_structure(pdb_name, structure=None):
+    if get_pdb_data(pdb_name, structure) is not None:
+        return get_structure(pdb_name, structure)
 
     return MMTFParser.get_structure_from_url(pdb_name)
@@ -13,6 +13,14 @@ class InteractingResiduePair(PolymorphicModel):
         db_table = 'interacting_residue_pair'
 
 
+class StructureInteractionsHash(models.Model):
+    structure = models.OneToOneField('structure.Structure', on_delete=models.CASCADE)
+    content_hash = models.CharField(max_length=40) # SHA-1 of the coordinates and preferred chain used
+
+    class Meta():
+        db_table = 'structure_interactions_hash'
+
+
 class Interaction(PolymorphicModel):
     interacting_pair = models.ForeignKey('contactnetwork.InteractingResiduePair', on_delete=models.CASCADE)
 
@@ -93,3 +101,22 @@ class PiCationInteraction(AromaticInteraction):
 
     class Meta():
         db_table = 'interaction_aromatic_pi_cation'
+
+
+class FlatInteraction(models.Model):
+    # One row per structure, residue pair and interaction type, with the residue information used by the
+    # interaction browser, so that it can be read without joins
+    structure = models.ForeignKey('structure.Structure', on_delete=models.CASCADE)
+    pdb_code = models.CharField(max_length=100, db_index=True)
+    interaction_type = models.CharField(max_length=50)
+    res1_sequence_number = models.SmallIntegerField()
+    res1_generic_number = models.CharField(max_length=12, null=True)
+    res1_segment = models.CharField(max_length=100, null=True)
+    res1_amino_acid = models.CharField(max_length=1)
+    res2_sequence_number = models.SmallIntegerField()
+    res2_generic_number = models.CharField(max_length=12, null=True)
+    res2_segment = models.CharField(max_length=100, null=True)
+    res2_amino_acid = models.CharField(max_length=1)
+
+    class Meta():
+        db_table = 'interaction_flat'
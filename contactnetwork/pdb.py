@@ -1,29 +1,6 @@
-import urllib.request
-import os
+from contactnetwork.structure_store import get_structure
 
-from Bio.PDB import *
-from Bio.PDB.PDBExceptions import PDBException
-
-from io import StringIO
-
-# Download the specified PDB file from RCSB.
-def pdb_get_structure(pdb_name):
-    # Download the PDB
-    response = urllib.request.urlopen('http://www.rcsb.org/pdb/files/%s.pdb' % pdb_name)
-
-    # Check that the requested PDB name is valid
-    if response.getcode() == 404:
-        raise PDBException('No PDB with name %s in RCSB.' % pdb_name)
-    # And that it could be retrieved
-    elif response.getcode() != 200:
-        raise PDBException('Could not retrieve PDB file from RCSB.')
-
-    # Decode the response
-    contents = response.read().decode("utf-8")
-
-    # Create filehandle
-    f = StringIO(contents)
-
-    # Return the structure
-    p = PDBParser(QUIET=True)
-    return p.get_structure(pdb_name, f)
+# Get the specified PDB structure from the local structure store (downloaded from RCSB if it is not available
+# locally), only the given chain of the first model if chain is set.
+def pdb_get_structure(pdb_name, structure=None, chain=None):
+    return get_structure(pdb_name, structure, chain)
@@ -0,0 +1,164 @@
+from django.conf import settings
+
+from Bio.PDB import PDBParser
+from Bio.PDB.PDBExceptions import PDBConstructionWarning, PDBException
+from Bio.PDB.StructureBuilder import StructureBuilder
+
+from structure.models import Structure
+
+from io import StringIO
+import hashlib
+import numpy as np
+import os
+import tempfile
+import urllib.request
+import warnings
+
+# Parsed structures are stored as one numpy record array per structure, named by the SHA-1 of the PDB file
+# contents, so that they can be memory mapped and a changed PDB file never reuses an old entry.
+STRUCTURE_STORE_DIR = os.sep.join([settings.BUILD_CACHE_DIR, 'structure_store'])
+
+# PDB files downloaded by build_structures
+PDB_DATA_DIR = os.sep.join([settings.DATA_DIR, 'structure_data', 'pdbs'])
+
+# One record per atom, in file order
+ATOM_DTYPE = np.dtype([
+    ('model', np.int16),
+    ('model_serial', np.int16),
+    ('chain', 'U4'),
+    ('segid', 'U4'),
+    ('hetfield', 'U1'),
+    ('resseq', np.int32),
+    ('icode', 'U1'),
+    ('resname', 'U3'),
+    ('name', 'U4'),
+    ('fullname', 'U4'),
+    ('altloc', 'U1'),
+    ('serial', np.int32),
+    ('element', 'U2'),
+    ('coord', np.float32, 3),
+    ('occupancy', np.float64),
+    ('bfactor', np.float64),
+])
+
+
+def get_pdb_data(pdb_name, structure=None):
+    """Return the PDB file contents of a structure, from the database or the local PDB file directory"""
+    if structure is None:
+        structure = Structure.objects.filter(protein_conformation__protein__entry_name=pdb_name.lower()).select_related(
+            'pdb_data').first()
+    if structure is not None and structure.pdb_data is not None:
+        return structure.pdb_data.pdb
+
+    for name in (pdb_name.upper(), pdb_name.lower()):
+        pdb_path = os.sep.join([PDB_DATA_DIR, name + '.pdb'])
+        if os.path.isfile(pdb_path):
+            with open(pdb_path, 'r') as pdb_file:
+                return pdb_file.read()
+
+    return None
+
+
+def download_pdb_data(pdb_name):
+    """Download a PDB file from RCSB, only used for structures that are not available locally"""
+    response = urllib.request.urlopen('http://www.rcsb.org/pdb/files/%s.pdb' % pdb_name)
+
+    # Check that the requested PDB name is valid
+    if response.getcode() == 404:
+        raise PDBException('No PDB with name %s in RCSB.' % pdb_name)
+    # And that it could be retrieved
+    elif response.getcode() != 200:
+        raise PDBException('Could not retrieve PDB file from RCSB.')
+
+    return response.read().decode("utf-8")
+
+
+def structure_to_array(s):
+    """Flatten a Biopython structure into an atom record array"""
+    records = []
+    for model in s:
+        model_serial = model.serial_num if model.serial_num is not None else -1
+        for chain in model:
+            for disordered_residue in chain:
+                # point mutations are stored as a residue per residue name
+                if disordered_residue.is_disordered() == 2:
+                    residues = disordered_residue.disordered_get_list()
+                else:
+                    residues = [disordered_residue]
+                for residue in residues:
+                    hetfield, resseq, icode = residue.id
+                    for atom in residue.get_unpacked_list():
+                        records.append((model.id, model_serial, chain.id, residue.segid, hetfield[0], resseq,
+                            icode, residue.resname, atom.name, atom.fullname, atom.altloc, atom.serial_number or 0,
+                            atom.element, atom.coord, atom.occupancy or 0, atom.bfactor or 0))
+    return np.array(records, dtype=ATOM_DTYPE)
+
+
+def array_to_structure(structure_id, atoms, chain=None):
+    """Rebuild a Biopython structure from an atom record array. With chain, only that chain of the first model is
+    built, the records of other chains and models are skipped before any Biopython objects are created."""
+    if chain is not None and len(atoms):
+        atoms = atoms[(atoms['model'] == atoms['model'][0]) & (atoms['chain'] == chain)]
+
+    builder = StructureBuilder()
+    builder.init_structure(structure_id)
+
+    current_model = current_chain = current_segid = current_residue = None
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', PDBConstructionWarning)
+        for atom in atoms.tolist():
+            model, model_serial, chain, segid, hetflag, resseq, icode, resname, name, fullname, altloc, serial, \
+                element, coord, occupancy, bfactor = atom
+            if model != current_model:
+                builder.init_model(model, model_serial if model_serial >= 0 else None)
+                current_model = model
+                current_chain = current_segid = current_residue = None
+            if segid != current_segid:
+                builder.init_seg(segid.ljust(4))
+                current_segid = segid
+            if chain != current_chain:
+                builder.init_chain(chain)
+                current_chain = chain
+                current_residue = None
+            residue = (hetflag, resseq, icode, resname)
+            if residue != current_residue:
+                builder.init_residue(resname, hetflag or ' ', resseq, icode or ' ')
+                current_residue = residue
+            builder.init_atom(name, np.array(coord, dtype='f'), bfactor, occupancy, altloc or ' ',
+                fullname, serial, element)
+
+    return builder.get_structure()
+
+
+def store_path(content_hash):
+    return os.sep.join([STRUCTURE_STORE_DIR, content_hash[:2], content_hash + '.npy'])
+
+
+def load_atoms(pdb_name, pdb_data):
+    """Return the atom records of a PDB file, parsing and storing it if it is not in the store yet"""
+    content_hash = hashlib.sha1(pdb_data.encode('utf-8')).hexdigest()
+    path = store_path(content_hash)
+    if os.path.isfile(path):
+        return np.load(path, mmap_mode='r')
+
+    p = PDBParser(QUIET=True)
+    atoms = structure_to_array(p.get_structure(pdb_name, StringIO(pdb_data)))
+
+    # write to a temporary file first, parallel builds can store the same structure at the same time
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        np.save(f, atoms)
+    os.replace(tmp_path, path)
+
+    return atoms
+
+
+def get_structure(pdb_name, structure=None, chain=None):
+    """Return the Biopython structure of a PDB from the local structure store, only the given chain of the first
+    model if chain is set"""
+    pdb_data = get_pdb_data(pdb_name, structure)
+    if pdb_data is None:
+        pdb_data = download_pdb_data(pdb_name)
+
+    return array_to_structure(pdb_name, load_atoms(pdb_name, pdb_data), chain)
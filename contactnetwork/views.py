@@ -6,12 +6,20 @@ from django.conf import settings
 
 import json
 import functools
+import hashlib
 
 from contactnetwork.models import *
 from structure.models import Structure
 from protein.models import Protein, ProteinSegment
 
-Alignment = getattr(__import__('common.alignment_' + settings.SITE_NAME, fromlist=['Alignment']), 'Alignment')
+AlignmentMatrix = getattr(__import__('common.alignment_' + settings.SITE_NAME, fromlist=['AlignmentMatrix']),
+    'AlignmentMatrix')
+from django.core.cache import cache
+from django.core.cache import caches
+try:
+    cache_alignment = caches['alignments']
+except:
+    cache_alignment = cache
 
 from django.http import JsonResponse, HttpResponse
 from collections import OrderedDict
@@ -102,6 +110,41 @@ def PdbTableData(request):
     data_table += "</tbody></table>"
     return HttpResponse(data_table)
 
+def get_consensus_maps(pdbs):
+    """
+    Consensus amino acids by generic number and by sequence number of the receptors of a set of structures, cached
+    per set of receptors
+    """
+    excluded_segment = ['C-term','N-term']
+    segments = ProteinSegment.objects.all().exclude(slug__in = excluded_segment)
+    proteins =  Protein.objects.filter(protein__entry_name__in=pdbs).all()
+
+    key = 'CONSENSUS_MAPS_' + hashlib.md5(','.join(str(pk) for pk in sorted(proteins.values_list('pk',
+        flat=True))).encode('utf-8')).hexdigest()
+    maps = cache_alignment.get(key)
+    if maps is not None:
+        return maps
+
+    # Create a consensus sequence.
+    a = AlignmentMatrix()
+    a.load_proteins(proteins)
+    a.load_segments(segments) #get all segments to make correct diagrams
+    # build the alignment data matrix
+    a.build_alignment()
+    # calculate consensus sequence + amino acid and feature frequency
+    a.calculate_statistics()
+    consensus = a.full_consensus
+
+    gn_map = OrderedDict()
+    pos_map = OrderedDict()
+    for aa in consensus:
+        if 'x' in aa.family_generic_number:
+            gn_map[aa.family_generic_number] = aa.amino_acid
+            pos_map[aa.sequence_number] = aa.amino_acid
+
+    cache_alignment.set(key, (gn_map, pos_map), 60*60*24*7) #set alignment cache one week
+    return gn_map, pos_map
+
 def InteractionData(request):
 
     def gpcrdb_number_comparator(e1, e2):
@@ -155,31 +198,31 @@ def InteractionData(request):
     segment_filter_res2 = Q()
 
     if segments:
-        segment_filter_res1 |= Q(interacting_pair__res1__protein_segment__slug__in=segments)
-        segment_filter_res2 |= Q(interacting_pair__res2__protein_segment__slug__in=segments)
+        segment_filter_res1 |= Q(res1_segment__in=segments)
+        segment_filter_res2 |= Q(res2_segment__in=segments)
 
     i_types_filter = Q()
 
     if i_types:
-        i_types_filter |= Q(polymorphic_ctype__model__in=i_types)
-
-    # Get the relevant interactions
-    interactions = Interaction.objects.filter(
-        interacting_pair__referenced_structure__protein_conformation__protein__entry_name__in=pdbs
-    ).values(
-        'interacting_pair__referenced_structure__protein_conformation__protein__entry_name',
-        'interacting_pair__res1__amino_acid',
-        'interacting_pair__res2__amino_acid',
-        'interacting_pair__res1__sequence_number',
-        'interacting_pair__res1__generic_number__label',
-        'interacting_pair__res1__protein_segment__slug',
-        'interacting_pair__res2__sequence_number',
-        'interacting_pair__res2__generic_number__label',
-        'interacting_pair__res2__protein_segment__slug',
-        'polymorphic_ctype__model',
+        i_types_filter |= Q(interaction_type__in=i_types)
+
+    # Get the relevant interactions from the flat interaction table
+    interactions = list(FlatInteraction.objects.filter(
+        pdb_code__in=pdbs
     ).filter(
         segment_filter_res1 & segment_filter_res2 & i_types_filter
-    )
+    ).values_list(
+        'pdb_code',
+        'res1_sequence_number',
+        'res2_sequence_number',
+        'res1_generic_number',
+        'res2_generic_number',
+        'res1_segment',
+        'res2_segment',
+        'res1_amino_acid',
+        'res2_amino_acid',
+        'interaction_type',
+    ))
 
 
     # Initialize response dictionary
@@ -191,30 +234,11 @@ def InteractionData(request):
     data['segment_map'] = {}
     data['aa_map'] = {}
 
-    # Create a consensus sequence.
-
-    excluded_segment = ['C-term','N-term']
-    segments = ProteinSegment.objects.all().exclude(slug__in = excluded_segment)
-    proteins =  Protein.objects.filter(protein__entry_name__in=pdbs).all()
-
-    a = Alignment()
-    a.load_proteins(proteins)
-    a.load_segments(segments) #get all segments to make correct diagrams
-    # build the alignment data matrix
-    a.build_alignment()
-    # calculate consensus sequence + amino acid and feature frequency
-    a.calculate_statistics()
-    consensus = a.full_consensus
-
-    data['gn_map'] = OrderedDict()
-    data['pos_map'] = OrderedDict()
-    for aa in consensus:
-        if 'x' in aa.family_generic_number:
-            data['gn_map'][aa.family_generic_number] = aa.amino_acid
-            data['pos_map'][aa.sequence_number] = aa.amino_acid
+    # Consensus sequence maps of the receptors of these structures
+    data['gn_map'], data['pos_map'] = get_consensus_maps(pdbs)
 
     for i in interactions:
-        pdb_name = i['interacting_pair__referenced_structure__protein_conformation__protein__entry_name']
+        pdb_name = i[0]
         if not pdb_name in data['pdbs']:
             data['pdbs'].add(pdb_name)
 
@@ -225,17 +249,7 @@ def InteractionData(request):
     # Dict to keep track of which residue numbers are in use
     number_dict = set()
 
-    for i in interactions:
-        pdb_name = i['interacting_pair__referenced_structure__protein_conformation__protein__entry_name']
-        res1_seq = i['interacting_pair__res1__sequence_number']
-        res2_seq = i['interacting_pair__res2__sequence_number']
-        res1_gen = i['interacting_pair__res1__generic_number__label']
-        res2_gen = i['interacting_pair__res2__generic_number__label']
-        res1_seg = i['interacting_pair__res1__protein_segment__slug']
-        res2_seg = i['interacting_pair__res2__protein_segment__slug']
-        res1_aa = i['interacting_pair__res1__amino_acid']
-        res2_aa = i['interacting_pair__res2__amino_acid']
-        model = i['polymorphic_ctype__model']
+    for pdb_name, res1_seq, res2_seq, res1_gen, res2_gen, res1_seg, res2_seg, res1_aa, res2_aa, model in interactions:
 
         if generic and (not res1_gen or not res2_gen):
             continue
@@ -698,7 +698,7 @@ def calculate(request, redirect=None):
                 runusercalculation(pdbname, session_key)
 
             # MAPPING GPCRdb numbering onto pdb.
-            generic_numbering = GenericNumbering(temp_path,top_results=1)
+            generic_numbering = GenericNumbering(temp_path,top_results=1, use_index=True)
             out_struct = generic_numbering.assign_generic_numbers()
             structure_residues = generic_numbering.residues
             prot_id_list = generic_numbering.prot_id_list
@@ -1033,7 +1033,7 @@ def excel(request, slug, **response_kwargs):
 
         mypath = '/tmp/interactions/' + session + '/pdbs/' + slug + '.pdb'
 
-        generic_numbering = GenericNumbering(mypath)
+        generic_numbering = GenericNumbering(mypath, use_index=True)
         out_struct = generic_numbering.assign_generic_numbers()
         structure_residues = generic_numbering.residues
         results = parseusercalculation(slug,session)
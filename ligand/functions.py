@@ -4,7 +4,7 @@ from django.db import IntegrityError
 #from chembl_webresource_client import new_client
 from common.models import WebResource
 from common.models import WebLink
-from ligand.models import Ligand, LigandType, LigandProperities
+from ligand.models import Ligand, LigandType, LigandProperities, LigandVendorLink
 
 def get_or_make_ligand(ligand_id,type_id, name = None):
     if type_id=='PubChem CID' or type_id=='SMILES':
@@ -163,3 +163,11 @@ def get_or_make_ligand(ligand_id,type_id, name = None):
 #    #https://www.ebi.ac.uk/chembl/doc/inspect/CHEMBL2766014
 
 #    return refs
+
+# sources listed as vendors that do not sell compounds, a ligand is purchasable if it has any other vendor
+NON_COMMERCIAL_VENDORS = ['ZINC', 'ChEMBL', 'BindingDB', 'SureChEMBL', 'eMolecules', 'MolPort', 'PubChem']
+
+def purchasable_properities():
+    """Ids of the ligand properities with a commercial vendor"""
+    return set(LigandVendorLink.objects.exclude(vendor__name__in=NON_COMMERCIAL_VENDORS).values_list('lp_id',
+        flat=True).distinct())
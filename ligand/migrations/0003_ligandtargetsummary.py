@@ -0,0 +1,50 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('protein', '0003_proteinsequencecard'),
+        ('ligand', '0002_auto_20180117_1457'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LigandTargetSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('family_slug', models.CharField(db_index=True, max_length=100)),
+                ('entry_name', models.CharField(db_index=True, max_length=100)),
+                ('species', models.CharField(max_length=100)),
+                ('chembl_id', models.CharField(max_length=100)),
+                ('record_count', models.IntegerField()),
+                ('assay_types', models.CharField(max_length=20)),
+                ('min_value', models.FloatField()),
+                ('avg_value', models.FloatField()),
+                ('max_value', models.FloatField()),
+                ('bind_count', models.IntegerField(default=0)),
+                ('bind_min', models.FloatField(null=True)),
+                ('bind_avg', models.FloatField(null=True)),
+                ('bind_max', models.FloatField(null=True)),
+                ('funct_count', models.IntegerField(default=0)),
+                ('funct_min', models.FloatField(null=True)),
+                ('funct_avg', models.FloatField(null=True)),
+                ('funct_max', models.FloatField(null=True)),
+                ('standard_units', models.CharField(max_length=100)),
+                ('purchasable', models.BooleanField(default=False)),
+                ('smiles', models.TextField(null=True)),
+                ('mw', models.FloatField(null=True)),
+                ('rotatable_bonds', models.SmallIntegerField(null=True)),
+                ('hdon', models.SmallIntegerField(null=True)),
+                ('hacc', models.SmallIntegerField(null=True)),
+                ('logp', models.FloatField(null=True)),
+                ('ligand', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='ligand.Ligand')),
+                ('protein', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='protein.Protein')),
+            ],
+            options={
+                'db_table': 'ligand_target_summary',
+                'unique_together': {('ligand', 'protein')},
+            },
+        ),
+    ]
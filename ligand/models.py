@@ -349,3 +349,39 @@ class LigandVendorLink(models.Model):
     vendor_external_id = models.CharField(max_length=300) #RegistryID
     sid = models.CharField(max_length=200, unique=True) #SID
     
+
+
+class LigandTargetSummary(models.Model):
+    # activities of a ChEMBL ligand on a protein, aggregated by build_ligand_summary for the target details pages.
+    # The protein and ligand fields are copied so that the pages can filter, sort and page without joins.
+    ligand = models.ForeignKey('Ligand', on_delete=models.CASCADE)
+    protein = models.ForeignKey('protein.Protein', on_delete=models.CASCADE)
+    family_slug = models.CharField(max_length=100, db_index=True) # slug of the protein family, filtered by prefix
+    entry_name = models.CharField(max_length=100, db_index=True)
+    species = models.CharField(max_length=100)
+    chembl_id = models.CharField(max_length=100)
+    record_count = models.IntegerField()
+    assay_types = models.CharField(max_length=20) # Bind, Funct or both
+    min_value = models.FloatField() # pchembl values of all assays
+    avg_value = models.FloatField()
+    max_value = models.FloatField()
+    bind_count = models.IntegerField(default=0) # pchembl values of binding assays
+    bind_min = models.FloatField(null=True)
+    bind_avg = models.FloatField(null=True)
+    bind_max = models.FloatField(null=True)
+    funct_count = models.IntegerField(default=0) # pchembl values of the other (functional) assays
+    funct_min = models.FloatField(null=True)
+    funct_avg = models.FloatField(null=True)
+    funct_max = models.FloatField(null=True)
+    standard_units = models.CharField(max_length=100)
+    purchasable = models.BooleanField(default=False)
+    smiles = models.TextField(null=True)
+    mw = models.FloatField(null=True)
+    rotatable_bonds = models.SmallIntegerField(null=True)
+    hdon = models.SmallIntegerField(null=True)
+    hacc = models.SmallIntegerField(null=True)
+    logp = models.FloatField(null=True)
+
+    class Meta():
+        db_table = 'ligand_target_summary'
+        unique_together = ('ligand', 'protein')
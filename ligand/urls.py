@@ -7,7 +7,11 @@ urlpatterns = [
     url(r'^$', cache_page(3600*24*7)(LigandBrowser.as_view()), name='ligand_browser'),
     url(r'^target/all/(?P<slug>[-\w]+)/$',TargetDetails, name='ligand_target_detail'),
     url(r'^target/compact/(?P<slug>[-\w]+)/$',TargetDetailsCompact, name='ligand_target_detail_compact'),
+    url(r'^target/compact/(?P<slug>[-\w]+)/data/$',TargetDetailsCompactData, name='ligand_target_detail_compact_data'),
+    url(r'^target/compact/(?P<slug>[-\w]+)/export/$',TargetDetailsCompactExport, name='ligand_target_detail_compact_export'),
     url(r'^targets$',TargetDetails, name='ligand_target_detail'),
+    url(r'^targets_compact_data',TargetDetailsCompactData, name='ligand_target_detail_compact_data'),
+    url(r'^targets_compact_export',TargetDetailsCompactExport, name='ligand_target_detail_compact_export'),
     url(r'^targets_compact',TargetDetailsCompact, name='ligand_target_detail_compact'),
     url(r'^targets_purchasable',TargetPurchasabilityDetails, name='ligand_target_detail_purchasable'),
     url(r'^(?P<ligand_id>[-\w]+)/$',LigandDetails, name='ligand_detail'),
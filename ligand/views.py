@@ -1,16 +1,18 @@
-from django.db.models import Count, Avg, Min, Max
+from django.db.models import Count, Avg, Min, Max, Q
 from collections import defaultdict
 from django.shortcuts import render
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
 from django.views.generic import TemplateView, View
 
 from common.models import ReleaseNotes
 from common.phylogenetic_tree import PhylogeneticTreeGenerator
 from common.selection import Selection, SelectionItem
-from ligand.models import Ligand, AssayExperiment, LigandProperities, LigandVendorLink
+from ligand.functions import NON_COMMERCIAL_VENDORS
+from ligand.models import Ligand, AssayExperiment, LigandProperities, LigandVendorLink, LigandTargetSummary
 from protein.models import Protein, Species, ProteinFamily
 
 from copy import deepcopy
+import csv
 import itertools
 import json
     
@@ -93,131 +95,145 @@ def LigandDetails(request, ligand_id):
     return render(request, 'ligand_details.html', context)
 
 
-def TargetDetailsCompact(request, **kwargs):
+def get_target_filters(request, kwargs):
+    """The target of a target details page, with filters for its AssayExperiment and LigandTargetSummary rows. The
+    target is a family or protein slug, or the targets of the selection."""
     if 'slug' in kwargs:
         slug = kwargs['slug']
-        if slug.count('_') == 0 :
-            ps = AssayExperiment.objects.filter(protein__family__parent__parent__parent__slug=slug, ligand__properities__web_links__web_resource__slug = 'chembl_ligand')
-        elif slug.count('_') == 1 and len(slug) == 7:
-            ps = AssayExperiment.objects.filter(protein__family__parent__parent__slug=slug, ligand__properities__web_links__web_resource__slug = 'chembl_ligand')
-        elif slug.count('_') == 2:
-            ps = AssayExperiment.objects.filter(protein__family__parent__slug=slug, ligand__properities__web_links__web_resource__slug = 'chembl_ligand')
-        #elif slug.count('_') == 3:
-        elif slug.count('_') == 1 and len(slug) != 7:
-            ps = AssayExperiment.objects.filter(protein__entry_name = slug, ligand__properities__web_links__web_resource__slug = 'chembl_ligand')
-    
+        if slug.count('_') == 0 or slug.count('_') == 2 or (slug.count('_') == 1 and len(slug) == 7):
+            # proteins of a class, ligand type or receptor family
+            assay_filter = Q(protein__family__slug__startswith=slug + '_')
+            summary_filter = Q(family_slug__startswith=slug + '_')
+        else:
+            assay_filter = Q(protein__entry_name=slug)
+            summary_filter = Q(entry_name=slug)
+
         if slug.count('_') == 1 and len(slug) == 7:
-            f = ProteinFamily.objects.get(slug=slug)      
+            target = ProteinFamily.objects.get(slug=slug)
         else:
-            f = slug
+            target = slug
+        return target, assay_filter, summary_filter
 
-        context = {
-            'target':f
-            }
-    else:
-        simple_selection = request.session.get('selection', False)
-        selection = Selection()
-        if simple_selection:
-            selection.importer(simple_selection)
-        if selection.targets != []:
-            prot_ids = [x.item.id for x in selection.targets]
-            ps = AssayExperiment.objects.filter(protein__in=prot_ids, ligand__properities__web_links__web_resource__slug = 'chembl_ligand')
-            context = {
-                'target': ', '.join([x.item.entry_name for x in selection.targets])
-                }
-
-    ps = ps.prefetch_related('protein','ligand__properities__web_links__web_resource','ligand__properities__vendors__vendor')
-    d = {}
-    for p in ps:
-        if p.ligand not in d:
-            d[p.ligand] = {}
-        if p.protein not in d[p.ligand]:
-             d[p.ligand][p.protein] = []
-        d[p.ligand][p.protein].append(p)
-    ligand_data = []
-    for lig, records  in d.items():
-
-        links = lig.properities.web_links.all()
-        chembl_id = [x for x in links if x.web_resource.slug=='chembl_ligand'][0].index
-
-        vendors = lig.properities.vendors.all()
-        purchasability = 'No'
-        for v in vendors:
-            if v.vendor.name not in ['ZINC', 'ChEMBL', 'BindingDB', 'SureChEMBL', 'eMolecules', 'MolPort', 'PubChem']:
-                purchasability = 'Yes'
-
-        for record, vals in records.items():
-            per_target_data = vals
-            protein_details = record
-
-            """
-            A dictionary of dictionaries with a list of values.
-            Assay_type
-            |
-            ->  Standard_type [list of values]
-            """
-            tmp = defaultdict(list)
-            tmp_count = 0
-            for data_line in per_target_data:
-                tmp["Bind" if data_line.assay_type == 'b' else "Funct"].append(data_line.pchembl_value)
-                tmp_count += 1
-            values = list(itertools.chain(*tmp.values()))
-            ligand_data.append({
-                'ligand_id': chembl_id,
-                'protein_name': protein_details.entry_name,
-                'species': protein_details.species.common_name,
-                'record_count': tmp_count,
-                'assay_type': ', '.join(tmp.keys()),
-                'purchasability': purchasability,
-                #Flattened list of lists of dict keys:
-                'low_value': min(values),
-                'average_value': sum(values)/len(values),
-                'high_value': max(values),
-                'standard_units': ', '.join(list(set([x.standard_units for x in per_target_data]))),
-                'smiles': lig.properities.smiles,
-                'mw': lig.properities.mw,
-                'rotatable_bonds': lig.properities.rotatable_bonds,
-                'hdon': lig.properities.hdon,
-                'hacc': lig.properities.hacc,
-                'logp': lig.properities.logp,
-                })
-    context['ligand_data'] = ligand_data
-    
-    return render(request, 'target_details_compact.html', context)
+    simple_selection = request.session.get('selection', False)
+    selection = Selection()
+    if simple_selection:
+        selection.importer(simple_selection)
+    prot_ids = [x.item.id for x in selection.targets]
+    target = ', '.join([x.item.entry_name for x in selection.targets])
+    return target, Q(protein__in=prot_ids), Q(protein__in=prot_ids)
 
-def TargetDetails(request, **kwargs):
 
+# columns of the compact target details table that can be sorted, by column index (the selection checkbox and the
+# unit, which is always shown as p (-log), are not sortable)
+TARGET_SUMMARY_ORDER = {1: 'chembl_id', 2: 'entry_name', 3: 'species', 4: 'purchasable', 5: 'record_count',
+    6: 'assay_types', 7: 'min_value', 8: 'avg_value', 9: 'max_value', 11: 'mw', 12: 'rotatable_bonds', 13: 'hdon',
+    14: 'hacc', 15: 'logp', 16: 'smiles'}
+
+# header of the compact target details table, also used for the CSV download
+TARGET_SUMMARY_COLUMNS = ['ChEMBL ID', 'Receptor', 'Species', 'Purchasable', 'No. records', 'Assay type', 'Min.',
+    'Average', 'Max.', 'Unit', 'Mol. weight', 'Rot. Bonds', 'H don', 'H acc', 'LogP', 'Smiles']
+
+def TargetDetailsCompact(request, **kwargs):
+    target, assay_filter, summary_filter = get_target_filters(request, kwargs)
     if 'slug' in kwargs:
-        slug = kwargs['slug']
-        if slug.count('_') == 0 :
-            ps = AssayExperiment.objects.filter(protein__family__parent__parent__parent__slug=slug, ligand__properities__web_links__web_resource__slug = 'chembl_ligand')
-        elif slug.count('_') == 1 and len(slug) == 7:
-            ps = AssayExperiment.objects.filter(protein__family__parent__parent__slug=slug, ligand__properities__web_links__web_resource__slug = 'chembl_ligand')
-        elif slug.count('_') == 2:
-            ps = AssayExperiment.objects.filter(protein__family__parent__slug=slug, ligand__properities__web_links__web_resource__slug = 'chembl_ligand')
-        #elif slug.count('_') == 3:
-        elif slug.count('_') == 1 and len(slug) != 7:
-            ps = AssayExperiment.objects.filter(protein__entry_name = slug, ligand__properities__web_links__web_resource__slug = 'chembl_ligand')
-    
-        if slug.count('_') == 1 and len(slug) == 7:
-            f = ProteinFamily.objects.get(slug=slug)      
-        else:
-            f = slug
+        data_url = '/ligand/target/compact/{}/data/'.format(kwargs['slug'])
+        export_url = '/ligand/target/compact/{}/export/'.format(kwargs['slug'])
+    else:
+        data_url = '/ligand/targets_compact_data'
+        export_url = '/ligand/targets_compact_export'
+    context = {
+        'target': target,
+        'data_url': data_url,
+        'export_url': export_url,
+        }
 
-        context = {
-            'target':f
-            }
+    return render(request, 'target_details_compact.html', context)
+
+def TargetDetailsCompactData(request, **kwargs):
+    """A page of the compact target details table, sorted and searched in the database (DataTables server-side
+    processing)"""
+    target, assay_filter, summary_filter = get_target_filters(request, kwargs)
+    rows = LigandTargetSummary.objects.filter(summary_filter)
+    total = rows.count()
+
+    rows = search_target_summary(rows, request.GET)
+    filtered = rows.count() if request.GET.get('search[value]', '').strip() else total
+
+    try:
+        start = max(int(request.GET.get('start', 0)), 0)
+        length = int(request.GET.get('length', 50))
+    except ValueError:
+        start, length = 0, 50
+    if length >= 0:
+        rows = rows[start:start + length]
+
+    try:
+        draw = int(request.GET.get('draw', 0))
+    except ValueError:
+        draw = 0
+    return JsonResponse({'draw': draw, 'recordsTotal': total, 'recordsFiltered': filtered,
+        'data': target_summary_table_rows(rows)})
+
+def TargetDetailsCompactExport(request, **kwargs):
+    """CSV or SMILES download of the rows selected in the compact target details table, all rows matching the search
+    (except the deselected ones) if all rows are selected"""
+    target, assay_filter, summary_filter = get_target_filters(request, kwargs)
+    rows = LigandTargetSummary.objects.filter(summary_filter)
+    ids = [int(pk) for pk in request.POST.get('ids', '').split(',') if pk.isdigit()]
+    if request.POST.get('all') == '1':
+        rows = search_target_summary(rows, request.POST).exclude(id__in=ids)
     else:
-        simple_selection = request.session.get('selection', False)
-        selection = Selection()
-        if simple_selection:
-            selection.importer(simple_selection)
-        if selection.targets != []:
-            prot_ids = [x.item.id for x in selection.targets]
-            ps = AssayExperiment.objects.filter(protein__in=prot_ids, ligand__properities__web_links__web_resource__slug = 'chembl_ligand')
-            context = {
-                'target': ', '.join([x.item.entry_name for x in selection.targets])
-                }
+        rows = search_target_summary(rows.filter(id__in=ids), request.POST)
+
+    if request.POST.get('format') == 'smi':
+        response = HttpResponse(content_type='chemical/x-daylight-smiles')
+        response['Content-Disposition'] = 'attachment; filename="target_ligands.smi"'
+        for smiles, chembl_id in rows.values_list('smiles', 'chembl_id'):
+            response.write('{} {}\n'.format(smiles or '', chembl_id))
+        return response
+
+    response = HttpResponse(content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="target_ligand_data.csv"'
+    writer = csv.writer(response, delimiter=';', lineterminator='\n')
+    writer.writerow(TARGET_SUMMARY_COLUMNS)
+    for row in target_summary_table_rows(rows):
+        writer.writerow(['' if value is None else value for value in row[1:]])
+    return response
+
+def search_target_summary(rows, params):
+    """LigandTargetSummary rows filtered by the search and sorted by the column of a DataTables request"""
+    search = params.get('search[value]', '').strip()
+    if search:
+        rows = rows.filter(Q(chembl_id__icontains=search) | Q(entry_name__icontains=search) |
+            Q(species__icontains=search) | Q(smiles__icontains=search))
+
+    try:
+        order = TARGET_SUMMARY_ORDER[int(params.get('order[0][column]', 1))]
+    except (KeyError, ValueError):
+        order = 'chembl_id'
+    if params.get('order[0][dir]') == 'desc':
+        order = '-' + order
+    return rows.order_by(order, 'id')
+
+def target_summary_table_rows(rows):
+    """Rows of the compact target details table, the first column is the id used to select a row"""
+    def rounded(value, digits):
+        return round(value, digits) if value is not None else None
+
+    return [[pk, chembl_id, entry_name, species, 'Yes' if purchasable else 'No', record_count, assay_types,
+        rounded(min_value, 2), rounded(avg_value, 2), rounded(max_value, 2), 'p (-log)', rounded(mw, 0),
+        rotatable_bonds, hdon, hacc, rounded(logp, 1), smiles]
+        for (pk, chembl_id, entry_name, species, purchasable, record_count, assay_types, min_value, avg_value,
+        max_value, mw, rotatable_bonds, hdon, hacc, logp, smiles) in rows.values_list('id', 'chembl_id',
+        'entry_name', 'species', 'purchasable', 'record_count', 'assay_types', 'min_value', 'avg_value', 'max_value',
+        'mw', 'rotatable_bonds', 'hdon', 'hacc', 'logp', 'smiles')]
+
+def TargetDetails(request, **kwargs):
+    target, assay_filter, summary_filter = get_target_filters(request, kwargs)
+    ps = AssayExperiment.objects.filter(assay_filter, ligand__properities__web_links__web_resource__slug = 'chembl_ligand')
+    context = {
+        'target': target
+        }
     ps = ps.values('standard_type',
                 'standard_relation',
                 'standard_value',
@@ -238,8 +254,15 @@ def TargetDetails(request, **kwargs):
                 'ligand__properities__hdon',
                 'ligand__properities__hacc','protein'
                 ).annotate(num_targets = Count('protein__id', distinct=True))
+    if LigandTargetSummary.objects.filter(summary_filter).exists():
+        purchasable = set(LigandTargetSummary.objects.filter(summary_filter, purchasable=True).values_list(
+            'ligand__properities_id', flat=True))
+    else:
+        # the summary table has not been built (yet), look up the vendors of the listed ligands
+        purchasable = set(LigandVendorLink.objects.filter(lp__in=ps.values('ligand__properities_id')).exclude(
+            vendor__name__in=NON_COMMERCIAL_VENDORS).values_list('lp_id', flat=True).distinct())
     for record in ps:
-        record['purchasability'] = 'Yes' if len(LigandVendorLink.objects.filter(lp=record['ligand__properities_id']).exclude(vendor__name__in=['ZINC', 'ChEMBL', 'BindingDB', 'SureChEMBL', 'eMolecules', 'MolPort', 'PubChem'])) > 0 else 'No'
+        record['purchasability'] = 'Yes' if record['ligand__properities_id'] in purchasable else 'No'
 
     context['proteins'] = ps
 
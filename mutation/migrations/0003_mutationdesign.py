@@ -0,0 +1,82 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mutation', '0002_auto_20180117_1457'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MutationDesignAlignment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('receptor_class', models.CharField(max_length=100, unique=True)),
+                ('generic_numbers', models.TextField()),
+                ('entry_names', models.TextField()),
+                ('sequences', models.TextField()),
+            ],
+            options={
+                'db_table': 'mutation_design_alignment',
+            },
+        ),
+        migrations.CreateModel(
+            name='MutationDesignInteraction',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('receptor_class', models.CharField(max_length=100)),
+                ('generic_number', models.CharField(max_length=12)),
+                ('amino_acid', models.CharField(max_length=1)),
+                ('entry_name', models.CharField(max_length=100)),
+                ('family', models.CharField(max_length=100)),
+                ('pdb_code', models.CharField(max_length=100)),
+                ('ligand', models.TextField()),
+                ('smiles', models.TextField()),
+                ('interaction_type', models.CharField(max_length=40)),
+                ('interaction_class', models.CharField(max_length=50, null=True)),
+            ],
+            options={
+                'db_table': 'mutation_design_interaction',
+                'index_together': {('receptor_class', 'generic_number')},
+            },
+        ),
+        migrations.CreateModel(
+            name='MutationDesignMutation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('receptor_class', models.CharField(max_length=100)),
+                ('generic_number', models.CharField(max_length=12)),
+                ('amino_acid', models.CharField(max_length=1)),
+                ('mutation_amino_acid', models.CharField(max_length=1)),
+                ('entry_name', models.CharField(max_length=100)),
+                ('family', models.CharField(max_length=100)),
+                ('ligand', models.TextField(null=True)),
+                ('smiles', models.TextField()),
+                ('foldchange', models.FloatField()),
+                ('qual', models.CharField(max_length=100)),
+                ('prop', models.CharField(max_length=100)),
+                ('exp_qual_id', models.IntegerField(null=True)),
+            ],
+            options={
+                'db_table': 'mutation_design_mutation',
+                'index_together': {('receptor_class', 'generic_number')},
+            },
+        ),
+        migrations.CreateModel(
+            name='MutationDesignPosition',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('receptor_class', models.CharField(max_length=100)),
+                ('generic_number', models.CharField(max_length=12)),
+                ('amino_acid', models.CharField(max_length=1)),
+                ('family', models.CharField(max_length=100)),
+                ('interactions', models.IntegerField()),
+                ('mutations', models.IntegerField()),
+            ],
+            options={
+                'db_table': 'mutation_design_position',
+                'index_together': {('receptor_class', 'generic_number')},
+            },
+        ),
+    ]
@@ -278,3 +278,71 @@ class MutationLigandRef(models.Model):
 
     class Meta():
         db_table = 'mutation_ligand_reference'
+
+
+# Precomputed class statistics of the mutation design tool (build_mutation_design). Receptors are referred to by
+# entry name and family slug, and ligands by name, so that the design page does not need any joins.
+
+class MutationDesignInteraction(models.Model):
+    # ligand interactions (except polar backbone) of residues with a generic number in annotated structures
+    receptor_class = models.CharField(max_length=100) # slug of the class family, e.g. 001
+    generic_number = models.CharField(max_length=12)
+    amino_acid = models.CharField(max_length=1)
+    entry_name = models.CharField(max_length=100) # parent (wild type) protein of the structure
+    family = models.CharField(max_length=100)
+    pdb_code = models.CharField(max_length=100)
+    ligand = models.TextField()
+    smiles = models.TextField()
+    interaction_type = models.CharField(max_length=40) # slug
+    interaction_class = models.CharField(max_length=50, null=True) # type of the interaction type, e.g. polar
+
+    class Meta():
+        db_table = 'mutation_design_interaction'
+        index_together = ('receptor_class', 'generic_number')
+
+
+class MutationDesignMutation(models.Model):
+    # mutations of residues with a generic number
+    receptor_class = models.CharField(max_length=100)
+    generic_number = models.CharField(max_length=12)
+    amino_acid = models.CharField(max_length=1)
+    mutation_amino_acid = models.CharField(max_length=1)
+    entry_name = models.CharField(max_length=100)
+    family = models.CharField(max_length=100)
+    ligand = models.TextField(null=True)
+    smiles = models.TextField()
+    foldchange = models.FloatField()
+    qual = models.CharField(max_length=100) # qual of exp_qual, '' if there is none
+    prop = models.CharField(max_length=100)
+    exp_qual_id = models.IntegerField(null=True) # to keep the order of the mutations by qualitative effect
+
+    class Meta():
+        db_table = 'mutation_design_mutation'
+        index_together = ('receptor_class', 'generic_number')
+
+
+class MutationDesignPosition(models.Model):
+    # number of distinct receptor (across species) and ligand pairs with an interaction or a significant mutation
+    # (foldchange over 5 or abolished) per generic number, amino acid and receptor family
+    receptor_class = models.CharField(max_length=100)
+    generic_number = models.CharField(max_length=12)
+    amino_acid = models.CharField(max_length=1)
+    family = models.CharField(max_length=100)
+    interactions = models.IntegerField()
+    mutations = models.IntegerField()
+
+    class Meta():
+        db_table = 'mutation_design_position'
+        index_together = ('receptor_class', 'generic_number')
+
+
+class MutationDesignAlignment(models.Model):
+    # helix residues (by generic number) of the receptors of a class with interaction or mutation data, a comma
+    # separated sequence per receptor with an amino acid per generic number, '-' where it has no residue
+    receptor_class = models.CharField(max_length=100, unique=True)
+    generic_numbers = models.TextField() # comma separated
+    entry_names = models.TextField() # comma separated
+    sequences = models.TextField() # comma separated, in the order of entry_names
+
+    class Meta():
+        db_table = 'mutation_design_alignment'
@@ -12,6 +12,7 @@ from common.views import AbsTargetSelection
 from common.views import AbsSegmentSelection
 from common.diagrams_gpcr import DrawHelixBox, DrawSnakePlot
 from common import definitions
+from common.alignment_matrix import encode_sequence, format_percentages, pairwise_similarity_counts
 
 from residue.models import Residue,ResidueNumberingScheme, ResidueGenericNumberEquivalent
 from residue.views import ResidueTablesDisplay
@@ -34,6 +35,7 @@ import math
 import urllib
 import xlsxwriter #sudo pip3 install XlsxWriter
 import operator
+import numpy as np
 
 Alignment = getattr(__import__('common.alignment_' + settings.SITE_NAME, fromlist=['Alignment']), 'Alignment')
 
@@ -989,6 +991,39 @@ def pocket(request):
     context['gn'] = generic
     return render(request, 'mutation/pocket.html', context)
 
+def class_similarity(protein, helix_residues, receptor_class):
+    """Similarity of a receptor to the receptors of its class with interaction or mutation data, over the helix
+    residues of the precomputed class alignment (build_mutation_design). Returns the similarity list (entry name ->
+    [identity, similarity, score]) and the receptors with each amino acid at the generic numbers of the receptor."""
+    similarity_list = {}
+    alternative_aa = {}
+    design_alignment = MutationDesignAlignment.objects.filter(receptor_class=receptor_class).first()
+    if design_alignment and design_alignment.entry_names:
+        generic_numbers = design_alignment.generic_numbers.split(',') if design_alignment.generic_numbers else []
+        entry_names = design_alignment.entry_names.split(',')
+        sequences = design_alignment.sequences.split(',')
+
+        # residues that none of the class receptors have are compared with gaps
+        class_generic_numbers = set(generic_numbers)
+        extra = [gn for gn in helix_residues if gn not in class_generic_numbers]
+        reference = encode_sequence(''.join(helix_residues.get(gn, '-') for gn in generic_numbers + extra))
+        others = np.array([encode_sequence(seq + '-' * len(extra)) for seq in sequences])
+        identities, similarities, scores, compared = pairwise_similarity_counts(reference[np.newaxis], others)
+        identities = format_percentages(identities, compared)[0]
+        similarities = format_percentages(similarities, compared)[0]
+
+        columns = [(i, gn) for i, gn in enumerate(generic_numbers) if gn in helix_residues]
+        for entry_name, sequence, identity, similarity, score in zip(entry_names, sequences, identities,
+            similarities, scores[0].tolist()):
+            similarity_list[entry_name] = [int(identity), int(similarity), score]
+            for i, gn in columns:
+                if sequence[i] != '-':
+                    alternative_aa.setdefault(gn, OrderedDict()).setdefault(sequence[i], []).append(entry_name)
+
+    similarity_list[protein.entry_name] = [int(100),int(100),1000]
+    return similarity_list, alternative_aa
+
+
 def showcalculation(request):
     if request.method == 'POST':
         form = PDBform(request.POST, request.FILES)
@@ -1043,127 +1078,37 @@ def showcalculation(request):
             lookup_with_pos[r.generic_number.label] = r.amino_acid+str(r.sequence_number)
             lookup_pos[r.generic_number.label] = str(r.sequence_number)
 
+    # class statistics precomputed by build_mutation_design, for the generic numbers of this receptor
     gpcr_class = family
-    class_interactions = ResidueFragmentInteraction.objects.filter(
-        structure_ligand_pair__structure__protein_conformation__protein__family__slug__startswith=gpcr_class.slug, structure_ligand_pair__annotated=True).prefetch_related(
-        'rotamer__residue__generic_number','interaction_type',
-        'structure_ligand_pair__structure__protein_conformation__protein__parent__family',
-        'structure_ligand_pair__ligand__properities')
-
-    class_mutations = MutationExperiment.objects.filter(
-        protein__family__slug__startswith=gpcr_class.slug).prefetch_related('protein__family','residue__generic_number','mutation','refs__web_link', 'exp_qual','ligand').order_by('foldchange','exp_qual')
-
     generic = {}
-
-    score_copy = {'score': {'a':0,'i':0,'i_aa':0,'i_weight':0,'m':0,'m_aa':0,'m_weight':0,'s':0,'s_weight':0,'s_aa':0}, 'homology' : {0:0,1:0,2:0,3:0} , 'interaction_aa' : {},'mutation_aa': {}, 'interaction' : {},'mutation': {}}
-
-    for i in class_interactions:
-        #continue
-        ligand = i.structure_ligand_pair.ligand.name
-        receptor = i.structure_ligand_pair.structure.protein_conformation.protein.parent.entry_name
-        receptor = receptor.split("_")[0]
-        family_id = i.structure_ligand_pair.structure.protein_conformation.protein.parent.family.slug.split("_")
-        interaction_type = i.interaction_type.slug
-        interaction_type_class = i.interaction_type.type
-
-        if family_level_ids[0:3]==family_id[0:3]:
-            pass
-            #continue
-
-        if interaction_type=='polar_backbone':
-            continue
-        if i.rotamer.residue.generic_number:
-            gn = i.rotamer.residue.generic_number.label
-        else:
+    positions = MutationDesignPosition.objects.filter(receptor_class=gpcr_class.slug,
+        generic_number__in=list(lookup))
+    for position in positions:
+        gn = position.generic_number
+        if lookup[gn] != position.amino_acid:
             continue
         if gn not in generic:
-            generic[gn] = copy.deepcopy(score_copy)
-        if receptor not in generic[gn]['interaction']:
-            generic[gn]['interaction'][receptor] = {}
-        if ligand not in generic[gn]['interaction'][receptor]:
-            generic[gn]['interaction'][receptor][ligand] = {}
-            generic[gn]['score']['i'] += 1
-            generic[gn]['score']['s'] += 1
-            generic[gn]['score']['s_weight'] += 1
-            #print(gn,receptor,ligand)
-        if gn in lookup and interaction_type=='acc':
-            generic[gn]['score']['a'] += 1
-        if gn in lookup and interaction_type!='acc':
-            if lookup[gn] == i.rotamer.residue.amino_acid:
-                if receptor not in generic[gn]['interaction_aa']:
-                    generic[gn]['interaction_aa'][receptor] = {}
-                if ligand not in generic[gn]['interaction_aa'][receptor]:
-                    generic[gn]['interaction_aa'][receptor][ligand] = {}
-                    generic[gn]['score']['i_aa'] += 1
-                    generic[gn]['score']['s_aa'] += 1
-                    if family_id==family_level_ids:
-                        generic[gn]['homology'][0] += 1
-                    elif family_id[0:3]==family_level_ids[0:3]:
-                        generic[gn]['homology'][1] += 1
-                    elif family_id[0:2]==family_level_ids[0:2]:
-                        generic[gn]['homology'][2] += 1
-                    elif family_id[0:1]==family_level_ids[0:1]:
-                        generic[gn]['homology'][3] += 1
-                    else:
-                        print("error",family_id,family_level_ids)
-
-    for m in class_mutations:
-        #continue
-        if not m.ligand: #ignore non ligand
-            continue
-        receptor = m.protein.entry_name
-        receptor = receptor.split("_")[0]
-        family_id = m.protein.family.slug.split("_")
-        ligand = m.ligand.name
-
-        if family_level_ids[0:3]==family_id[0:3]:
-            pass
-            #continue
-
-        if m.residue.generic_number:
-            gn = m.residue.generic_number.label
+            generic[gn] = {'score': {'a':0,'s_aa':0}, 'homology' : {0:0,1:0,2:0,3:0}}
+        family_id = position.family.split("_")
+        count = position.interactions + position.mutations
+        generic[gn]['score']['s_aa'] += count
+        if family_id==family_level_ids:
+            generic[gn]['homology'][0] += count
+        elif family_id[0:3]==family_level_ids[0:3]:
+            generic[gn]['homology'][1] += count
+        elif family_id[0:2]==family_level_ids[0:2]:
+            generic[gn]['homology'][2] += count
+        elif family_id[0:1]==family_level_ids[0:1]:
+            generic[gn]['homology'][3] += count
         else:
-            continue
-        if gn not in generic:
-            generic[gn] = copy.deepcopy(score_copy)
-        if receptor not in generic[gn]['mutation']:
-            generic[gn]['mutation'][receptor] = {}
-        if ligand not in generic[gn]['mutation'][receptor]:
-            generic[gn]['score']['m'] += 1
-            generic[gn]['score']['s'] += 1
-
-            if m.foldchange>5:
-                generic[gn]['score']['m_weight'] += 1
-                generic[gn]['score']['s_weight'] += 1
+            print("error",family_id,family_level_ids)
 
-                generic[gn]['mutation'][receptor][ligand] = {}
-                #print(gn,receptor,ligand)
-            elif m.exp_qual:
-                if m.exp_qual.qual=='Abolish' or m.exp_qual.qual.find('abolish')!=-1 or m.exp_qual.qual.find('Abolish')!=-1:
-                   generic[gn]['score']['m_weight'] += 1
-                   generic[gn]['score']['s_weight'] += 1
-                   m.foldchange = 6
-
-                   generic[gn]['mutation'][receptor][ligand] = {}
-                   #print(gn,receptor,ligand)
-        if gn in lookup:
-            if lookup[gn] == m.residue.amino_acid and m.foldchange>5:
-                if receptor not in generic[gn]['mutation_aa']:
-                    generic[gn]['mutation_aa'][receptor] = {}
-                if ligand not in generic[gn]['mutation_aa'][receptor]:
-                    generic[gn]['mutation_aa'][receptor][ligand] = {}
-                    generic[gn]['score']['m_aa'] += 1
-                    generic[gn]['score']['s_aa'] += 1
-                    if family_id==family_level_ids:
-                        generic[gn]['homology'][0] += 1
-                    elif family_id[0:3]==family_level_ids[0:3]:
-                        generic[gn]['homology'][1] += 1
-                    elif family_id[0:2]==family_level_ids[0:2]:
-                        generic[gn]['homology'][2] += 1
-                    elif family_id[0:1]==family_level_ids[0:1]:
-                        generic[gn]['homology'][3] += 1
-                    else:
-                        print("error",family_id,family_level_ids)
+    accessible = MutationDesignInteraction.objects.filter(receptor_class=gpcr_class.slug,
+        generic_number__in=list(lookup), interaction_type='acc').values_list('generic_number').annotate(count=Count('id'))
+    for gn, count in accessible:
+        if gn not in generic:
+            generic[gn] = {'score': {'a':0,'s_aa':0}, 'homology' : {0:0,1:0,2:0,3:0}}
+        generic[gn]['score']['a'] = count
 
     position_scores = OrderedDict(sorted(generic.items(), key=lambda x: (x[1]['homology'][0],x[1]['homology'][1],x[1]['homology'][2],x[1]['homology'][3]), reverse=True))
     pocket_scores = {}
@@ -1179,99 +1124,18 @@ def showcalculation(request):
 
 
     #NEW CLASS METHOD, then select closest
-    class_interactions = ResidueFragmentInteraction.objects.filter(
-        structure_ligand_pair__structure__protein_conformation__protein__family__slug__startswith=family.slug, structure_ligand_pair__annotated=True).prefetch_related('rotamer__residue__generic_number','interaction_type','structure_ligand_pair__structure__protein_conformation__protein__parent__family','structure_ligand_pair__structure__pdb_code','structure_ligand_pair__ligand__properities')
-
-    class_mutations = MutationExperiment.objects.filter(
-        protein__family__slug__startswith=family.slug).prefetch_related('protein__family','residue__generic_number','mutation','refs__web_link', 'exp_qual','ligand__properities').order_by('-foldchange','exp_qual')
-
-    # class_proteins = Protein.objects.filter(family__slug__startswith=family.slug, source__name='SWISSPROT',species__common_name='Human').all()
-    # family_proteins = Protein.objects.filter(family__parent__in=family_ids, source__name='SWISSPROT').all() #,species__common_name='Human'
-    # ligand_proteins = Protein.objects.filter(family__parent__parent__in =parent_ids, source__name='SWISSPROT',species__common_name='Human').all()
-
-    class_p = []
-    for i in class_interactions:
-        p = i.structure_ligand_pair.structure.protein_conformation.protein.parent
-        if p not in class_p:
-            class_p.append(p)
-    for m in class_mutations:
-        entry_name = m.protein.entry_name
-        if (int(m.foldchange)!=0 or m.exp_qual):
-            p = m.protein
-            if p not in class_p:
-                class_p.append(p)
-    # for p in class_proteins: #remove these as they are never used.
-    #     if p not in class_p:
-    #         class_p.append(p)
-    print("Proteins in alignment",len(class_p),'proteins with contributing data')
-
-    # print(list(settings.REFERENCE_POSITIONS.keys()))
-    segments = ProteinSegment.objects.filter(slug__in=list(settings.REFERENCE_POSITIONS.keys()))
-    segments = ProteinSegment.objects.filter(category='helix') #only use helix for faster rendering.
-
-    # a = Alignment()
-    # a.load_reference_protein(context['proteins'][0])
-    # a.load_proteins(family_proteins)
-    # #segments = ProteinSegment.objects.filter(category='helix')
-    # a.load_segments(segments)
-    # a.build_alignment()
-    # a.calculate_similarity()
-    # a.calculate_statistics()
-    # family_generic_aa_count = a.calculate_aa_count_per_generic_number()
-
-    # print('alignment 1')
-
-
-    #Consider caching result! Would be by protein since it compares protein to whole class.
-    json_generic = str(context['proteins'][0])+'_generic.json'
-    json_alternative = str(context['proteins'][0])+'_alternative.json'
-    json_similarity_list = str(context['proteins'][0])+'_similarity_list.json'
-
-
-    generic_aa_count = cache.get(json_generic)
-    alternative_aa = cache.get(json_alternative)
-    similarity_list = cache.get(json_similarity_list)
-
-    # if os.path.isfile(json_generic) and os.path.isfile(json_alternative) and os.path.isfile(json_similarity_list) and 1==1: #DISABLE THIS AS IT MISFIRED WHEN NEW DATA
-    #     generic_aa_count = json.load(open(json_generic, 'r'))
-    #     alternative_aa = json.load(open(json_alternative, 'r'))
-    #     similarity_list = json.load(open(json_similarity_list, 'r'))
-    #     print('alignment (class) using cache')
-    if generic_aa_count==None or alternative_aa==None or similarity_list==None:
-        a = Alignment()
-        a.load_reference_protein(context['proteins'][0])
-        a.load_proteins(class_p)
-        segments = ProteinSegment.objects.filter(category='helix') #only use helix for faster rendering.
-        #segments = ProteinSegment.objects.all()
-        a.load_segments(segments) #get all segments to make correct diagrams
-
-        # build the alignment data matrix
-        a.build_alignment()
-
-        # calculate similarity
-        a.calculate_similarity()
-
-        a.calculate_statistics()
-        generic_aa_count = a.calculate_aa_count_per_generic_number()
-        alternative_aa = a.aa_count_with_protein
-
-        print('alignment (class)')
-
-        similarity_list = {}
-        for p in a.proteins:
-            similarity_list[p.protein.entry_name] = [int(p.identity),int(p.similarity),p.similarity_score]
-            if (p.protein.entry_name==context['proteins'][0].entry_name):
-                similarity_list[p.protein.entry_name] = [int(100),int(100),1000]
+    class_interactions = MutationDesignInteraction.objects.filter(receptor_class=family.slug,
+        generic_number__in=list(lookup)).order_by('id')
 
-        # json.dump(generic_aa_count, open(json_generic, 'w'))
-        # json.dump(alternative_aa, open(json_alternative, 'w'))
-        # json.dump(similarity_list, open(json_similarity_list, 'w'))
+    class_mutations = MutationDesignMutation.objects.filter(receptor_class=family.slug,
+        generic_number__in=list(lookup)).order_by('-foldchange','exp_qual_id','id')
 
-        cache.set(json_generic,generic_aa_count)
-        cache.set(json_alternative,alternative_aa)
-        cache.set(json_similarity_list,similarity_list)
-    else:
-        print('alignment (class) using cache')
+    # similarity of the receptor to the receptors of the class with contributing data, over the helix residues
+    helix_residues = {}
+    for r in residues:
+        if r.generic_number and r.protein_segment and r.protein_segment.category=='helix':
+            helix_residues[r.generic_number.label] = r.amino_acid
+    similarity_list, alternative_aa = class_similarity(context['proteins'][0], helix_residues, family.slug)
 
     results = {}
     mutant_lookup = {}
@@ -1287,240 +1151,222 @@ def showcalculation(request):
 
     for i in class_interactions:
         #continue
-        interaction_type = i.interaction_type.slug
-        interaction_type_class = i.interaction_type.type
+        interaction_type = i.interaction_type
+        interaction_type_class = i.interaction_class
 
         if interaction_type_class=='hidden':
             interaction_type_class = 'accessible'
 
-        if interaction_type=='polar_backbone':
-            continue
-
         if interaction_type_class=='accessible':
             continue
 
-        if i.rotamer.residue.generic_number:
-            generic = i.rotamer.residue.generic_number.label
+        generic = i.generic_number
+        entry_name = i.entry_name
+        family_id = i.family.split("_")
+        pdbcode = i.pdb_code
+        ligand = i.ligand
+        smiles = i.smiles
 
-            entry_name = i.structure_ligand_pair.structure.protein_conformation.protein.parent.entry_name
-            family_id = i.structure_ligand_pair.structure.protein_conformation.protein.parent.family.slug.split("_")
-            pdbcode = i.structure_ligand_pair.structure.pdb_code.index
-            ligand = i.structure_ligand_pair.ligand.name
-            if i.structure_ligand_pair.ligand.properities:
-                smiles = i.structure_ligand_pair.ligand.properities.smiles
-            else:
-                smiles = ""
+        if family_level_ids[0:3]==family_id[0:3]:
+            pass
+            #continue
 
-            if family_level_ids[0:3]==family_id[0:3]:
-                pass
-                #continue
+        if generic in lookup:
+            if generic not in distinct_species:
+                distinct_species[generic] = []
+                distinct_ligands[generic] = []
+                distinct_big_decrease[generic] = []
 
-            if generic in lookup:
-                if generic not in distinct_species:
-                    distinct_species[generic] = []
-                    distinct_ligands[generic] = []
-                    distinct_big_decrease[generic] = []
+            if lookup[generic] == i.amino_acid:
 
-                if lookup[generic] == i.rotamer.residue.amino_acid:
 
+                if entry_name.split("_")[0] not in distinct_species[generic]:
+                    distinct_species[generic].append(entry_name.split("_")[0])
 
-                    if entry_name.split("_")[0] not in distinct_species[generic]:
-                        distinct_species[generic].append(entry_name.split("_")[0])
+                if ligand not in distinct_ligands[generic]:
+                    distinct_ligands[generic].append(ligand)
 
-                    if ligand not in distinct_ligands[generic]:
-                        distinct_ligands[generic].append(ligand)
+                if generic  in results:
 
-                    if generic  in results:
+                    if interaction_type_class not in results[generic]['interactions']:
+                        results[generic]['interactions'][interaction_type_class] = []
 
-                        if interaction_type_class not in results[generic]['interactions']:
-                            results[generic]['interactions'][interaction_type_class] = []
+                    results[generic]['interactions'][interaction_type_class].append({ 'species' : entry_name, 'similarity' : similarity_list[entry_name][1], 'pdbcode' : pdbcode, 'ligand' : ligand,'smiles':smiles})
 
-                        results[generic]['interactions'][interaction_type_class].append({ 'species' : entry_name, 'similarity' : similarity_list[entry_name][1], 'pdbcode' : pdbcode, 'ligand' : ligand,'smiles':smiles})
 
 
+                    if family_id==family_level_ids:
+                        results[generic]['homology'][0] += 1
+                    elif family_id[0:3]==family_level_ids[0:3]:
+                        results[generic]['homology'][1] += 1
+                    elif family_id[0:2]==family_level_ids[0:2]:
+                        results[generic]['homology'][2] += 1
+                    elif family_id[0:1]==family_level_ids[0:1]:
+                        results[generic]['homology'][3] += 1
+                    else:
+                        print("error",family_id,family_level_ids)
 
-                        if family_id==family_level_ids:
-                            results[generic]['homology'][0] += 1
-                        elif family_id[0:3]==family_level_ids[0:3]:
-                            results[generic]['homology'][1] += 1
-                        elif family_id[0:2]==family_level_ids[0:2]:
-                            results[generic]['homology'][2] += 1
-                        elif family_id[0:1]==family_level_ids[0:1]:
-                            results[generic]['homology'][3] += 1
-                        else:
-                            print("error",family_id,family_level_ids)
+                    if similarity_list[entry_name][1]>results[generic]['closestinteraction']['similarity']:
+                        results[generic]['closestinteraction']['species'] = entry_name
+                        results[generic]['closestinteraction']['similarity'] = similarity_list[entry_name][1]
+                        results[generic]['closestinteraction']['type'] = interaction_type
+                        results[generic]['closestinteraction']['type_class'] = interaction_type_class
+                        results[generic]['closestinteraction']['pdbcode'] = pdbcode
+                    elif similarity_list[entry_name][1]==results[generic]['closestinteraction']['similarity'] and results[generic]['closestinteraction']['type_class']=='hydrophobic':
+                        results[generic]['closestinteraction']['species'] = entry_name
+                        results[generic]['closestinteraction']['similarity'] = similarity_list[entry_name][1]
+                        results[generic]['closestinteraction']['type'] = interaction_type
+                        results[generic]['closestinteraction']['type_class'] = interaction_type_class
+                        results[generic]['closestinteraction']['pdbcode'] = pdbcode
+                    #if similarity_list[entry_name][1]>results[generic]['interactions'][interaction_type_class]['similarity']:
+                        #results[generic]['interactions'][interaction_type_class]['similarity'] = similarity_list[entry_name][1]
+
+                else:
+                    results[generic] = copy.deepcopy(empty_result)
+                    mutant_lookup[generic] = []
+                    if generic in lookup:
+                        if (lookup[generic] == i.amino_acid): #only for same aa (FIXME substitution)
+                            if interaction_type_class=='accessible':
+                                    continue
+
+                            if family_id==family_level_ids:
+                                results[generic]['homology'][0] += 1
+                            elif family_id[0:3]==family_level_ids[0:3]:
+                                results[generic]['homology'][1] += 1
+                            elif family_id[0:2]==family_level_ids[0:2]:
+                                results[generic]['homology'][2] += 1
+                            elif family_id[0:1]==family_level_ids[0:1]:
+                                results[generic]['homology'][3] += 1
+                            else:
+                                print("error",family_id,family_level_ids)
+                            results[generic]['interactions'][interaction_type_class] = [{ 'species' : entry_name, 'similarity' : similarity_list[entry_name][1], 'pdbcode' : pdbcode, 'ligand' : ligand,'smiles': smiles}]
 
-                        if similarity_list[entry_name][1]>results[generic]['closestinteraction']['similarity']:
-                            results[generic]['closestinteraction']['species'] = entry_name
-                            results[generic]['closestinteraction']['similarity'] = similarity_list[entry_name][1]
-                            results[generic]['closestinteraction']['type'] = interaction_type
-                            results[generic]['closestinteraction']['type_class'] = interaction_type_class
-                            results[generic]['closestinteraction']['pdbcode'] = pdbcode
-                        elif similarity_list[entry_name][1]==results[generic]['closestinteraction']['similarity'] and results[generic]['closestinteraction']['type_class']=='hydrophobic':
                             results[generic]['closestinteraction']['species'] = entry_name
                             results[generic]['closestinteraction']['similarity'] = similarity_list[entry_name][1]
                             results[generic]['closestinteraction']['type'] = interaction_type
                             results[generic]['closestinteraction']['type_class'] = interaction_type_class
                             results[generic]['closestinteraction']['pdbcode'] = pdbcode
-                        #if similarity_list[entry_name][1]>results[generic]['interactions'][interaction_type_class]['similarity']:
-                            #results[generic]['interactions'][interaction_type_class]['similarity'] = similarity_list[entry_name][1]
-
-                    else:
-                        results[generic] = copy.deepcopy(empty_result)
-                        mutant_lookup[generic] = []
-                        if generic in lookup:
-                            if (lookup[generic] == i.rotamer.residue.amino_acid): #only for same aa (FIXME substitution)
-                                if interaction_type_class=='accessible':
-                                        continue
-
-                                if family_id==family_level_ids:
-                                    results[generic]['homology'][0] += 1
-                                elif family_id[0:3]==family_level_ids[0:3]:
-                                    results[generic]['homology'][1] += 1
-                                elif family_id[0:2]==family_level_ids[0:2]:
-                                    results[generic]['homology'][2] += 1
-                                elif family_id[0:1]==family_level_ids[0:1]:
-                                    results[generic]['homology'][3] += 1
-                                else:
-                                    print("error",family_id,family_level_ids)
-                                results[generic]['interactions'][interaction_type_class] = [{ 'species' : entry_name, 'similarity' : similarity_list[entry_name][1], 'pdbcode' : pdbcode, 'ligand' : ligand,'smiles': smiles}]
-
-                                results[generic]['closestinteraction']['species'] = entry_name
-                                results[generic]['closestinteraction']['similarity'] = similarity_list[entry_name][1]
-                                results[generic]['closestinteraction']['type'] = interaction_type
-                                results[generic]['closestinteraction']['type_class'] = interaction_type_class
-                                results[generic]['closestinteraction']['pdbcode'] = pdbcode
-        else:
-            pass
-            #print('no generic number',interaction_type)
 
     print('parsed interaction data',len(results))
 
     for m in class_mutations:
         #continue
-        if m.residue.generic_number:
-            generic = m.residue.generic_number.label
-            entry_name = m.protein.entry_name
-            family_id = m.protein.family.slug.split("_")
-            if m.ligand:
-                ligand = m.ligand.name
-                if m.ligand.properities:
-                    smiles = m.ligand.properities.smiles
-                else:
-                    smiles = ""
-            else:
-                ligand = "N/A"
-                smiles = ""
+        generic = m.generic_number
+        entry_name = m.entry_name
+        family_id = m.family.split("_")
+        if m.ligand is not None:
+            ligand = m.ligand
+            smiles = m.smiles
+        else:
+            ligand = "N/A"
+            smiles = ""
 
-            if family_level_ids[0:3]==family_id[0:3]:
-                pass
-                #continue
+        if family_level_ids[0:3]==family_id[0:3]:
+            pass
+            #continue
 
-            if m.exp_qual:
-                qual = m.exp_qual.qual +" "+m.exp_qual.prop
-            else:
-                qual = ''
-            #only select positions where interaction data is present and mutant has real data
-            if generic in lookup: # or similarity_list[entry_name][1]>60 (or is closely related.)
-                if generic not in distinct_species:
-                    distinct_species[generic] = []
-                    distinct_ligands[generic] = []
-                    distinct_big_decrease[generic] = []
-                #skip data that is far away / disable this for now
-                #if similarity_list[entry_name][1]<50:
-                #   continue
-
-
-                #Only look at same residues (Expand with substitution possibilities) FIXME
-                if lookup[generic] == m.residue.amino_acid:
-
-                    #if row is allowed due to mutant data, create entry if it isnt there.
-                    if generic not in results and (int(m.foldchange)!=0 or qual!=''):
-                        results[generic] = copy.deepcopy(empty_result)
-                    elif not (int(m.foldchange)!=0 or qual!=''): #skip no data on non-interesting positions / potentially miss a bit of data if datamutant comes later.. risk! FIXME
-                    #should be fixed with order by
-                    # generic not in results and
-                        continue
-
-                    if m.foldchange>20:
-                        results[generic]['bestmutation']['bigdecrease'] += 1
-                        if entry_name.split("_")[0] not in distinct_big_decrease[generic]:
-                            results[generic]['bestmutation']['bigdecrease_distinct'] += 1
-                            distinct_big_decrease[generic].append(entry_name.split("_")[0])
-                    elif m.foldchange>5:
-                        results[generic]['bestmutation']['decrease'] += 1
-                    elif m.foldchange<-5:
-                        results[generic]['bestmutation']['bigincrease'] += 1
-                    elif (m.foldchange<5 or m.foldchange>-5) and m.foldchange!=0:
-                        results[generic]['bestmutation']['nonsignificant'] += 1
-                    else:
-                        if m.exp_qual:
-                            #print( m.exp_qual.qual.find('abolish'))
-                            #print(m.exp_qual.qual)
-                            if m.exp_qual.qual=='Abolish' or m.exp_qual.qual.find('abolish')!=-1 or m.exp_qual.qual.find('Abolish')!=-1:
-                                results[generic]['bestmutation']['bigdecrease'] += 1
-                                if entry_name.split("_")[0] not in distinct_big_decrease[generic]:
-                                    results[generic]['bestmutation']['bigdecrease_distinct'] += 1
-                                    distinct_big_decrease[generic].append(entry_name.split("_")[0])
-
-                                m.foldchange = 20 #insert a 'fake' foldchange to make it count
-                            elif m.exp_qual.qual=='Gain of':
-                                results[generic]['bestmutation']['bigincrease'] += 1
-                            elif m.exp_qual.qual=='Increase':
-                                results[generic]['bestmutation']['nonsignificant'] += 1
-                            elif m.exp_qual.qual=='Decrease':
-                                results[generic]['bestmutation']['nonsignificant'] += 1
-                            else:
-                                results[generic]['bestmutation']['nonsignificant'] += 1 #non-abolish qual
-                        else:
-                            results[generic]['bestmutation']['nodata'] += 1
-
-                    if m.foldchange>5:
-                        if entry_name.split("_")[0] not in distinct_species[generic]:
-                            distinct_species[generic].append(entry_name.split("_")[0])
-                        if ligand not in distinct_ligands[generic]:
-                            distinct_ligands[generic].append(ligand)
-
-
-                    #If next is closer in similarity replace "closest"
-                    if int(m.foldchange)!=0 or qual!='': #FIXME qual values need a corresponding foldchange value to outrank other values
-                        if ((similarity_list[entry_name][1]>=results[generic]['bestmutation']['similarity'] and
-                                m.foldchange>results[generic]['bestmutation']['foldchange']) and lookup[generic] == m.residue.amino_acid):
-                            results[generic]['bestmutation']['species'] = entry_name
-                            results[generic]['bestmutation']['similarity'] = similarity_list[entry_name][1]
-                            results[generic]['bestmutation']['foldchange'] = m.foldchange
-                            results[generic]['bestmutation']['qual'] = qual
-                            results[generic]['bestmutation']['aa'] = m.mutation.amino_acid
-
-                        results[generic]['bestmutation']['allmut'].append([entry_name,m.foldchange,qual,m.mutation.amino_acid,similarity_list[entry_name][1],ligand,smiles])
-
-                    if int(m.foldchange>5):
-                        if family_id==family_level_ids:
-                            results[generic]['homology'][0] += 1
-                        elif family_id[0:3]==family_level_ids[0:3]:
-                            results[generic]['homology'][1] += 1
-                        elif family_id[0:2]==family_level_ids[0:2]:
-                            results[generic]['homology'][2] += 1
-                        elif family_id[0:1]==family_level_ids[0:1]:
-                            results[generic]['homology'][3] += 1
+        if m.qual:
+            qual = m.qual +" "+m.prop
+        else:
+            qual = ''
+        #only select positions where interaction data is present and mutant has real data
+        if generic in lookup: # or similarity_list[entry_name][1]>60 (or is closely related.)
+            if generic not in distinct_species:
+                distinct_species[generic] = []
+                distinct_ligands[generic] = []
+                distinct_big_decrease[generic] = []
+            #skip data that is far away / disable this for now
+            #if similarity_list[entry_name][1]<50:
+            #   continue
+
+
+            #Only look at same residues (Expand with substitution possibilities) FIXME
+            if lookup[generic] == m.amino_acid:
+
+                #if row is allowed due to mutant data, create entry if it isnt there.
+                if generic not in results and (int(m.foldchange)!=0 or qual!=''):
+                    results[generic] = copy.deepcopy(empty_result)
+                elif not (int(m.foldchange)!=0 or qual!=''): #skip no data on non-interesting positions / potentially miss a bit of data if datamutant comes later.. risk! FIXME
+                #should be fixed with order by
+                # generic not in results and
+                    continue
+
+                if m.foldchange>20:
+                    results[generic]['bestmutation']['bigdecrease'] += 1
+                    if entry_name.split("_")[0] not in distinct_big_decrease[generic]:
+                        results[generic]['bestmutation']['bigdecrease_distinct'] += 1
+                        distinct_big_decrease[generic].append(entry_name.split("_")[0])
+                elif m.foldchange>5:
+                    results[generic]['bestmutation']['decrease'] += 1
+                elif m.foldchange<-5:
+                    results[generic]['bestmutation']['bigincrease'] += 1
+                elif (m.foldchange<5 or m.foldchange>-5) and m.foldchange!=0:
+                    results[generic]['bestmutation']['nonsignificant'] += 1
+                else:
+                    if m.qual:
+                        #print( m.qual.find('abolish'))
+                        #print(m.qual)
+                        if m.qual=='Abolish' or m.qual.find('abolish')!=-1 or m.qual.find('Abolish')!=-1:
+                            results[generic]['bestmutation']['bigdecrease'] += 1
+                            if entry_name.split("_")[0] not in distinct_big_decrease[generic]:
+                                results[generic]['bestmutation']['bigdecrease_distinct'] += 1
+                                distinct_big_decrease[generic].append(entry_name.split("_")[0])
+
+                            m.foldchange = 20 #insert a 'fake' foldchange to make it count
+                        elif m.qual=='Gain of':
+                            results[generic]['bestmutation']['bigincrease'] += 1
+                        elif m.qual=='Increase':
+                            results[generic]['bestmutation']['nonsignificant'] += 1
+                        elif m.qual=='Decrease':
+                            results[generic]['bestmutation']['nonsignificant'] += 1
                         else:
-                            print("error",family_id,family_level_ids)
+                            results[generic]['bestmutation']['nonsignificant'] += 1 #non-abolish qual
+                    else:
+                        results[generic]['bestmutation']['nodata'] += 1
+
+                if m.foldchange>5:
+                    if entry_name.split("_")[0] not in distinct_species[generic]:
+                        distinct_species[generic].append(entry_name.split("_")[0])
+                    if ligand not in distinct_ligands[generic]:
+                        distinct_ligands[generic].append(ligand)
+
+
+                #If next is closer in similarity replace "closest"
+                if int(m.foldchange)!=0 or qual!='': #FIXME qual values need a corresponding foldchange value to outrank other values
+                    if ((similarity_list[entry_name][1]>=results[generic]['bestmutation']['similarity'] and
+                            m.foldchange>results[generic]['bestmutation']['foldchange']) and lookup[generic] == m.amino_acid):
+                        results[generic]['bestmutation']['species'] = entry_name
+                        results[generic]['bestmutation']['similarity'] = similarity_list[entry_name][1]
+                        results[generic]['bestmutation']['foldchange'] = m.foldchange
+                        results[generic]['bestmutation']['qual'] = qual
+                        results[generic]['bestmutation']['aa'] = m.mutation_amino_acid
+
+                    results[generic]['bestmutation']['allmut'].append([entry_name,m.foldchange,qual,m.mutation_amino_acid,similarity_list[entry_name][1],ligand,smiles])
 
-                    if m.mutation.amino_acid in results[generic]['bestmutation']['counts']:
-                        results[generic]['bestmutation']['counts'][m.mutation.amino_acid] += 1
+                if int(m.foldchange>5):
+                    if family_id==family_level_ids:
+                        results[generic]['homology'][0] += 1
+                    elif family_id[0:3]==family_level_ids[0:3]:
+                        results[generic]['homology'][1] += 1
+                    elif family_id[0:2]==family_level_ids[0:2]:
+                        results[generic]['homology'][2] += 1
+                    elif family_id[0:1]==family_level_ids[0:1]:
+                        results[generic]['homology'][3] += 1
                     else:
-                        results[generic]['bestmutation']['counts'][m.mutation.amino_acid] = 1
+                        print("error",family_id,family_level_ids)
 
-                    if m.mutation.amino_acid in results[generic]['bestmutation']['counts_close'] and similarity_list[entry_name][1]>60:
-                        results[generic]['bestmutation']['counts_close'][m.mutation.amino_acid] += 1
-                    elif similarity_list[entry_name][1]>60:
-                        results[generic]['bestmutation']['counts_close'][m.mutation.amino_acid] = 1
+                if m.mutation_amino_acid in results[generic]['bestmutation']['counts']:
+                    results[generic]['bestmutation']['counts'][m.mutation_amino_acid] += 1
+                else:
+                    results[generic]['bestmutation']['counts'][m.mutation_amino_acid] = 1
 
+                if m.mutation_amino_acid in results[generic]['bestmutation']['counts_close'] and similarity_list[entry_name][1]>60:
+                    results[generic]['bestmutation']['counts_close'][m.mutation_amino_acid] += 1
+                elif similarity_list[entry_name][1]>60:
+                    results[generic]['bestmutation']['counts_close'][m.mutation_amino_acid] = 1
 
-                mutant_lookup[generic] = []
-        else:
-            pass
-            #print('no generic number')
+
+            mutant_lookup[generic] = []
     print('parsed mutant data',len(results))
 
     #Fetch defined subsitution matrix for mutant design tool
@@ -1530,7 +1376,7 @@ def showcalculation(request):
     summary_score = []
     for res,values in results.items():
 
-        if position_scores[res]['score']['a']==0: #skip those who have no evidence of being in pocket
+        if res not in position_scores or position_scores[res]['score']['a']==0: #skip those who have no evidence of being in pocket
             #pass
             continue
 
@@ -0,0 +1,91 @@
+from interaction.models import ResidueFragmentInteraction
+from mutational_landscape.models import NaturalMutations, PTMs
+from protein.models import Protein
+from residue.models import Residue, ResiduePositionSet
+
+from collections import OrderedDict
+import gzip
+import hashlib
+import json
+
+
+def position_set_labels(name):
+    """Generic number labels of a residue position set, empty if the set has not been built"""
+    return list(ResiduePositionSet.objects.filter(name=name).values_list('residue_position__label',
+        flat=True).exclude(residue_position__isnull=True))
+
+def natural_mutations_payload(protein):
+    """Natural mutations of a protein with their functional annotation, keyed by sequence number"""
+    ptms_dict = dict(PTMs.objects.filter(protein=protein).values_list('residue__sequence_number', 'modification'))
+
+    # sequence numbers of the microswitch and sodium pocket positions of this protein
+    ms_sequence_numbers = set(Residue.objects.filter(protein_conformation__protein=protein,
+        generic_number__label__in=position_set_labels('State (micro-)switches')).values_list('sequence_number',
+        flat=True))
+    sp_sequence_numbers = set(Residue.objects.filter(protein_conformation__protein=protein,
+        generic_number__label__in=position_set_labels('Sodium ion pocket')).values_list('sequence_number',
+        flat=True))
+
+    # THIS SHOULD BE CLASS SPECIFIC (different set)
+    gprotein_generic_set = set(position_set_labels('G-protein interface'))
+
+    # ligand interactions, also of the orthologs which might have been crystallised instead
+    orthologs = Protein.objects.filter(family__slug__startswith=protein.family.slug, sequence_type__slug='wt')
+    interactions = ResidueFragmentInteraction.objects.filter(
+        structure_ligand_pair__structure__protein_conformation__protein__parent__in=orthologs,
+        structure_ligand_pair__annotated=True, rotamer__residue__generic_number__isnull=False).exclude(
+        interaction_type__type='hidden').order_by('rotamer__residue__sequence_number').values_list(
+        'rotamer__residue__sequence_number', 'interaction_type__name')
+    interaction_data = {}
+    for sequence_number, interaction_type in interactions:
+        types = interaction_data.setdefault(sequence_number, [])
+        if interaction_type not in types:
+            types.append(interaction_type)
+
+    jsondata = OrderedDict()
+    NMs = NaturalMutations.objects.filter(protein=protein).order_by('id').values_list('residue__sequence_number',
+        'residue__generic_number__label', 'amino_acid', 'allele_frequency', 'allele_count', 'allele_number',
+        'number_homozygotes', 'type', 'sift_score', 'polyphen_score')
+    for (SN, GN, amino_acid, allele_frequency, allele_count, allele_number, number_homozygotes, type, sift_score,
+        polyphen_score) in NMs:
+        if type == 'missense':
+            deleterious = ((sift_score is not None and sift_score <= 0.05) or
+                (polyphen_score is not None and polyphen_score >= 0.1))
+            effect = 'deleterious' if deleterious else 'tolerated'
+            color = '#e30e0e' if deleterious else '#70c070'
+        else:
+            effect = 'deleterious'
+            color = '#575c9d'
+
+        functional_annotation = ''
+        if SN in sp_sequence_numbers:
+            functional_annotation += 'SodiumPocket '
+        if SN in ms_sequence_numbers:
+            functional_annotation += 'MicroSwitch '
+        if SN in ptms_dict:
+            functional_annotation += 'PTM (' + ptms_dict[SN] + ') '
+        if SN in interaction_data:
+            functional_annotation += 'LB (' + ', '.join(interaction_data[SN]) + ') '
+        if GN in gprotein_generic_set:
+            functional_annotation += 'GP (contact) '
+        if functional_annotation == '':
+            functional_annotation = '-'
+
+        # account for multiple mutations at this position!
+        jsondata[SN] = [amino_acid, allele_frequency, allele_count, allele_number, number_homozygotes, type, effect,
+            color, functional_annotation]
+
+    return jsondata
+
+def ptms_payload(protein):
+    """Post-translational modifications of a protein, keyed by sequence number"""
+    jsondata = OrderedDict()
+    for SN, modification in PTMs.objects.filter(protein=protein).order_by('id').values_list(
+        'residue__sequence_number', 'modification'):
+        jsondata[SN] = [modification]
+    return jsondata
+
+def compress_payload(jsondata):
+    """Gzip compressed JSON of a payload and its ETag"""
+    data = json.dumps(jsondata).encode('utf-8')
+    return gzip.compress(data), hashlib.sha1(data).hexdigest()
@@ -65,6 +65,18 @@ class PTMs(models.Model):
     class Meta():
         db_table = 'residue_ptm'
 
+class MutationalLandscapePayload(models.Model):
+
+    # JSON served to the landscape viewer for a protein, built by build_mutational_landscape
+    protein = models.ForeignKey('protein.Protein', on_delete=models.CASCADE)
+    kind = models.CharField(max_length=20) # natural_mutations or ptms
+    data = models.BinaryField() # gzip compressed
+    etag = models.CharField(max_length=40) # sha1 of the uncompressed JSON
+
+    class Meta():
+        db_table = 'mutation_landscape_payload'
+        unique_together = ('protein', 'kind')
+
 # class PTMsType(models.Model):
 #     modification = models.CharField(max_length=100, unique=True)
 #
@@ -1,13 +1,14 @@
 from django.shortcuts import get_object_or_404, render
 from django.http import HttpResponse
-from django.core.cache import cache
 from django.db.models import Count, Min, Sum, Avg, Q
-from django.core.cache import cache
 from django.views.decorators.cache import cache_page
+from django.utils.cache import get_conditional_response, patch_vary_headers
 
 from protein.models import Protein, ProteinConformation, ProteinAlias, ProteinFamily, Gene, ProteinGProtein, ProteinGProteinPair
 from residue.models import Residue, ResiduePositionSet, ResidueSet
-from mutational_landscape.models import NaturalMutations, CancerMutations, DiseaseMutations, PTMs, NHSPrescribings
+from mutational_landscape.models import (NaturalMutations, CancerMutations, DiseaseMutations, PTMs, NHSPrescribings,
+    MutationalLandscapePayload)
+from mutational_landscape.functions import natural_mutations_payload, ptms_payload, compress_payload
 
 from common.diagrams_gpcr import DrawHelixBox, DrawSnakePlot
 
@@ -32,6 +33,7 @@ from collections import OrderedDict
 from copy import deepcopy
 
 from io import BytesIO
+import gzip
 import re
 import math
 import urllib
@@ -258,138 +260,33 @@ def render_variants(request, protein=None, family=None, download=None, receptor_
 
     return render(request, 'browser.html', {'mutations': NMs, 'type': target_type, 'HelixBox': HelixBox, 'SnakePlot': SnakePlot, 'receptor': str(proteins[0].entry_name), 'mutations_pos_list': json.dumps(jsondata), 'natural_mutations_pos_list': json.dumps(jsondata_natural_mutations)})
 
-def ajaxNaturalMutation(request, slug, **response_kwargs):
-
-    name_of_cache = 'ajaxNaturalMutation_'+slug
-
-    ptms = PTMs.objects.filter(protein__entry_name=slug).prefetch_related('residue')
-    ptms_dict = {}
-
-    for ptm in ptms:
-        ptms_dict[ptm.residue.sequence_number] = ptm.modification
-
-    ## MICROSWITCHES
-    micro_switches_rset = ResiduePositionSet.objects.get(name="State (micro-)switches")
-    ms_label = []
-    for residue in micro_switches_rset.residue_position.all():
-        ms_label.append(residue.label)
-
-    ms_object = Residue.objects.filter(protein_conformation__protein__entry_name=slug, generic_number__label__in=ms_label)
-    ms_sequence_numbers = []
-    for ms in ms_object:
-        ms_sequence_numbers.append(ms.sequence_number)
-
-    ## SODIUM POCKET
-    sodium_pocket_rset = ResiduePositionSet.objects.get(name="Sodium ion pocket")
-    sp_label = []
-    for residue in sodium_pocket_rset.residue_position.all():
-        sp_label.append(residue.label)
-
-    sp_object = Residue.objects.filter(protein_conformation__protein__entry_name=slug, generic_number__label__in=ms_label)
-    sp_sequence_numbers = []
-    for sp in sp_object:
-        sp_sequence_numbers.append(sp.sequence_number)
-
-    ## G PROTEIN INTERACTION POSITIONS
-    # THIS SHOULD BE CLASS SPECIFIC (different set)
-    rset = ResiduePositionSet.objects.get(name='G-protein interface')
-    gprotein_generic_set = []
-    for residue in rset.residue_position.all():
-        gprotein_generic_set.append(residue.label)
-
-    ### GET LB INTERACTION DATA
-    # get also ortholog proteins, which might have been crystallised to extract
-    # interaction data also from those
-    p = Protein.objects.get(entry_name=slug)
-    orthologs = Protein.objects.filter(family__slug__startswith=p.family.slug, sequence_type__slug='wt')
-
-    interactions = ResidueFragmentInteraction.objects.filter(
-        structure_ligand_pair__structure__protein_conformation__protein__parent__in=orthologs, structure_ligand_pair__annotated=True).exclude(interaction_type__type ='hidden').order_by('rotamer__residue__sequence_number')
-    interaction_data = {}
-    for interaction in interactions:
-        if interaction.rotamer.residue.generic_number:
-            sequence_number = interaction.rotamer.residue.sequence_number
-            # sequence_number = lookup[interaction.rotamer.residue.generic_number.label]
-            label = interaction.rotamer.residue.generic_number.label
-            aa = interaction.rotamer.residue.amino_acid
-            interactiontype = interaction.interaction_type.name
-            if sequence_number not in interaction_data:
-                interaction_data[sequence_number] = []
-            if interactiontype not in interaction_data[sequence_number]:
-                interaction_data[sequence_number].append(interactiontype)
-
-    jsondata = cache.get(name_of_cache)
-
-    if jsondata == None:
-        jsondata = {}
-
-        NMs = NaturalMutations.objects.filter(protein__entry_name=slug).prefetch_related('residue')
-
-        for NM in NMs:
-
-            SN = NM.residue.sequence_number
-            type = NM.type
-
-            if type == 'missense':
-                effect = 'deleterious' if NM.sift_score <= 0.05 or NM.polyphen_score >= 0.1 else 'tolerated'
-                color = '#e30e0e' if NM.sift_score <= 0.05 or NM.polyphen_score >= 0.1 else '#70c070'
-            else:
-                effect = 'deleterious'
-                color = '#575c9d'
+def landscape_payload_response(request, slug, kind, build_payload):
+    """JSON payload of a protein for the landscape viewer, served from the blob prebuilt by
+    build_mutational_landscape with an ETag, and built on the fly if there is none"""
+    payload = MutationalLandscapePayload.objects.filter(protein__entry_name=slug, kind=kind).values_list('data',
+        'etag').first()
+    if payload:
+        data, etag = bytes(payload[0]), payload[1]
+    else:
+        data, etag = compress_payload(build_payload(get_object_or_404(Protein, entry_name=slug)))
+    etag = '"{}"'.format(etag)
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        if 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+            response = HttpResponse(data, content_type='application/json')
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = HttpResponse(gzip.decompress(data), content_type='application/json')
+    response['ETag'] = etag
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
 
-            functional_annotation = ''
-            SN = NM.residue.sequence_number
-            if NM.residue.generic_number:
-                GN = NM.residue.generic_number.label
-            else:
-                GN = ''
-            if SN in sp_sequence_numbers:
-                functional_annotation +=  'SodiumPocket '
-            if SN in ms_sequence_numbers:
-                functional_annotation +=  'MicroSwitch '
-            if SN in ptms_dict:
-                functional_annotation +=  'PTM (' + ptms_dict[SN] + ') '
-            if SN in interaction_data:
-                functional_annotation +=  'LB (' + ', '.join(interaction_data[SN]) + ') '
-            if GN in gprotein_generic_set:
-                functional_annotation +=  'GP (contact) '
-
-            if functional_annotation == '':
-                functional_annotation = '-'
-            # account for multiple mutations at this position!
-            jsondata[SN] = [NM.amino_acid, NM.allele_frequency, NM.allele_count, NM.allele_number, NM.number_homozygotes, NM.type, effect, color, functional_annotation]
-
-        jsondata = json.dumps(jsondata)
-        response_kwargs['content_type'] = 'application/json'
-
-        cache.set(name_of_cache, jsondata, 20) # 60*60*24*2 two days timeout on cache
-
-    return HttpResponse(jsondata, **response_kwargs)
+def ajaxNaturalMutation(request, slug, **response_kwargs):
+    return landscape_payload_response(request, slug, 'natural_mutations', natural_mutations_payload)
 
 def ajaxPTMs(request, slug, **response_kwargs):
-
-    name_of_cache = 'ajaxPTMs_'+slug
-
-    jsondata = cache.get(name_of_cache)
-
-    if jsondata == None:
-        jsondata = {}
-
-        NMs = PTMs.objects.filter(protein__entry_name=slug).prefetch_related('residue')
-
-        for NM in NMs:
-
-            SN = NM.residue.sequence_number
-            mod = NM.modification
-
-            jsondata[SN] = [mod]
-
-        jsondata = json.dumps(jsondata)
-        response_kwargs['content_type'] = 'application/json'
-
-        cache.set(name_of_cache, jsondata, 20) # 60*60*24*2 two days timeout on cache
-
-    return HttpResponse(jsondata, **response_kwargs)
+    return landscape_payload_response(request, slug, 'ptms', ptms_payload)
 
 # def ajaxCancerMutation(request, slug, **response_kwargs):
 #
@@ -0,0 +1,33 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('protein', '0002_auto_20180117_1457'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProteinSequenceCard',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.TextField()),
+                ('sequence_numbers', models.TextField()),
+                ('segments', models.TextField()),
+                ('generic_numbers', models.TextField()),
+                ('families', models.TextField()),
+                ('aliases', models.TextField()),
+                ('genes', models.TextField()),
+                ('links', models.TextField()),
+                ('structures', models.TextField()),
+                ('homology_models', models.TextField()),
+                ('mutation_count', models.IntegerField()),
+                ('protein', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='sequence_card', to='protein.Protein')),
+            ],
+            options={
+                'db_table': 'protein_sequence_card',
+            },
+        ),
+    ]
@@ -7,6 +7,10 @@ from common.diagrams_arrestin import DrawArrestinPlot
 
 from residue.models import Residue, ResidueNumberingScheme, ResidueGenericNumberEquivalent, ResidueDataType, ResidueDataPoint
 
+from collections import defaultdict
+from types import SimpleNamespace
+import json
+
 class Protein(models.Model):
     parent = models.ForeignKey('self', null=True, on_delete=models.CASCADE)
     family = models.ForeignKey('ProteinFamily', on_delete=models.CASCADE)
@@ -363,6 +367,118 @@ class ProteinGProteinPair(models.Model):
         db_table = 'protein_gprotein_pair'
 
 
+class ProteinSequenceCard(models.Model):
+    # denormalized data of the protein detail page, built by build_protein_cards. Lists are stored as JSON.
+    protein = models.OneToOneField('Protein', related_name='sequence_card', on_delete=models.CASCADE)
+    sequence = models.TextField() # amino acids of the residues, in order of sequence number
+    sequence_numbers = models.TextField()
+    segments = models.TextField() # [slug, id, index of the first residue, number of residues] per segment
+    generic_numbers = models.TextField() # display generic number label of each residue, null if it has none
+    families = models.TextField() # family names, from the class down
+    aliases = models.TextField()
+    genes = models.TextField()
+    links = models.TextField() # [url, web resource name]
+    structures = models.TextField() # PDB codes, representative first
+    homology_models = models.TextField() # [entry name, state slug]
+    mutation_count = models.IntegerField()
+
+    class Meta():
+        db_table = 'protein_sequence_card'
+
+    def residues(self):
+        """Residues with the attributes used by the sequence viewer (protein_segment, amino_acid, sequence_number,
+        generic_number and display_generic_number)"""
+        sequence_numbers = json.loads(self.sequence_numbers)
+        generic_numbers = json.loads(self.generic_numbers)
+        residues = []
+        for slug, segment_id, start, length in json.loads(self.segments):
+            segment = SimpleNamespace(slug=slug, id=segment_id)
+            for i in range(start, start + length):
+                gn = SimpleNamespace(label=generic_numbers[i]) if generic_numbers[i] is not None else None
+                residues.append(SimpleNamespace(protein_segment=segment, amino_acid=self.sequence[i],
+                    sequence_number=sequence_numbers[i], generic_number=gn, display_generic_number=gn))
+        return residues
+
+    @classmethod
+    def build(cls, proteins):
+        """Unsaved cards of a list of proteins, with a fixed number of queries"""
+        from mutation.models import MutationExperiment
+        from structure.models import Structure, StructureModel
+
+        ids = [p.id for p in proteins]
+        residues = defaultdict(list)
+        for row in Residue.objects.filter(protein_conformation__protein__in=ids).order_by(
+            'protein_conformation__protein', 'sequence_number').values_list('protein_conformation__protein',
+            'amino_acid', 'sequence_number', 'protein_segment__slug', 'protein_segment', 'generic_number',
+            'display_generic_number__label'):
+            residues[row[0]].append(row[1:])
+
+        aliases = defaultdict(list)
+        for protein_id, name in ProteinAlias.objects.filter(protein__in=ids).order_by('protein', 'position',
+            'id').values_list('protein', 'name'):
+            aliases[protein_id].append(name)
+
+        genes = defaultdict(list)
+        for protein_id, name in Gene.objects.filter(proteins__in=ids).order_by('position', 'id').values_list(
+            'proteins', 'name'):
+            genes[protein_id].append(name)
+
+        # one link per web resource
+        links = defaultdict(list)
+        seen_resources = set()
+        for protein_link in Protein.web_links.through.objects.filter(protein__in=ids).select_related(
+            'weblink__web_resource').order_by('protein', 'weblink__web_resource__slug', 'weblink'):
+            link = protein_link.weblink
+            if (protein_link.protein_id, link.web_resource.slug) not in seen_resources:
+                seen_resources.add((protein_link.protein_id, link.web_resource.slug))
+                links[protein_link.protein_id].append([str(link), link.web_resource.name])
+
+        structures = defaultdict(list)
+        for protein_id, pdb_code in Structure.objects.filter(protein_conformation__protein__parent__in=ids).order_by(
+            '-representative', 'resolution').values_list('protein_conformation__protein__parent', 'pdb_code__index'):
+            structures[protein_id].append(pdb_code)
+
+        homology_models = defaultdict(list)
+        for protein_id, entry_name, state in StructureModel.objects.filter(protein__in=ids).order_by('id').values_list(
+            'protein', 'protein__entry_name', 'state__slug'):
+            homology_models[protein_id].append([entry_name, state])
+
+        mutation_counts = dict(MutationExperiment.objects.filter(protein__in=ids).values('protein').annotate(
+            count=models.Count('id')).values_list('protein', 'count'))
+
+        family_names = {f['id']: f for f in ProteinFamily.objects.values('id', 'name', 'parent')}
+
+        cards = []
+        for p in proteins:
+            segments = []
+            for i, (_, _, slug, segment_id, _, _) in enumerate(residues[p.id]):
+                if not segments or segments[-1][0] != slug:
+                    segments.append([slug, segment_id, i, 0])
+                segments[-1][3] += 1
+
+            families = []
+            family = family_names[p.family_id]
+            while family['parent'] is not None and family_names[family['parent']]['parent'] is not None:
+                families.append(family['name'])
+                family = family_names[family['parent']]
+            families.append(family['name'])
+            families.reverse()
+
+            cards.append(cls(protein=p,
+                sequence=''.join(r[0] for r in residues[p.id]),
+                sequence_numbers=json.dumps([r[1] for r in residues[p.id]]),
+                segments=json.dumps(segments),
+                generic_numbers=json.dumps([r[5] if r[4] else None for r in residues[p.id]]),
+                families=json.dumps(families),
+                aliases=json.dumps(aliases[p.id]),
+                genes=json.dumps(genes[p.id]),
+                links=json.dumps(links[p.id]),
+                structures=json.dumps(structures[p.id]),
+                homology_models=json.dumps(homology_models[p.id]),
+                mutation_count=mutation_counts.get(p.id, 0)))
+        return cards
+
+
 def dgn(gn, protein_conformation):
     ''' Converts generic number to display generic number.
     '''
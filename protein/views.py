@@ -6,10 +6,7 @@ from django.core.cache import cache
 from django.views.decorators.cache import cache_page
 from django.urls import reverse
 
-from protein.models import Protein, ProteinConformation, ProteinAlias, ProteinFamily, Gene,ProteinGProteinPair
-from residue.models import Residue
-from structure.models import Structure, StructureModel
-from mutation.models import MutationExperiment
+from protein.models import Protein, ProteinAlias, ProteinFamily, ProteinGProteinPair, ProteinSequenceCard
 from common.selection import Selection
 from common.views import AbsBrowseSelection
 
@@ -28,54 +25,36 @@ class BrowseSelection(AbsBrowseSelection):
 
 @cache_page(60 * 60 * 24)
 def detail(request, slug):
-    # get protein
+    # get protein and its sequence card (build_protein_cards)
     slug = slug.lower()
-    try:
-        if Protein.objects.filter(entry_name=slug).exists():
-            p = Protein.objects.prefetch_related('web_links__web_resource').get(entry_name=slug, sequence_type__slug='wt')
-        else:
-            p = Protein.objects.prefetch_related('web_links__web_resource').get(accession=slug.upper(), sequence_type__slug='wt')
-    except:
-        context = {'protein_no_found': slug}
+    cards = list(ProteinSequenceCard.objects.filter(Q(protein__entry_name=slug) | Q(protein__accession=slug.upper()),
+        protein__sequence_type__slug='wt').select_related('protein__family', 'protein__species', 'protein__source'))
+    if cards:
+        # an entry name match goes before an accession match
+        card = sorted(cards, key=lambda c: c.protein.entry_name != slug)[0]
+        p = card.protein
+    else:
+        # cards that have not been built yet are made on the fly
+        try:
+            if Protein.objects.filter(entry_name=slug).exists():
+                p = Protein.objects.get(entry_name=slug, sequence_type__slug='wt')
+            else:
+                p = Protein.objects.get(accession=slug.upper(), sequence_type__slug='wt')
+        except:
+            context = {'protein_no_found': slug}
 
-        return render(request, 'protein/protein_detail.html', context)
+            return render(request, 'protein/protein_detail.html', context)
+        card = ProteinSequenceCard.build([p])[0]
 
 
     if p.family.slug.startswith('100') or p.family.slug.startswith('200'):
         # If this protein is a gprotein, redirect to that page.
         return redirect(reverse('signprotdetail', kwargs={'slug': slug}))
 
-    # get family list
-    pf = p.family
-    families = [pf.name]
-    while pf.parent.parent:
-        families.append(pf.parent.name)
-        pf = pf.parent
-    families.reverse()
-
-    # get default conformation
-    pc = ProteinConformation.objects.get(protein=p)
-
-    # get protein aliases
-    aliases = ProteinAlias.objects.filter(protein=p).values_list('name', flat=True)
-
-    # get genes
-    genes = Gene.objects.filter(proteins=p).values_list('name', flat=True)
-    gene = genes[0]
+    genes = json.loads(card.genes)
+    gene = genes[0] if genes else ''
     alt_genes = genes[1:]
 
-    # get structures of this protein
-    structures = Structure.objects.filter(protein_conformation__protein__parent=p).order_by('-representative',
-        'resolution')
-
-    # get residues
-    residues = Residue.objects.filter(protein_conformation=pc).order_by('sequence_number').prefetch_related(
-        'protein_segment', 'generic_number', 'display_generic_number')
-
-    mutations = MutationExperiment.objects.filter(protein=p)
-
-    protein_links = p.web_links.all().distinct('web_resource__slug')
-
     # process residues and return them in chunks of 10
     # this is done for easier scaling on smaller screens
     chunk_size = 10
@@ -84,7 +63,7 @@ def detail(request, slug):
     last_segment = False
     border = False
     title_cell_skip = 0
-    for i, r in enumerate(residues):
+    for i, r in enumerate(card.residues()):
         # title of segment to be written out for the first residue in each segment
         segment_title = False
 
@@ -111,10 +90,10 @@ def detail(request, slug):
     if r_buffer:
         r_chunks.append(r_buffer)
 
-    homology_models = StructureModel.objects.filter(protein=p)
-
-    context = {'p': p, 'families': families, 'r_chunks': r_chunks, 'chunk_size': chunk_size, 'aliases': aliases,
-        'gene': gene, 'alt_genes': alt_genes, 'structures': structures, 'mutations': mutations, 'protein_links': protein_links,'homology_models': homology_models}
+    context = {'p': p, 'families': json.loads(card.families), 'r_chunks': r_chunks, 'chunk_size': chunk_size,
+        'aliases': json.loads(card.aliases), 'gene': gene, 'alt_genes': alt_genes,
+        'structures': json.loads(card.structures), 'mutation_count': card.mutation_count,
+        'protein_links': json.loads(card.links), 'homology_models': json.loads(card.homology_models)}
 
     return render(request, 'protein/protein_detail.html', context)
 
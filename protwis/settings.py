@@ -188,19 +188,25 @@ if DEBUG:
     }
 
 #CACHE
+# two tier cache, a per-process LRU in front of a SQLite store shared by all processes (common.cache_backend)
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
-        'LOCATION': '/tmp/django_cache',
+        'BACKEND': 'common.cache_backend.TieredCache',
+        'LOCATION': '/tmp/django_cache/cache.sqlite3',
         'OPTIONS': {
-            'MAX_ENTRIES': 10000000
+            'MAX_SIZE': 20 * 1024 ** 3,
+            'LOCAL_MAX_SIZE': 256 * 1024 ** 2,
         }
     },
     'alignments': {
-        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
-        'LOCATION': '/tmp/django_cache_alignments',
+        'BACKEND': 'common.cache_backend.TieredCache',
+        'LOCATION': '/tmp/django_cache_alignments/cache.sqlite3',
         'OPTIONS': {
-            'MAX_ENTRIES': 1000
+            'MAX_SIZE': 5 * 1024 ** 3,
+            'LOCAL_MAX_ENTRIES': 20,
         }
     }
 }
+
+# total size (bytes) of built alignments kept in the database alignment cache
+ALIGNMENT_CACHE_MAX_SIZE = 2 * 1024 ** 3
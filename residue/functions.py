@@ -1,17 +1,34 @@
 from django.conf import settings
 from django.db.models import Q
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 
-from protein.models import ProteinAnomaly
+from protein.models import ProteinAnomaly, ProteinConformation
 from residue.models import Residue, ResidueGenericNumber, ResidueNumberingScheme, ResidueGenericNumberEquivalent
 
 import logging
+import threading
+import time
 from collections import OrderedDict
 import yaml
 import shlex
 import os
-from Bio import AlignIO
-from Bio.Align.Applications import ClustalOmegaCommandline
+
+from common.cache_backend import current_data_release
+from common.pairwise_alignment import global_align_many, transfer_positions
+
+# in-process LRU of generic number equivalent tables, one table per numbering scheme
+GN_EQUIVALENT_CACHE_SCHEMES = 16
+gn_equivalent_tables = OrderedDict()
+gn_scheme_ids = {}
+gn_equivalent_lock = threading.Lock()
+
+# in-process LRU of generic number translation tables, one table per protein conformation
+GN_TRANSLATION_CACHE_CONFORMATIONS = 256
+gn_translation_tables = OrderedDict()
+gn_translation_lock = threading.Lock()
+
+# data release the in-process tables were loaded for, they are emptied when a new release is set
+gn_cache_release = {'release': None}
 
 def parse_scheme_tables(path):
     # get generic residue numbering schemes
@@ -88,6 +105,8 @@ def create_or_update_residue(protein_conformation, segment, schemes,residue,b_an
                 default_generic_number=rvalues['generic_number'],
                 scheme=protein_conformation.protein.residue_numbering_scheme,
                 defaults={'label': numbers['equivalent']})
+            if created:
+                clear_gn_equivalent_cache()
             # if created:
             #     logger.info('Created generic number equivalent {} ({}) for scheme {}'.format(
             #         numbers['equivalent'], numbers['generic_number'],
@@ -226,6 +245,7 @@ def create_or_update_residues_in_segment(protein_conformation, segment, start, a
                         scheme=protein_conformation.protein.residue_numbering_scheme,
                         defaults={'label': numbers['equivalent']})
                     if created:
+                        clear_gn_equivalent_cache()
                         logger.info('Created generic number equivalent {} ({}) for scheme {}'.format(
                             numbers['equivalent'], numbers['generic_number'],
                             protein_conformation.protein.residue_numbering_scheme))
@@ -283,6 +303,182 @@ def create_or_update_residues_in_segment(protein_conformation, segment, start, a
 
     if created_residues:
         logger.info('Created {} residues for {} of {}'.format(created_residues, segment, protein_conformation))
+    clear_gn_translation_cache([protein_conformation])
+
+
+class ResidueBatch:
+    """Builds the residues of many protein conformations in memory and writes them with bulk queries.
+
+    add_segment() numbers residues in the same way as create_or_update_residues_in_segment (with
+    disregard_db_residues), write() then creates the missing generic numbers and equivalents, creates or updates the
+    residues and replaces their alternative generic numbers."""
+
+    def __init__(self, schemes, batch_size=5000):
+        self.schemes = schemes
+        self.batch_size = batch_size
+        self.logger = logging.getLogger('build')
+        self.ns = settings.DEFAULT_NUMBERING_SCHEME
+        self.scheme_objs = {rns.slug: rns for rns in ResidueNumberingScheme.objects.all()}
+
+        # existing generic numbers and equivalents
+        for gn in ResidueGenericNumber.objects.select_related('scheme'):
+            if gn.scheme.slug in self.schemes:
+                self.schemes[gn.scheme.slug]['generic_numbers'].setdefault(gn.label, gn)
+        self.equivalents = set(ResidueGenericNumberEquivalent.objects.values_list('default_generic_number_id',
+            'scheme_id'))
+
+        self.residues = OrderedDict()
+        self.total_residues = 0
+        self.total_time = 0
+
+    def __len__(self):
+        return len(self.residues)
+
+    def add_segment(self, protein_conformation, segment, start, aligned_start, end, aligned_end, ref_positions,
+        protein_anomalies):
+        """Adds the residues of a segment of a protein conformation to the batch"""
+        residues_to_update = [(start+i, aa) for i, aa in
+            enumerate(protein_conformation.protein.sequence[(start-1):end])]
+
+        # how many residues are there before and after the aligned segment (only relevant to non-fully aligned
+        # segments)
+        if aligned_start:
+            residues_before = aligned_start - start
+        else:
+            residues_before = 0
+        if aligned_end:
+            residues_after = len(residues_to_update) - (end - aligned_end)
+        else:
+            residues_after = 0
+
+        numbered_segment = (segment.slug in settings.REFERENCE_POSITIONS
+            and settings.REFERENCE_POSITIONS[segment.slug] in ref_positions)
+        for res_num, (sequence_number, amino_acid) in enumerate(residues_to_update, start=1):
+            numbers = {}
+            if numbered_segment and res_num > residues_before and res_num <= residues_after:
+                numbers = format_generic_numbers_old(protein_conformation.protein.residue_numbering_scheme,
+                    self.schemes, sequence_number, settings.REFERENCE_POSITIONS[segment.slug],
+                    ref_positions[settings.REFERENCE_POSITIONS[segment.slug]], protein_anomalies)
+
+            # a residue added twice is updated, as with update_or_create
+            key = (protein_conformation.pk, sequence_number)
+            self.residues.pop(key, None)
+            self.residues[key] = (protein_conformation, segment, amino_acid, numbers)
+
+    def generic_number(self, scheme_slug, label, segment, new_numbers):
+        """Returns a generic number from the scheme tables, or registers it for creation"""
+        gn = self.schemes[scheme_slug]['generic_numbers'].get(label)
+        if gn is None:
+            # the segment of the first residue with a new generic number is used, as with get_or_create
+            new_numbers.setdefault((scheme_slug, label), segment)
+        return gn
+
+    def resolve_generic_numbers(self):
+        """Creates all generic numbers of the batch that do not exist yet"""
+        new_numbers = OrderedDict()
+        for protein_conformation, segment, amino_acid, numbers in self.residues.values():
+            if 'generic_number' in numbers:
+                self.generic_number(self.ns, numbers['generic_number'], segment, new_numbers)
+            if 'display_generic_number' in numbers:
+                self.generic_number(protein_conformation.protein.residue_numbering_scheme.slug,
+                    numbers['display_generic_number'], segment, new_numbers)
+            for alt_scheme, alt_num in numbers.get('alternative_generic_numbers', {}).items():
+                self.generic_number(alt_scheme, alt_num, segment, new_numbers)
+        if not new_numbers:
+            return
+
+        # other processes may create the same generic numbers, those are fetched below
+        ResidueGenericNumber.objects.bulk_create([ResidueGenericNumber(scheme=self.scheme_objs[scheme_slug],
+            label=label, protein_segment=segment) for (scheme_slug, label), segment in new_numbers.items()],
+            batch_size=self.batch_size, ignore_conflicts=True)
+        labels = {}
+        for scheme_slug, label in new_numbers:
+            labels.setdefault(scheme_slug, []).append(label)
+        for scheme_slug, scheme_labels in labels.items():
+            for gn in ResidueGenericNumber.objects.filter(scheme=self.scheme_objs[scheme_slug],
+                label__in=scheme_labels):
+                self.schemes[scheme_slug]['generic_numbers'][gn.label] = gn
+        self.logger.info('Created {} generic numbers'.format(len(new_numbers)))
+
+    def write(self):
+        """Writes the residues of the batch to the database, returns the number of residues written"""
+        if not self.residues:
+            return 0
+        start_time = time.time()
+
+        with transaction.atomic():
+            self.resolve_generic_numbers()
+
+            residues = []
+            alternative_numbers = []
+            new_equivalents = OrderedDict()
+            for (pconf_id, sequence_number), (protein_conformation, segment, amino_acid, numbers) in \
+                self.residues.items():
+                scheme = protein_conformation.protein.residue_numbering_scheme
+                gn = dgn = None
+                if 'generic_number' in numbers:
+                    gn = self.schemes[self.ns]['generic_numbers'][numbers['generic_number']]
+                if 'equivalent' in numbers and gn is not None and (gn.pk, scheme.pk) not in self.equivalents:
+                    new_equivalents.setdefault((gn.pk, scheme.pk), numbers['equivalent'])
+                if 'display_generic_number' in numbers:
+                    dgn = self.schemes[scheme.slug]['generic_numbers'][numbers['display_generic_number']]
+                residues.append(Residue(protein_conformation_id=pconf_id, sequence_number=sequence_number,
+                    amino_acid=amino_acid, protein_segment=segment, generic_number=gn, display_generic_number=dgn))
+                alternative_numbers.append([self.schemes[alt_scheme]['generic_numbers'][alt_num].pk
+                    for alt_scheme, alt_num in numbers.get('alternative_generic_numbers', {}).items()])
+
+            # equivalents with a label that is already used in the scheme are skipped, as with get_or_create
+            ResidueGenericNumberEquivalent.objects.bulk_create([ResidueGenericNumberEquivalent(
+                default_generic_number_id=gn_id, scheme_id=scheme_id, label=label)
+                for (gn_id, scheme_id), label in new_equivalents.items()], batch_size=self.batch_size,
+                ignore_conflicts=True)
+            self.equivalents.update(new_equivalents)
+            if new_equivalents:
+                clear_gn_equivalent_cache()
+
+            # update existing residues and create the others
+            pconf_ids = set(key[0] for key in self.residues)
+            existing = {(pconf_id, sequence_number): pk for pconf_id, sequence_number, pk in
+                Residue.objects.filter(protein_conformation_id__in=pconf_ids).values_list('protein_conformation_id',
+                'sequence_number', 'pk')}
+            update_residues = []
+            create_residues = []
+            for r in residues:
+                pk = existing.get((r.protein_conformation_id, r.sequence_number))
+                if pk is not None:
+                    r.pk = pk
+                    update_residues.append(r)
+                else:
+                    create_residues.append(r)
+            if update_residues:
+                Residue.objects.bulk_update(update_residues, ['protein_segment', 'amino_acid', 'generic_number',
+                    'display_generic_number'], batch_size=self.batch_size)
+                Residue.alternative_generic_numbers.through.objects.filter(
+                    residue_id__in=[r.pk for r in update_residues]).delete()
+            Residue.objects.bulk_create(create_residues, batch_size=self.batch_size)
+
+            # ids of the created residues are not returned by every database backend
+            if create_residues and create_residues[0].pk is None:
+                created = {(pconf_id, sequence_number): pk for pconf_id, sequence_number, pk in
+                    Residue.objects.filter(protein_conformation_id__in=pconf_ids).values_list(
+                    'protein_conformation_id', 'sequence_number', 'pk')}
+                for r in create_residues:
+                    r.pk = created[(r.protein_conformation_id, r.sequence_number)]
+
+            # alternative generic numbers
+            through = Residue.alternative_generic_numbers.through
+            through.objects.bulk_create([through(residue_id=r.pk, residuegenericnumber_id=gn_id)
+                for r, gn_ids in zip(residues, alternative_numbers) for gn_id in set(gn_ids)],
+                batch_size=self.batch_size)
+        clear_gn_translation_cache(pconf_ids)
+
+        elapsed = time.time() - start_time
+        self.total_residues += len(residues)
+        self.total_time += elapsed
+        self.logger.info('Created {} and updated {} residues of {} protein conformations ({:.0f} residues/s)'.format(
+            len(create_residues), len(update_residues), len(pconf_ids), len(residues) / max(elapsed, 1e-6)))
+        self.residues = OrderedDict()
+        return len(residues)
 
 
 def format_generic_numbers_old(residue_numbering_scheme, schemes, sequence_number, ref_position, ref_residue,
@@ -481,49 +677,26 @@ def format_generic_numbers(residue_numbering_scheme, schemes, sequence_number, g
     return numbers
 
 def align_protein_to_reference(protein, tpl_ref_pos_file_path, ref_protein):
+    return align_proteins_to_reference([protein], tpl_ref_pos_file_path, ref_protein)[protein['entry_name']]
+
+def align_proteins_to_reference(proteins, tpl_ref_pos_file_path, ref_protein):
+    ''' Transfers the reference positions of a template protein to other proteins (dicts with entry_name and
+    sequence) by aligning them all to the template at once. Returns a dict of entry name -> reference positions.
+    '''
     logger = logging.getLogger('build')
 
     # does the template reference position file exists?
     if not os.path.isfile(tpl_ref_pos_file_path):
         logger.error("File {} not found, skipping!".format(tpl_ref_pos_file_path))
-        return False
+        return {protein['entry_name']: False for protein in proteins}
     template_ref_positions = load_reference_positions(tpl_ref_pos_file_path)
 
-    # write sequences to files
-    seq_filename = "/tmp/" + protein['entry_name'] + ".fa"
-    with open(seq_filename, 'w') as seq_file:
-        seq_file.write("> ref\n")
-        seq_file.write(ref_protein.sequence + "\n")
-        seq_file.write("> seq\n")
-        seq_file.write(protein['sequence'] + "\n")
-
-    try:
-        ali_filename = "/tmp/out.fa"
-        acmd = ClustalOmegaCommandline(infile=seq_filename, outfile=ali_filename, force=True)
-        stdout, stderr = acmd()
-        a = AlignIO.read(ali_filename, "fasta")
-        logger.info("{} aligned to {}".format(protein['entry_name'], ref_protein.entry_name))
-    except:
-        logger.error('Alignment failed for {}'.format(protein['entry_name']))
-        return False
+    alignments = global_align_many(ref_protein.sequence, [protein['sequence'] for protein in proteins])
 
-    # find reference positions
     ref_positions = {}
-    ref_positions_in_ali = {}
-    for position_generic_number, rp in template_ref_positions.items():
-        gaps = 0
-        for i, r in enumerate(a[0].seq, 1):
-            if r == "-":
-                gaps += 1
-            if i-gaps == rp:
-                ref_positions_in_ali[position_generic_number] = i
-    for position_generic_number, rp in ref_positions_in_ali.items():
-        gaps = 0
-        for i, r in enumerate(a[1].seq, 1):
-            if r == "-":
-                gaps += 1
-            if i == rp:
-                ref_positions[position_generic_number] = i - gaps
+    for protein, (aligned_ref, aligned_seq, score) in zip(proteins, alignments):
+        logger.info("{} aligned to {}".format(protein['entry_name'], ref_protein.entry_name))
+        ref_positions[protein['entry_name']] = transfer_positions(aligned_ref, aligned_seq, template_ref_positions)
 
     return ref_positions
 
@@ -582,7 +755,180 @@ def ggn(gn):
 def dgn(gn, protein_conformation):
     ''' Converts generic number to display generic number.
     '''
-    scheme = ResidueNumberingScheme.objects.get(slug=protein_conformation.protein.residue_numbering_scheme.slug)
-    convert_gn = ResidueGenericNumberEquivalent.objects.get(label=gn, scheme=scheme).default_generic_number.label
-    return Residue.objects.get(protein_conformation=protein_conformation, generic_number__label=convert_gn).display_generic_number.label
-    
+    return get_gn_translation_table(protein_conformation).display_number(gn)
+
+
+def check_gn_cache_release():
+    ''' Empties the in-process generic number tables when the data release has changed since they were loaded.
+    '''
+    release = current_data_release()
+    if release != gn_cache_release['release']:
+        clear_gn_equivalent_cache()
+        clear_gn_translation_cache()
+        gn_cache_release['release'] = release
+
+def get_gn_scheme_id(scheme):
+    ''' Returns the id of a numbering scheme given as an id, slug or object.
+    '''
+    if isinstance(scheme, ResidueNumberingScheme):
+        return scheme.pk
+    if isinstance(scheme, int) or (isinstance(scheme, str) and scheme.isdigit()):
+        return int(scheme)
+    if scheme not in gn_scheme_ids:
+        gn_scheme_ids.update(ResidueNumberingScheme.objects.values_list('slug', 'pk'))
+    if scheme not in gn_scheme_ids:
+        raise ResidueNumberingScheme.DoesNotExist('No numbering scheme {}'.format(scheme))
+    return gn_scheme_ids[scheme]
+
+def get_gn_equivalent_table(scheme):
+    ''' Returns the generic number equivalents of a numbering scheme as a dict of label -> database row, loaded in
+    one query and kept in an in-process LRU.
+    '''
+    check_gn_cache_release()
+    scheme_id = get_gn_scheme_id(scheme)
+    with gn_equivalent_lock:
+        if scheme_id in gn_equivalent_tables:
+            gn_equivalent_tables.move_to_end(scheme_id)
+            return gn_equivalent_tables[scheme_id]
+
+    rows = ResidueGenericNumberEquivalent.objects.filter(scheme_id=scheme_id).values_list('id',
+        'default_generic_number_id', 'scheme_id', 'label', 'default_generic_number__scheme_id',
+        'default_generic_number__protein_segment_id', 'default_generic_number__label')
+    table = {row[3]: row for row in rows}
+
+    with gn_equivalent_lock:
+        gn_equivalent_tables[scheme_id] = table
+        while len(gn_equivalent_tables) > GN_EQUIVALENT_CACHE_SCHEMES:
+            gn_equivalent_tables.popitem(last=False)
+    return table
+
+def clear_gn_equivalent_cache():
+    ''' Empties the in-process generic number equivalent tables, used after generic numbers are rebuilt.
+    '''
+    with gn_equivalent_lock:
+        gn_equivalent_tables.clear()
+        gn_scheme_ids.clear()
+
+def get_gn_equivalents(labels, scheme, ignore_missing=False):
+    ''' Resolves a list of generic number labels in a numbering scheme (id, slug or object) to
+    ResidueGenericNumberEquivalent objects with their default generic numbers, in the order of the labels. Raises
+    ResidueGenericNumberEquivalent.DoesNotExist for unknown labels, unless ignore_missing is set.
+    '''
+    table = get_gn_equivalent_table(scheme)
+    equivalents = []
+    for label in labels:
+        if label not in table:
+            if ignore_missing:
+                continue
+            raise ResidueGenericNumberEquivalent.DoesNotExist('No generic number {} in scheme {}'.format(label,
+                scheme))
+        row = table[label]
+        # new objects for every call, callers add properties to them
+        equivalent = ResidueGenericNumberEquivalent.from_db('default', ['id', 'default_generic_number_id',
+            'scheme_id', 'label'], row[:4])
+        equivalent.default_generic_number = ResidueGenericNumber.from_db('default', ['id', 'scheme_id',
+            'protein_segment_id', 'label'], (row[1],) + row[4:])
+        equivalents.append(equivalent)
+    return equivalents
+
+class GenericNumberTable(object):
+    ''' Translation table between the generic numbers (in the numbering scheme of the protein), display generic
+    numbers, sequence numbers and residue ids of a protein conformation. Lookups of unknown generic numbers raise
+    ResidueGenericNumberEquivalent.DoesNotExist, and of generic numbers without a residue Residue.DoesNotExist, as
+    the queries they replace did.
+    '''
+    def __init__(self, protein_conformation_id, scheme_id, residues):
+        self.protein_conformation_id = protein_conformation_id
+        self.scheme_id = scheme_id
+        # residues as (id, sequence number, generic number, display generic number)
+        self.by_generic_number = {r[2]: r for r in residues if r[2]}
+        self.by_sequence_number = {r[1]: r for r in residues}
+
+    def residue(self, gn):
+        equivalents = get_gn_equivalent_table(self.scheme_id)
+        if gn not in equivalents:
+            raise ResidueGenericNumberEquivalent.DoesNotExist('No generic number {} in scheme {}'.format(gn,
+                self.scheme_id))
+        default_gn = equivalents[gn][6]
+        if default_gn not in self.by_generic_number:
+            raise Residue.DoesNotExist('No residue {} in protein conformation {}'.format(default_gn,
+                self.protein_conformation_id))
+        return self.by_generic_number[default_gn]
+
+    def display_number(self, gn):
+        display_gn = self.residue(gn)[3]
+        if display_gn is None:
+            raise Residue.DoesNotExist('Residue {} of protein conformation {} has no display generic number'.format(
+                gn, self.protein_conformation_id))
+        return display_gn
+
+    def sequence_number(self, gn):
+        return self.residue(gn)[1]
+
+    def residue_id(self, gn):
+        return self.residue(gn)[0]
+
+    def display_numbers(self, gns, ignore_missing=False):
+        return self._many(self.display_number, gns, ignore_missing)
+
+    def sequence_numbers(self, gns, ignore_missing=False):
+        return self._many(self.sequence_number, gns, ignore_missing)
+
+    def residue_ids(self, gns, ignore_missing=False):
+        return self._many(self.residue_id, gns, ignore_missing)
+
+    def _many(self, lookup, gns, ignore_missing):
+        values = []
+        for gn in gns:
+            try:
+                values.append(lookup(gn))
+            except (ResidueGenericNumberEquivalent.DoesNotExist, Residue.DoesNotExist):
+                if not ignore_missing:
+                    raise
+        return values
+
+    def residue_by_sequence_number(self, sequence_number):
+        ''' Returns (id, sequence number, generic number, display generic number) of a residue, or None.
+        '''
+        try:
+            return self.by_sequence_number.get(int(sequence_number))
+        except (TypeError, ValueError):
+            return None
+
+def get_gn_translation_table(protein_conformation, refresh=False):
+    ''' Returns the GenericNumberTable of a protein conformation (object or id), loaded in one query and kept in an
+    in-process LRU. Use refresh after residues of the conformation were added or renumbered.
+    '''
+    check_gn_cache_release()
+    protein_conformation_id = getattr(protein_conformation, 'pk', protein_conformation)
+    with gn_translation_lock:
+        if not refresh and protein_conformation_id in gn_translation_tables:
+            gn_translation_tables.move_to_end(protein_conformation_id)
+            return gn_translation_tables[protein_conformation_id]
+
+    if hasattr(protein_conformation, 'protein'):
+        scheme_id = protein_conformation.protein.residue_numbering_scheme_id
+    else:
+        scheme_id = ProteinConformation.objects.filter(pk=protein_conformation_id).values_list(
+            'protein__residue_numbering_scheme_id', flat=True).get()
+    residues = list(Residue.objects.filter(protein_conformation_id=protein_conformation_id).order_by(
+        'sequence_number').values_list('id', 'sequence_number', 'generic_number__label',
+        'display_generic_number__label'))
+    table = GenericNumberTable(protein_conformation_id, scheme_id, residues)
+
+    with gn_translation_lock:
+        gn_translation_tables[protein_conformation_id] = table
+        while len(gn_translation_tables) > GN_TRANSLATION_CACHE_CONFORMATIONS:
+            gn_translation_tables.popitem(last=False)
+    return table
+
+def clear_gn_translation_cache(protein_conformations=None):
+    ''' Empties the in-process generic number translation tables, or only those of the given protein conformations
+    (objects or ids), used after residues are created or renumbered.
+    '''
+    with gn_translation_lock:
+        if protein_conformations is None:
+            gn_translation_tables.clear()
+        else:
+            for protein_conformation in protein_conformations:
+                gn_translation_tables.pop(getattr(protein_conformation, 'pk', protein_conformation), None)
@@ -1,3 +1,71 @@
-from django.test import TestCase
+from django.test import SimpleTestCase
 
-# Create your tests here.
+from common.pairwise_alignment import BLOSUM62_SCORES, encode_sequence, global_align_many, transfer_positions
+from common.testing import mutate_sequence, random_sequence
+
+from Bio import pairwise2
+from Bio.SubsMat import MatrixInfo
+import random
+
+
+def transfer_positions_per_residue(aligned_reference, aligned_sequence, positions):
+    """Reference positions transferred to an aligned sequence by counting the gaps up to each position, the loops
+    align_protein_to_reference used on the Clustal Omega alignments"""
+    ref_positions_in_ali = {}
+    for position_generic_number, rp in positions.items():
+        gaps = 0
+        for i, r in enumerate(aligned_reference, 1):
+            if r == "-":
+                gaps += 1
+            if i-gaps == rp:
+                ref_positions_in_ali[position_generic_number] = i
+    ref_positions = {}
+    for position_generic_number, rp in ref_positions_in_ali.items():
+        gaps = 0
+        for i, r in enumerate(aligned_sequence, 1):
+            if r == "-":
+                gaps += 1
+            if i == rp:
+                ref_positions[position_generic_number] = i - gaps
+    return ref_positions
+
+
+class PairwiseAlignmentTests(SimpleTestCase):
+    """Sequences aligned to a reference in one batch get the optimal global alignment score (BLOSUM62, gap open 10,
+    gap extend 0.5) and the same reference positions as before"""
+
+    def setUp(self):
+        rnd = random.Random(5)
+        self.reference = random_sequence(rnd, 120)
+        # point mutations, deletions and insertions of the reference, with truncated N-termini
+        self.sequences = [mutate_sequence(rnd, self.reference, substitution=0.05, deletion=0.05,
+            insertion=0.03)[rnd.randint(0, 8):] for p in range(12)]
+
+    def alignment_score(self, aligned_reference, aligned_sequence):
+        score = 0
+        gap = None
+        for r, s in zip(aligned_reference, aligned_sequence):
+            if r == '-' or s == '-':
+                score -= 0.5 if gap == (r == '-') else 10
+                gap = r == '-'
+            else:
+                score += BLOSUM62_SCORES[encode_sequence(r)[0], encode_sequence(s)[0]]
+                gap = None
+        return score
+
+    def test_scores_match_biopython(self):
+        # a small max_cells, so that the sequences are aligned in several chunks
+        alignments = global_align_many(self.reference, self.sequences, max_cells=500000)
+        for sequence, (aligned_reference, aligned_sequence, score) in zip(self.sequences, alignments):
+            self.assertEqual(aligned_reference.replace('-', ''), self.reference)
+            self.assertEqual(aligned_sequence.replace('-', ''), sequence)
+            expected = pairwise2.align.globalds(self.reference, sequence, MatrixInfo.blosum62, -10, -0.5,
+                one_alignment_only=True)[0][2]
+            self.assertAlmostEqual(score, expected)
+            self.assertAlmostEqual(self.alignment_score(aligned_reference, aligned_sequence), score)
+
+    def test_transfer_positions_match_per_residue(self):
+        positions = dict((str(i), i) for i in range(0, 125))
+        for aligned_reference, aligned_sequence, score in global_align_many(self.reference, self.sequences):
+            self.assertEqual(transfer_positions(aligned_reference, aligned_sequence, positions),
+                transfer_positions_per_residue(aligned_reference, aligned_sequence, positions))
@@ -1,3 +1,44 @@
 from django.test import TestCase
 
-# Create your tests here.
+from common.alignment_gpcr import Alignment, AlignmentMatrix
+from common.testing import create_receptors
+from protein.models import Protein, ProteinSegment
+
+import random
+
+
+class SimilarityMatrixTests(TestCase):
+    """The identities, similarities and BLOSUM62 scores counted for all pairs at once by AlignmentMatrix are the ones
+    Alignment.pairwise_similarity calculates pair by pair"""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_receptors(random.Random(9), classes=[('001', 14)])
+
+    def test_similarity_matrix(self):
+        for show_padding in (True, False):
+            matrices = []
+            for alignment_class in (Alignment, AlignmentMatrix):
+                a = alignment_class()
+                a.show_padding = show_padding
+                a.load_proteins(Protein.objects.all())
+                a.load_segments(ProteinSegment.objects.all())
+                a.build_alignment()
+                a.calculate_statistics()
+                a.calculate_similarity_matrix()
+                matrices.append(a.similarity_matrix)
+            self.assertEqual(len(matrices[0]), 14)
+            self.assertEqual(matrices[0], matrices[1])
+
+    def test_similarity_to_reference(self):
+        similarities = []
+        for alignment_class in (Alignment, AlignmentMatrix):
+            a = alignment_class()
+            a.load_reference_protein(Protein.objects.get(entry_name='p0_human'))
+            a.load_proteins(Protein.objects.exclude(entry_name='p0_human'))
+            a.load_segments(ProteinSegment.objects.all())
+            a.build_alignment()
+            a.calculate_similarity()
+            similarities.append([(p.protein.entry_name, p.identity, p.similarity, p.similarity_score)
+                for p in a.proteins])
+        self.assertEqual(similarities[0], similarities[1])
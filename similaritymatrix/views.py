@@ -3,8 +3,9 @@ from django.conf import settings
 
 from common.views import AbsSegmentSelection
 from common.views import AbsTargetSelection
-# from common.alignment_SITE_NAME import Alignment
-Alignment = getattr(__import__('common.alignment_' + settings.SITE_NAME, fromlist=['Alignment']), 'Alignment')
+# from common.alignment_SITE_NAME import AlignmentMatrix
+AlignmentMatrix = getattr(__import__('common.alignment_' + settings.SITE_NAME, fromlist=['AlignmentMatrix']),
+    'AlignmentMatrix')
 
 from collections import OrderedDict
 
@@ -50,7 +51,7 @@ def render_matrix(request):
     simple_selection = request.session.get('selection', False)
     
     # create an alignment object
-    a = Alignment()
+    a = AlignmentMatrix()
 
     # load data from selection into the alignment
     a.load_proteins_from_selection(simple_selection)
@@ -72,7 +73,7 @@ def render_csv_matrix(request):
     simple_selection = request.session.get('selection', False)
     
     # create an alignment object
-    a = Alignment()
+    a = AlignmentMatrix()
     a.show_padding = False
 
     # load data from selection into the alignment
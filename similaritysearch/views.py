@@ -4,6 +4,7 @@ from django.conf import settings
 from common.views import AbsReferenceSelection
 from common.views import AbsSegmentSelection
 from common.views import AbsTargetSelection
+from common.alignment_cache import get_or_build_alignment
 # from common.alignment_SITE_NAME import Alignment
 Alignment = getattr(__import__('common.alignment_' + settings.SITE_NAME, fromlist=['Alignment']), 'Alignment')
 
@@ -71,14 +72,9 @@ def render_alignment(request):
     a.load_proteins_from_selection(simple_selection)
     a.load_segments_from_selection(simple_selection)
 
-    # build the alignment data matrix
-    a.build_alignment()
-
-    # calculate consensus sequence + amino acid and feature frequency
-    a.calculate_statistics()
-
-    # calculate identity and similarity of each row compared to the reference
-    a.calculate_similarity()
+    # build the alignment data matrix, calculate consensus sequence + amino acid and feature frequency and the
+    # identity and similarity of each row compared to the reference, or load a previously built alignment
+    a = get_or_build_alignment(a, similarity=True)
 
     num_of_sequences = len(a.proteins)
     num_residue_columns = len(a.positions) + len(a.segments)
@@ -99,11 +95,9 @@ def render_fasta_alignment(request):
     a.load_proteins_from_selection(simple_selection)
     a.load_segments_from_selection(simple_selection)
 
-    # build the alignment data matrix
-    a.build_alignment()
-
-    # calculate identity and similarity of each row compared to the reference
-    a.calculate_similarity()
+    # build the alignment data matrix, calculate consensus sequence + amino acid and feature frequency and the
+    # identity and similarity of each row compared to the reference, or load a previously built alignment
+    a = get_or_build_alignment(a, similarity=True)
 
     num_of_sequences = len(a.proteins)
     num_residue_columns = len(a.positions) + len(a.segments)
@@ -126,14 +120,9 @@ def render_csv_alignment(request):
     a.load_proteins_from_selection(simple_selection)
     a.load_segments_from_selection(simple_selection)
 
-    # build the alignment data matrix
-    a.build_alignment()
-
-    # calculate consensus sequence + amino acid and feature frequency
-    a.calculate_statistics()
-
-    # calculate identity and similarity of each row compared to the reference
-    a.calculate_similarity()
+    # build the alignment data matrix, calculate consensus sequence + amino acid and feature frequency and the
+    # identity and similarity of each row compared to the reference, or load a previously built alignment
+    a = get_or_build_alignment(a, similarity=True)
 
     num_of_sequences = len(a.proteins)
     num_residue_columns = len(a.positions) + len(a.segments)
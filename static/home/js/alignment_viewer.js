@@ -0,0 +1,243 @@
+/*
+ * Windowed alignment viewer. The alignment is fetched as a header and one compact payload per segment
+ * (see AlignmentMatrix.payload_header and segment_payload), and only the cells in view are turned into elements.
+ */
+var ALI_CELL_WIDTH = 14;
+var ALI_NAME_WIDTH = 260;
+var ALI_OVERSCAN = 200;
+
+function AlignmentViewer(container) {
+    this.container = $(container);
+    this.url = this.container.data('url');
+    this.names = this.container.find('.ali-viewer-names');
+    this.main = this.container.find('.ali-viewer-main');
+    this.namesLayer = this.names.find('.ali-viewer-layer');
+    this.mainLayer = this.main.find('.ali-viewer-layer');
+    this.status = this.container.find('.ali-viewer-status');
+    this.pending = false;
+
+    var viewer = this;
+    this.main.on('scroll', function () { viewer.scheduleRender(); });
+    $(window).on('resize', function () { viewer.resize(); });
+    $.getJSON(this.url, function (header) {
+        viewer.setHeader(header);
+        viewer.loadSegment(0);
+    }).fail(function () {
+        viewer.status.text('The alignment could not be loaded.');
+    });
+}
+
+AlignmentViewer.prototype.segmentUrl = function (segment) {
+    return this.url + (this.url.indexOf('?') < 0 ? '?' : '&') + 'segment=' + encodeURIComponent(segment);
+};
+
+AlignmentViewer.prototype.loadSegment = function (s) {
+    var viewer = this;
+    if (s >= this.segments.length) {
+        this.status.hide();
+        return;
+    }
+    $.getJSON(this.segmentUrl(this.segments[s].slug), function (data) {
+        viewer.segments[s].data = viewer.decodeSegment(data);
+        viewer.status.text('Loading alignment... ' + (s + 1) + ' of ' + viewer.segments.length + ' segments');
+        viewer.scheduleRender();
+        viewer.loadSegment(s + 1);
+    }).fail(function () {
+        viewer.status.text('The alignment could not be loaded.');
+    });
+};
+
+AlignmentViewer.prototype.decodeSegment = function (data) {
+    // sequence numbers are sent as differences to the previous residue of the row
+    data.numbers = [];
+    for (var row = 0; row < data.sequences.length; row++) {
+        var sequence = data.sequences[row], deltas = data.sequence_numbers[row], numbers = [], last = 0;
+        for (var i = 0; i < sequence.length; i++) {
+            if (sequence[i] == '-' || sequence[i] == '_') {
+                numbers.push('');
+            } else {
+                numbers.push(last + deltas[i]);
+                last = Math.max(last, last + deltas[i]);
+            }
+        }
+        data.numbers.push(numbers);
+    }
+    return data;
+};
+
+AlignmentViewer.prototype.setHeader = function (header) {
+    var i, k;
+    this.header = header;
+
+    // columns, with a spacer column after each segment
+    this.segments = [];
+    this.columns = [];
+    for (i = 0; i < header.segments.length; i++) {
+        var segment = {'slug': header.segments[i][0], 'size': header.segments[i][1], 'start': this.columns.length,
+            'data': null};
+        for (k = 0; k < segment.size; k++) {
+            this.columns.push([i, k]);
+        }
+        this.columns.push([i, -1]);
+        this.segments.push(segment);
+    }
+
+    // rows, as [type, index, label, height]
+    var schemes = header.numbering_schemes;
+    this.rows = [['segment', 0, '', 20]];
+    for (i = 0; i < schemes.length; i++) {
+        this.rows.push(['generic_number', i, schemes[i][1], 40]);
+    }
+    for (i = 0; i < header.proteins.length; i++) {
+        var p = header.proteins[i];
+        this.rows.push(['protein', i, '<a href="' + p[3] + p[0] + '">[' + p[1] + '] ' + p[2] + '</a>', 25]);
+    }
+    for (i = 0; i < schemes.length; i++) {
+        this.rows.push(['generic_number', i, schemes[i][1], 40]);
+    }
+    if (header.statistics) {
+        this.rows.push(['consensus', 0, '<b>CONSENSUS</b>', 25]);
+        this.rows.push(['title', 0, '<b>RESIDUE PROPERTIES</b>', 25]);
+        for (i = 0; i < header.features.length; i++) {
+            this.rows.push(['feature', i, header.features[i], 25]);
+        }
+        this.rows.push(['title', 0, '<b>AMINO ACIDS</b>', 25]);
+        for (i = 0; i < header.amino_acids.length; i++) {
+            this.rows.push(['amino_acid', i, header.amino_acids[i], 25]);
+        }
+    }
+    this.rowTops = [0];
+    for (i = 0; i < this.rows.length; i++) {
+        this.rowTops.push(this.rowTops[i] + this.rows[i][3]);
+    }
+
+    this.names.css({'width': ALI_NAME_WIDTH});
+    this.main.css({'margin-left': ALI_NAME_WIDTH});
+    this.main.find('.ali-viewer-spacer').css({'width': this.columns.length * ALI_CELL_WIDTH,
+        'height': this.rowTops[this.rows.length]});
+    this.resize();
+};
+
+AlignmentViewer.prototype.resize = function () {
+    if (!this.rows) {
+        return;
+    }
+    var height = Math.max(300, Math.min(this.rowTops[this.rows.length] + 20, $(window).height() - 150));
+    this.main.css({'height': height});
+    this.names.css({'height': this.main[0].clientHeight, 'top': this.main.position().top});
+    this.scheduleRender();
+};
+
+AlignmentViewer.prototype.scheduleRender = function () {
+    var viewer = this;
+    if (this.pending || !this.rows) {
+        return;
+    }
+    this.pending = true;
+    window.requestAnimationFrame(function () {
+        viewer.pending = false;
+        viewer.render();
+    });
+};
+
+AlignmentViewer.prototype.visibleRows = function (top, bottom) {
+    // binary search for the first row ending below top
+    var low = 0, high = this.rows.length - 1;
+    while (low < high) {
+        var mid = (low + high) >> 1;
+        if (this.rowTops[mid + 1] <= top) {
+            low = mid + 1;
+        } else {
+            high = mid;
+        }
+    }
+    var last = low;
+    while (last < this.rows.length - 1 && this.rowTops[last + 1] < bottom) {
+        last++;
+    }
+    return [low, last];
+};
+
+AlignmentViewer.prototype.render = function () {
+    var main = this.main[0];
+    var top = main.scrollTop, left = main.scrollLeft;
+    var rows = this.visibleRows(Math.max(0, top - ALI_OVERSCAN), top + main.clientHeight + ALI_OVERSCAN);
+    var firstColumn = Math.max(0, Math.floor((left - ALI_OVERSCAN) / ALI_CELL_WIDTH));
+    var lastColumn = Math.min(this.columns.length - 1,
+        Math.ceil((left + main.clientWidth + ALI_OVERSCAN) / ALI_CELL_WIDTH));
+
+    var names = [], cells = [];
+    for (var r = rows[0]; r <= rows[1]; r++) {
+        var row = this.rows[r], rowTop = this.rowTops[r];
+        var style = 'top:' + rowTop + 'px;height:' + row[3] + 'px;line-height:' + row[3] + 'px;';
+        names.push('<div style="' + style + 'width:' + ALI_NAME_WIDTH + 'px">' + row[2] + '</div>');
+        if (row[0] == 'segment') {
+            this.renderSegmentTitles(cells, firstColumn, lastColumn, style);
+            continue;
+        }
+        for (var c = firstColumn; c <= lastColumn; c++) {
+            var column = this.columns[c], data = this.segments[column[0]].data;
+            if (column[1] < 0 || !data) {
+                continue;
+            }
+            var cell = this.cell(row, column[1], data);
+            if (cell) {
+                cells.push('<div class="' + cell[0] + '" style="' + style + 'left:' + c * ALI_CELL_WIDTH +
+                    'px;width:' + ALI_CELL_WIDTH + 'px"' + (cell[2] ? ' title="' + cell[2] + '"' : '') + '>' +
+                    cell[1] + '</div>');
+            }
+        }
+    }
+    this.namesLayer.css({'top': -top}).html(names.join(''));
+    this.mainLayer.html(cells.join(''));
+};
+
+AlignmentViewer.prototype.renderSegmentTitles = function (cells, firstColumn, lastColumn, style) {
+    for (var s = 0; s < this.segments.length; s++) {
+        var segment = this.segments[s];
+        if (segment.start > lastColumn || segment.start + segment.size < firstColumn) {
+            continue;
+        }
+        cells.push('<div class="ali-td-segment-title" style="' + style + 'left:' + segment.start * ALI_CELL_WIDTH +
+            'px;width:' + segment.size * ALI_CELL_WIDTH + 'px">' + segment.slug + '</div>');
+    }
+};
+
+AlignmentViewer.prototype.cell = function (row, i, data) {
+    // [class, content, tooltip] of a cell, like the cells of alignment/alignment.html
+    var header = this.header, stat;
+    switch (row[0]) {
+        case 'generic_number':
+            var dn = (data.generic_numbers[row[1]] || [])[i] || '';
+            return ['ali-td-generic-num', header.g_alpha ? dn.slice(2) : dn, ''];
+        case 'protein':
+            var aa = data.sequences[row[1]][i], number = data.numbers[row[1]][i];
+            var display = data.display_numbers[row[1]][i], title = aa + number;
+            if (display >= 0) {
+                var label = header.display_labels[display];
+                title += '&#10;' + label[1] + ': ' + label[0];
+                if (label[1] != 'GPCRdb(A)') {
+                    title += '&#10;(GPCRdb(A): ' + data.positions[i] + ')';
+                }
+            }
+            var border = row[1] == 0 ? ' ali-residue-top-border' :
+                (row[1] == header.proteins.length - 1 ? ' ali-residue-bottom-border' : '');
+            return ['ali-residue res-color-' + aa + border, aa, title];
+        case 'consensus':
+            var consensus = data.consensus[i];
+            return consensus ? ['ali-residue res-cons-' + consensus[1], consensus[0], consensus[2]] : null;
+        case 'feature':
+            stat = data.feature_stats[row[1]][i];
+            return stat ? ['ali-td-stat-summary res-cons-' + stat[1], stat[0], ''] : null;
+        case 'amino_acid':
+            stat = data.amino_acid_stats[row[1]][i];
+            return stat ? ['ali-td-stat-summary res-cons-' + stat[1], stat[0], ''] : null;
+    }
+    return null;
+};
+
+$(function () {
+    $('.ali-viewer').each(function () {
+        new AlignmentViewer(this);
+    });
+});
@@ -25,7 +25,7 @@ class GenericNumbering(object):
     exceptions = {'6GDG':[255, 10], '6G79':[232, 10]}
   
     def __init__ (self, pdb_file=None, pdb_filename=None, structure=None, pdb_code=None, blast_path='blastp',
-        blastdb=os.sep.join([settings.STATICFILES_DIRS[0], 'blast', 'protwis_blastdb']),top_results=1, sequence_parser=False, signprot=False):
+        blastdb=os.sep.join([settings.STATICFILES_DIRS[0], 'blast', 'protwis_blastdb']),top_results=1, sequence_parser=False, signprot=False, use_index=False):
     
         # pdb_file can be either a name/path or a handle to an open file
         self.pdb_file = pdb_file
@@ -40,7 +40,7 @@ class GenericNumbering(object):
         # list of uniprot ids returned from blast
         self.prot_id_list = []
         #setup for local blast search
-        self.blast = BlastSearch(blast_path=blast_path, blastdb=blastdb,top_results=top_results)
+        self.blast = BlastSearch(blast_path=blast_path, blastdb=blastdb,top_results=top_results, use_index=use_index)
         
         # calling sequence parser
         if sequence_parser:
@@ -48,11 +48,11 @@ class GenericNumbering(object):
                 struct = Structure.objects.get(pdb_code__index=self.pdb_code)
             if not signprot:
                 if pdb_code:
-                    s = SequenceParser(pdb_file=self.pdb_file, wt_protein_id=struct.protein_conformation.protein.parent.id)
+                    s = SequenceParser(pdb_file=self.pdb_file, wt_protein_id=struct.protein_conformation.protein.parent.id, use_index=use_index)
                 else:
-                    s = SequenceParser(pdb_file=self.pdb_file)#, wt_protein_id=struct.protein_conformation.protein.parent.id)
+                    s = SequenceParser(pdb_file=self.pdb_file, use_index=use_index)#, wt_protein_id=struct.protein_conformation.protein.parent.id)
             else:
-                s = SequenceParser(pdb_file=self.pdb_file, wt_protein_id=signprot.id)
+                s = SequenceParser(pdb_file=self.pdb_file, wt_protein_id=signprot.id, use_index=use_index)
             self.pdb_structure = s.pdb_struct
             self.mapping = s.mapping
             self.wt = s.wt
@@ -205,9 +205,10 @@ class GenericNumbering(object):
     def assign_generic_numbers(self):
         
         alignments = {}
-        #blast search goes first, looping through all the chains
-        for chain in self.pdb_seq.keys():
-            alignments[chain] = self.blast.run(self.pdb_seq[chain])
+        #blast search goes first, all the chains at once
+        chains = list(self.pdb_seq.keys())
+        for chain, alignment in zip(chains, self.blast.run_many([self.pdb_seq[chain] for chain in chains])):
+            alignments[chain] = alignment
             
         #map the results onto pdb sequence for every sequence pair from blast
         for chain in self.pdb_seq.keys():
@@ -16,6 +16,7 @@ from protein.models import Protein, ProteinSegment, ProteinConformation, Protein
 from residue.functions import dgn
 from residue.models import Residue, ResidueGenericNumberEquivalent
 from structure.models import Structure, Rotamer
+from structure.sequence_index import get_sequence_index
 
 from subprocess import Popen, PIPE
 from io import StringIO
@@ -42,7 +43,7 @@ class BlastSearch(object):
 
 
     def __init__ (self, blast_path='blastp',
-        blastdb=os.sep.join([settings.STATICFILES_DIRS[0], 'blast', 'protwis_blastdb']), top_results=1):
+        blastdb=os.sep.join([settings.STATICFILES_DIRS[0], 'blast', 'protwis_blastdb']), top_results=1, use_index=False):
 
         self.blast_path = blast_path
         self.blastdb = blastdb
@@ -50,11 +51,35 @@ class BlastSearch(object):
         #residues it is better to use more results to avoid getting sequence of
         #e.g.  different species
         self.top_results = top_results
+        #the databases made by build_blast_database can be searched in-process with a sequence index (use_index, as
+        #the web views do), blastp is run for other databases or when use_index is False
+        self.use_index = use_index
 
     #takes Bio.Seq sequence as an input and returns a list of tuples with the
     #alignments
     def run (self, input_seq):
 
+        index = self.sequence_index()
+        if index is not None:
+            return index.search(input_seq, self.top_results)
+        return self.run_blastp(input_seq)
+
+    #takes a list of sequences (e.g. the chains of a structure) and returns a list of results of run
+    def run_many (self, input_seqs):
+
+        index = self.sequence_index()
+        if index is not None:
+            return index.search_many(input_seqs, self.top_results)
+        return [self.run_blastp(input_seq) for input_seq in input_seqs]
+
+    def sequence_index (self):
+
+        if self.use_index:
+            return get_sequence_index(self.blastdb)
+        return None
+
+    def run_blastp (self, input_seq):
+
         output = []
         #Windows has problems with Popen and PIPE
         if sys.platform == 'win32':
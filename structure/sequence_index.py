@@ -0,0 +1,293 @@
+from django.db.models import Count, Max
+
+from Bio.Blast.Record import Alignment, HSP
+
+from common.pairwise_alignment import BLOSUM62_ALPHABET, BLOSUM62_SCORES, UNKNOWN_CODE, encode_sequence, \
+    local_align_banded, local_score_banded
+from protein.models import Protein
+
+from collections import OrderedDict, defaultdict
+import logging
+import math
+import numpy as np
+import os
+import threading
+import time
+
+logger = logging.getLogger("protwis")
+
+# The sequence sets of the blast databases made by build_blast_database, by database name
+SEQUENCE_INDEX_DATABASES = {
+    'protwis_blastdb': {'sequence_type__slug': 'wt'},
+    'protwis_human_blastdb': {'sequence_type__slug': 'wt', 'species__common_name': 'Human'},
+}
+
+# blastp defaults: BLOSUM62, gap existence 11 and extension 1 (a gap of length L costs 11 + L), E-value cutoff 10
+GAP_OPEN = 12
+GAP_EXTEND = 1
+MAX_EXPECT = 10
+
+# Karlin-Altschul parameters of BLOSUM62 with gap costs 11/1
+KA_LAMBDA = 0.267
+KA_K = 0.041
+KA_H = 0.14
+
+# seed word length
+WORD_SIZE = 3
+
+# seeded diagonals of a subject at most MAX_DIAGONAL_GAP apart are searched as one band, with BAND_MARGIN diagonals
+# on both sides. Longer gaps are not bridged by the blast gapped extension either (its final X-drop of 25 bits is about
+# 53 raw score), parts of the alignment on distant diagonals are separate HSPs.
+MAX_DIAGONAL_GAP = 40
+BAND_MARGIN = 16
+MAX_BAND_WIDTH = 1024
+
+# subjects with less than 1 / SEED_RATIO of the word hits of the best subject are not searched, nor are bands with less
+# than 1 / SEED_RATIO of the word hits of the best band of a subject
+SEED_RATIO = 10
+
+# minimum number of candidates verified with Smith-Waterman per query
+MIN_CANDIDATES = 20
+
+# seconds between checks whether the proteins of an index have changed
+INDEX_CHECK_INTERVAL = 60
+
+
+class SequenceIndex(object):
+    """Word index of protein sequences for blastp-like searches without a blast process. A query is seeded with exact
+    word hits, the subjects with the most hits on nearby diagonals are aligned with a banded Smith-Waterman and the
+    hits are returned in the format of Bio.Blast.NCBIXML, best hit first."""
+
+    def __init__(self, ids, names, sequences):
+        self.ids = ids
+        self.names = names
+        self.sequences = sequences
+        self.codes = [encode_sequence(s) for s in sequences]
+        self.lengths = np.array([len(s) for s in sequences], dtype=np.int64)
+        self.total_length = int(self.lengths.sum())
+
+        # words of all subjects, sorted by word; the entries of a word are offsets[word]:offsets[word + 1]
+        words = []
+        subjects = []
+        positions = []
+        for k, codes in enumerate(self.codes):
+            word, position = self.words(codes)
+            words.append(word)
+            subjects.append(np.full(len(word), k, dtype=np.int32))
+            positions.append(position.astype(np.int32))
+        words = np.concatenate(words) if words else np.zeros(0, dtype=np.int64)
+        order = np.argsort(words, kind='stable')
+        self.word_subjects = np.concatenate(subjects)[order] if subjects else np.zeros(0, dtype=np.int32)
+        self.word_positions = np.concatenate(positions)[order] if positions else np.zeros(0, dtype=np.int32)
+        self.word_offsets = np.searchsorted(words[order], np.arange(len(BLOSUM62_ALPHABET) ** WORD_SIZE + 1))
+
+    @classmethod
+    def from_proteins(cls, proteins):
+        ids, names, sequences = [], [], []
+        for protein_id, entry_name, sequence in proteins.values_list('id', 'entry_name', 'sequence'):
+            ids.append(protein_id)
+            names.append(entry_name)
+            sequences.append(sequence or '')
+        return cls(ids, names, sequences)
+
+    @staticmethod
+    def words(codes):
+        """Codes and start positions of the words of a sequence, words with unknown residues are skipped"""
+        if len(codes) < WORD_SIZE:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        size = len(BLOSUM62_ALPHABET)
+        words = np.zeros(len(codes) - WORD_SIZE + 1, dtype=np.int64)
+        known = np.ones(len(words), dtype=bool)
+        for offset in range(WORD_SIZE):
+            window = codes[offset:offset + len(words)]
+            words = words * size + window
+            known &= window != UNKNOWN_CODE
+        return words[known], np.flatnonzero(known)
+
+    def candidates(self, query_codes, number):
+        """Bands of diagonals to search in the subjects with the most word hits on diagonals with at least two hits, as
+        (subject, band start, band width)"""
+        words, positions = self.words(query_codes)
+        starts = self.word_offsets[words]
+        counts = self.word_offsets[words + 1] - starts
+        total = int(counts.sum())
+        if not total:
+            return []
+        entries = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(total)
+        subjects = self.word_subjects[entries].astype(np.int64)
+        diagonals = self.word_positions[entries] - np.repeat(positions, counts)
+
+        # word hits per (subject, diagonal)
+        shift = len(query_codes)
+        span = shift + int(self.lengths.max()) + 1
+        keys, key_counts = np.unique(subjects * span + diagonals + shift, return_counts=True)
+        seeded = key_counts >= 2
+        keys, key_counts = keys[seeded], key_counts[seeded]
+        if not len(keys):
+            return []
+        key_subjects = keys // span
+        key_diagonals = keys % span - shift
+
+        hits = np.bincount(key_subjects, weights=key_counts, minlength=len(self.ids))
+        ranked = np.flatnonzero(hits >= hits.max() / SEED_RATIO)
+        # most hits first, database order for ties
+        ranked = ranked[np.lexsort((ranked, -hits[ranked]))][:number]
+
+        # bands per subject (the keys are sorted by subject and diagonal)
+        first = np.searchsorted(key_subjects, ranked, side='left')
+        last = np.searchsorted(key_subjects, ranked, side='right')
+        bands = []
+        for subject, f, l in zip(ranked, first, last):
+            diagonals = key_diagonals[f:l]
+            counts = key_counts[f:l]
+            breaks = np.flatnonzero(np.diff(diagonals) > MAX_DIAGONAL_GAP) + 1
+            band_hits = np.add.reduceat(counts, np.concatenate([[0], breaks]))
+            for band, band_diagonals in enumerate(np.split(diagonals, breaks)):
+                if band_hits[band] < band_hits.max() / SEED_RATIO:
+                    continue
+                low, high = int(band_diagonals[0]), int(band_diagonals[-1])
+                if high - low + 2 * BAND_MARGIN >= MAX_BAND_WIDTH:
+                    high = low + MAX_BAND_WIDTH - 2 * BAND_MARGIN - 1
+                bands.append((int(subject), low - BAND_MARGIN, high - low + 2 * BAND_MARGIN + 1))
+        return bands
+
+    def search(self, query, top_results=1):
+        """Hits of a query sequence as (hit id, Bio.Blast.Record.Alignment) tuples, best first, like BlastSearch.run"""
+        return self.search_many([query], top_results)[0]
+
+    def search_many(self, queries, top_results=1):
+        """Hits of each of a list of query sequences (e.g. the chains of a structure). The bands of all queries are
+        aligned together, identical queries are searched once."""
+        queries = [str(query).upper() for query in queries]
+        unique = list(OrderedDict.fromkeys(queries))
+
+        # (query, subject, band start, band width) of all candidate bands
+        bands = []
+        for query in unique:
+            bands.extend((query,) + c for c in self.candidates(encode_sequence(query),
+                max(MIN_CANDIDATES, 2 * top_results)))
+
+        # scores of all bands first, the alignments are only made for the bands of the best hits
+        band_scores = local_score_banded(*self.band_arguments(bands), GAP_OPEN, GAP_EXTEND)
+        best_scores = defaultdict(dict)
+        for (query, subject, _, _), score in zip(bands, band_scores):
+            if score > self.min_score(len(query)):
+                best_scores[query][subject] = max(score, best_scores[query].get(subject, 0))
+        # best hit first, database order for ties
+        hits = {query: sorted(scores, key=lambda subject: (-scores[subject], subject))[:top_results] for query,
+            scores in best_scores.items()}
+        bands = [band for band, score in zip(bands, band_scores) if band[1] in hits.get(band[0], []) and
+            score > self.min_score(len(band[0]))]
+        alignments = local_align_banded(*self.band_arguments(bands), GAP_OPEN, GAP_EXTEND)
+
+        # HSPs per query and subject, best first; an HSP that is mostly covered by a better one is dropped
+        hsps = defaultdict(list)
+        for (query, subject, _, _), (score, query_index, subject_index) in sorted(zip(bands, alignments),
+                key=lambda a: -a[1][0]):
+            query_range = query_index[query_index >= 0][[0, -1]]
+            subject_range = subject_index[subject_index >= 0][[0, -1]]
+            if any(covered(query_range, h[0]) or covered(subject_range, h[1]) for h in hsps[query, subject]):
+                continue
+            hsps[query, subject].append((query_range, subject_range, score, self.expect(score, len(query)),
+                query_index, subject_index))
+
+        results = {}
+        for query in unique:
+            results[query] = []
+            for subject in hits.get(query, []):
+                aln = self.blast_alignment(subject, query, [h[2:] for h in hsps[query, subject]])
+                results[query].append((aln.hit_id, aln))
+        return [results[query] for query in queries]
+
+    def band_arguments(self, bands):
+        """Queries, subjects, band starts and band widths of a list of bands for the banded alignment functions"""
+        return ([b[0] for b in bands], [self.codes[b[1]] for b in bands], [b[2] for b in bands],
+            [b[3] for b in bands])
+
+    def search_space(self, query_length):
+        """Effective search space of a query, with the blast length adjustment of the query and the database"""
+        adjustment = math.log(KA_K * max(query_length, 1) * max(self.total_length, 1)) / KA_H
+        effective_query = max(query_length - adjustment, 1 / KA_K)
+        effective_database = max(self.total_length - len(self.ids) * adjustment, 1)
+        return effective_query * effective_database
+
+    def expect(self, score, query_length):
+        """E-value of a raw score"""
+        return KA_K * self.search_space(query_length) * math.exp(-KA_LAMBDA * score)
+
+    def min_score(self, query_length):
+        """Highest raw score with an E-value above MAX_EXPECT"""
+        return math.log(KA_K * self.search_space(query_length) / MAX_EXPECT) / KA_LAMBDA
+
+    def blast_alignment(self, subject, query, hsps):
+        """Bio.Blast.Record.Alignment of a subject from a list of (score, expect, query index, subject index)"""
+        aln = Alignment()
+        aln.hit_id = str(self.ids[subject])
+        aln.hit_def = self.names[subject]
+        aln.title = '{} {}'.format(aln.hit_id, aln.hit_def)
+        aln.accession = aln.hit_id
+        aln.length = len(self.sequences[subject])
+        aln.hsps = [self.blast_hsp(subject, query, *h) for h in hsps]
+        return aln
+
+    def blast_hsp(self, subject, query, score, expect, query_index, subject_index):
+        query_residues = np.array(list(query))
+        subject_residues = np.array(list(self.sequences[subject]))
+        aligned_query = np.where(query_index >= 0, query_residues[np.maximum(query_index, 0)], '-')
+        aligned_subject = np.where(subject_index >= 0, subject_residues[np.maximum(subject_index, 0)], '-')
+
+        # blast match line: identical residues, '+' for other positive scores
+        paired = (query_index >= 0) & (subject_index >= 0)
+        pair_scores = np.where(paired, BLOSUM62_SCORES[encode_sequence(query)[np.maximum(query_index, 0)],
+            self.codes[subject][np.maximum(subject_index, 0)]], 0)
+        identical = paired & (aligned_query == aligned_subject)
+        positive = paired & (pair_scores > 0)
+
+        hsp = HSP()
+        hsp.score = score
+        hsp.bits = (KA_LAMBDA * score - math.log(KA_K)) / math.log(2)
+        hsp.expect = expect
+        hsp.identities = int(identical.sum())
+        hsp.positives = int(positive.sum())
+        hsp.gaps = int((~paired).sum())
+        hsp.align_length = len(query_index)
+        hsp.query = ''.join(aligned_query)
+        hsp.match = ''.join(np.where(identical, aligned_query, np.where(positive, '+', ' ')))
+        hsp.sbjct = ''.join(aligned_subject)
+        hsp.query_start, hsp.query_end = (int(i) + 1 for i in query_index[query_index >= 0][[0, -1]])
+        hsp.sbjct_start, hsp.sbjct_end = (int(i) + 1 for i in subject_index[subject_index >= 0][[0, -1]])
+        return hsp
+
+
+def covered(a, b):
+    """Whether more than half of range a is covered by range b, ranges are (first, last)"""
+    return min(a[1], b[1]) - max(a[0], b[0]) + 1 > (a[1] - a[0] + 1) / 2
+
+
+# indexes of this process, by database name: (index, fingerprint of the proteins, time of the last check)
+sequence_indexes = {}
+sequence_indexes_lock = threading.Lock()
+
+
+def get_sequence_index(blastdb):
+    """The index of the sequences of a blast database made by build_blast_database, built on first use and rebuilt
+    when the proteins change. Returns None for other databases."""
+    name = os.path.basename(blastdb)
+    if name not in SEQUENCE_INDEX_DATABASES:
+        return None
+
+    with sequence_indexes_lock:
+        index, fingerprint, checked = sequence_indexes.get(name, (None, None, 0))
+        now = time.time()
+        if index is not None and now - checked < INDEX_CHECK_INTERVAL:
+            return index
+
+        proteins = Protein.objects.filter(**SEQUENCE_INDEX_DATABASES[name])
+        current = tuple(proteins.aggregate(count=Count('id'), max_id=Max('id')).values())
+        if index is None or current != fingerprint:
+            start = time.time()
+            index = SequenceIndex.from_proteins(proteins)
+            logger.info('Built sequence index {} of {} proteins in {:.1f}s'.format(name, len(index.ids),
+                time.time() - start))
+        sequence_indexes[name] = (index, current, now)
+        return index
@@ -18,14 +18,14 @@ class ProteinSuperpose(object):
   
     
 
-    def __init__ (self, ref_file, alt_files, simple_selection):
+    def __init__ (self, ref_file, alt_files, simple_selection, use_index=False):
     
         self.selection = SelectionParser(simple_selection)
         self.ref_struct = PDBParser(PERMISSIVE=True).get_structure('ref', ref_file)[0]
         assert self.ref_struct, self.logger.error("Can't parse the ref file %s".format(ref_file))
         if self.selection.generic_numbers != [] or self.selection.helices != []:
             if not check_gn(self.ref_struct):
-                gn_assigner = GenericNumbering(structure=self.ref_struct)
+                gn_assigner = GenericNumbering(structure=self.ref_struct, use_index=use_index)
                 self.ref_struct = gn_assigner.assign_generic_numbers()
       
         self.alt_structs = []
@@ -34,7 +34,7 @@ class ProteinSuperpose(object):
                 tmp_struct = PDBParser(PERMISSIVE=True).get_structure(alt_id, alt_file)[0]
                 if self.selection.generic_numbers != [] or self.selection.helices != []:
                     if not check_gn(tmp_struct):
-                        gn_assigner = GenericNumbering(structure=tmp_struct)
+                        gn_assigner = GenericNumbering(structure=tmp_struct, use_index=use_index)
                         self.alt_structs.append(gn_assigner.assign_generic_numbers())
                         self.alt_structs[-1].id = alt_id
                     else:
@@ -66,17 +66,17 @@ class FragmentSuperpose(object):
 
     logger = logging.getLogger("structure")
 
-    def __init__(self, pdb_file=None, pdb_filename=None):
+    def __init__(self, pdb_file=None, pdb_filename=None, use_index=False):
         
         #pdb_file can be either a name/path or a handle to an open file
         self.pdb_file = pdb_file
         self.pdb_filename = pdb_filename
         self.pdb_seq = {}
-        self.blast = BlastSearch()
+        self.blast = BlastSearch(use_index=use_index)
 
         self.pdb_struct = self.parse_pdb()
         if not check_gn(self.pdb_struct):
-            gn_assigner = GenericNumbering(structure=self.pdb_struct)
+            gn_assigner = GenericNumbering(structure=self.pdb_struct, use_index=use_index)
             self.pdb_struct = gn_assigner.assign_generic_numbers()
             self.target = Protein.objects.get(pk=gn_assigner.prot_id_list[0])
         else:
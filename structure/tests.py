@@ -1,3 +1,51 @@
-from django.test import TestCase
+from django.test import SimpleTestCase
 
-# Create your tests here.
+from common.testing import mutate_sequence, random_sequence
+from structure.functions import BlastSearch
+from structure.sequence_index import SequenceIndex
+
+from subprocess import Popen, PIPE
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+
+class BlastSearchTests(SimpleTestCase):
+    """The in-process sequence index is only used when asked for, and finds the same top hits as blastp"""
+
+    def setUp(self):
+        rnd = random.Random(1)
+        self.sequences = [random_sequence(rnd, rnd.randint(200, 450)) for p in range(30)]
+        # fragments of every third subject with point mutations
+        self.queries = []
+        for sequence in self.sequences[::3]:
+            start = rnd.randint(0, 50)
+            self.queries.append(mutate_sequence(rnd, sequence, substitution=0.2)[start:start + 150])
+
+    def test_index_not_used_by_default(self):
+        self.assertIsNone(BlastSearch().sequence_index())
+        self.assertTrue(BlastSearch(use_index=True).use_index)
+
+    @unittest.skipUnless(shutil.which('blastp') and shutil.which('makeblastdb'), 'blastp is not installed')
+    def test_index_top_hit_matches_blastp(self):
+        ids = list(range(1, len(self.sequences) + 1))
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            fasta = os.path.join(tmp_dir, 'sequences.fa')
+            with open(fasta, 'w') as f:
+                for protein_id, sequence in zip(ids, self.sequences):
+                    f.write('>{} p{}_human\n{}\n'.format(protein_id, protein_id, sequence))
+            blastdb = os.path.join(tmp_dir, 'test_blastdb')
+            Popen('makeblastdb -in {} -dbtype prot -out {} -parse_seqids'.format(fasta, blastdb), shell=True,
+                stdout=PIPE, stderr=PIPE).communicate()
+
+            blast = BlastSearch(blastdb=blastdb)
+            index = SequenceIndex(ids, ['p{}_human'.format(i) for i in ids], self.sequences)
+            for query in self.queries:
+                blast_hits = [hit_id for hit_id, _ in blast.run(query)]
+                index_hits = [hit_id for hit_id, _ in index.search(query)]
+                self.assertEqual(blast_hits, index_hits)
+        finally:
+            shutil.rmtree(tmp_dir)
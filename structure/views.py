@@ -1,7 +1,7 @@
 from django.shortcuts import render
 from django.conf import settings
 from django.views.generic import TemplateView, View
-from django.http import HttpResponse, JsonResponse, HttpResponseRedirect
+from django.http import HttpResponse, JsonResponse, HttpResponseRedirect, StreamingHttpResponse
 from django.db.models import Count, Q, Prefetch
 from django import forms
 from django.core.cache import cache
@@ -24,6 +24,7 @@ from common.views import AbsSegmentSelection,AbsReferenceSelection
 from common.selection import Selection, SelectionItem
 from common.extensions import MultiFileField
 from common.models import ReleaseNotes
+from common.tools import stream_zip
 
 Alignment = getattr(__import__('common.alignment_' + settings.SITE_NAME, fromlist=['Alignment']), 'Alignment')
 
@@ -946,7 +947,7 @@ class GenericNumberingResults(TemplateView):
 
     def post (self, request, *args, **kwargs):
 
-        generic_numbering = GenericNumbering(StringIO(request.FILES['pdb_file'].file.read().decode('UTF-8',"ignore")))
+        generic_numbering = GenericNumbering(StringIO(request.FILES['pdb_file'].file.read().decode('UTF-8',"ignore")), use_index=True)
         out_struct = generic_numbering.assign_generic_numbers()
         out_stream = StringIO()
         io = PDBIO()
@@ -1262,7 +1263,7 @@ class SuperpositionWorkflowResults(TemplateView):
         elif selection.targets != []:
             alt_files = [StringIO(x.item.get_cleaned_pdb()) for x in selection.targets if x.type in ['structure', 'structure_model', 'structure_model_Inactive', 'structure_model_Intermediate', 'structure_model_Active']]
 
-        superposition = ProteinSuperpose(deepcopy(ref_file),alt_files, selection)
+        superposition = ProteinSuperpose(deepcopy(ref_file),alt_files, selection, use_index=True)
         out_structs = superposition.run()
         if 'alt_files' in self.request.session.keys():
             alt_file_names = [x.name for x in self.request.session['alt_files']]
@@ -1314,13 +1315,13 @@ class SuperpositionWorkflowDownload(View):
         if 'ref_file' in request.session.keys():
             self.request.session['ref_file'].file.seek(0)
             ref_struct = PDBParser(PERMISSIVE=True, QUIET=True).get_structure('ref', StringIO(self.request.session['ref_file'].file.read().decode('UTF-8')))[0]
-            gn_assigner = GenericNumbering(structure=ref_struct)
+            gn_assigner = GenericNumbering(structure=ref_struct, use_index=True)
             gn_assigner.assign_generic_numbers()
             self.ref_substructure_mapping = gn_assigner.get_substructure_mapping_dict()
             ref_name = self.request.session['ref_file'].name
         elif selection.reference != []:
             ref_struct = PDBParser(PERMISSIVE=True, QUIET=True).get_structure('ref', StringIO(selection.reference[0].item.get_cleaned_pdb()))[0]
-            gn_assigner = GenericNumbering(structure=ref_struct)
+            gn_assigner = GenericNumbering(structure=ref_struct, use_index=True)
             gn_assigner.assign_generic_numbers()
             self.ref_substructure_mapping = gn_assigner.get_substructure_mapping_dict()
             if selection.reference[0].type=='structure':
@@ -1333,7 +1334,7 @@ class SuperpositionWorkflowDownload(View):
         for alt_id, st in self.request.session['alt_structs'].items():
             st.seek(0)
             alt_structs[alt_id] = PDBParser(PERMISSIVE=True, QUIET=True).get_structure(alt_id, st)[0]
-            gn_assigner = GenericNumbering(structure=alt_structs[alt_id])
+            gn_assigner = GenericNumbering(structure=alt_structs[alt_id], use_index=True)
             gn_assigner.assign_generic_numbers()
             self.alt_substructure_mapping[alt_id] = gn_assigner.get_substructure_mapping_dict()
 
@@ -1466,7 +1467,7 @@ class FragmentSuperpositionResults(TemplateView):
 
     def post (self, request, *args, **kwargs):
 
-        frag_sp = FragmentSuperpose(StringIO(request.FILES['pdb_file'].file.read().decode('UTF-8', 'ignore')),request.FILES['pdb_file'].name)
+        frag_sp = FragmentSuperpose(StringIO(request.FILES['pdb_file'].file.read().decode('UTF-8', 'ignore')),request.FILES['pdb_file'].name, use_index=True)
         superposed_fragments = []
         superposed_fragments_repr = []
         if request.POST['similarity'] == 'identical':
@@ -1656,8 +1657,6 @@ class PDBClean(TemplateView):
     def post(self, request, *args, **kwargs):
         context = super(PDBClean, self).get_context_data(**kwargs)
 
-        class_dict = {'001':'A','002':'B1','003':'B2','004':'C','005':'F','006':'T','007':'O'}
-
         self.posted = True
         pref = True
         water = False
@@ -1675,57 +1674,18 @@ class PDBClean(TemplateView):
         selection = Selection()
         if simple_selection:
             selection.importer(simple_selection)
-        out_stream = BytesIO()
-        io = PDBIO()
-        zipf = zipfile.ZipFile(out_stream, 'w', zipfile.ZIP_DEFLATED)
 
         if selection.targets != []:
+            # only the selected structures and options are kept, the archive is generated when it is downloaded
+            cleaned_structures = {'structures': [], 'structure_models': [], 'pref': pref, 'water': water, 'hets': hets}
             if selection.targets != [] and selection.targets[0].type == 'structure':
                 for selected_struct in [x for x in selection.targets if x.type == 'structure']:
-                    struct_name = '{}_{}.pdb'.format(selected_struct.item.protein_conformation.protein.parent.entry_name, selected_struct.item.pdb_code.index)
-                    if hets:
-                        lig_names = [x.pdb_reference for x in StructureLigandInteraction.objects.filter(structure=selected_struct.item, annotated=True)]
-                    else:
-                        lig_names = None
-                    gn_assigner = GenericNumbering(structure=PDBParser(QUIET=True).get_structure(struct_name, StringIO(selected_struct.item.get_cleaned_pdb(pref, water, lig_names)))[0])
-                    tmp = StringIO()
-                    io.set_structure(gn_assigner.assign_generic_numbers())
-                    request.session['substructure_mapping'] = gn_assigner.get_substructure_mapping_dict()
-                    io.save(tmp)
-                    zipf.writestr(struct_name, tmp.getvalue())
-                    del gn_assigner, tmp
+                    cleaned_structures['structures'].append(selected_struct.item.id)
                 for struct in selection.targets:
                     selection.remove('targets', 'structure', struct.item.id)
             elif selection.targets != [] and selection.targets[0].type in ['structure_model', 'structure_model_Inactive', 'structure_model_Intermediate', 'structure_model_Active']:
                 for hommod in [x for x in selection.targets if x.type in ['structure_model', 'structure_model_Inactive', 'structure_model_Intermediate', 'structure_model_Active']]:
-                    mod_name = 'Class{}_{}_{}_{}_{}_GPCRDB.pdb'.format(class_dict[hommod.item.protein.family.slug[:3]], hommod.item.protein.entry_name, 
-                                                                                  hommod.item.state.name, hommod.item.main_template.pdb_code.index, hommod.item.version)
-                    tmp = StringIO(hommod.item.pdb)
-                    request.session['substructure_mapping'] = 'full'
-                    zipf.writestr(mod_name, tmp.getvalue())
-                    del tmp
-
-                    # stat file
-                    # rotamers = StructureModelStatsRotamer.objects.filter(homology_model=hommod.item).prefetch_related('residue','backbone_template','rotamer_template').order_by('residue__sequence_number')
-                    # stats_data = 'Segment,Sequence_number,Generic_number,Backbone_template,Rotamer_template\n'
-                    # for r in rotamers:
-                    #     try:
-                    #         gn = r.residue.generic_number.label
-                    #     except:
-                    #         gn = '-'
-                    #     if r.backbone_template:
-                    #         bt = r.backbone_template.pdb_code.index
-                    #     else:
-                    #         bt = '-'
-                    #     if r.rotamer_template:
-                    #         rt = r.rotamer_template.pdb_code.index
-                    #     else:
-                    #         rt = '-'
-                    #     stats_data+='{},{},{},{},{}\n'.format(r.residue.protein_segment.slug, r.residue.sequence_number, gn, bt, rt)
-                    # stats_name = mod_name[:-3]+'templates.csv'
-                    # zipf.writestr(stats_name, stats_data)
-                    # del stats_data
-
+                    cleaned_structures['structure_models'].append(hommod.item.id)
                 for mod in selection.targets:
                     selection.remove('targets', 'structure_model', mod.item.id)
 
@@ -1733,17 +1693,14 @@ class PDBClean(TemplateView):
             simple_selection = selection.exporter()
 
             request.session['selection'] = simple_selection
-            request.session['cleaned_structures'] = out_stream
+            request.session['cleaned_structures'] = cleaned_structures
 
         attributes = inspect.getmembers(self, lambda a:not(inspect.isroutine(a)))
         for a in attributes:
             if not(a[0].startswith('__') and a[0].endswith('__')):
                 context[a[0]] = a[1]
 
-        if selection.targets != [] and selection.targets[0].type == 'structure_model':
-            return zipf
-        else:
-            return render(request, self.template_name, context)
+        return render(request, self.template_name, context)
 
 
     def get_context_data (self, **kwargs):
@@ -1816,6 +1773,38 @@ class PDBSegmentSelection(AbsSegmentSelection):
         return context
 
 #==============================================================================
+def cleaned_structure_zip_entries(cleaned_structures, parsed_selection=None):
+    """
+    Generate the cleaned structures and homology models selected in the structure browser, with generic numbers. If
+    a parsed segment selection is given, only these substructures are included.
+    """
+    class_dict = {'001':'A','002':'B1','003':'B2','004':'C','005':'F','006':'T','007':'O'}
+    io = PDBIO()
+
+    for pk in cleaned_structures['structures']:
+        structure = Structure.objects.select_related('protein_conformation__protein__parent', 'pdb_code',
+            'pdb_data').get(pk=pk)
+        struct_name = '{}_{}.pdb'.format(structure.protein_conformation.protein.parent.entry_name, structure.pdb_code.index)
+        if cleaned_structures['hets']:
+            lig_names = [x.pdb_reference for x in StructureLigandInteraction.objects.filter(structure=structure, annotated=True)]
+        else:
+            lig_names = None
+        gn_assigner = GenericNumbering(structure=PDBParser(QUIET=True).get_structure(struct_name, StringIO(structure.get_cleaned_pdb(cleaned_structures['pref'], cleaned_structures['water'], lig_names)))[0], use_index=True)
+        tmp = StringIO()
+        io.set_structure(gn_assigner.assign_generic_numbers())
+        if parsed_selection:
+            io.save(tmp, SubstructureSelector(gn_assigner.get_substructure_mapping_dict(), parsed_selection=parsed_selection))
+        else:
+            io.save(tmp)
+        yield struct_name, tmp.getvalue()
+        del gn_assigner, tmp
+
+    for pk in cleaned_structures['structure_models']:
+        hommod = StructureModel.objects.select_related('protein__family', 'state', 'main_template__pdb_code').get(pk=pk)
+        mod_name = 'Class{}_{}_{}_{}_{}_GPCRDB.pdb'.format(class_dict[hommod.protein.family.slug[:3]], hommod.protein.entry_name, 
+                                                                      hommod.state.name, hommod.main_template.pdb_code.index, hommod.version)
+        yield mod_name, hommod.pdb
+
 class PDBDownload(View):
     """
     Serve the PDB (sub)structures depending on user's choice.
@@ -1825,34 +1814,26 @@ class PDBDownload(View):
         if self.kwargs['substructure'] == 'select':
             return HttpResponseRedirect('/structure/pdb_segment_selection')
 
-        if self.kwargs['substructure'] == 'full':
-            out_stream = request.session['cleaned_structures']
+        # the structures selected in PDBClean
+        cleaned_structures = request.session.get('cleaned_structures', False)
+        if not isinstance(cleaned_structures, dict):
+            return HttpResponseRedirect('/structure/pdb_download')
 
-        elif self.kwargs['substructure'] == 'custom':
+        if self.kwargs['substructure'] == 'custom':
             simple_selection = request.session.get('selection', False)
             selection = Selection()
             if simple_selection:
                 selection.importer(simple_selection)
-            io = PDBIO()
-            zipf_in = zipfile.ZipFile(request.session['cleaned_structures'], 'r')
-            out_stream = BytesIO()
-            zipf_out = zipfile.ZipFile(out_stream, 'w', zipfile.ZIP_DEFLATED)
-            for name in zipf_in.namelist():
-                tmp = StringIO()
-                io.set_structure(PDBParser(QUIET=True).get_structure(name, StringIO(zipf_in.read(name).decode('utf-8')))[0])
-                io.save(tmp, SubstructureSelector(request.session['substructure_mapping'], parsed_selection=SelectionParser(selection)))
-                zipf_out.writestr(name, tmp.getvalue())
+            entries = cleaned_structure_zip_entries(cleaned_structures, SelectionParser(selection))
+        else:
+            entries = cleaned_structure_zip_entries(cleaned_structures)
 
-            zipf_in.close()
-            zipf_out.close()
-            del request.session['substructure_mapping']
-        if len(out_stream.getvalue()) > 0:
-            response = HttpResponse(content_type="application/zip")
-            if hommods == False:
-                response['Content-Disposition'] = 'attachment; filename="pdb_structures.zip"'
-            else:
-                response['Content-Disposition'] = 'attachment; filename="GPCRDB_homology_models.zip"'
-            response.write(out_stream.getvalue())
+        # the archive is written while it is sent, one structure at a time
+        response = StreamingHttpResponse(stream_zip(entries), content_type="application/zip")
+        if hommods == False:
+            response['Content-Disposition'] = 'attachment; filename="pdb_structures.zip"'
+        else:
+            response['Content-Disposition'] = 'attachment; filename="GPCRDB_homology_models.zip"'
 
         return response
 
@@ -1944,23 +1925,13 @@ def ConvertStructureComplexSignprotToProteins(request):
     return HttpResponseRedirect('/alignment/segmentselectiongprot')
 
 
-def HommodDownload(request):
-    "Download selected homology models in zip file"
-
-    out_stream = BytesIO()
-    io = PDBIO()
-    zipf = zipfile.ZipFile(out_stream, 'w', zipfile.ZIP_DEFLATED)
-    pks = request.GET['ids'].split(',')
+def homology_model_zip_entries(hommodels):
+    "Generate the model and template statistics files of homology models"
     class_dict = {'001':'A','002':'B1','003':'B2','004':'C','005':'F','006':'T','007':'O'}
-    hommodels = StructureModel.objects.filter(pk__in=pks).prefetch_related('protein__family','state','main_template__pdb_code').all()
-    print(hommodels)
     for hommod in hommodels:
         mod_name = 'Class{}_{}_{}_{}_{}_GPCRDB.pdb'.format(class_dict[hommod.protein.family.slug[:3]], hommod.protein.entry_name, 
                                                                       hommod.state.name, hommod.main_template.pdb_code.index, hommod.version)
-
-        tmp = StringIO(hommod.pdb)
-        zipf.writestr(mod_name, tmp.getvalue())
-        del tmp
+        yield mod_name, hommod.pdb
 
         stats_name = mod_name[:-3]+'templates.csv'
         # Use cache to prevent this being performed too often
@@ -1986,30 +1957,26 @@ def HommodDownload(request):
 
             cache.set(stats_name,stats_data,3600*24*7) # cache a week
 
-        zipf.writestr(stats_name, stats_data)
-        del stats_data
-    zipf.close()
-    response = HttpResponse(content_type="application/zip")
-    response['Content-Disposition'] = 'attachment; filename="GPCRDB_homology_models.zip"'
-    response.write(out_stream.getvalue())
-    return response
+        yield stats_name, stats_data
 
-def ComplexmodDownload(request):
-    "Download selected complex homology models in zip file"
+def HommodDownload(request):
+    "Download selected homology models in zip file"
 
-    out_stream = BytesIO()
-    io = PDBIO()
-    zipf = zipfile.ZipFile(out_stream, 'w', zipfile.ZIP_DEFLATED)
     pks = request.GET['ids'].split(',')
+    hommodels = StructureModel.objects.filter(pk__in=pks).select_related('protein__family','state','main_template__pdb_code').iterator()
+
+    # the archive is written while it is sent, one model at a time
+    response = StreamingHttpResponse(stream_zip(homology_model_zip_entries(hommodels)), content_type="application/zip")
+    response['Content-Disposition'] = 'attachment; filename="GPCRDB_homology_models.zip"'
+    return response
+
+def complex_model_zip_entries(hommodels):
+    "Generate the model and template statistics files of complex homology models"
     class_dict = {'001':'A','002':'B1','003':'B2','004':'C','005':'F','006':'T','007':'O'}
-    hommodels = StructureComplexModel.objects.filter(pk__in=pks).prefetch_related('receptor_protein__family','main_template__pdb_code').all()
-    print(hommodels)
     for hommod in hommodels:
         mod_name = 'Class{}_{}-{}_{}_{}_GPCRDB_complex.pdb'.format(class_dict[hommod.receptor_protein.family.slug[:3]], hommod.receptor_protein.entry_name, 
                                                                    hommod.sign_protein.entry_name, hommod.main_template.pdb_code.index, hommod.version)
-        tmp = StringIO(hommod.pdb)
-        zipf.writestr(mod_name, tmp.getvalue())
-        del tmp
+        yield mod_name, hommod.pdb
 
         stats_name = mod_name[:-3]+'templates.csv'
         # Use cache to prevent this being performed too often
@@ -2035,12 +2002,17 @@ def ComplexmodDownload(request):
 
             cache.set(stats_name,stats_data,3600*24*7) # cache a week
 
-        zipf.writestr(stats_name, stats_data)
-        del stats_data
-    zipf.close()
-    response = HttpResponse(content_type="application/zip")
+        yield stats_name, stats_data
+
+def ComplexmodDownload(request):
+    "Download selected complex homology models in zip file"
+
+    pks = request.GET['ids'].split(',')
+    hommodels = StructureComplexModel.objects.filter(pk__in=pks).select_related('receptor_protein__family','sign_protein','main_template__pdb_code').iterator()
+
+    # the archive is written while it is sent, one model at a time
+    response = StreamingHttpResponse(stream_zip(complex_model_zip_entries(hommodels)), content_type="application/zip")
     response['Content-Disposition'] = 'attachment; filename="GPCRDB_complex_homology_models.zip"'
-    response.write(out_stream.getvalue())
     return response
 
 def SingleModelDownload(request, modelname, state, csv=False):
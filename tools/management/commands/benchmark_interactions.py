@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+
+from Bio.PDB import Selection
+from Bio.PDB.NeighborSearch import NeighborSearch
+
+from contactnetwork.cube import NUM_SKIP_RESIDUES
+from contactnetwork.interaction import get_interactions, get_interactions_batch
+from contactnetwork.pdb import pdb_get_structure
+from contactnetwork.residue import is_aa
+from structure.models import Structure
+
+import time
+
+
+class Command(BaseCommand):
+
+    help = "Compares the speed and results of the per-pair and batched interaction classification"
+
+    def add_arguments(self, parser):
+        parser.add_argument('pdb_codes', nargs='*', help='PDB codes of the structures to use (default: 10 structures)')
+
+    def handle(self, *args, **options):
+        structures = Structure.objects.exclude(refined=True).exclude(pdb_data=None).select_related(
+            'protein_conformation__protein', 'pdb_data')
+        if options['pdb_codes']:
+            structures = structures.filter(protein_conformation__protein__entry_name__in=[p.lower() for p in
+                options['pdb_codes']])
+        else:
+            structures = structures[:10]
+
+        total_pair = total_batch = 0
+        for s in structures:
+            pdb_code = s.protein_conformation.protein.entry_name
+            preferred_chain = s.preferred_chain.split(',')[0]
+            structure = pdb_get_structure(pdb_code, s, preferred_chain)
+
+            # the residue pairs compute_interactions classifies
+            atom_list = Selection.unfold_entities(structure[0][preferred_chain], 'A')
+            pairs = [pair for pair in NeighborSearch(atom_list).search_all(4.5, "R") if is_aa(pair[0])
+                and is_aa(pair[1]) and abs(pair[0].id[1] - pair[1].id[1]) > NUM_SKIP_RESIDUES]
+
+            start = time.time()
+            pair_interactions = [get_interactions(pair[0], pair[1]) for pair in pairs]
+            pair_time = time.time() - start
+
+            start = time.time()
+            batch_interactions = get_interactions_batch(pairs)
+            batch_time = time.time() - start
+
+            identical = all([[i.get_name() for i in a] == [i.get_name() for i in b] for a, b in zip(pair_interactions,
+                batch_interactions)])
+
+            total_pair += pair_time
+            total_batch += batch_time
+            self.stdout.write('{}: {} residue pairs, per-pair {:.2f}s, batched {:.2f}s, {}'.format(pdb_code,
+                len(pairs), pair_time, batch_time, 'identical' if identical else 'DIFFERENT'))
+
+        if total_batch:
+            self.stdout.write('Total: per-pair {:.2f}s, batched {:.2f}s ({:.1f}x)'.format(total_pair, total_batch,
+                total_pair / total_batch))
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+
+from structure.functions import BlastSearch
+from structure.models import Structure
+from structure.sequence_index import get_sequence_index
+
+import time
+
+
+class Command(BaseCommand):
+
+    help = "Compares the speed and top hits of blastp and the in-process sequence index used by BlastSearch"
+
+    def add_arguments(self, parser):
+        parser.add_argument('pdb_codes', nargs='*', help='PDB codes of the structures whose sequences are searched '
+            '(default: 20 structures)')
+        parser.add_argument('--top-results', type=int, default=1, help='Number of hits to compare per sequence')
+        parser.add_argument('--human', action='store_true', help='Search the human sequences only')
+
+    def handle(self, *args, **options):
+        structures = Structure.objects.select_related('protein_conformation__protein').order_by('pdb_code__index')
+        if options['pdb_codes']:
+            structures = structures.filter(pdb_code__index__in=[p.upper() for p in options['pdb_codes']])
+        else:
+            structures = structures[:20]
+        sequences = [(s.pdb_code.index, s.protein_conformation.protein.sequence) for s in structures]
+
+        blast = BlastSearch(top_results=options['top_results'], use_index=False)
+        index_search = BlastSearch(top_results=options['top_results'], use_index=True)
+        if options['human']:
+            blast.blastdb = index_search.blastdb = blast.blastdb.replace('protwis_blastdb', 'protwis_human_blastdb')
+
+        start = time.time()
+        get_sequence_index(index_search.blastdb)
+        self.stdout.write('Sequence index loaded in {:.2f}s'.format(time.time() - start))
+
+        total_blast = total_index = 0
+        same = 0
+        for pdb_code, sequence in sequences:
+            start = time.time()
+            blast_hits = [hit_id for hit_id, _ in blast.run(sequence)]
+            blast_time = time.time() - start
+
+            start = time.time()
+            index_hits = [hit_id for hit_id, _ in index_search.run(sequence)]
+            index_time = time.time() - start
+
+            total_blast += blast_time
+            total_index += index_time
+            same += blast_hits == index_hits
+            self.stdout.write('{}: {} residues, blastp {:.3f}s, index {:.3f}s, {}'.format(pdb_code, len(sequence),
+                blast_time, index_time, 'identical' if blast_hits == index_hits else 'DIFFERENT {} {}'.format(
+                blast_hits, index_hits)))
+
+        # the chains of a structure are searched together
+        start = time.time()
+        index_search.run_many([sequence for _, sequence in sequences])
+        batch_time = time.time() - start
+
+        if total_index:
+            self.stdout.write('Total: {} of {} identical, blastp {:.2f}s, index {:.2f}s ({:.1f}x), index batch '
+                '{:.2f}s'.format(same, len(sequences), total_blast, total_index, total_blast / total_index,
+                batch_time))
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+
+from Bio.PDB import PDBParser, Selection
+
+from contactnetwork.structure_store import array_to_structure, get_pdb_data, load_atoms
+from structure.models import Structure
+
+from io import StringIO
+import time
+
+
+class Command(BaseCommand):
+
+    help = "Compares the time to load structures from the structure store with parsing their PDB files"
+
+    def add_arguments(self, parser):
+        parser.add_argument('pdb_codes', nargs='*', help='PDB codes of the structures to use (default: 10 structures)')
+
+    def handle(self, *args, **options):
+        structures = Structure.objects.exclude(refined=True).exclude(pdb_data=None).select_related(
+            'protein_conformation__protein', 'pdb_data')
+        if options['pdb_codes']:
+            structures = structures.filter(protein_conformation__protein__entry_name__in=[p.lower() for p in
+                options['pdb_codes']])
+        else:
+            structures = structures[:10]
+
+        total_parse = total_store = total_chain = 0
+        for s in structures:
+            pdb_code = s.protein_conformation.protein.entry_name
+            preferred_chain = s.preferred_chain.split(',')[0]
+            pdb_data = get_pdb_data(pdb_code, s)
+            # stored first, so that only loading is timed
+            load_atoms(pdb_code, pdb_data)
+
+            start = time.time()
+            parsed = PDBParser(QUIET=True).get_structure(pdb_code, StringIO(pdb_data))
+            parse_time = time.time() - start
+
+            start = time.time()
+            array_to_structure(pdb_code, load_atoms(pdb_code, pdb_data))
+            store_time = time.time() - start
+
+            start = time.time()
+            chain = array_to_structure(pdb_code, load_atoms(pdb_code, pdb_data), preferred_chain)
+            chain_time = time.time() - start
+
+            atoms = lambda structure: [(a.get_full_id()[3:], tuple(a.coord)) for a in
+                Selection.unfold_entities(structure[0][preferred_chain], 'A')]
+            identical = atoms(parsed) == atoms(chain)
+
+            total_parse += parse_time
+            total_store += store_time
+            total_chain += chain_time
+            self.stdout.write('{}: PDBParser {:.3f}s, store {:.3f}s, store chain {} {:.3f}s, {}'.format(pdb_code,
+                parse_time, store_time, preferred_chain, chain_time, 'identical' if identical else 'DIFFERENT'))
+
+        if total_chain:
+            self.stdout.write('Total: PDBParser {:.2f}s, store {:.2f}s, store chain {:.2f}s ({:.1f}x)'.format(
+                total_parse, total_store, total_chain, total_parse / total_chain))
@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+
+    help = "Print the hit, miss and eviction counters of the tiered caches, or set a new data release"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cache',
+            action='append',
+            dest='caches',
+            help='Cache alias (default: all configured caches)')
+        parser.add_argument('--reset',
+            action='store_true',
+            default=False,
+            help='Reset the counters after printing them')
+        parser.add_argument('--set-release',
+            dest='release',
+            help='Set a new data release, which removes all cached entries of other releases')
+
+    def handle(self, *args, **options):
+        aliases = options['caches'] or list(settings.CACHES)
+        for alias in aliases:
+            if alias not in settings.CACHES:
+                raise CommandError('No cache named {}'.format(alias))
+            cache = caches[alias]
+            if not hasattr(cache, 'stats'):
+                self.stdout.write('{}: {} has no counters'.format(alias, settings.CACHES[alias]['BACKEND']))
+                continue
+
+            if options['release'] is not None:
+                deleted = cache.set_release(options['release'])
+                self.stdout.write('{}: release set to {}, {} entries removed'.format(alias, options['release'],
+                    deleted))
+
+            stats = cache.stats()
+            hits = stats.get('local_hits', 0) + stats.get('shared_hits', 0)
+            lookups = hits + stats.get('misses', 0)
+            self.stdout.write('{} (release {})'.format(alias, stats['release'] or '-'))
+            self.stdout.write('  entries                {:>12}'.format(stats['entries']))
+            self.stdout.write('  size (MB)              {:>12.1f} of {:.1f}'.format(stats['size'] / 1024 ** 2,
+                stats['max_size'] / 1024 ** 2))
+            for name in ['local_hits', 'shared_hits', 'misses', 'expired', 'sets', 'evictions',
+                'release_invalidations']:
+                self.stdout.write('  {:<22} {:>12}'.format(name, stats.get(name, 0)))
+            if lookups:
+                self.stdout.write('  hit rate               {:>11.1f}%'.format(100 * hits / lookups))
+
+            if options['reset']:
+                cache.reset_stats()
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+
+from common.telemetry import read_records, percentile, TELEMETRY_LOG
+
+from collections import defaultdict
+
+
+class Command(BaseCommand):
+
+    help = "Print the slowest endpoints from the request telemetry log"
+
+    def add_arguments(self, parser):
+        parser.add_argument('-n', '--number',
+            type=int,
+            dest='number',
+            default=20,
+            help='Number of endpoints to show')
+        parser.add_argument('--min-requests',
+            type=int,
+            dest='min_requests',
+            default=1,
+            help='Only show endpoints with at least this many requests')
+        parser.add_argument('--sort',
+            choices=['p50', 'p95', 'p99', 'max', 'total'],
+            dest='sort',
+            default='p95',
+            help='Latency statistic to sort by')
+        parser.add_argument('--log',
+            dest='log',
+            default=TELEMETRY_LOG,
+            help='Telemetry log file')
+
+    def handle(self, *args, **options):
+        views = defaultdict(list)
+        for record in read_records(options['log']):
+            views[record['view']].append(record)
+
+        endpoints = []
+        for view, records in views.items():
+            if len(records) < options['min_requests']:
+                continue
+            times = [r['time'] for r in records]
+            endpoints.append({
+                'view': view,
+                'requests': len(records),
+                'p50': percentile(times, 50),
+                'p95': percentile(times, 95),
+                'p99': percentile(times, 99),
+                'max': max(times),
+                'total': sum(times),
+                'queries': sum(r.get('db_queries', 0) for r in records) / len(records),
+                'db_time': sum(r.get('db_time', 0) for r in records) / len(records),
+                'cache_hits': sum(r.get('cache_hits', 0) for r in records),
+                'cache_misses': sum(r.get('cache_misses', 0) for r in records),
+            })
+        endpoints.sort(key=lambda e: e[options['sort']], reverse=True)
+
+        self.stdout.write('{:<50} {:>8} {:>8} {:>8} {:>8} {:>8} {:>8} {:>8} {:>12}'.format('View', 'Requests', 'p50',
+            'p95', 'p99', 'Max', 'Queries', 'DB time', 'Cache h/m'))
+        for e in endpoints[:options['number']]:
+            self.stdout.write('{:<50} {:>8} {:>8.2f} {:>8.2f} {:>8.2f} {:>8.2f} {:>8.1f} {:>8.2f} {:>12}'.format(
+                e['view'][:50], e['requests'], e['p50'], e['p95'], e['p99'], e['max'], e['queries'], e['db_time'],
+                '{}/{}'.format(e['cache_hits'], e['cache_misses'])))
@@ -0,0 +1,118 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import Client
+
+from common.telemetry import read_records, TELEMETRY_LOG
+
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import threading
+import time
+
+# REMOTE_ADDR of the warm-up requests, which are left out when ranking the pages
+WARMUP_ADDR = 'cache-warmup'
+
+
+class Command(BaseCommand):
+
+    help = "Render the most requested pages for a new data release, then switch the caches to it. The current " \
+        "release is served to everyone else while the pages are rendered."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--release',
+            dest='release',
+            help='New data release (default: the current date and time)')
+        parser.add_argument('-n', '--number',
+            type=int,
+            dest='number',
+            default=500,
+            help='Number of pages to render, most requested first')
+        parser.add_argument('--days',
+            type=int,
+            dest='days',
+            default=30,
+            help='Rank the pages by the requests of this many days')
+        parser.add_argument('--time-limit',
+            type=int,
+            dest='time_limit',
+            help='Stop rendering after this many seconds')
+        parser.add_argument('--workers',
+            type=int,
+            dest='workers',
+            default=4,
+            help='Number of pages rendered at the same time')
+        parser.add_argument('--switch',
+            action='store_true',
+            default=False,
+            help='Set the new release when done, which removes the cached entries of other releases')
+        parser.add_argument('--log',
+            dest='log',
+            default=TELEMETRY_LOG,
+            help='Telemetry log file')
+
+    def handle(self, *args, **options):
+        release = options['release'] or datetime.now().strftime('%Y%m%d%H%M%S')
+        tiered = [caches[alias] for alias in settings.CACHES if hasattr(caches[alias], 'pin_release')]
+        for cache in tiered:
+            cache.pin_release(release)
+
+        pages = self.ranked_pages(options['log'], options['days'])[:options['number']]
+        self.stdout.write('Rendering {} pages for release {}'.format(len(pages), release))
+
+        start = time.time()
+        deadline = start + options['time_limit'] if options['time_limit'] else None
+        clients = threading.local()
+
+        def render(page):
+            host, path = page
+            if deadline and time.time() > deadline:
+                return None
+            if not hasattr(clients, 'client'):
+                clients.client = Client(REMOTE_ADDR=WARMUP_ADDR)
+            page_start = time.time()
+            try:
+                status = clients.client.get(path, HTTP_HOST=host).status_code
+            except Exception as msg:
+                status = 'error: {}'.format(msg)
+            finally:
+                connections.close_all()
+            return status, time.time() - page_start
+
+        rendered = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for (host, path), result in zip(pages, executor.map(render, pages)):
+                if result is None:
+                    continue
+                rendered += 1
+                self.stdout.write('{} {} {} {:.2f}s'.format(host, path, result[0], result[1]))
+        self.stdout.write('Rendered {} of {} pages in {:.1f}s'.format(rendered, len(pages), time.time() - start))
+
+        for cache in tiered:
+            if options['switch']:
+                deleted = cache.set_release(release)
+                self.stdout.write('{}: release set to {}, {} entries removed'.format(cache.location, release,
+                    deleted))
+            else:
+                cache.pin_release(None)
+
+    def ranked_pages(self, log, days):
+        """Pages (host, path with the query string) successfully requested with GET in the last days, most requested
+        first, then slowest"""
+        since = time.time() - days * 24 * 60 * 60
+        requests = defaultdict(int)
+        total_time = defaultdict(float)
+        for record in read_records(log):
+            if (record.get('method') != 'GET' or record.get('status') != 200 or record['timestamp'] < since or
+                record.get('remote_addr') == WARMUP_ADDR):
+                continue
+            # records written before the query string was logged count as requests of the path alone
+            path = record['path']
+            if record.get('query_string'):
+                path += '?' + record['query_string']
+            page = (record.get('host') or 'localhost', path)
+            requests[page] += 1
+            total_time[page] += record['time']
+        return sorted(requests, key=lambda page: (requests[page], total_time[page]), reverse=True)